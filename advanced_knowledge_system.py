@@ -16,13 +16,16 @@ import numpy as np
 from dataclasses import dataclass, field
 from enum import Enum
 import asyncio
-import aiohttp
 from sentence_transformers import SentenceTransformer
 import faiss
 import pickle
 from collections import defaultdict
 import threading
 import time
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from core.context_budget import ContextAssembler
+from services.search_client import SearchClient, get_search_client
 
 class SourceType(Enum):
     """情報ソースタイプ"""
@@ -54,10 +57,50 @@ class KnowledgeItem:
     access_count: int = 0
     last_accessed: datetime = field(default_factory=datetime.now)
 
+class _DuckDuckGoResultParser(HTMLParser):
+    """DuckDuckGo HTML結果ページを1回の走査でタイトル・URL・抜粋に分解"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.results = []
+        self._field = None
+        self._buffer = []
+    
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        attributes = dict(attrs)
+        classes = (attributes.get('class') or '').split()
+        if 'result__a' in classes:
+            self.results.append({'url': attributes.get('href') or '', 'title': '', 'snippet': ''})
+            self._field = 'title'
+            self._buffer = []
+        elif 'result__snippet' in classes and self.results:
+            self._field = 'snippet'
+            self._buffer = []
+    
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._field:
+            self.results[-1][self._field] = ''.join(self._buffer).strip()
+            self._field = None
+    
+    def handle_data(self, data):
+        if self._field:
+            self._buffer.append(data)
+
 class MultiSearchAgent:
     """マルチ検索エージェント"""
     
-    def __init__(self):
+    # 検索APIのエンドポイント（テスト時はローカルサーバーに差し替え可能）
+    DEFAULT_ENDPOINTS = {
+        SourceType.DUCKDUCKGO: "https://html.duckduckgo.com/html/",
+        SourceType.ARXIV: "http://export.arxiv.org/api/query",
+        SourceType.GITHUB: "https://api.github.com/search/repositories"
+    }
+    
+    ATOM_NAMESPACE = "{http://www.w3.org/2005/Atom}"
+    
+    def __init__(self, endpoints: Optional[Dict[SourceType, str]] = None, search_client: Optional[SearchClient] = None):
         self.name = "multi_search_agent"
         self.description = "複数の情報源から検索・統合する高度検索システム"
         
@@ -67,10 +110,10 @@ class MultiSearchAgent:
             SourceType.ARXIV: self._search_arxiv,
             SourceType.GITHUB: self._search_github
         }
+        self.endpoints = {**self.DEFAULT_ENDPOINTS, **(endpoints or {})}
         
-        # 検索結果キャッシュ
-        self.search_cache = {}
-        self.cache_ttl = 3600  # 1時間キャッシュ
+        # 共有HTTPセッション・TTLキャッシュ・レート制限はプロセス共通の検索クライアントが管理
+        self.search_client = search_client or get_search_client()
         
         # 検索統計
         self.search_stats = defaultdict(int)
@@ -113,51 +156,52 @@ class MultiSearchAgent:
             print(f"{source_type.value}検索エラー: {str(e)}")
             return []
     
+    async def _fetch(self, source_type: SourceType, query: str, params: Dict, parser, max_results: int,
+                     response_type: str = "text") -> List[SearchResult]:
+        """検索クライアント経由で取得（キャッシュ済みの結果はコピーして返す）"""
+        results = await self.search_client.fetch(
+            source_type.value, query, self.endpoints[source_type], params=params,
+            parser=parser, response_type=response_type, cache_key_extra=max_results
+        )
+        return list(results)
+    
     async def _search_duckduckgo(self, query: str, max_results: int) -> List[SearchResult]:
         """DuckDuckGo検索"""
         try:
             # DuckDuckGo HTML検索API
-            url = "https://html.duckduckgo.com/html/"
             params = {
                 'q': query,
                 'kl': 'jp-jp'
             }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        html = await response.text()
-                        
-                        # 結果を解析
-                        results = []
-                        # 簡易的なHTML解析（実際はBeautifulSoupを使用）
-                        matches = re.findall(r'<a[^>]*class="result__a"[^>]*href="([^"]*)"[^>]*>([^<]*)</a>', html)
-                        
-                        for i, (url, title) in enumerate(matches[:max_results]):
-                            # 内容の抜粋を取得
-                            content_match = re.search(f'<a[^>]*href="{re.escape(url)}"[^>]*>.*?</a>.*?<a[^>]*class="result__snippet"[^>]*>([^<]*)</a>', html, re.DOTALL)
-                            content = content_match.group(1) if content_match else title
-                            
-                            results.append(SearchResult(
-                                source=SourceType.DUCKDUCKGO,
-                                title=title.strip(),
-                                content=content.strip(),
-                                url=url,
-                                confidence=0.8
-                            ))
-                        
-                        return results
+            return await self._fetch(SourceType.DUCKDUCKGO, query, params,
+                                     lambda html: self._parse_duckduckgo(html, max_results), max_results)
             
         except Exception as e:
             print(f"DuckDuckGo検索エラー: {str(e)}")
         
         return []
     
+    def _parse_duckduckgo(self, html: str, max_results: int) -> List[SearchResult]:
+        """DuckDuckGo結果ページを解析"""
+        parser = _DuckDuckGoResultParser()
+        parser.feed(html)
+        parser.close()
+        
+        return [
+            SearchResult(
+                source=SourceType.DUCKDUCKGO,
+                title=item['title'],
+                content=item['snippet'] or item['title'],
+                url=item['url'],
+                confidence=0.8
+            )
+            for item in parser.results[:max_results]
+        ]
+    
     async def _search_arxiv(self, query: str, max_results: int) -> List[SearchResult]:
         """arXiv検索"""
         try:
             # arXiv API
-            url = "http://export.arxiv.org/api/query"
             params = {
                 'search_query': f'all:"{query}"',
                 'start': 0,
@@ -165,76 +209,79 @@ class MultiSearchAgent:
                 'sortBy': 'relevance',
                 'sortOrder': 'descending'
             }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        xml = await response.text()
-                        
-                        # XML解析
-                        results = []
-                        entries = re.findall(r'<entry>.*?</entry>', xml, re.DOTALL)
-                        
-                        for entry in entries[:max_results]:
-                            title_match = re.search(r'<title>([^<]*)</title>', entry)
-                            summary_match = re.search(r'<summary>([^<]*)</summary>', entry)
-                            id_match = re.search(r'<id>([^<]*)</id>', entry)
-                            
-                            if title_match and summary_match:
-                                results.append(SearchResult(
-                                    source=SourceType.ARXIV,
-                                    title=title_match.group(1).strip(),
-                                    content=summary_match.group(1).strip(),
-                                    url=id_match.group(1).strip() if id_match else None,
-                                    confidence=0.9,
-                                    metadata={'type': 'academic_paper'}
-                                ))
-                        
-                        return results
+            return await self._fetch(SourceType.ARXIV, query, params,
+                                     lambda xml: self._parse_arxiv(xml, max_results), max_results)
             
         except Exception as e:
             print(f"arXiv検索エラー: {str(e)}")
         
         return []
     
+    def _parse_arxiv(self, xml: str, max_results: int) -> List[SearchResult]:
+        """arXiv Atomフィードを解析"""
+        try:
+            root = ET.fromstring(xml)
+        except ET.ParseError as e:
+            print(f"arXiv応答の解析エラー: {str(e)}")
+            return []
+        
+        results = []
+        for entry in root.iter(f'{self.ATOM_NAMESPACE}entry'):
+            title = entry.findtext(f'{self.ATOM_NAMESPACE}title')
+            summary = entry.findtext(f'{self.ATOM_NAMESPACE}summary')
+            entry_id = entry.findtext(f'{self.ATOM_NAMESPACE}id')
+            
+            if title and summary:
+                results.append(SearchResult(
+                    source=SourceType.ARXIV,
+                    title=title.strip(),
+                    content=summary.strip(),
+                    url=entry_id.strip() if entry_id else None,
+                    confidence=0.9,
+                    metadata={'type': 'academic_paper'}
+                ))
+            if len(results) >= max_results:
+                break
+        
+        return results
+    
     async def _search_github(self, query: str, max_results: int) -> List[SearchResult]:
         """GitHub検索"""
         try:
             # GitHub API（認証なしの場合制限あり）
-            url = "https://api.github.com/search/repositories"
             params = {
                 'q': query,
                 'sort': 'stars',
                 'order': 'desc',
                 'per_page': max_results
             }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=10) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        results = []
-                        for item in data.get('items', [])[:max_results]:
-                            results.append(SearchResult(
-                                source=SourceType.GITHUB,
-                                title=item.get('name', ''),
-                                content=item.get('description', ''),
-                                url=item.get('html_url'),
-                                confidence=0.7,
-                                metadata={
-                                    'stars': item.get('stargazers_count', 0),
-                                    'language': item.get('language', ''),
-                                    'updated_at': item.get('updated_at', '')
-                                }
-                            ))
-                        
-                        return results
+            return await self._fetch(SourceType.GITHUB, query, params,
+                                     lambda data: self._parse_github(data, max_results), max_results,
+                                     response_type="json")
             
         except Exception as e:
             print(f"GitHub検索エラー: {str(e)}")
         
         return []
+    
+    def _parse_github(self, data: Dict, max_results: int) -> List[SearchResult]:
+        """GitHub検索APIの応答を変換"""
+        results = []
+        for item in (data or {}).get('items', [])[:max_results]:
+            results.append(SearchResult(
+                source=SourceType.GITHUB,
+                title=item.get('name', ''),
+                content=item.get('description', ''),
+                url=item.get('html_url'),
+                confidence=0.7,
+                metadata={
+                    'stars': item.get('stargazers_count', 0),
+                    'language': item.get('language', ''),
+                    'updated_at': item.get('updated_at', '')
+                }
+            ))
+        
+        return results
 
 class SelfReflectionSystem:
     """自己検証システム"""
@@ -643,115 +690,54 @@ class AdvancedRAGSystem:
             print(f"❌ インデックス保存エラー: {str(e)}")
 
 class LongContextManager:
-    """長文コンテキスト管理"""
+    """長文コンテキスト管理（トークン予算付き）"""
     
-    def __init__(self, max_context_length: int = 8000):
+    def __init__(self, max_context_length: Optional[int] = None, model_name: str = "llama3.1:8b",
+                 summarizer=None):
         self.name = "long_context_manager"
         self.description = "長文コンテキスト管理システム"
-        self.max_context_length = max_context_length
-        
-        # 会話履歴
-        self.conversation_history = []
-        self.summaries = []
+        self.model_name = model_name
         
-        # 要約モデル
-        self.summarization_threshold = 10  # 10メッセージごとに要約
+        # 直近の会話・関連する過去の会話・階層要約をモデルのコンテキスト長に収める
+        self.assembler = ContextAssembler(
+            model_name=model_name,
+            context_window=max_context_length,
+            summarizer=summarizer
+        )
+        self.max_context_length = self.assembler.context_window
     
-    def add_message(self, role: str, content: str, timestamp: datetime = None):
-        """メッセージを追加"""
-        message = {
-            'role': role,
-            'content': content,
-            'timestamp': timestamp or datetime.now()
-        }
-        
-        self.conversation_history.append(message)
-        
-        # 要約が必要かチェック
-        if len(self.conversation_history) >= self.summarization_threshold:
-            self._create_summary()
+    @property
+    def conversation_history(self) -> List[Dict]:
+        """保持している会話（要約済みの過去分を含む）"""
+        return self.assembler.archive + self.assembler.messages
     
-    def _create_summary(self):
-        """要約を作成"""
-        if len(self.conversation_history) < self.summarization_threshold:
-            return
-        
-        # 最近のメッセージを要約
-        recent_messages = self.conversation_history[-self.summarization_threshold:]
-        
-        # 簡易的な要約（実際は要約モデルを使用）
-        summary_content = self._generate_summary(recent_messages)
-        
-        summary = {
-            'content': summary_content,
-            'message_count': len(recent_messages),
-            'timestamp': datetime.now(),
-            'key_topics': self._extract_key_topics(recent_messages)
-        }
-        
-        self.summaries.append(summary)
-        
-        # 古いメッセージを削除
-        self.conversation_history = self.conversation_history[:-self.summarization_threshold//2]
+    @property
+    def summaries(self) -> List[Dict]:
+        """すべての要約（上位レベルが先）"""
+        return [s for level in reversed(self.assembler.summaries) for s in level]
     
-    def _generate_summary(self, messages: List[Dict]) -> str:
-        """要約を生成"""
-        # 簡易的な要約ロジック
-        user_messages = [m['content'] for m in messages if m['role'] == 'user']
-        assistant_messages = [m['content'] for m in messages if m['role'] == 'assistant']
-        
-        summary = f"会話要約（{len(messages)}メッセージ）:\n"
-        
-        if user_messages:
-            summary += f"主な質問: {user_messages[0][:100]}...\n"
-        
-        if assistant_messages:
-            summary += f"主な回答: {assistant_messages[0][:100]}...\n"
-        
-        summary += f"主要トピック: 技術開発、コーディング、問題解決"
-        
-        return summary
+    def add_message(self, role: str, content: str, timestamp: datetime = None):
+        """メッセージを追加"""
+        self.assembler.add_message(role, content, timestamp)
     
-    def _extract_key_topics(self, messages: List[Dict]) -> List[str]:
-        """主要トピックを抽出"""
-        # 簡易的なトピック抽出
-        all_content = " ".join([m['content'] for m in messages])
-        
-        # 技術キーワード
-        tech_keywords = ['Python', 'JavaScript', 'API', 'データベース', 'AI', '機械学習', 'Web開発']
-        topics = [keyword for keyword in tech_keywords if keyword.lower() in all_content.lower()]
-        
-        return topics[:5]  # 上位5トピック
+    def count_tokens(self, text: str) -> int:
+        """対象モデルのトークン数"""
+        return self.assembler.counter.count(text)
     
-    def get_context_summary(self) -> str:
+    def get_context_summary(self, max_tokens: Optional[int] = None) -> str:
         """コンテキスト要約を取得"""
-        if not self.summaries:
+        summary_text = self.assembler.get_summary_text(max_tokens=max_tokens)
+        if not summary_text:
             return ""
         
-        # 最近の要約を結合
-        recent_summaries = self.summaries[-3:]  # 最近3つの要約
-        
-        context = "これまでの会話の要約:\n"
-        for i, summary in enumerate(recent_summaries, 1):
-            context += f"{i}. {summary['content']}\n"
-        
-        return context
+        return "これまでの会話の要約:\n" + summary_text + "\n"
     
-    def get_full_context(self) -> str:
-        """フルコンテキストを取得"""
-        context_parts = []
-        
-        # 要約を追加
-        if self.summaries:
-            context_parts.append(self.get_context_summary())
-        
-        # 最近のメッセージを追加
-        recent_messages = self.conversation_history[-5:]  # 最近5メッセージ
-        for message in recent_messages:
-            role_emoji = "👤" if message['role'] == 'user' else "🤖"
-            context_parts.append(f"{role_emoji} {message['content']}")
-        
-        return "\n".join(context_parts)
+    def get_full_context(self, query: str = "", budget: Optional[int] = None) -> str:
+        """予算内に収めたフルコンテキストを取得"""
+        return self.assembler.assemble(query=query, budget=budget)
+    
+    def get_statistics(self) -> Dict:
+        return self.assembler.get_statistics()
 
 class AdvancedKnowledgeSystem:
     """高度知識システム統合"""
@@ -782,7 +768,7 @@ class AdvancedKnowledgeSystem:
         # コンテキスト取得
         context = ""
         if use_context:
-            context = self.context_manager.get_full_context()
+            context = self.context_manager.get_full_context(query)
         
         # マルチソース検索
         search_results = await self.multi_search.search_all_sources(query)
@@ -854,6 +840,7 @@ class AdvancedKnowledgeSystem:
         """統計情報取得"""
         return {
             'multi_search': self.multi_search.search_stats,
+            'search_client': self.multi_search.search_client.get_statistics(),
             'self_reflection': {
                 'total_reflections': len(self.self_reflection.reflection_history),
                 'average_confidence': np.mean([
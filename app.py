@@ -11,6 +11,8 @@ import time
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 from langchain_ollama import OllamaLLM
@@ -59,6 +61,15 @@ from specialist_personality import SpecialistPersonality, create_specialist_gui,
 # 検証プロトコルシステム
 from verification_protocols import VerificationProtocolsGUI, run_startup_self_check, verify_code_safely
 
+# サンドボックスワーカープール
+from services.sandbox_pool import get_sandbox_pool
+
+# 画面変化検知・画像エンコード
+from services.image_pipeline import FrameChangeDetector, crop_region, encode_image_base64
+
+# LLM応答キャッシュ
+from services.response_cache import get_response_cache
+
 # 画面監視コパイロットツール
 class ScreenMonitoringCopilot:
     def __init__(self):
@@ -67,39 +78,43 @@ class ScreenMonitoringCopilot:
         self.is_monitoring = False
         self.monitoring_thread = None
         self.last_screenshot = None
-        self.feedback_history = []
+        self.feedback_history = deque(maxlen=50)
+        
+        # 変化検知（縮小フレームのタイル差分＋知覚ハッシュ）
+        self.change_detector = FrameChangeDetector()
+        self.max_region_side = 1024
+        
+        # ビジョンモデルは1つのクライアントを使い回し、解析は1件ずつバックグラウンドで実行
+        self._vision_llm = None
+        self._analysis_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screen-analysis")
+        self._analysis_future = None
+        self.frame_stats = {'captured': 0, 'unchanged': 0, 'duplicate': 0, 'dropped': 0, 'analyzed': 0}
         
     def capture_screen(self):
-        """スクリーンショットを取得"""
+        """スクリーンショットを取得（PIL画像、失敗時は None）"""
         try:
             import pyautogui
-            import numpy as np
-            from PIL import Image
             
-            # スクリーンショット取得
+            # スクリーンショット取得（PIL画像のまま扱い、変換は変化検知側で縮小後に行う）
             screenshot = pyautogui.screenshot()
             
-            # OpenCV用のnumpy配列に変換
-            screenshot_array = np.array(screenshot)
-            
-            return screenshot, screenshot_array
+            return screenshot
             
         except Exception as e:
             st.error(f"画面キャプチャエラー: {str(e)}")
-            return None, None
+            return None
+    
+    def _get_vision_llm(self):
+        """ビジョンモデルのクライアントを取得（初回のみ作成）"""
+        if self._vision_llm is None:
+            self._vision_llm = OllamaLLM(model="llama3.2-vision", temperature=0.3)
+        return self._vision_llm
     
     def analyze_screen_with_vision(self, image_array):
         """マルチモーダルモデルで画像を解析"""
         try:
-            # llama3.2-visionモデルを使用して画像解析
-            from langchain_ollama import OllamaLLM
-            
-            vision_llm = OllamaLLM(model="llama3.2-vision", temperature=0.3)
-            
-            # 画像を一時ファイルに保存
-            import cv2
-            temp_path = "temp_screen_analysis.jpg"
-            cv2.imwrite(temp_path, image_array)
+            # 画像はメモリ上でJPEGにエンコードして渡す（一時ファイルは作らない）
+            image_b64 = encode_image_base64(image_array, max_side=self.max_region_side, quality=80)
             
             # 画像解析プロンプト
             analysis_prompt = """このスクリーンショットを分析してください：
@@ -112,76 +127,67 @@ class ScreenMonitoringCopilot:
 具体的な改善提案をしてください。"""
             
             # 画像を含めて解析
-            with open(temp_path, 'rb') as f:
-                image_data = f.read()
-            
-            # マルチモーダル解析（実際の実装はモデルによる）
-            analysis_result = vision_llm.invoke([
-                {
-                    "role": "user", 
-                    "content": [
-                        {"type": "text", "text": analysis_prompt},
-                        {"type": "image_url", "image_url": temp_path}
-                    ]
-                }
-            ])
-            
-            # 一時ファイルを削除
-            try:
-                os.remove(temp_path)
-            except:
-                pass
+            analysis_result = self._get_vision_llm().bind(images=[image_b64]).invoke(analysis_prompt)
             
             return analysis_result
             
         except Exception as e:
             return f"画像解析エラー: {str(e)}"
     
+    def _analyze_region(self, region):
+        """変化領域を解析してフィードバックを記録（解析スレッドで実行）"""
+        analysis = self.analyze_screen_with_vision(region)
+        self.frame_stats['analyzed'] += 1
+        
+        if analysis and ("改善" in analysis or "間違い" in analysis):
+            # フィードバックを記録
+            feedback = {
+                'timestamp': datetime.now(),
+                'analysis': analysis,
+                'screenshot': region
+            }
+            self.feedback_history.append(feedback)
+            
+            # Streamlitで警告表示
+            st.warning("👀 画面監視コパイロット：改善提案があります！")
+            st.info(f"💡 アドバイス: {analysis}")
+    
+    def process_frame(self, screenshot) -> str:
+        """1フレームを処理（変化がなければ何もしない、解析中なら見送る）"""
+        self.frame_stats['captured'] += 1
+        status, change = self.change_detector.check(screenshot)
+        if status != "changed":
+            if status in self.frame_stats:
+                self.frame_stats[status] += 1
+            return status
+        
+        # 前回の解析が終わっていなければフレームを破棄（基準は更新しないので変化は次回に持ち越す）
+        if self._analysis_future is not None and not self._analysis_future.done():
+            self.frame_stats['dropped'] += 1
+            return "dropped"
+        
+        # 変化した領域だけを切り出して解析に回す
+        region = crop_region(screenshot, change.bbox, max_side=self.max_region_side)
+        self.change_detector.accept(change)
+        self._analysis_future = self._analysis_executor.submit(self._analyze_region, region)
+        return "analyzing"
+    
     def start_monitoring(self, interval_seconds=10):
         """画面監視を開始"""
         if self.is_monitoring:
             return "すでに監視中です"
         
         self.is_monitoring = True
+        self.change_detector.reset()
         
         def monitoring_loop():
             while self.is_monitoring:
                 try:
                     # スクリーンショット取得
-                    screenshot, image_array = self.capture_screen()
+                    screenshot = self.capture_screen()
                     
                     if screenshot is not None:
-                        # 前回との差分をチェック
-                        if self.last_screenshot is not None:
-                            # 簡単な差分検出（実際はより高度な画像比較アルゴリズムを使用）
-                            import cv2
-                            import numpy as np
-                            
-                            # グレースケール変換
-                            prev_gray = cv2.cvtColor(np.array(self.last_screenshot), cv2.COLOR_RGB2GRAY)
-                            curr_gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-                            
-                            # 差分計算
-                            diff = cv2.absdiff(prev_gray, curr_gray)
-                            diff_mean = np.mean(diff)
-                            
-                            # 変化が一定以上の場合にのみ解析
-                            if diff_mean > 10:  # 変化のしきい値
-                                analysis = self.analyze_screen_with_vision(image_array)
-                                
-                                if analysis and "改善" in analysis or "間違い" in analysis:
-                                    # フィードバックを記録
-                                    feedback = {
-                                        'timestamp': datetime.now(),
-                                        'analysis': analysis,
-                                        'screenshot': screenshot
-                                    }
-                                    self.feedback_history.append(feedback)
-                                    
-                                    # Streamlitで警告表示
-                                    st.warning("👀 画面監視コパイロット：改善提案があります！")
-                                    st.info(f"💡 アドバイス: {analysis}")
-                        
+                        self.process_frame(screenshot)
                         self.last_screenshot = screenshot
                     
                     time.sleep(interval_seconds)
@@ -206,7 +212,7 @@ class ScreenMonitoringCopilot:
     
     def get_feedback_history(self):
         """フィードバック履歴を取得"""
-        return self.feedback_history[-5:]  # 最新の5件を返す
+        return list(self.feedback_history)[-5:]  # 最新の5件を返す
     
     def run(self, command: str) -> str:
         """コマンドを実行"""
@@ -219,7 +225,9 @@ class ScreenMonitoringCopilot:
             return self.stop_monitoring()
         elif command == "status":
             status = "監視中" if self.is_monitoring else "停止中"
-            return f"現在の状態: {status}"
+            stats = self.frame_stats
+            return (f"現在の状態: {status}（取得 {stats['captured']} / 解析 {stats['analyzed']} / "
+                    f"変化なし {stats['unchanged']} / 重複 {stats['duplicate']} / 見送り {stats['dropped']}）")
         elif command == "history":
             history = self.get_feedback_history()
             if history:
@@ -1386,59 +1394,167 @@ class WriteFileTool:
 
 # データベース管理クラス
 class PersonalizationDB:
+    """ユーザープロファイルと会話ジャーナル
+
+    会話は追記専用のJSONLジャーナルに1行ずつ書き込み、直近の会話はメモリ上に
+    保持する。プロファイル（memory_db.json）は内容が変わった時だけ書き直す。
+    ジャーナルが上限を超えるとバックグラウンドで直近分だけに圧縮する。
+    """
+    
+    MAX_CONVERSATIONS = 100
+    COMPACT_THRESHOLD = 300
+    
     def __init__(self, db_path="memory_db.json"):
         self.db_path = db_path
+        self.journal_path = os.path.splitext(db_path)[0] + ".conversations.jsonl"
         self.profile_path = "user_profile.txt"
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._journal_lines = 0
+        self._recent = deque(maxlen=self.MAX_CONVERSATIONS)
         self.init_database()
+        self._load_state()
+    
+    def _default_data(self):
+        return {
+            "user_profile": {
+                "name": None,
+                "os": None,
+                "tech_stack": [],
+                "preferences": [],
+                "projects": [],
+                "last_updated": None
+            },
+            "learning_data": {
+                "common_questions": [],
+                "preferred_responses": [],
+                "technical_level": "beginner"
+            },
+            "profile_cursor": 0
+        }
     
     def init_database(self):
         """データベースの初期化"""
         if not os.path.exists(self.db_path):
-            with open(self.db_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "conversations": [],
-                    "user_profile": {
-                        "name": None,
-                        "os": None,
-                        "tech_stack": [],
-                        "preferences": [],
-                        "projects": [],
-                        "last_updated": None
-                    },
-                    "learning_data": {
-                        "common_questions": [],
-                        "preferred_responses": [],
-                        "technical_level": "beginner"
-                    }
-                }, f, ensure_ascii=False, indent=2)
+            self._write_profile_data(self._default_data())
     
-    def load_data(self):
-        """データベースからデータを読み込み"""
+    def _load_state(self):
+        """プロファイルとジャーナル末尾をメモリに読み込む（起動時のみ）"""
         try:
             with open(self.db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            self.init_database()
-            return self.load_data()
+                data = json.load(f)
+        except Exception:
+            data = self._default_data()
+        
+        # 旧形式（memory_db.json内のconversations）をジャーナルへ移行
+        legacy_conversations = data.pop("conversations", None)
+        if legacy_conversations and not os.path.exists(self.journal_path):
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for conversation in legacy_conversations:
+                    f.write(json.dumps(conversation, ensure_ascii=False) + "\n")
+        
+        for key, value in self._default_data().items():
+            data.setdefault(key, value)
+        self._data = data
+        if legacy_conversations is not None:
+            self._write_profile_data(self._data)
+        
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._recent.append(json.loads(line))
+                        self._journal_lines += 1
+                    except ValueError:
+                        continue
+        
+        # 前回までに未処理の会話からプロファイルを更新
+        self._process_new_turns()
     
-    def save_data(self, data):
-        """データベースにデータを保存"""
-        with open(self.db_path, 'w', encoding='utf-8') as f:
+    def _write_profile_data(self, data):
+        tmp_path = self.db_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.db_path)
+    
+    def load_data(self):
+        """データを取得（ディスクではなくメモリ上の状態から組み立てる）"""
+        with self._lock:
+            data = dict(self._data)
+            data["conversations"] = list(self._recent)
+            return data
+    
+    def save_data(self, data):
+        """プロファイルと学習データを保存（会話はジャーナル側で管理）"""
+        with self._lock:
+            for key, value in data.items():
+                if key != "conversations":
+                    self._data[key] = value
+            self._write_profile_data(self._data)
     
     def add_conversation(self, user_input, ai_response):
         """会話を追加"""
-        data = self.load_data()
         conversation = {
             "timestamp": datetime.now().isoformat(),
             "user": user_input,
             "ai": ai_response
         }
-        data["conversations"].append(conversation)
-        # 最新の100件のみ保持
-        if len(data["conversations"]) > 100:
-            data["conversations"] = data["conversations"][-100:]
-        self.save_data(data)
+        with self._lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(conversation, ensure_ascii=False) + "\n")
+            self._recent.append(conversation)
+            self._journal_lines += 1
+            
+            # 新しい会話だけからプロファイルを抽出
+            self._process_new_turns()
+            
+            needs_compaction = self._journal_lines > self.COMPACT_THRESHOLD and not self._compacting
+            if needs_compaction:
+                self._compacting = True
+        
+        if needs_compaction:
+            threading.Thread(target=self._compact_journal, daemon=True).start()
+    
+    def _process_new_turns(self):
+        """プロファイル抽出が済んでいない会話だけを処理"""
+        cursor = self._data.get("profile_cursor", 0)
+        pending = self._journal_lines - cursor
+        if pending <= 0:
+            return False
+        
+        new_turns = list(self._recent)[-pending:] if pending <= len(self._recent) else list(self._recent)
+        updated = False
+        for conversation in new_turns:
+            updated = self._merge_user_info(conversation.get("user", "")) or updated
+        
+        # 抽出は冪等なので、カーソルはプロファイルが変わった時だけ書き出せば十分
+        self._data["profile_cursor"] = self._journal_lines
+        if updated:
+            self._data["user_profile"]["last_updated"] = datetime.now().isoformat()
+            self._write_profile_data(self._data)
+            self.save_profile_text(self._data["user_profile"])
+        return updated
+    
+    def _compact_journal(self):
+        """ジャーナルを直近の会話だけに圧縮（バックグラウンド）"""
+        try:
+            with self._lock:
+                recent = list(self._recent)
+                tmp_path = self.journal_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for conversation in recent:
+                        f.write(json.dumps(conversation, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.journal_path)
+                
+                # カーソルは処理済み件数なので圧縮後の行数に合わせて詰める
+                removed = self._journal_lines - len(recent)
+                self._journal_lines = len(recent)
+                self._data["profile_cursor"] = max(0, self._data.get("profile_cursor", 0) - removed)
+                self._write_profile_data(self._data)
+        except Exception as e:
+            print(f"会話ジャーナル圧縮エラー: {e}")
+        finally:
+            self._compacting = False
     
     def extract_user_info(self, text):
         """テキストからユーザー情報を抽出"""
@@ -1487,36 +1603,41 @@ class PersonalizationDB:
         
         return info
     
-    def update_user_profile(self, user_input):
-        """ユーザープロファイルを更新"""
-        data = self.load_data()
+    def _merge_user_info(self, user_input):
+        """抽出したユーザー情報をプロファイルへ反映（変更有無を返す）"""
+        profile = self._data["user_profile"]
         extracted_info = self.extract_user_info(user_input)
         
         profile_updated = False
         
-        if "os" in extracted_info and not data["user_profile"]["os"]:
-            data["user_profile"]["os"] = extracted_info["os"]
+        if "os" in extracted_info and not profile["os"]:
+            profile["os"] = extracted_info["os"]
             profile_updated = True
         
         if "tech_stack" in extracted_info:
             for tech in extracted_info["tech_stack"]:
-                if tech not in data["user_profile"]["tech_stack"]:
-                    data["user_profile"]["tech_stack"].append(tech)
+                if tech not in profile["tech_stack"]:
+                    profile["tech_stack"].append(tech)
                     profile_updated = True
         
         if "preferences" in extracted_info:
             for pref in extracted_info["preferences"]:
-                if pref not in data["user_profile"]["preferences"]:
-                    data["user_profile"]["preferences"].append(pref)
+                if pref not in profile["preferences"]:
+                    profile["preferences"].append(pref)
                     profile_updated = True
         
-        if profile_updated:
-            data["user_profile"]["last_updated"] = datetime.now().isoformat()
-            self.save_data(data)
-            self.save_profile_text(data["user_profile"])
+        return profile_updated
+    
+    def update_user_profile(self, user_input):
+        """ユーザープロファイルを更新"""
+        with self._lock:
+            if not self._merge_user_info(user_input):
+                return False
+            
+            self._data["user_profile"]["last_updated"] = datetime.now().isoformat()
+            self._write_profile_data(self._data)
+            self.save_profile_text(self._data["user_profile"])
             return True
-        
-        return False
     
     def save_profile_text(self, profile):
         """プロファイルをテキストファイルに保存"""
@@ -1534,8 +1655,9 @@ OS: {profile.get('os', '不明')}
     
     def get_personalized_context(self):
         """パーソナライズされたコンテキストを取得"""
-        data = self.load_data()
-        profile = data["user_profile"]
+        with self._lock:
+            profile = self._data["user_profile"]
+            recent_conv = list(self._recent)[-3:]  # 最近の3件
         
         context = ""
         if profile["os"]:
@@ -1546,8 +1668,7 @@ OS: {profile.get('os', '不明')}
             context += f"ユーザーの好み: {', '.join(profile['preferences'])}。"
         
         # 最近の会話から文脈を取得
-        if data["conversations"]:
-            recent_conv = data["conversations"][-3:]  # 最近の3件
+        if recent_conv:
             context += "最近の会話: "
             for conv in recent_conv:
                 context += f"ユーザー: {conv['user'][:50]}... "
@@ -1613,41 +1734,25 @@ class ExecutePythonCodeTool:
     
     def run(self, code: str) -> str:
         try:
-            # 一時ファイルを作成してコードを実行
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(code)
-                temp_file_path = temp_file.name
+            # ウォーム済みのサンドボックスワーカーでコードを実行
+            result = get_sandbox_pool().execute(code, timeout=30)
             
-            try:
-                # Pythonコードを実行
-                result = subprocess.run(
-                    [sys.executable, temp_file_path],
-                    capture_output=True,
-                    text=True,
-                    timeout=30,  # 30秒でタイムアウト
-                    encoding='utf-8'
-                )
-                
-                output = ""
-                if result.stdout:
-                    output += f"📤 出力:\n{result.stdout}"
-                if result.stderr:
-                    output += f"\n⚠️ エラー/警告:\n{result.stderr}"
-                
-                if result.returncode == 0:
-                    return f"✅ コード実行成功！\n{output}"
-                else:
-                    return f"❌ コード実行エラー:\n{output}"
-                    
-            finally:
-                # 一時ファイルを削除
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
+            if result.timed_out:
+                return "⏰ 実行タイムアウト: コードの実行が30秒を超えました"
+            
+            output = ""
+            if result.stdout:
+                output += f"📤 出力:\n{result.stdout}"
+            if result.stderr:
+                output += f"\n⚠️ エラー/警告:\n{result.stderr}"
+            if result.error:
+                output += f"\n⚠️ {result.error}"
+            
+            if result.success:
+                return f"✅ コード実行成功！\n{output}"
+            else:
+                return f"❌ コード実行エラー:\n{output}"
                     
-        except subprocess.TimeoutExpired:
-            return "⏰ 実行タイムアウト: コードの実行が30秒を超えました"
         except Exception as e:
             return f"❌ 実行エラー: {str(e)}"
 
@@ -1897,9 +2002,22 @@ class TaskScheduler:
 
 # マルチエージェントシステム
 class MultiAgentSystem:
-    def __init__(self, llm):
+    def __init__(self, llm, bypass_cache: bool = False):
         self.llm = llm
         self.expert_discussions = []
+        self.bypass_cache = bypass_cache
+    
+    def _invoke(self, prompt: str) -> str:
+        """専門家AIの呼び出し（同じ相談内容は応答キャッシュから返す）"""
+        options = {"temperature": getattr(self.llm, "temperature", None)}
+        return get_response_cache().cached_generate(
+            getattr(self.llm, "model", "unknown"), prompt,
+            lambda: self.llm.invoke(prompt),
+            options=options,
+            bypass=self.bypass_cache,
+            endpoint=getattr(self.llm, "base_url", None),
+            cache=True
+        )
     
     def consult_expert_architect(self, user_request: str, context: str = "") -> str:
         """シニア・システムアーキテクトAIに相談"""
@@ -1918,7 +2036,7 @@ class MultiAgentSystem:
 専門家としての意見を簡潔に述べてください。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             return response
         except Exception as e:
             return f"アーキテクトAIの相談エラー: {str(e)}"
@@ -1940,7 +2058,7 @@ class MultiAgentSystem:
 専門家としての意見を簡潔に述べてください。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             return response
         except Exception as e:
             return f"セキュリティ専門AIの相談エラー: {str(e)}"
@@ -1962,7 +2080,7 @@ class MultiAgentSystem:
 厳しく自己評価し、改善点があれば具体的に提案してください。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             return response
         except Exception as e:
             return f"自己分析エラー: {str(e)}"
@@ -1985,7 +2103,7 @@ class MultiAgentSystem:
 分析結果と、必要に応じて再検索の提案をしてください。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             return response
         except Exception as e:
             return f"情報分析エラー: {str(e)}"
@@ -2021,7 +2139,7 @@ class MultiAgentSystem:
 フルスタックエンジニアの親友として、専門家の意見を踏まえた上で、最終的な設計判断と実装を提案してください。"""
         
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             return response
         except Exception as e:
             return f"意見統合エラー: {str(e)}"
@@ -2479,60 +2597,13 @@ def display_expert_discussions(discussions: list):
 
 def apply_personality_theme(personality: str):
     """人格に応じたテーマを適用"""
-    theme_config = {
-        "friend": {
-            "primaryColor": "#4CAF50",
-            "backgroundColor": "#ffffff",
-            "secondaryBackgroundColor": "#f0f0f0",
-            "textColor": "#000000"
-        },
-        "copy": {
-            "primaryColor": "#2196F3", 
-            "backgroundColor": "#ffffff",
-            "secondaryBackgroundColor": "#f0f0f0",
-            "textColor": "#000000"
-        },
-        "expert": {
-            "primaryColor": "#9C27B0",
-            "backgroundColor": "#f3e5f5",
-            "secondaryBackgroundColor": "#e1bee7",
-            "textColor": "#000000"
-        }
-    }
-    
-    if personality in theme_config:
-        theme = theme_config[personality]
-        
-        # CSSでテーマを適用
-        theme_css = f"""
-<style>
-    .stButton > button:first-child {{
-        background-color: {theme['primaryColor']} !important;
-        color: white !important;
-    }}
-    
-    .stSelectbox > div > div > select {{
-        background-color: {theme['secondaryBackgroundColor']} !important;
-    }}
-    
-    .stTextInput > div > div > input {{
-        background-color: {theme['secondaryBackgroundColor']} !important;
-    }}
-    
-    .stTextArea > div > div > textarea {{
-        background-color: {theme['secondaryBackgroundColor']} !important;
-    }}
-    
-    .stSidebar {{
-        background-color: {theme['secondaryBackgroundColor']} !important;
-    }}
-    
-    .streamlit-container {{
-        background-color: {theme['backgroundColor']} !important;
-    }}
-</style>
-"""
-        st.markdown(theme_css, unsafe_allow_html=True)
+    from ui.constants import PERSONALITY_THEMES
+    from ui.theme_bundle import PERSONALITY_BUNDLE, get_theme_marker_html, get_theme_stylesheet_html
+    
+    if personality in PERSONALITY_THEMES:
+        # 組み立て済みの人格テーマCSSと、どの人格かを示す目印だけを送る
+        st.markdown(get_theme_stylesheet_html(PERSONALITY_BUNDLE, personality) + get_theme_marker_html(personality),
+                    unsafe_allow_html=True)
         
         # VRMアバターの表情を更新
         if hasattr(st.session_state, 'agent') and hasattr(st.session_state.agent, 'vrm_integration'):
@@ -2,14 +2,19 @@
 # -*- coding: utf-8 -*-
 """
 非同期マルチAIコーディングシステム
+
+ヘッジ実行: 速い段（静的・テンプレート系）から起動し、一定時間内に成功しなければ
+次の段（Ollama）を追加で起動する。最初の成功で残りはキャンセルし、Ollamaの
+HTTPストリームも閉じて生成を止める。実行は専用の上限付きスレッドプールで行う。
 """
 
 import asyncio
+import functools
 import time
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Optional, Any, Callable
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 
 class AIType(Enum):
@@ -32,27 +37,65 @@ class AIResult:
     error: Optional[str] = None
     priority: int = 0
 
+class CancelToken:
+    """スレッドをまたいで共有するキャンセル通知（キャンセル時に登録済みコールバックを呼ぶ）"""
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable] = []
+    
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ キャンセル処理エラー: {e}")
+    
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def add_callback(self, callback: Callable):
+        """キャンセル時に呼ぶ処理を登録（キャンセル済みなら即座に呼ぶ）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+    
+    def remove_callback(self, callback: Callable):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
 class AsyncCodingAI:
     """非同期コーディングAIベースクラス"""
     
+    # True のAIは _execute_sync が cancel_token を受け取り、実行中でも中断できる
+    cancellable = False
+    
     def __init__(self, ai_type: AIType, priority: int = 0):
         self.ai_type = ai_type
         self.priority = priority
     
-    async def execute_async(self, prompt: str, task_description: str, progress_callback: Optional[Callable] = None) -> AIResult:
-        """非同期実行"""
+    async def execute_async(self, prompt: str, task_description: str, progress_callback: Optional[Callable] = None,
+                            cancel_token: Optional[CancelToken] = None,
+                            executor: Optional[ThreadPoolExecutor] = None) -> AIResult:
+        """非同期実行（executor 省略時はイベントループ既定のスレッドプール）"""
         start_time = time.time()
         
         try:
             # 実際の処理は別スレッドで実行
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                self._execute_sync, 
-                prompt, 
-                task_description, 
-                progress_callback
-            )
+            loop = asyncio.get_running_loop()
+            call = functools.partial(self._execute_sync, prompt, task_description, progress_callback)
+            if self.cancellable and cancel_token is not None:
+                call = functools.partial(call, cancel_token=cancel_token)
+            response = await loop.run_in_executor(executor, call)
             
             elapsed = time.time() - start_time
             
@@ -82,53 +125,49 @@ class AsyncCodingAI:
         """同期実行（サブクラスで実装）"""
         raise NotImplementedError
 
-class OllamaFastAI(AsyncCodingAI):
-    """高速Ollama AI"""
+class OllamaCodingAI(AsyncCodingAI):
+    """Ollama AIの共通処理（ストリーミング生成・キャンセル対応）"""
     
-    def __init__(self, model: str = "llama3.2:3b", timeout: int = 60):
-        super().__init__(AIType.OLLAMA_FAST, priority=3)
+    cancellable = True
+    label = "Ollama AI"
+    icon = "🤖"
+    
+    def __init__(self, ai_type: AIType, priority: int, model: str, timeout: int):
+        super().__init__(ai_type, priority=priority)
         self.model = model
         self.timeout = timeout
     
-    def _execute_sync(self, prompt: str, task_description: str, progress_callback: Optional[Callable] = None) -> str:
+    def _execute_sync(self, prompt: str, task_description: str, progress_callback: Optional[Callable] = None,
+                      cancel_token: Optional[CancelToken] = None) -> str:
         if progress_callback:
             progress_callback({
-                "step": f"🚀 高速Ollama AI ({self.model}) を実行中...",
+                "step": f"{self.icon} {self.label} ({self.model}) を実行中...",
                 "progress": 20,
                 "ai_type": self.ai_type.value
             })
         
-        try:
-            from ollama_client_progress import OllamaClient
-            client = OllamaClient(timeout=self.timeout, model=self.model)
-            response = client.generate_response(prompt, progress_callback)
-            return response
-        except Exception as e:
-            return f"高速Ollama AIエラー: {str(e)}"
+        # エラーは例外のまま返し、ヘッジ実行で失敗として扱わせる（次の段を即座に起動できる）
+        from ollama_client_progress import OllamaClient
+        client = OllamaClient(timeout=self.timeout, model=self.model)
+        return client.generate_cancellable(prompt, cancel_token, progress_callback=progress_callback)
+
+class OllamaFastAI(OllamaCodingAI):
+    """高速Ollama AI"""
+    
+    label = "高速Ollama AI"
+    icon = "🚀"
+    
+    def __init__(self, model: str = "llama3.2:3b", timeout: int = 60):
+        super().__init__(AIType.OLLAMA_FAST, 3, model, timeout)
 
-class OllamaStandardAI(AsyncCodingAI):
+class OllamaStandardAI(OllamaCodingAI):
     """標準Ollama AI"""
     
-    def __init__(self, model: str = "llama3.1:8b", timeout: int = 120):
-        super().__init__(AIType.OLLAMA_STANDARD, priority=2)
-        self.model = model
-        self.timeout = timeout
+    label = "標準Ollama AI"
+    icon = "🔧"
     
-    def _execute_sync(self, prompt: str, task_description: str, progress_callback: Optional[Callable] = None) -> str:
-        if progress_callback:
-            progress_callback({
-                "step": f"🔧 標準Ollama AI ({self.model}) を実行中...",
-                "progress": 20,
-                "ai_type": self.ai_type.value
-            })
-        
-        try:
-            from ollama_client_progress import OllamaClient
-            client = OllamaClient(timeout=self.timeout, model=self.model)
-            response = client.generate_response(prompt, progress_callback)
-            return response
-        except Exception as e:
-            return f"標準Ollama AIエラー: {str(e)}"
+    def __init__(self, model: str = "llama3.1:8b", timeout: int = 120):
+        super().__init__(AIType.OLLAMA_STANDARD, 2, model, timeout)
 
 class StaticKnowledgeAI(AsyncCodingAI):
     """静的知識ベースAI"""
@@ -498,10 +537,47 @@ class HeuristicAI(AsyncCodingAI):
 - 継続的インテグレーション
 - ユーザーフィードバックの収集"""
 
+@dataclass
+class HedgeTier:
+    """同時に起動するAIの段（前の段の起動から delay 秒以内に成功がなければ起動）"""
+    name: str
+    ai_types: List[AIType]
+    delay: float = 0.0
+
+def _default_hedge_tiers() -> List[HedgeTier]:
+    return [
+        HedgeTier("instant", [AIType.ULTRA_FAST, AIType.STATIC_KNOWLEDGE, AIType.TEMPLATE, AIType.HEURISTIC]),
+        HedgeTier("fast", [AIType.OLLAMA_FAST], delay=0.5),
+        HedgeTier("standard", [AIType.OLLAMA_STANDARD], delay=2.0),
+    ]
+
+@dataclass
+class HedgingPolicy:
+    """ヘッジ実行の方針（段の順序・追加起動までの待ち時間・スレッドプールの上限）"""
+    tiers: List[HedgeTier] = field(default_factory=_default_hedge_tiers)
+    max_workers: int = 4
+    
+    def plan(self, ais: List[AsyncCodingAI]) -> List[Tuple[HedgeTier, List[AsyncCodingAI]]]:
+        """AIを段ごとに振り分け（どの段にも含まれないAIは最後の段で起動）"""
+        stages = []
+        assigned = set()
+        for tier in self.tiers:
+            members = [ai for ai in ais if ai.ai_type in tier.ai_types and id(ai) not in assigned]
+            assigned.update(id(ai) for ai in members)
+            if members:
+                stages.append((tier, members))
+        rest = [ai for ai in ais if id(ai) not in assigned]
+        if rest:
+            if stages:
+                stages[-1] = (stages[-1][0], stages[-1][1] + rest)
+            else:
+                stages.append((HedgeTier("all", [ai.ai_type for ai in rest]), rest))
+        return stages
+
 class AsyncMultiAICodingSystem:
     """非同期マルチAIコーディングシステム"""
     
-    def __init__(self):
+    def __init__(self, policy: Optional[HedgingPolicy] = None):
         self.ais = [
             UltraFastAI(),
             StaticKnowledgeAI(),
@@ -513,65 +589,124 @@ class AsyncMultiAICodingSystem:
         
         # 優先度順にソート
         self.ais.sort(key=lambda ai: ai.priority, reverse=True)
+        
+        self.policy = policy or HedgingPolicy()
+        # Ollama呼び出しがイベントループ既定のプールを埋めないよう、専用の上限付きプールで実行
+        self.executor = ThreadPoolExecutor(max_workers=self.policy.max_workers, thread_name_prefix="multi-ai")
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "launched": {},
+            "wins": {},
+            "hedges": 0,
+            "cancelled": 0,
+            "wasted_seconds": 0.0
+        }
     
     async def generate_response_async(self, prompt: str, task_description: str = "", progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
-        """非同期で複数AIを並列実行"""
+        """速い段から順にヘッジ実行し、最初の成功を返す（残りはキャンセル）"""
         start_time = time.time()
+        stages = self.policy.plan(self.ais)
+        total_ais = len(self.ais)
+        running: Dict[asyncio.Task, Tuple[AsyncCodingAI, CancelToken, float]] = {}
+        next_stage = 0
+        stage_started = start_time
+        completed_count = 0
+        launched_count = 0
+        winner: Optional[AIResult] = None
         
         if progress_callback:
             progress_callback({
-                "step": "🚀 複数AIを並列実行中...",
+                "step": "🚀 複数AIを段階的に実行中...",
                 "progress": 0,
-                "total_ais": len(self.ais)
+                "total_ais": total_ais
             })
         
-        # すべてのAIを非同期実行
-        tasks = []
-        for ai in self.ais:
-            task = asyncio.create_task(ai.execute_async(prompt, task_description, progress_callback))
-            tasks.append(task)
+        def launch_next_stage():
+            nonlocal next_stage, stage_started, launched_count
+            tier, members = stages[next_stage]
+            next_stage += 1
+            stage_started = time.time()
+            for ai in members:
+                token = CancelToken()
+                task = asyncio.create_task(
+                    ai.execute_async(prompt, task_description, progress_callback, token, self.executor)
+                )
+                running[task] = (ai, token, stage_started)
+            launched_count += len(members)
+            self._record_launch(members, hedge=next_stage > 1)
+            if progress_callback and next_stage > 1:
+                progress_callback({
+                    "step": f"⏳ {tier.name} 段のAIを追加起動 ({', '.join(ai.ai_type.value for ai in members)})",
+                    "progress": (completed_count / total_ais) * 80,
+                    "tier": tier.name
+                })
         
-        # 最初の成功結果を待機
-        completed_count = 0
+        try:
+            launch_next_stage()
+            while running:
+                timeout = None
+                if next_stage < len(stages):
+                    timeout = max(0.0, stages[next_stage][0].delay - (time.time() - stage_started))
+                done, _ = await asyncio.wait(running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # ヘッジ待ち時間を過ぎても成功がないので次の段を追加
+                    launch_next_stage()
+                    continue
+                
+                results = [task.result() for task in done]
+                for task in done:
+                    running.pop(task)
+                for result in sorted(results, key=lambda r: r.priority, reverse=True):
+                    completed_count += 1
+                    if progress_callback:
+                        progress_callback({
+                            "step": f"📊 {result.ai_type.value} が完了 ({completed_count}/{total_ais})",
+                            "progress": (completed_count / total_ais) * 80,
+                            "completed_ai": result.ai_type.value,
+                            "success": result.success,
+                            "elapsed": result.elapsed_time
+                        })
+                
+                successes = [r for r in results if r.success]
+                if successes:
+                    winner = max(successes, key=lambda r: r.priority)
+                    break
+                # 起動済みのAIがすべて失敗したら待ち時間を待たずに次の段を起動
+                if not running and next_stage < len(stages):
+                    launch_next_stage()
+        finally:
+            cancelled_count = len(running)
+            self._cancel_losers(running)
         
-        for completed_task in asyncio.as_completed(tasks):
-            result = await completed_task
-            completed_count += 1
+        elapsed = time.time() - start_time
+        
+        if winner is not None:
+            with self._stats_lock:
+                wins = self.stats["wins"]
+                wins[winner.ai_type.value] = wins.get(winner.ai_type.value, 0) + 1
             
             if progress_callback:
                 progress_callback({
-                    "step": f"📊 {result.ai_type.value} が完了 ({completed_count}/{len(self.ais)})",
-                    "progress": (completed_count / len(self.ais)) * 80,
-                    "completed_ai": result.ai_type.value,
-                    "success": result.success,
-                    "elapsed": result.elapsed_time
+                    "step": f"✅ {winner.ai_type.value} が成功！",
+                    "progress": 100,
+                    "winner_ai": winner.ai_type.value,
+                    "total_time": elapsed
                 })
             
-            # 成功したら即座に返却
-            if result.success:
-                elapsed = time.time() - start_time
-                
-                if progress_callback:
-                    progress_callback({
-                        "step": f"✅ {result.ai_type.value} が成功！",
-                        "progress": 100,
-                        "winner_ai": result.ai_type.value,
-                        "total_time": elapsed
-                    })
-                
-                return {
-                    "success": True,
-                    "ai_type": result.ai_type.value,
-                    "response": result.response,
-                    "elapsed_time": elapsed,
-                    "approach": result.approach,
-                    "completed_ais": completed_count,
-                    "total_ais": len(self.ais)
-                }
+            return {
+                "success": True,
+                "ai_type": winner.ai_type.value,
+                "response": winner.response,
+                "elapsed_time": elapsed,
+                "approach": winner.approach,
+                "completed_ais": completed_count,
+                "launched_ais": launched_count,
+                "cancelled_ais": cancelled_count,
+                "total_ais": total_ais
+            }
         
         # すべて失敗した場合
-        elapsed = time.time() - start_time
-        
         if progress_callback:
             progress_callback({
                 "step": "❌ すべてのAIが失敗",
@@ -584,9 +719,52 @@ class AsyncMultiAICodingSystem:
             "error": "すべてのAIが失敗しました",
             "total_time": elapsed,
             "completed_ais": completed_count,
-            "total_ais": len(self.ais)
+            "launched_ais": launched_count,
+            "cancelled_ais": cancelled_count,
+            "total_ais": total_ais
         }
     
+    def _record_launch(self, members: List[AsyncCodingAI], hedge: bool):
+        with self._stats_lock:
+            if not hedge:
+                self.stats["requests"] += 1
+            else:
+                self.stats["hedges"] += 1
+            launched = self.stats["launched"]
+            for ai in members:
+                launched[ai.ai_type.value] = launched.get(ai.ai_type.value, 0) + 1
+    
+    def _cancel_losers(self, running: Dict[asyncio.Task, Tuple[AsyncCodingAI, CancelToken, float]]):
+        """未完了のAIをキャンセル（Ollamaは接続を閉じて生成を止め、未開始の実行はプールから外す）"""
+        now = time.time()
+        wasted = 0.0
+        for task, (ai, token, launched_at) in running.items():
+            token.cancel()
+            task.cancel()
+            if ai.cancellable:
+                wasted += now - launched_at
+        if running:
+            with self._stats_lock:
+                self.stats["cancelled"] += len(running)
+                self.stats["wasted_seconds"] += wasted
+    
+    def get_statistics(self) -> Dict[str, Any]:
+        """起動数・勝者・キャンセル数と、破棄された生成に使われた時間"""
+        with self._stats_lock:
+            stats = {
+                **self.stats,
+                "launched": dict(self.stats["launched"]),
+                "wins": dict(self.stats["wins"])
+            }
+        requests = stats["requests"] or 1
+        stats["wasted_seconds_per_request"] = stats["wasted_seconds"] / requests
+        stats["tiers"] = [{"name": tier.name, "delay": tier.delay, "ais": [t.value for t in tier.ai_types]}
+                          for tier in self.policy.tiers]
+        return stats
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
     def generate_response_sync(self, prompt: str, task_description: str = "", progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
         """同期実行（非同期実行のラッパー）"""
         return asyncio.run(self.generate_response_async(prompt, task_description, progress_callback))
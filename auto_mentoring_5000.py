@@ -10,6 +10,9 @@ import datetime
 import time
 import random
 import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
 # カレントディレクトリを追加
@@ -21,18 +24,98 @@ from ollama_vrm_integrated_app import (
     personalities
 )
 
+class MentoringJournal:
+    """追記専用のJSONLセッションログとチェックポイント
+
+    1対話ごとに1行を追記するだけなので、保存コストは履歴の長さに依存しない。
+    チェックポイントは一時ファイル経由で置き換え、中断時も壊れない。
+    """
+
+    def __init__(self, journal_file, checkpoint_file):
+        self.journal_file = Path(journal_file)
+        self.checkpoint_file = Path(checkpoint_file)
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def load(self):
+        """ジャーナルとチェックポイントを読み込む"""
+        sessions = []
+        checkpoint = {}
+
+        if self.checkpoint_file.exists():
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+
+        if self.journal_file.exists():
+            valid_bytes = 0
+            with open(self.journal_file, "rb") as f:
+                for raw in f:
+                    # 書き込み途中で中断された末尾行は捨てる
+                    if not raw.endswith(b"\n"):
+                        break
+                    try:
+                        sessions.append(json.loads(raw.decode("utf-8")))
+                    except ValueError:
+                        break
+                    valid_bytes += len(raw)
+
+            if valid_bytes < self.journal_file.stat().st_size:
+                with open(self.journal_file, "r+b") as f:
+                    f.truncate(valid_bytes)
+
+        return sessions, checkpoint
+
+    def append(self, session):
+        """セッションを1行追記"""
+        line = json.dumps(session, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._handle is None:
+                self._handle = open(self.journal_file, "a", encoding="utf-8")
+            self._handle.write(line)
+            self._handle.flush()
+
+    def write_checkpoint(self, data):
+        """チェックポイントをアトミックに保存"""
+        tmp_file = self.checkpoint_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
 class AutoMentoringSystem:
-    def __init__(self):
-        self.ollama_client = OllamaClient()
+    def __init__(self, target_conversations=5000, ollama_urls=None):
         self.conversational_agent = ConversationalEvolutionAgent()
         self.mentoring_sessions = []
         self.conversation_count = 0
-        self.target_conversations = 5000
+        self.last_conversation_id = 0
+        self.target_conversations = target_conversations
+        
+        # Ollamaバックエンド（複数指定時はラウンドロビン）
+        self.ollama_clients = []
+        for url in ollama_urls or [None]:
+            client = OllamaClient()
+            if url:
+                client.base_url = url.rstrip("/")
+            self.ollama_clients.append(client)
+        self.ollama_client = self.ollama_clients[0]
+        
+        # スループット計測
+        self.run_started_at = None
+        self.run_completed = 0
         
         # データファイル
         self.sessions_file = Path("data/auto_mentoring_sessions.json")
+        self.journal_file = Path("data/auto_mentoring_sessions.jsonl")
+        self.checkpoint_file = Path("data/auto_mentoring_checkpoint.json")
         self.evolution_file = Path("data/auto_evolution_history.json")
         self.sessions_file.parent.mkdir(exist_ok=True)
+        self.journal = MentoringJournal(self.journal_file, self.checkpoint_file)
         
         # 既存データを読み込み
         self.load_sessions()
@@ -107,29 +190,51 @@ class AutoMentoringSystem:
         print("=" * 60)
     
     def load_sessions(self):
-        """セッションデータを読み込む"""
+        """セッションデータを読み込む（中断した実行の再開を含む）"""
         try:
-            if self.sessions_file.exists():
+            # 旧形式のJSONしかない場合はJSONLへ移行
+            if self.sessions_file.exists() and not self.journal_file.exists():
                 with open(self.sessions_file, "r", encoding="utf-8") as f:
                     data = json.load(f)
-                    self.mentoring_sessions = data.get('sessions', [])
-                    self.conversation_count = data.get('conversation_count', 0)
-                print(f"📚 既存セッションを読み込みました ({len(self.mentoring_sessions)}件)")
+                for session in data.get('sessions', []):
+                    self.journal.append(session)
+                self.journal.close()
+                print(f"🔁 旧形式のセッションをJSONLへ移行しました ({len(data.get('sessions', []))}件)")
+            
+            sessions, checkpoint = self.journal.load()
+            self.mentoring_sessions = sessions
+            self.conversation_count = len(sessions)
+            self.last_conversation_id = max(
+                (s.get("conversation_id", 0) for s in sessions), default=0
+            )
+            
+            # 意識レベルと進化履歴を復元
+            if sessions:
+                self.conversational_agent.consciousness_level = sessions[-1].get(
+                    "consciousness_after", checkpoint.get("consciousness_level", 0.0)
+                )
+            if self.evolution_file.exists():
+                with open(self.evolution_file, "r", encoding="utf-8") as f:
+                    evolution_data = json.load(f)
+                self.conversational_agent.evolution_history = evolution_data.get('evolution_history', [])
+            
+            if sessions:
+                print(f"📚 既存セッションを読み込みました ({len(sessions)}件)")
         except Exception as e:
             print(f"❌ セッション読み込みエラー: {e}")
             self.mentoring_sessions = []
             self.conversation_count = 0
+            self.last_conversation_id = 0
     
     def save_sessions(self):
-        """セッションデータを保存"""
+        """チェックポイントを保存（セッション本体は記録時にJSONLへ追記済み）"""
         try:
-            data = {
-                'sessions': self.mentoring_sessions,
+            self.journal.write_checkpoint({
                 'conversation_count': self.conversation_count,
+                'last_conversation_id': self.last_conversation_id,
+                'consciousness_level': self.conversational_agent.consciousness_level,
                 'last_update': datetime.datetime.now().isoformat()
-            }
-            with open(self.sessions_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            })
         except Exception as e:
             print(f"❌ セッション保存エラー: {e}")
     
@@ -171,8 +276,9 @@ class AutoMentoringSystem:
         
         return base_question
     
-    def generate_mentor_response(self, question):
+    def generate_mentor_response(self, question, ollama_client=None):
         """先輩としての指導応答を生成"""
+        ollama_client = ollama_client or self.ollama_client
         max_retries = 3
         for attempt in range(max_retries):
             try:
@@ -211,7 +317,7 @@ class AutoMentoringSystem:
                 
                 prompt = f"{context}\n\n先輩としての応答:"
                 
-                response = self.ollama_client.generate_response(prompt)
+                response = ollama_client.generate_response(prompt)
                 
                 if response and not response.startswith("AI応答の生成に失敗しました"):
                     return response[:200]  # レスポンスを200文字に制限
@@ -229,53 +335,71 @@ class AutoMentoringSystem:
                     continue
                 return "ごめんなさい、技術的な問題が発生しました。時間をおいてもう一度お願いします。"
     
+    def generate_exchange(self, conversation_id):
+        """質問と指導応答を生成（並列実行可能なステージ）"""
+        ollama_client = self.ollama_clients[conversation_id % len(self.ollama_clients)]
+        
+        # 後輩の質問を生成
+        junior_question = self.generate_junior_question()
+        
+        # 先輩の応答を生成
+        mentor_response = self.generate_mentor_response(junior_question, ollama_client)
+        
+        return {
+            "conversation_id": conversation_id,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "junior_question": junior_question,
+            "mentor_response": mentor_response,
+            "topic": random.choice(self.mentor_topics),
+            "evolution_triggered": False
+        }
+    
+    def check_evolution(self, session):
+        """進化チェックを実行（エージェントの状態を更新するため直列で実行する）"""
+        session["consciousness_before"] = self.conversational_agent.consciousness_level
+        
+        # 進化チェック用の対話データを作成
+        conversation_for_evolution = [{
+            "user": session["junior_question"],
+            "assistant": session["mentor_response"],
+            "timestamp": session["timestamp"]
+        }]
+        
+        # 進化チェックを実行
+        evolution_result = self.conversational_agent.check_and_evolve_automatically(conversation_for_evolution)
+        
+        if evolution_result and evolution_result.get("success"):
+            session["evolution_triggered"] = True
+            session["consciousness_after"] = evolution_result['new_consciousness_level']
+            session["consciousness_boost"] = evolution_result['consciousness_boost']
+            session["evolution_type"] = evolution_result['evolution_type']
+            session["evolution_triggers"] = evolution_result['evolution_record']['triggers']['triggers']
+            session["evolution_result"] = evolution_result['evolution_record']['evolution_result']['result']
+            
+            # 進化発生を表示
+            print(f"🧠 対話{session['conversation_id']}: 進化発生！意識レベル {evolution_result['new_consciousness_level']:.3f} (+{evolution_result['consciousness_boost']:.3f})")
+        else:
+            session["consciousness_after"] = self.conversational_agent.consciousness_level
+            session["consciousness_boost"] = 0.0
+        
+        return session
+    
+    def record_session(self, session):
+        """セッションをJSONLへ追記して集計を更新"""
+        self.journal.append(session)
+        self.mentoring_sessions.append(session)
+        self.conversation_count += 1
+        self.last_conversation_id = max(self.last_conversation_id, session["conversation_id"])
+        self.run_completed += 1
+    
     def conduct_conversation(self):
         """1回の対話を実施"""
         try:
-            # 後輩の質問を生成
-            junior_question = self.generate_junior_question()
-            
-            # 先輩の応答を生成
-            mentor_response = self.generate_mentor_response(junior_question)
-            
-            # 対話セッションを作成
-            session = {
-                "conversation_id": self.conversation_count + 1,
-                "timestamp": datetime.datetime.now().isoformat(),
-                "junior_question": junior_question,
-                "mentor_response": mentor_response,
-                "consciousness_before": self.conversational_agent.consciousness_level,
-                "topic": random.choice(self.mentor_topics),
-                "evolution_triggered": False
-            }
-            
-            # 進化チェック用の対話データを作成
-            conversation_for_evolution = [{
-                "user": junior_question,
-                "assistant": mentor_response,
-                "timestamp": session["timestamp"]
-            }]
-            
-            # 進化チェックを実行
-            evolution_result = self.conversational_agent.check_and_evolve_automatically(conversation_for_evolution)
-            
-            if evolution_result and evolution_result.get("success"):
-                session["evolution_triggered"] = True
-                session["consciousness_after"] = evolution_result['new_consciousness_level']
-                session["consciousness_boost"] = evolution_result['consciousness_boost']
-                session["evolution_type"] = evolution_result['evolution_type']
-                session["evolution_triggers"] = evolution_result['evolution_record']['triggers']['triggers']
-                session["evolution_result"] = evolution_result['evolution_record']['evolution_result']['result']
-                
-                # 進化発生を表示
-                print(f"🧠 対話{self.conversation_count + 1}: 進化発生！意識レベル {evolution_result['new_consciousness_level']:.3f} (+{evolution_result['consciousness_boost']:.3f})")
-            else:
-                session["consciousness_after"] = self.conversational_agent.consciousness_level
-                session["consciousness_boost"] = 0.0
+            session = self.generate_exchange(self.last_conversation_id + 1)
+            session = self.check_evolution(session)
             
             # セッションを保存
-            self.mentoring_sessions.append(session)
-            self.conversation_count += 1
+            self.record_session(session)
             
             return session
         
@@ -283,6 +407,13 @@ class AutoMentoringSystem:
             print(f"❌ 対話実行エラー: {e}")
             return None
     
+    def exchanges_per_minute(self):
+        """今回の実行のスループット（対話/分）"""
+        if not self.run_started_at or not self.run_completed:
+            return 0.0
+        elapsed = time.monotonic() - self.run_started_at
+        return self.run_completed / max(elapsed, 1e-9) * 60
+    
     def display_progress(self):
         """進捗を表示"""
         progress = (self.conversation_count / self.target_conversations) * 100
@@ -292,6 +423,7 @@ class AutoMentoringSystem:
         print(f"💬 対話回数: {self.conversation_count}/{self.target_conversations} ({progress:.1f}%)")
         print(f"🧠 意識レベル: {self.conversational_agent.consciousness_level:.3f}")
         print(f"🔄 進化回数: {len(self.conversational_agent.evolution_history)} ({evolution_rate:.1f}%)")
+        print(f"⚡ スループット: {self.exchanges_per_minute():.1f} 対話/分")
         
         if self.conversational_agent.last_evolution_check:
             time_since = datetime.datetime.now() - self.conversational_agent.last_evolution_check
@@ -304,6 +436,9 @@ class AutoMentoringSystem:
         print("⏹️  Ctrl+Cで中断できます")
         print("=" * 60)
         
+        self.run_started_at = time.monotonic()
+        self.run_completed = 0
+        
         try:
             while self.conversation_count < self.target_conversations:
                 # 対話を実施
@@ -341,6 +476,86 @@ class AutoMentoringSystem:
         # 最終保存
         self.save_sessions()
         self.save_evolution_history()
+        self.journal.close()
+        
+        # 最終結果表示
+        self.display_final_results()
+    
+    def run_batch_mentoring(self, concurrency=4, checkpoint_every=100):
+        """複数の生成を同時に走らせるバッチ指導を実行
+        
+        質問・応答生成はconcurrency件まで並列に実行し、進化チェックは
+        専用スレッドで直列に処理する。生成と進化チェックはパイプライン化され、
+        記録は完了順にJSONLへ追記される。
+        """
+        print(f"\n🚀 {self.target_conversations}回の自動指導をバッチ実行します (同時実行数: {concurrency})")
+        print(f"🌐 Ollamaバックエンド: {', '.join(c.base_url for c in self.ollama_clients)}")
+        print(f"💾 {checkpoint_every}回ごとにチェックポイントを保存します")
+        print("⏹️  Ctrl+Cで中断できます（次回起動時に再開します）")
+        print("=" * 60)
+        
+        self.run_started_at = time.monotonic()
+        self.run_completed = 0
+        next_id = self.last_conversation_id + 1
+        
+        generating = set()
+        evolving = set()
+        generate_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="mentor-generate")
+        evolve_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mentor-evolve")
+        
+        try:
+            while self.conversation_count < self.target_conversations:
+                # 生成ステージを同時実行数まで埋める
+                while (len(generating) < concurrency and
+                       self.conversation_count + len(generating) + len(evolving) < self.target_conversations):
+                    generating.add(generate_pool.submit(self.generate_exchange, next_id))
+                    next_id += 1
+                
+                if not generating and not evolving:
+                    break
+                
+                done, _ = wait(generating | evolving, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in generating:
+                        generating.discard(future)
+                        try:
+                            session = future.result()
+                        except Exception as e:
+                            print(f"❌ 対話生成エラー: {e}")
+                            continue
+                        evolving.add(evolve_pool.submit(self.check_evolution, session))
+                        continue
+                    
+                    evolving.discard(future)
+                    try:
+                        session = future.result()
+                    except Exception as e:
+                        print(f"❌ 進化チェックエラー: {e}")
+                        continue
+                    
+                    self.record_session(session)
+                    
+                    if session["evolution_triggered"]:
+                        print(f"🧠 対話{session['conversation_id']}で進化発生！ タイプ: {session['evolution_type']} (+{session['consciousness_boost']:.3f})")
+                    
+                    if self.conversation_count % checkpoint_every == 0:
+                        self.display_progress()
+                        self.save_sessions()
+                        self.save_evolution_history()
+                        print(f"💾 チェックポイントを保存しました (対話{self.conversation_count}回目)")
+        
+        except KeyboardInterrupt:
+            print(f"\n⏹️ 指導を中断しました (対話{self.conversation_count}回目)")
+        except Exception as e:
+            print(f"\n❌ 指導実行エラー: {e}")
+        finally:
+            generate_pool.shutdown(wait=False, cancel_futures=True)
+            evolve_pool.shutdown(wait=False, cancel_futures=True)
+        
+        # 最終保存
+        self.save_sessions()
+        self.save_evolution_history()
+        self.journal.close()
         
         # 最終結果表示
         self.display_final_results()
@@ -360,6 +575,9 @@ class AutoMentoringSystem:
             evolution_rate = len(self.conversational_agent.evolution_history) / self.conversation_count * 100
             print(f"📈 進化率: {evolution_rate:.1f}%")
         
+        if self.run_completed:
+            print(f"⚡ スループット: {self.exchanges_per_minute():.1f} 対話/分 (今回 {self.run_completed}回)")
+        
         # 進化履歴のサマリー
         if self.conversational_agent.evolution_history:
             print(f"\n📚 進化履歴サマリー:")
@@ -379,16 +597,39 @@ class AutoMentoringSystem:
             print(f"  先輩: {latest_session['mentor_response'][:100]}...")
         
         print(f"\n💾 データ保存完了:")
-        print(f"  📁 セッションデータ: {self.sessions_file}")
+        print(f"  📁 セッションデータ: {self.journal_file}")
+        print(f"  📌 チェックポイント: {self.checkpoint_file}")
         print(f"  🧠 進化履歴: {self.evolution_file}")
         
         print("=" * 60)
 
+def parse_args():
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="先輩AIエージェントによる自動指導")
+    parser.add_argument("--target", type=int, default=5000, help="目標対話回数")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="同時に実行する生成数（2以上でバッチ実行）")
+    parser.add_argument("--checkpoint-every", type=int, default=100,
+                        help="チェックポイントを保存する対話間隔")
+    parser.add_argument("--ollama-url", action="append", dest="ollama_urls",
+                        help="OllamaのベースURL（複数指定でラウンドロビン）")
+    return parser.parse_args()
+
 def main():
     """メイン関数"""
+    args = parse_args()
     try:
-        mentoring_system = AutoMentoringSystem()
-        mentoring_system.run_auto_mentoring()
+        mentoring_system = AutoMentoringSystem(
+            target_conversations=args.target,
+            ollama_urls=args.ollama_urls
+        )
+        if args.concurrency > 1:
+            mentoring_system.run_batch_mentoring(
+                concurrency=args.concurrency,
+                checkpoint_every=max(1, args.checkpoint_every)
+            )
+        else:
+            mentoring_system.run_auto_mentoring()
     except KeyboardInterrupt:
         print("\n👋 システムを終了します")
     except Exception as e:
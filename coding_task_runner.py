@@ -9,13 +9,13 @@ import queue
 import threading
 import time
 import json
-import subprocess
 import tempfile
 import os
 from typing import Dict, List, Optional, Any, Callable
 from dataclasses import dataclass, field
 from enum import Enum
 from concurrent.futures import ThreadPoolExecutor
+from services.sandbox_pool import get_sandbox_pool
 
 class TaskStatus(Enum):
     """タスクステータス"""
@@ -157,32 +157,19 @@ class CodeValidator:
         """実行テスト"""
         try:
             if language == "python":
-                # 安全な実行環境でテスト
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                    f.write(code)
-                    f.flush()
-                    
-                    # タイムアウト付きで実行
-                    result = subprocess.run(
-                        ['python', f.name],
-                        capture_output=True,
-                        text=True,
-                        timeout=5,
-                        cwd=self.temp_dir
-                    )
-                    
-                    os.unlink(f.name)
-                    
-                    return {
-                        "success": result.returncode == 0,
-                        "stdout": result.stdout,
-                        "stderr": result.stderr,
-                        "returncode": result.returncode
-                    }
+                # 安全な実行環境でテスト（リソース制限付きのウォーム済みワーカー）
+                result = get_sandbox_pool().execute(code, timeout=5, cwd=self.temp_dir)
+                if result.timed_out:
+                    return {"success": False, "error": "Execution timeout"}
+                
+                return {
+                    "success": result.success,
+                    "stdout": result.stdout,
+                    "stderr": result.stderr or (result.error or ""),
+                    "returncode": result.returncode
+                }
             else:
                 return {"success": False, "error": f"Execution test not supported for {language}"}
-        except subprocess.TimeoutExpired:
-            return {"success": False, "error": "Execution timeout"}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
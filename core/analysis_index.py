@@ -0,0 +1,193 @@
+"""
+プロジェクト分析索引モジュール
+ファイルごとのコード分析結果を (パス, mtime, ハッシュ) で保存し、変更されたファイルだけを再分析する
+
+- mtimeとサイズが同じなら読み込まずに再利用し、mtimeだけ変わった場合は内容のハッシュで判定
+- 変更されたファイルの分析はプロセスプールで並列実行（数が少ない場合・プールが使えない場合は直列）
+- 自己診断（self_diagnose）とリファクタリング提案（suggest_refactoring）が同じ索引を参照する
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.constants import ANALYSIS_CACHE_FILE, BASE_DIR
+
+# 分析ロジックを変えたら上げる（保存済みの結果を破棄して再分析する）
+ANALYZER_VERSION = 1
+
+# 自己診断の対象（分割後のモジュール群。ディレクトリ配下は自動で探索）
+DIAGNOSE_SCOPE = ("main_app_new.py", "core", "ui", "services")
+
+EXCLUDED_DIRS = {"__pycache__", "backups", ".git", "data", "generated_apps", "node_modules"}
+
+# これ未満の変更ファイル数ならプロセス起動のコストを避けて直列で分析
+PROCESS_POOL_MIN_FILES = 4
+
+
+def calculate_complexity(content: str) -> Dict:
+    """行数・関数数・クラス数・インポート数から複雑度スコアを計算"""
+    lines = len(content.split('\n'))
+    functions = len(re.findall(r'def\s+\w+', content))
+    classes = len(re.findall(r'class\s+\w+', content))
+    imports = len(re.findall(r'import\s+\w+|from\s+\w+', content))
+    return {
+        "lines": lines,
+        "functions": functions,
+        "classes": classes,
+        "imports": imports,
+        "complexity_score": lines + functions * 10 + classes * 20
+    }
+
+
+def analyze_source(file_path: str, content: str) -> Dict:
+    """1ファイル分の分析（プロセスプールのワーカーで実行されるためモジュール関数にしている）"""
+    from core.self_optimizer import code_analyzer
+    return {
+        "analysis": code_analyzer.analyze_content(file_path, content),
+        "complexity": calculate_complexity(content)
+    }
+
+
+def file_fingerprint(path: Path) -> Tuple[int, int]:
+    """(mtime_ns, サイズ)"""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ProjectAnalysisIndex:
+    """プロジェクト全体のファイル分析結果の索引"""
+
+    def __init__(self, root: Path = BASE_DIR, cache_file: Optional[Path] = ANALYSIS_CACHE_FILE,
+                 max_workers: Optional[int] = None):
+        self.root = Path(root)
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._lock = threading.RLock()
+        self.entries: Dict[str, Dict] = {}
+        self.stats = {"reused": 0, "rehashed": 0, "analyzed": 0, "removed": 0}
+        self._load()
+
+    # 永続化
+    def _load(self):
+        if not self.cache_file or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == ANALYZER_VERSION:
+                self.entries = data.get("entries", {})
+        except Exception as e:
+            print(f"⚠️ 分析キャッシュ読み込みエラー（再分析します）: {e}")
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.cache_file.with_suffix(".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"version": ANALYZER_VERSION, "entries": self.entries}, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            print(f"⚠️ 分析キャッシュ保存エラー: {e}")
+
+    # 対象ファイル
+    def discover(self, scope: Iterable[str] = DIAGNOSE_SCOPE) -> List[str]:
+        """scope 内のPythonファイルをルートからの相対パスで列挙"""
+        files = []
+        for item in scope:
+            path = self.root / item
+            if path.is_file() and path.suffix == ".py":
+                files.append(item)
+            elif path.is_dir():
+                for file_path in sorted(path.rglob("*.py")):
+                    relative = file_path.relative_to(self.root)
+                    if not EXCLUDED_DIRS.intersection(relative.parts[:-1]):
+                        files.append(relative.as_posix())
+        return files
+
+    # 更新
+    def refresh(self, paths: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """指定ファイル（省略時は DIAGNOSE_SCOPE）を最新化し、{相対パス: エントリ} を返す"""
+        paths = list(paths) if paths is not None else self.discover()
+        with self._lock:
+            pending: Dict[str, Tuple[int, int, str, str]] = {}
+            changed = False
+            for relative in paths:
+                path = self.root / relative
+                if not path.is_file():
+                    if self.entries.pop(relative, None) is not None:
+                        self.stats["removed"] += 1
+                        changed = True
+                    continue
+
+                mtime_ns, size = file_fingerprint(path)
+                entry = self.entries.get(relative)
+                if entry and entry["mtime_ns"] == mtime_ns and entry["size"] == size:
+                    self.stats["reused"] += 1
+                    continue
+
+                data = path.read_bytes()
+                sha256 = hashlib.sha256(data).hexdigest()
+                if entry and entry["sha256"] == sha256:
+                    # 触られただけで内容は同じ（チェックアウト・保存し直しなど）
+                    entry.update(mtime_ns=mtime_ns, size=size)
+                    self.stats["rehashed"] += 1
+                    changed = True
+                    continue
+                pending[relative] = (mtime_ns, size, sha256, data.decode('utf-8', errors='replace'))
+
+            if pending:
+                results = self._analyze(pending)
+                for relative, (mtime_ns, size, sha256, _) in pending.items():
+                    self.entries[relative] = {"mtime_ns": mtime_ns, "size": size, "sha256": sha256,
+                                              **results[relative]}
+                self.stats["analyzed"] += len(pending)
+                changed = True
+
+            if changed:
+                self._save()
+            return {relative: self.entries[relative] for relative in paths if relative in self.entries}
+
+    def _analyze(self, pending: Dict[str, Tuple[int, int, str, str]]) -> Dict[str, Dict]:
+        if len(pending) >= PROCESS_POOL_MIN_FILES and self.max_workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                    futures = {relative: executor.submit(analyze_source, relative, item[3])
+                               for relative, item in pending.items()}
+                    return {relative: future.result() for relative, future in futures.items()}
+            except Exception as e:
+                print(f"⚠️ プロセスプールでの分析に失敗したため直列で実行します: {e}")
+        return {relative: analyze_source(relative, item[3]) for relative, item in pending.items()}
+
+    # 参照
+    def analysis_results(self, paths: Optional[Iterable[str]] = None) -> List[Dict]:
+        """CodeAnalyzer.analyze_file と同じ形式の結果一覧"""
+        return [entry["analysis"] for entry in self.refresh(paths).values()]
+
+    def complexity(self, paths: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """{相対パス: 複雑度} を返す"""
+        return {relative: entry["complexity"] for relative, entry in self.refresh(paths).items()}
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "indexed_files": len(self.entries)}
+
+
+_analysis_index = None
+_analysis_index_lock = threading.Lock()
+
+
+def get_analysis_index() -> ProjectAnalysisIndex:
+    """共有プロジェクト分析索引を取得"""
+    global _analysis_index
+    with _analysis_index_lock:
+        if _analysis_index is None:
+            _analysis_index = ProjectAnalysisIndex()
+        return _analysis_index
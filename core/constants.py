@@ -16,9 +16,19 @@ GENERATED_APPS_DIR = BASE_DIR / "generated_apps"
 # ファイルパス定数
 WORKSPACE_STATE_FILE = DATA_DIR / "workspace_state.json"
 AGENT_DIARY_FILE = DATA_DIR / "agent_diary.json"
+WORKSPACE_DB_FILE = DATA_DIR / "workspace.db"
+RESPONSE_CACHE_DB_FILE = DATA_DIR / "response_cache.db"
+ANALYSIS_CACHE_FILE = DATA_DIR / "analysis_cache.json"
+PROJECT_INDEX_FILE = DATA_DIR / "project_index.json"
 PERSONALITIES_FILE = BASE_DIR / "personalities.json"
 PERSONALITIES_CUSTOM_FILE = BASE_DIR / "personalities_custom.json"
 
+# 静的ファイル（static_server.py が /static で配信）
+STATIC_DIR = BASE_DIR / "static"
+THEME_CSS_DIR = STATIC_DIR / "css"
+# テーマCSSを <link> で読み込むときの配信元（例: http://192.168.0.10:8000/static/css）。未設定ならインライン
+THEME_CSS_BASE_URL = os.environ.get("THEME_CSS_BASE_URL", "")
+
 # VRM関連
 VRM_FILE = BASE_DIR / "vrm" / "AliciaSolid_state.vrm"
 
@@ -49,8 +59,14 @@ SESSION_KEYS = {
     "active_app": "active_app",
     "show_app_inline": "show_app_inline",
     "workspace_state": "workspace_state",
-    "agent_diary": "agent_diary"
+    "agent_diary": "agent_diary",
+    "chat_visible_turns": "chat_visible_turns",
+    "chat_rendered_turns": "chat_rendered_turns"
 }
 
+# チャット表示（直近のターンだけを描画し、古いものは「以前のメッセージ」で段階的に読み込む）
+CHAT_PAGE_SIZE = 20
+CHAT_HTML_CACHE_SIZE = 512
+
 # エージェント名
 AGENT_NAME = "AIエージェント"
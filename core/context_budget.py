@@ -0,0 +1,400 @@
+"""
+コンテキスト予算管理モジュール
+モデルのトークナイザでトークン数を数え、モデルごとのコンテキスト長に収まるよう
+会話コンテキスト（直近の会話・関連する過去の会話・階層要約）を組み立てる
+"""
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# モデルごとのコンテキスト長（ModelRouter の ModelConfig.context_window で上書きされる）
+_context_windows: Dict[str, int] = {
+    "llama3.2:3b": 8192,
+    "llama3.1:8b": 32768,
+    "llama3.2-vision": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+# リクエストごとの num_ctx の下限（num_ctx が変わるとOllamaはモデルを読み込み直すため、2の累乗に丸めて種類を絞る）
+MIN_REQUEST_CONTEXT = 2048
+# トークン数の見積もり誤差に備えた余裕
+CONTEXT_SAFETY_MARGIN = 1.1
+
+# Ollamaモデル名 → Hugging Face トークナイザ（ローカルにある場合のみ使用）
+HF_TOKENIZERS = {
+    "llama3.2": "meta-llama/Llama-3.2-3B-Instruct",
+    "llama3.1": "meta-llama/Llama-3.1-8B-Instruct",
+}
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def register_context_window(model_name: str, context_window: int):
+    """モデルのコンテキスト長を登録"""
+    _context_windows[model_name] = context_window
+
+
+def get_context_window(model_name: str) -> int:
+    """モデルのコンテキスト長を取得（タグ違いはベース名で解決）"""
+    if model_name in _context_windows:
+        return _context_windows[model_name]
+    base = model_name.split(":")[0]
+    for name, window in _context_windows.items():
+        if name.split(":")[0] == base:
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def size_context_window(model_name: str, prompt_tokens: int, num_predict: int) -> int:
+    """プロンプトと生成分が収まる num_ctx（2の累乗に切り上げ、モデルのコンテキスト長が上限）"""
+    window = get_context_window(model_name)
+    needed = int((prompt_tokens + num_predict) * CONTEXT_SAFETY_MARGIN)
+    size = MIN_REQUEST_CONTEXT
+    while size < needed and size < window:
+        size *= 2
+    return min(size, window)
+
+
+class TokenCounter:
+    """モデルのトークナイザによるトークン数カウント
+
+    transformers とトークナイザがローカルにあればそれを使い、
+    なければ日本語1文字≒1トークン、英単語≒1.3トークンの近似で数える。
+    """
+
+    def __init__(self, model_name: str, cache_size: int = 4096):
+        self.model_name = model_name
+        self.tokenizer = self._load_tokenizer(model_name)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_tokenizer(model_name: str):
+        repo = HF_TOKENIZERS.get(model_name.split(":")[0].split("-")[0])
+        if not repo:
+            return None
+        try:
+            from transformers import AutoTokenizer
+            # リクエスト経路でダウンロードしないようローカルキャッシュのみ参照
+            return AutoTokenizer.from_pretrained(repo, local_files_only=True)
+        except Exception:
+            return None
+
+    def _estimate(self, text: str) -> int:
+        cjk = len(_CJK_RE.findall(text))
+        others = _WORD_RE.findall(text)
+        words = sum(1 for w in others if w[0].isalnum() or w[0] == "_")
+        symbols = len(others) - words
+        return int(cjk + words * 1.3 + symbols) + 1
+
+    def count(self, text: str) -> int:
+        """テキストのトークン数"""
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=12).digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        if self.tokenizer is not None:
+            tokens = len(self.tokenizer.encode(text, add_special_tokens=False))
+        else:
+            tokens = self._estimate(text)
+
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_name: str) -> TokenCounter:
+    """モデルごとのトークンカウンタを取得（共有）"""
+    with _counters_lock:
+        if model_name not in _counters:
+            _counters[model_name] = TokenCounter(model_name)
+        return _counters[model_name]
+
+
+def fit_text_to_budget(text: str, max_tokens: int, counter: TokenCounter, keep: str = "tail") -> str:
+    """テキストを予算内に収める（keep="tail"なら末尾、"head"なら先頭を残す）"""
+    if max_tokens <= 0:
+        return ""
+    if counter.count(text) <= max_tokens:
+        return text
+
+    # 行単位で詰め、1行が大きすぎる場合は二分探索で文字数を決める
+    lines = text.splitlines(keepends=True)
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        tokens = counter.count(line)
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used
+            if remaining > 0:
+                low, high = 0, len(line)
+                while low < high:
+                    mid = (low + high + 1) // 2
+                    piece = line[-mid:] if keep == "tail" else line[:mid]
+                    if counter.count(piece) <= remaining:
+                        low = mid
+                    else:
+                        high = mid - 1
+                if low:
+                    kept.append(line[-low:] if keep == "tail" else line[:low])
+            break
+        kept.append(line)
+        used += tokens
+    if keep == "tail":
+        kept.reverse()
+    return "".join(kept)
+
+
+def _bigrams(text: str) -> set:
+    text = re.sub(r"\s+", " ", text.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class OllamaSummarizer:
+    """高速モデルによる要約"""
+
+    def __init__(self, model_name: str = "llama3.2:3b", base_url: str = "http://localhost:11434",
+                 timeout: int = 60):
+        self.model_name = model_name
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def __call__(self, text: str) -> str:
+        import requests
+
+        prompt = (
+            "以下の会話を、後で参照できるように重要な事実・決定事項・未解決の質問を中心に"
+            "日本語で簡潔に要約してください（300文字以内）。\n\n" + text + "\n\n要約:"
+        )
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json={
+                "model": self.model_name,
+                "prompt": prompt,
+                "stream": False,
+                "options": {"temperature": 0.2, "num_predict": 300}
+            },
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json().get("response", "").strip()
+
+
+class ContextAssembler:
+    """トークン予算内で会話コンテキストを組み立てる
+
+    - 直近の会話（recency window）はそのまま残す
+    - 窓から外れた会話はチャンクごとに高速モデルで非同期に要約し、
+      要約が溜まったら要約の要約（上位レベル）にまとめる
+    - 現在の質問に関連する過去の会話を検索して差し込む
+    要約が未完成の間は抽出的な仮要約を使うため、呼び出し側は待たされない。
+    """
+
+    def __init__(self, model_name: str = "llama3.1:8b", context_window: Optional[int] = None,
+                 reserve_tokens: int = 1024, recent_turns: int = 8, summary_chunk_tokens: int = 1500,
+                 summaries_per_level: int = 4, summarizer: Optional[Callable[[str], str]] = None,
+                 max_archive: int = 2000):
+        self.model_name = model_name
+        self.context_window = context_window or get_context_window(model_name)
+        self.reserve_tokens = reserve_tokens
+        self.recent_turns = recent_turns
+        self.summary_chunk_tokens = summary_chunk_tokens
+        self.summaries_per_level = summaries_per_level
+        self.max_archive = max_archive
+        self.counter = get_token_counter(model_name)
+        self.summarizer = summarizer if summarizer is not None else OllamaSummarizer()
+
+        self.messages: List[Dict] = []       # 直近の会話
+        self.archive: List[Dict] = []        # 窓から外れた会話（検索用）
+        self.pending: List[Dict] = []        # 要約待ちの会話
+        self.summaries: List[List[Dict]] = [[]]  # summaries[level] = [{content, message_count, ...}]
+
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+
+    # 会話の追加
+    def add_message(self, role: str, content: str, timestamp: datetime = None) -> Dict:
+        message = {
+            "role": role,
+            "content": content,
+            "timestamp": timestamp or datetime.now(),
+            "tokens": self.counter.count(content),
+        }
+        with self._lock:
+            self.messages.append(message)
+            # 古いものから窓の外へ送る
+            while len(self.messages) > self.recent_turns:
+                old = self.messages.pop(0)
+                old["bigrams"] = _bigrams(old["content"])
+                self.archive.append(old)
+                self.pending.append(old)
+            if len(self.archive) > self.max_archive:
+                del self.archive[:len(self.archive) - self.max_archive]
+            self._schedule_summaries()
+        return message
+
+    def _schedule_summaries(self):
+        pending_tokens = sum(m["tokens"] for m in self.pending)
+        if pending_tokens < self.summary_chunk_tokens:
+            return
+        chunk, self.pending = self.pending, []
+        self._executor.submit(self._summarize_chunk, 0, chunk)
+
+    def _format_messages(self, messages: List[Dict]) -> str:
+        return "\n".join(
+            f"{'ユーザー' if m['role'] == 'user' else 'アシスタント'}: {m['content']}" for m in messages
+        )
+
+    def _fallback_summary(self, text: str) -> str:
+        first_lines = [line[:80] for line in text.splitlines() if line.strip()][:6]
+        return " / ".join(first_lines)
+
+    def _summarize_chunk(self, level: int, items: List[Dict]):
+        """要約を生成して所定のレベルに登録（バックグラウンド）"""
+        if level == 0:
+            text = self._format_messages(items)
+            message_count = len(items)
+        else:
+            text = "\n".join(s["content"] for s in items)
+            message_count = sum(s["message_count"] for s in items)
+
+        try:
+            content = self.summarizer(text) if self.summarizer else ""
+        except Exception as e:
+            print(f"⚠️ 要約生成エラー: {e}")
+            content = ""
+        content = content or self._fallback_summary(text)
+
+        summary = {
+            "content": content,
+            "level": level,
+            "message_count": message_count,
+            "timestamp": datetime.now(),
+            "tokens": self.counter.count(content),
+        }
+        with self._lock:
+            while len(self.summaries) <= level:
+                self.summaries.append([])
+            self.summaries[level].append(summary)
+            if len(self.summaries[level]) >= self.summaries_per_level:
+                merged, self.summaries[level] = self.summaries[level], []
+                self._executor.submit(self._summarize_chunk, level + 1, merged)
+
+    # 検索
+    def retrieve(self, query: str, top_k: int = 3) -> List[Dict]:
+        """質問に関連する過去の会話を取得"""
+        if not query:
+            return []
+        query_grams = _bigrams(query)
+        if not query_grams:
+            return []
+        with self._lock:
+            scored = []
+            for message in self.archive:
+                overlap = len(query_grams & message["bigrams"])
+                if overlap:
+                    scored.append((overlap / len(query_grams), message))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [message for score, message in scored[:top_k] if score >= 0.15]
+
+    # 組み立て
+    def budget_for(self, fixed_text: str = "") -> int:
+        """固定部分（システムプロンプト・質問）を除いたコンテキスト予算"""
+        return max(0, self.context_window - self.reserve_tokens - self.counter.count(fixed_text))
+
+    def get_summary_text(self, max_tokens: Optional[int] = None) -> str:
+        """要約（上位レベルから）を予算内で連結"""
+        with self._lock:
+            summaries = [s for level in reversed(self.summaries) for s in level]
+            pending = list(self.pending)
+        parts, used = [], 0
+        if pending:
+            # 要約待ちの会話は抽出的な仮要約で補う
+            text = self._fallback_summary(self._format_messages(pending))
+            summaries.append({"content": text, "tokens": self.counter.count(text)})
+        for summary in summaries:
+            if max_tokens is not None and used + summary["tokens"] > max_tokens:
+                continue
+            parts.append(summary["content"])
+            used += summary["tokens"]
+        return "\n".join(f"{i}. {p}" for i, p in enumerate(parts, 1))
+
+    def assemble(self, query: str = "", budget: Optional[int] = None, recent_share: float = 0.5,
+                 retrieved_share: float = 0.25) -> str:
+        """予算内のコンテキストを組み立てる（要約 → 関連する過去の会話 → 直近の会話）"""
+        budget = self.budget_for(query) if budget is None else budget
+        if budget <= 0:
+            return ""
+
+        with self._lock:
+            recent = list(self.messages)
+
+        # 直近の会話（新しいものから）
+        recent_budget = int(budget * recent_share)
+        recent_lines, used = [], 0
+        for message in reversed(recent):
+            line = f"{'👤' if message['role'] == 'user' else '🤖'} {message['content']}"
+            tokens = message["tokens"] + 2
+            if used + tokens > recent_budget:
+                if not recent_lines:
+                    recent_lines.append(fit_text_to_budget(line, recent_budget, self.counter))
+                    used = recent_budget
+                break
+            recent_lines.append(line)
+            used += tokens
+        recent_lines.reverse()
+        remaining = budget - used
+
+        # 関連する過去の会話
+        retrieved_budget = min(remaining, int(budget * retrieved_share))
+        retrieved_lines, used = [], 0
+        for message in self.retrieve(query):
+            tokens = message["tokens"] + 2
+            if used + tokens > retrieved_budget:
+                continue
+            retrieved_lines.append(f"{'👤' if message['role'] == 'user' else '🤖'} {message['content']}")
+            used += tokens
+        remaining -= used
+
+        # 残りを要約に充てる
+        summary_text = self.get_summary_text(max_tokens=max(0, remaining - 20))
+
+        parts = []
+        if summary_text:
+            parts.append("これまでの会話の要約:\n" + summary_text)
+        if retrieved_lines:
+            parts.append("関連する過去の会話:\n" + "\n".join(retrieved_lines))
+        parts.extend(recent_lines)
+        return "\n".join(parts)
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "context_window": self.context_window,
+                "tokenizer": "model" if self.counter.tokenizer is not None else "estimate",
+                "recent_messages": len(self.messages),
+                "archived_messages": len(self.archive),
+                "pending_messages": len(self.pending),
+                "summaries_by_level": [len(level) for level in self.summaries],
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -6,15 +6,15 @@
 from typing import Dict, Optional, List
 from pathlib import Path
 from .constants import *
+from .project_index import get_project_index
 
-# プロジェクト内の全ファイルマップ
+# プロジェクト内の全ファイルマップ（役割・カテゴリのみ。依存関係はプロジェクト索引から導出）
 FILE_MAP = {
     # コアシステム
     "core/constants.py": {
         "role": "定数管理",
         "description": "パス設定、UIカラー、セッションキーなどの定数を定義",
         "categories": ["定数", "設定", "パス", "カラー"],
-        "dependencies": [],
         "file_size": "small",
         "change_frequency": "low"
     },
@@ -22,7 +22,6 @@ FILE_MAP = {
         "role": "LLM通信",
         "description": "Ollamaとの通信、自己進化ロジック、TODO抽出",
         "categories": ["AI", "LLM", "進化", "会話", "TODO"],
-        "dependencies": ["constants.py", "self_mutation.py"],
         "file_size": "medium",
         "change_frequency": "medium"
     },
@@ -30,7 +29,6 @@ FILE_MAP = {
         "role": "VRM制御",
         "description": "VRMモデルのロード、表示、表情制御",
         "categories": ["VRM", "アバター", "表情", "3D"],
-        "dependencies": ["constants.py"],
         "file_size": "medium",
         "change_frequency": "low"
     },
@@ -38,7 +36,6 @@ FILE_MAP = {
         "role": "自己改造",
         "description": "モジュール対応の自己改造プロトコル",
         "categories": ["進化", "改造", "リファクタリング"],
-        "dependencies": ["constants.py"],
         "file_size": "medium",
         "change_frequency": "low"
     },
@@ -48,7 +45,6 @@ FILE_MAP = {
         "role": "UIスタイル",
         "description": "LINE風CSS、テーマ設定、デザイン一貫性",
         "categories": ["デザイン", "UI", "CSS", "スタイル", "テーマ"],
-        "dependencies": ["constants.py"],
         "file_size": "medium",
         "change_frequency": "high"
     },
@@ -56,7 +52,6 @@ FILE_MAP = {
         "role": "UIコンポーネント",
         "description": "チャット表示、ツール棚、TODO/メモパネル",
         "categories": ["UI", "コンポーネント", "チャット", "TODO", "メモ"],
-        "dependencies": ["constants.py", "state_manager.py", "app_generator.py"],
         "file_size": "large",
         "change_frequency": "high"
     },
@@ -66,7 +61,6 @@ FILE_MAP = {
         "role": "アプリ生成",
         "description": "コード生成、アプリ実行、自己修復",
         "categories": ["生成", "アプリ", "コード", "実行", "修復"],
-        "dependencies": ["constants.py"],
         "file_size": "medium",
         "change_frequency": "medium"
     },
@@ -74,7 +68,6 @@ FILE_MAP = {
         "role": "状態管理",
         "description": "会話履歴、TODO、日記の保存・読み込み",
         "categories": ["データ", "保存", "状態", "永続化", "日記"],
-        "dependencies": ["constants.py"],
         "file_size": "medium",
         "change_frequency": "medium"
     },
@@ -84,7 +77,6 @@ FILE_MAP = {
         "role": "エントリーポイント",
         "description": "Streamlitメインループ、全機能の統合",
         "categories": ["メイン", "エントリー", "統合"],
-        "dependencies": ["core/*", "ui/*", "services/*"],
         "file_size": "small",
         "change_frequency": "low"
     },
@@ -94,7 +86,6 @@ FILE_MAP = {
         "role": "レガシーアプリ",
         "description": "単一ファイル版の完全なAIシステム",
         "categories": ["レガシー", "完全版", "互換性"],
-        "dependencies": [],
         "file_size": "xlarge",
         "change_frequency": "none"
     }
@@ -197,9 +188,9 @@ class FileMapResolver:
         return list(set(files))
     
     def get_dependencies(self, file_path: str) -> List[str]:
-        """ファイルの依存関係を取得"""
-        file_info = self.get_file_info(file_path)
-        return file_info.get("dependencies", [])
+        """ファイルの依存関係を取得（プロジェクト索引のASTから導出した相対パス）"""
+        index = get_project_index()
+        return [index.module_path(dependency) for dependency in index.dependencies_of(file_path)]
     
     def get_change_frequency(self, file_path: str) -> str:
         """ファイルの変更頻度を取得"""
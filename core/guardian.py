@@ -142,10 +142,19 @@ def find_correct_import_path(module_name: str) -> Optional[str]:
         Optional[str]: 正しいインポートパス、見つからない場合はNone
     """
     try:
+        # プロジェクト索引から引く（分割後のパッケージを優先）
+        try:
+            from core.project_index import get_project_index
+            import_path = get_project_index().find_module(module_name, packages=('core', 'services', 'ui'))
+            if import_path:
+                return import_path
+        except Exception:
+            pass
+        
         # プロジェクトルートを取得
         current_dir = Path(__file__).parent.parent
         
-        # 全ディレクトリを再帰的に検索
+        # 索引が使えない場合は全ディレクトリを再帰的に検索
         for root_dir in ['core', 'services', 'ui']:
             search_path = current_dir / root_dir
             if search_path.exists():
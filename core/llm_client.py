@@ -12,6 +12,11 @@ from datetime import datetime
 from core.constants import *
 from core.self_mutation import ModularSelfMutationManager
 from core.file_map import resolve_target_file, get_relevant_files
+from core.context_budget import get_context_window, get_token_counter, fit_text_to_budget, size_context_window
+from services.response_cache import get_response_cache
+
+# 応答生成用に確保するトークン数
+RESPONSE_TOKEN_RESERVE = 1000
 
 class OllamaClient:
     def __init__(self, model_name="llama3.2:3b", base_url="http://localhost:11434"):
@@ -19,8 +24,33 @@ class OllamaClient:
         self.base_url = base_url
         self.conversation_history = []
     
-    def generate_response(self, prompt, context=None):
-        """Ollamaで応答生成（メモリ最適化版）"""
+    def generate_response(self, prompt, context=None, bypass_cache=False, cache=None):
+        """Ollamaで応答生成（メモリ最適化版）
+
+        温度0.7で生成するため、応答キャッシュは cache=True を指定した呼び出しだけが使う。
+        コード書き換えなど毎回新しい応答が必要な呼び出しは bypass_cache=True を渡す。
+        """
+        # コンテキストを構築（モデルのコンテキスト長に収める）
+        full_prompt = self._fit_prompt(prompt, context)
+        # num_ctx はモデルの最大長ではなく、このプロンプトと生成分に必要な長さにする（KVキャッシュを無駄に確保しない）
+        prompt_tokens = get_token_counter(self.model_name).count(full_prompt)
+        options = {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "num_ctx": size_context_window(self.model_name, prompt_tokens, RESPONSE_TOKEN_RESERVE),
+            "num_predict": RESPONSE_TOKEN_RESERVE  # 2,000から1,000に削減
+        }
+        return get_response_cache().cached_generate(
+            self.model_name, full_prompt,
+            lambda: self._request_generation(full_prompt, options),
+            options=options,
+            bypass=bypass_cache,
+            is_valid=lambda text: not text.startswith(("APIエラー", "LLM接続エラー")),
+            endpoint=self.base_url,
+            cache=cache
+        )
+    
+    def _request_generation(self, full_prompt, options):
         try:
             import requests
             import gc
@@ -28,13 +58,6 @@ class OllamaClient:
             # メモリ解放
             gc.collect()
             
-            # コンテキストを構築
-            full_prompt = self._build_prompt(prompt, context)
-            
-            # プロンプト長さを制限してメモリ使用量を削減
-            if len(full_prompt) > 5000:  # 10,000から5,000に削減
-                full_prompt = full_prompt[:5000] + "...[truncated]"
-            
             # Ollama API呼び出し
             response = requests.post(
                 f"{self.base_url}/api/generate",
@@ -42,11 +65,7 @@ class OllamaClient:
                     "model": self.model_name,
                     "prompt": full_prompt,
                     "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "max_tokens": 1000  # 2,000から1,000に削減
-                    }
+                    "options": options
                 },
                 timeout=120  # 240秒から120秒に短縮
             )
@@ -66,6 +85,22 @@ class OllamaClient:
         except Exception as e:
             return f"LLM接続エラー: {str(e)}"
     
+    def _fit_prompt(self, prompt, context=None):
+        """トークン予算内に収めたプロンプトを構築（超過分はコンテキストの古い側から削る）"""
+        counter = get_token_counter(self.model_name)
+        budget = get_context_window(self.model_name) - RESPONSE_TOKEN_RESERVE
+        
+        full_prompt = self._build_prompt(prompt, context)
+        if counter.count(full_prompt) <= budget:
+            return full_prompt
+        
+        base_prompt = self._build_prompt(prompt)
+        context_budget = budget - counter.count(base_prompt) - 16
+        if context and context_budget > 0:
+            return self._build_prompt(prompt, fit_text_to_budget(str(context), context_budget, counter))
+        
+        return fit_text_to_budget(base_prompt, budget, counter, keep="head")
+    
     def _build_prompt(self, user_input, context=None):
         """プロンプトを構築"""
         # 基本プロンプト
@@ -177,7 +212,7 @@ class SelfEvolvingAgent:
             
             # エラーハンドリング付きでLLM応答を取得
             try:
-                modified_code = ollama_client.generate_response(focused_prompt)
+                modified_code = ollama_client.generate_response(focused_prompt, bypass_cache=True)
                 
                 if not modified_code or "APIエラー" in modified_code or "LLM接続エラー" in modified_code:
                     return {
@@ -659,36 +694,14 @@ class {Path(file_path).stem.replace('.py', '').capitalize()}:
     def self_diagnose(self) -> Dict:
         """自分の全ソースコードを読み込み、自己診断を実行"""
         try:
-            from .self_optimizer import code_analyzer, optimization_suggester, evolution_logger
+            from .self_optimizer import optimization_suggester, evolution_logger
             
             st.info("🔍 自己診断を開始します...")
             
-            # プロジェクト内の全Pythonファイルを分析
-            project_files = [
-                "main_app_new.py",
-                "core/constants.py",
-                "core/file_map.py", 
-                "core/llm_client.py",
-                "core/vrm_controller.py",
-                "core/self_mutation.py",
-                "core/self_optimizer.py",
-                "ui/styles.py",
-                "ui/components.py",
-                "services/app_generator.py",
-                "services/state_manager.py",
-                "services/backup_manager.py",
-                "services/import_sync.py",
-                "services/import_validator.py"
-            ]
-            
-            analysis_results = []
-            total_issues = 0
-            
-            for file_path in project_files:
-                if Path(file_path).exists():
-                    result = code_analyzer.analyze_file(file_path)
-                    analysis_results.append(result)
-                    total_issues += len(result.get('issues', []))
+            # プロジェクト内の全Pythonファイルを分析（未変更のファイルは前回の結果を再利用）
+            from .analysis_index import get_analysis_index
+            analysis_results = get_analysis_index().analysis_results()
+            total_issues = sum(len(result.get('issues', [])) for result in analysis_results)
             
             # 改善提案を生成
             suggestions = optimization_suggester.generate_suggestions(analysis_results)
@@ -1169,7 +1182,7 @@ def render_secret_fortune_telling():
                 st.session_state[SESSION_KEYS['ollama']] = OllamaClient()
             
             ollama_client = st.session_state[SESSION_KEYS['ollama']]
-            modified_code = ollama_client.generate_response(focused_prompt)
+            modified_code = ollama_client.generate_response(focused_prompt, bypass_cache=True)
             
             # 最終防衛線：ガーディアンによるコード洗浄
             from core.guardian import validate_and_clean_content
@@ -0,0 +1,433 @@
+"""
+プロジェクト索引モジュール
+全モジュールのASTを一度だけ解析し、インポート・定義シンボル・呼び出し箇所を索引化する
+
+- ファイルごとの解析結果は (mtime, サイズ, ハッシュ) 付きで保存し、変更されたファイルだけを再解析
+- 「Xをインポートしているのは誰か」「シンボルYはどこで定義されているか」は逆引き辞書でO(1)
+- 循環参照は索引が変わったときだけ再計算（モジュールレベルのインポートのみ対象）
+"""
+
+import ast
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from core.analysis_index import EXCLUDED_DIRS, file_fingerprint
+from core.constants import BASE_DIR, PROJECT_INDEX_FILE
+
+# 解析内容を変えたら上げる（保存済みの索引を破棄して再解析する）
+INDEX_VERSION = 1
+
+PROJECT_EXCLUDED_DIRS = EXCLUDED_DIRS | {".venv", "venv", ".pytest_cache"}
+
+# 分割後のモジュール群（循環参照チェックと短縮名解決で優先する範囲）
+MODULAR_PACKAGES = ("main_app_new", "core", "ui", "services")
+
+# この秒数以内に走査済みなら問い合わせ時の再走査を省く
+RESCAN_INTERVAL = 2.0
+
+
+def path_to_module(relative_path: str) -> str:
+    """相対パスをモジュール名に変換（core/__init__.py → core）"""
+    parts = list(Path(relative_path).with_suffix('').parts)
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def _resolve_relative(module: str, is_package: bool, level: int, name: Optional[str]) -> str:
+    """相対インポートを絶対モジュール名に解決"""
+    package = module.split(".") if is_package else module.split(".")[:-1]
+    if level > 1:
+        package = package[:len(package) - (level - 1)]
+    if name:
+        package = package + [name]
+    return ".".join(package)
+
+
+def parse_module(relative_path: str, content: str) -> Dict:
+    """1モジュール分のインポート・定義シンボル・呼び出しを抽出"""
+    module = path_to_module(relative_path)
+    is_package = Path(relative_path).stem == "__init__"
+    entry = {
+        "module": module,
+        "imports": [],           # [インポート先, モジュールレベルか]
+        "from_imports": {},      # {インポート先: [名前]}
+        "direct_imports": [],
+        "functions": [],
+        "classes": [],
+        "variables": [],
+        "calls": [],
+        "error": None
+    }
+
+    try:
+        tree = ast.parse(content)
+    except SyntaxError as e:
+        entry["error"] = f"構文エラー (line {e.lineno}): {e.msg}"
+        return entry
+
+    # モジュールレベルの文（if/try 配下を含む）だけを集める。関数内の遅延インポートは循環にならない
+    toplevel_nodes: Set[int] = set()
+    pending = list(tree.body)
+    while pending:
+        node = pending.pop()
+        toplevel_nodes.add(id(node))
+        if isinstance(node, (ast.If, ast.Try, ast.With)):
+            for field in ("body", "orelse", "finalbody"):
+                pending.extend(getattr(node, field, []))
+            for handler in getattr(node, "handlers", []):
+                pending.extend(handler.body)
+
+    imports: Dict[str, bool] = {}
+    calls: Set[str] = set()
+
+    def add_import(target: str, toplevel: bool):
+        imports[target] = imports.get(target, False) or toplevel
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                entry["direct_imports"].append(alias.name)
+                add_import(alias.name, id(node) in toplevel_nodes)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                target = _resolve_relative(module, is_package, node.level, node.module)
+            else:
+                target = node.module or ""
+            names = [alias.name for alias in node.names]
+            entry["from_imports"].setdefault(target, []).extend(names)
+            toplevel = id(node) in toplevel_nodes
+            add_import(target, toplevel)
+            # from package import submodule の場合に備えて候補も記録（実在するものだけ依存として扱う）
+            for name in names:
+                if name != "*":
+                    add_import(f"{target}.{name}" if target else name, toplevel)
+        elif isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name):
+                calls.add(node.func.id)
+            elif isinstance(node.func, ast.Attribute):
+                calls.add(node.func.attr)
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            entry["functions"].append(node.name)
+        elif isinstance(node, ast.ClassDef):
+            entry["classes"].append(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            entry["variables"].extend(t.id for t in targets if isinstance(t, ast.Name))
+
+    entry["imports"] = [[target, toplevel] for target, toplevel in sorted(imports.items())]
+    entry["calls"] = sorted(calls)
+    return entry
+
+
+class ProjectIndex:
+    """プロジェクト全体のシンボル・インポートグラフ索引"""
+
+    def __init__(self, root: Path = BASE_DIR, cache_file: Optional[Path] = PROJECT_INDEX_FILE,
+                 rescan_interval: float = RESCAN_INTERVAL):
+        self.root = Path(root)
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.rescan_interval = rescan_interval
+        self._lock = threading.RLock()
+        self.entries: Dict[str, Dict] = {}
+        self._last_scan = 0.0
+        self._generation = 0
+        self._cycle_cache: Dict[Tuple, List[List[str]]] = {}
+        self.stats = {"reused": 0, "rehashed": 0, "parsed": 0, "removed": 0, "scans": 0}
+
+        # 逆引き辞書
+        self.module_files: Dict[str, str] = {}
+        self.short_names: Dict[str, Set[str]] = {}
+        self.importers: Dict[str, Set[str]] = {}
+        self.definitions: Dict[str, Set[str]] = {}
+        self.callers: Dict[str, Set[str]] = {}
+
+        self._load()
+        for relative, entry in self.entries.items():
+            self._add_to_maps(relative, entry)
+
+    # 永続化
+    def _load(self):
+        if not self.cache_file or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.entries = data.get("entries", {})
+        except Exception as e:
+            print(f"⚠️ プロジェクト索引読み込みエラー（再解析します）: {e}")
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.cache_file.with_suffix(".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"version": INDEX_VERSION, "entries": self.entries}, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            print(f"⚠️ プロジェクト索引保存エラー: {e}")
+
+    # 逆引き辞書の差分更新
+    def _add_to_maps(self, relative: str, entry: Dict):
+        module = entry["module"]
+        self.module_files[module] = relative
+        self.short_names.setdefault(module.rsplit(".", 1)[-1], set()).add(module)
+        for target, _ in entry["imports"]:
+            self.importers.setdefault(target, set()).add(module)
+        for symbol in entry["functions"] + entry["classes"] + entry["variables"]:
+            self.definitions.setdefault(symbol, set()).add(module)
+        for name in entry["calls"]:
+            self.callers.setdefault(name, set()).add(module)
+
+    def _remove_from_maps(self, entry: Dict):
+        module = entry["module"]
+
+        def discard(mapping: Dict[str, Set[str]], key: str):
+            values = mapping.get(key)
+            if values is not None:
+                values.discard(module)
+                if not values:
+                    del mapping[key]
+
+        self.module_files.pop(module, None)
+        discard(self.short_names, module.rsplit(".", 1)[-1])
+        for target, _ in entry["imports"]:
+            discard(self.importers, target)
+        for symbol in entry["functions"] + entry["classes"] + entry["variables"]:
+            discard(self.definitions, symbol)
+        for name in entry["calls"]:
+            discard(self.callers, name)
+
+    # 走査・更新
+    def discover(self) -> List[str]:
+        """索引対象のPythonファイルをルートからの相対パスで列挙"""
+        files = []
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            dir_names[:] = sorted(d for d in dir_names if d not in PROJECT_EXCLUDED_DIRS and not d.startswith("."))
+            for file_name in sorted(file_names):
+                if file_name.endswith(".py"):
+                    files.append(Path(dir_path, file_name).relative_to(self.root).as_posix())
+        return files
+
+    def _to_relative(self, file_path) -> str:
+        path = Path(file_path)
+        if path.is_absolute():
+            path = path.relative_to(self.root)
+        return path.as_posix()
+
+    def _update(self, relative: str) -> bool:
+        """1ファイルを最新化。索引が変わったら True"""
+        path = self.root / relative
+        entry = self.entries.get(relative)
+
+        if not path.is_file():
+            if entry is None:
+                return False
+            self._remove_from_maps(self.entries.pop(relative))
+            self.stats["removed"] += 1
+            return True
+
+        mtime_ns, size = file_fingerprint(path)
+        if entry and entry["mtime_ns"] == mtime_ns and entry["size"] == size:
+            self.stats["reused"] += 1
+            return False
+
+        data = path.read_bytes()
+        sha256 = hashlib.sha256(data).hexdigest()
+        if entry and entry["sha256"] == sha256:
+            entry.update(mtime_ns=mtime_ns, size=size)
+            self.stats["rehashed"] += 1
+            return True
+
+        new_entry = parse_module(relative, data.decode('utf-8', errors='replace'))
+        new_entry.update(mtime_ns=mtime_ns, size=size, sha256=sha256)
+        if entry:
+            self._remove_from_maps(entry)
+        self.entries[relative] = new_entry
+        self._add_to_maps(relative, new_entry)
+        self.stats["parsed"] += 1
+        self._generation += 1
+        return True
+
+    def refresh(self, force: bool = False):
+        """プロジェクト全体を走査して変更・追加・削除されたファイルを反映"""
+        with self._lock:
+            if not force and time.monotonic() - self._last_scan < self.rescan_interval:
+                return
+            files = self.discover()
+            changed = False
+            for relative in files:
+                changed = self._update(relative) or changed
+            for relative in set(self.entries) - set(files):
+                changed = self._update(relative) or changed
+            self._last_scan = time.monotonic()
+            self.stats["scans"] += 1
+            if changed:
+                self._save()
+
+    def update_file(self, file_path) -> Optional[Dict]:
+        """変更が分かっているファイルだけを即座に反映（自己改造後など）"""
+        relative = self._to_relative(file_path)
+        with self._lock:
+            if self._update(relative):
+                self._save()
+            return self.entries.get(relative)
+
+    # 問い合わせ
+    def get_entry(self, file_path) -> Optional[Dict]:
+        self.refresh()
+        return self.entries.get(self._to_relative(file_path))
+
+    def module_path(self, module: str) -> Optional[str]:
+        """モジュール名から相対パスを取得"""
+        self.refresh()
+        return self.module_files.get(module)
+
+    def find_module(self, short_name: str, packages: Optional[Iterable[str]] = None) -> Optional[str]:
+        """短縮名（例: state_manager）から完全なモジュール名を取得。分割後のパッケージを優先"""
+        self.refresh()
+        candidates = self.short_names.get(short_name, set())
+        if packages is not None:
+            packages = tuple(packages)
+            candidates = {module for module in candidates if module.split(".")[0] in packages}
+        if not candidates:
+            return None
+        return min(candidates, key=lambda module: (module.split(".")[0] not in MODULAR_PACKAGES,
+                                                    module.count("."), module))
+
+    def importers_of(self, module: str) -> Set[str]:
+        """module をインポートしているモジュール"""
+        self.refresh()
+        return set(self.importers.get(module, ()))
+
+    def dependent_files(self, file_path) -> List[str]:
+        """file_path のモジュールをインポートしているファイル"""
+        self.refresh()
+        module = path_to_module(self._to_relative(file_path))
+        return sorted(self.module_files[m] for m in self.importers.get(module, ()) if m in self.module_files)
+
+    def where_defined(self, symbol: str) -> Set[str]:
+        """symbol をモジュールレベルで定義しているモジュール"""
+        self.refresh()
+        return set(self.definitions.get(symbol, ()))
+
+    def callers_of(self, name: str) -> Set[str]:
+        """name を呼び出しているモジュール"""
+        self.refresh()
+        return set(self.callers.get(name, ()))
+
+    def extract_imports(self, file_path) -> Dict:
+        """ImportAnalyzer.extract_imports と同じ形式で返す（モジュールレベルの定義のみ）"""
+        entry = self.get_entry(file_path) or {}
+        return {
+            'direct_imports': list(entry.get("direct_imports", [])),
+            'from_imports': {module: list(names) for module, names in entry.get("from_imports", {}).items()},
+            'functions': set(entry.get("functions", [])),
+            'classes': set(entry.get("classes", []))
+        }
+
+    def _resolve_internal(self, target: str) -> Optional[str]:
+        """インポート先を索引内のモジュールに解決（import a.b.c は実在する最長のモジュールへ）"""
+        while target:
+            if target in self.module_files:
+                return target
+            if "." not in target:
+                return None
+            target = target.rsplit(".", 1)[0]
+        return None
+
+    def dependency_graph(self, packages: Optional[Iterable[str]] = MODULAR_PACKAGES,
+                         toplevel_only: bool = True) -> Dict[str, List[str]]:
+        """プロジェクト内モジュール間の依存グラフ {モジュール: [依存先]}"""
+        self.refresh()
+        packages = tuple(packages) if packages else None
+
+        def in_scope(module: str) -> bool:
+            return packages is None or module.split(".")[0] in packages
+
+        with self._lock:
+            graph = {}
+            for entry in self.entries.values():
+                module = entry["module"]
+                if not module or not in_scope(module):
+                    continue
+                graph[module] = [dependency for dependency in self._dependencies(entry, toplevel_only)
+                                 if in_scope(dependency)]
+            return graph
+
+    def _dependencies(self, entry: Dict, toplevel_only: bool) -> List[str]:
+        dependencies = set()
+        for target, toplevel in entry["imports"]:
+            if toplevel_only and not toplevel:
+                continue
+            resolved = self._resolve_internal(target)
+            # パッケージ自身（__init__）への解決は自己参照にしない
+            if resolved and resolved != entry["module"]:
+                dependencies.add(resolved)
+        return sorted(dependencies)
+
+    def dependencies_of(self, file_path, toplevel_only: bool = False) -> List[str]:
+        """file_path がインポートしているプロジェクト内モジュール"""
+        entry = self.get_entry(file_path)
+        if not entry:
+            return []
+        with self._lock:
+            return self._dependencies(entry, toplevel_only)
+
+    def find_cycles(self, packages: Optional[Iterable[str]] = MODULAR_PACKAGES) -> List[List[str]]:
+        """モジュールレベルのインポートによる循環参照（索引が変わるまで結果を再利用）"""
+        self.refresh()
+        key = (self._generation, tuple(packages) if packages else None)
+        with self._lock:
+            if key in self._cycle_cache:
+                return self._cycle_cache[key]
+
+            graph = self.dependency_graph(packages)
+            visited, rec_stack, cycles = set(), set(), []
+
+            def dfs(node, path):
+                if node in rec_stack:
+                    cycles.append(path[path.index(node):] + [node])
+                    return
+                if node in visited:
+                    return
+                visited.add(node)
+                rec_stack.add(node)
+                for neighbor in graph.get(node, []):
+                    dfs(neighbor, path + [node])
+                rec_stack.remove(node)
+
+            for node in graph:
+                if node not in visited:
+                    dfs(node, [])
+
+            self._cycle_cache = {key: cycles}
+            return cycles
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "indexed_files": len(self.entries), "modules": len(self.module_files),
+                    "symbols": len(self.definitions)}
+
+
+_project_index = None
+_project_index_lock = threading.Lock()
+
+
+def get_project_index() -> ProjectIndex:
+    """共有プロジェクト索引を取得"""
+    global _project_index
+    with _project_index_lock:
+        if _project_index is None:
+            _project_index = ProjectIndex()
+        return _project_index
@@ -8,6 +8,7 @@ import re
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Any
 from core.constants import *
+from core.analysis_index import calculate_complexity, get_analysis_index
 
 class ModularSelfMutationManager:
     def __init__(self):
@@ -52,48 +53,36 @@ class ModularSelfMutationManager:
         return files
     
     def analyze_file_complexity(self, file_path: str) -> Dict:
-        """ファイルの複雑さを分析"""
+        """ファイルの複雑さを分析（プロジェクト分析索引のキャッシュを利用）"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            lines = len(content.split('\n'))
-            functions = len(re.findall(r'def\s+\w+', content))
-            classes = len(re.findall(r'class\s+\w+', content))
-            imports = len(re.findall(r'import\s+\w+|from\s+\w+', content))
+            result = get_analysis_index().complexity([file_path])
+            if file_path in result:
+                return result[file_path]
             
-            return {
-                "lines": lines,
-                "functions": functions,
-                "classes": classes,
-                "imports": imports,
-                "complexity_score": lines + functions * 10 + classes * 20
-            }
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return calculate_complexity(f.read())
         except Exception as e:
             return {"error": str(e)}
     
     def suggest_refactoring(self) -> List[Dict]:
-        """リファクタリング提案"""
+        """リファクタリング提案（自己診断と同じプロジェクト分析索引を参照）"""
         suggestions = []
         
-        for file_path in self.get_all_python_files():
-            analysis = self.analyze_file_complexity(file_path)
-            
-            if "error" not in analysis:
-                if analysis["lines"] > 500:
-                    suggestions.append({
-                        "file": file_path,
-                        "reason": f"行数が{analysis['lines']}行を超えています",
-                        "action": "サブモジュールへの分割を検討",
-                        "priority": "high"
-                    })
-                elif analysis["complexity_score"] > 300:
-                    suggestions.append({
-                        "file": file_path,
-                        "reason": f"複雑度スコアが{analysis['complexity_score']}を超えています",
-                        "action": "関数の分割を検討",
-                        "priority": "medium"
-                    })
+        for file_path, analysis in get_analysis_index().complexity().items():
+            if analysis["lines"] > 500:
+                suggestions.append({
+                    "file": file_path,
+                    "reason": f"行数が{analysis['lines']}行を超えています",
+                    "action": "サブモジュールへの分割を検討",
+                    "priority": "high"
+                })
+            elif analysis["complexity_score"] > 300:
+                suggestions.append({
+                    "file": file_path,
+                    "reason": f"複雑度スコアが{analysis['complexity_score']}を超えています",
+                    "action": "関数の分割を検討",
+                    "priority": "medium"
+                })
         
         return suggestions
     
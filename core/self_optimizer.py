@@ -49,7 +49,19 @@ class CodeAnalyzer:
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
-            
+        except Exception as e:
+            return {
+                'file_path': file_path,
+                'error': str(e),
+                'issues': [],
+                'metrics': {},
+                'suggestions': []
+            }
+        return self.analyze_content(file_path, content)
+    
+    def analyze_content(self, file_path: str, content: str) -> Dict:
+        """読み込み済みのソースを分析（プロセスプールからも呼ばれる）"""
+        try:
             analysis_result = {
                 'file_path': file_path,
                 'issues': [],
@@ -7,11 +7,24 @@
 import streamlit as st
 import re
 import json
+from bisect import bisect_left, bisect_right
+from collections import deque
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from dataclasses import dataclass
 from enum import Enum
 
+# 1つの矛盾として扱う最大文字幅（「A.*B」のA〜B間）
+MATCH_WINDOW = 200
+# 分析対象の最大文字数（超える場合は先頭と末尾のみ分析）
+MAX_ANALYSIS_CHARS = 4000
+# 保持する分析履歴の件数
+MAX_HISTORY = 200
+
+_CODE_BLOCK_PATTERN = re.compile(r"```[\s\S]*?(?:```|$)")
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
 class ContradictionType(Enum):
     """矛盾タイプの定義"""
     LOGICAL = "論理的矛盾"
@@ -31,6 +44,138 @@ class ContradictionFinding:
     context: str
     confidence: float
 
+class ContradictionScanner:
+    """矛盾パターンをまとめて走査する線形時間スキャナー
+
+    「(?:A|B).*(?:C|D)」形式のパターンを語句の並びに分解し、全語句の出現位置を
+    1回の走査で収集する。語句が揃わないパターンは走査せずに除外し、揃ったものだけ
+    出現位置リスト上で行内・MATCH_WINDOW文字以内の組み合わせを探す。
+    語句に分解できないパターンは幅を制限した正規表現で照合する。
+    """
+
+    def __init__(self, contradiction_patterns: Dict, window: int = MATCH_WINDOW):
+        self.window = window
+        # (矛盾タイプ, 区間ごとの語句リスト) または (矛盾タイプ, コンパイル済み正規表現)
+        self.literal_rules: List[Tuple[ContradictionType, List[List[str]]]] = []
+        self.regex_rules: List[Tuple[ContradictionType, Any]] = []
+        self.rule_order: List[Tuple[str, int]] = []
+
+        for contradiction_type, patterns in contradiction_patterns.items():
+            for pattern in patterns:
+                segments = self._parse_pattern(pattern)
+                if segments:
+                    self.rule_order.append(('literal', len(self.literal_rules)))
+                    self.literal_rules.append((contradiction_type, segments))
+                else:
+                    bounded = pattern.replace('.*', '.{0,%d}' % window)
+                    self.rule_order.append(('regex', len(self.regex_rules)))
+                    self.regex_rules.append((contradiction_type, re.compile(bounded, re.IGNORECASE)))
+
+        literals = sorted({alt for _, segments in self.literal_rules for segment in segments for alt in segment},
+                          key=len, reverse=True)
+        # 同じ位置では最長一致のみ捕捉されるため、接頭辞となる短い語句を補完する
+        self._implied = {literal: [other for other in literals if literal.startswith(other)] for literal in literals}
+        self._literal_pattern = re.compile("(?=(" + "|".join(re.escape(l) for l in literals) + "))") if literals else None
+
+    @staticmethod
+    def _parse_pattern(pattern: str) -> Optional[List[List[str]]]:
+        """「.*」区切りの語句選択に分解（分解できない場合はNone）"""
+        segments = []
+        for part in pattern.split('.*'):
+            body = part.replace('(?:', '').replace('(', '').replace(')', '')
+            alternatives = body.split('|')
+            if not body or any(not alt or _REGEX_META.intersection(alt) for alt in alternatives):
+                return None
+            segments.append([alt.translate(_ASCII_LOWER) for alt in alternatives])
+        return segments
+
+    def scan(self, text: str) -> List[Tuple[ContradictionType, str]]:
+        """(矛盾タイプ, 一致テキスト) をパターン定義順に返す"""
+        lowered = text.translate(_ASCII_LOWER)
+        occurrences: Dict[str, List[int]] = {}
+        if self._literal_pattern is not None:
+            for match in self._literal_pattern.finditer(lowered):
+                start = match.start()
+                for literal in self._implied[match.group(1)]:
+                    occurrences.setdefault(literal, []).append(start)
+
+        newlines = [index for index, char in enumerate(text) if char == '\n'] if '\n' in text else []
+        results = []
+        for kind, index in self.rule_order:
+            if kind == 'literal':
+                contradiction_type, segments = self.literal_rules[index]
+                # 語句が1つも出現しない区間があればパターンごと除外
+                if any(not any(alt in occurrences for alt in segment) for segment in segments):
+                    continue
+                for start, end in self._match_segments(segments, occurrences, newlines, len(text)):
+                    results.append((contradiction_type, text[start:end]))
+            else:
+                contradiction_type, regex = self.regex_rules[index]
+                results.extend((contradiction_type, match.group()) for match in regex.finditer(text))
+        return results
+
+    def _match_segments(self, segments: List[List[str]], occurrences: Dict[str, List[int]],
+                        newlines: List[int], text_length: int) -> List[Tuple[int, int]]:
+        """出現位置リスト上で区間の並びを照合（最後の区間は窓内で最も右を採用）"""
+        # 区間ごとに 開始位置 -> 語句の長さ（定義順）
+        tables = []
+        for segment in segments:
+            table: Dict[int, List[int]] = {}
+            for alt in segment:
+                for position in occurrences.get(alt, ()):
+                    table.setdefault(position, []).append(len(alt))
+            tables.append((sorted(table), table))
+
+        matches = []
+        cursor = 0
+        first_starts, first_table = tables[0]
+        for start in first_starts:
+            if start < cursor:
+                continue
+            line_index = bisect_left(newlines, start)
+            line_end = newlines[line_index] if line_index < len(newlines) else text_length
+            limit = min(line_end, start + self.window)
+
+            end = self._first_fit(start, first_table[start], limit)
+            if end is None:
+                continue
+            for middle_starts, middle_table in tables[1:-1]:
+                end = self._earliest(middle_starts, middle_table, end, limit)
+                if end is None:
+                    break
+            if end is not None and len(tables) > 1:
+                end = self._rightmost(*tables[-1], end, limit)
+            if end is None:
+                continue
+            matches.append((start, end))
+            cursor = end
+        return matches
+
+    @staticmethod
+    def _first_fit(position: int, lengths: List[int], limit: int) -> Optional[int]:
+        for length in lengths:
+            if position + length <= limit:
+                return position + length
+        return None
+
+    def _earliest(self, starts: List[int], table: Dict[int, List[int]], begin: int, limit: int) -> Optional[int]:
+        for position in starts[bisect_left(starts, begin):]:
+            if position >= limit:
+                break
+            fits = [position + length for length in table[position] if position + length <= limit]
+            if fits:
+                return min(fits)
+        return None
+
+    def _rightmost(self, starts: List[int], table: Dict[int, List[int]], begin: int, limit: int) -> Optional[int]:
+        index = bisect_right(starts, limit) - 1
+        while index >= 0 and starts[index] >= begin:
+            end = self._first_fit(starts[index], table[starts[index]], limit)
+            if end is not None:
+                return end
+            index -= 1
+        return None
+
 class CriticalListeningSystem:
     """クリティカル・リスニングシステム"""
     
@@ -79,8 +224,8 @@ class CriticalListeningSystem:
             ContradictionType.COMPLETENESS: [
                 r"(?:作って|実装して).*(?:ください|お願い)",
                 r"(?:欲しいです|必要です).*(?:作成して)",
-                r"(?:どうすれば|どのように).*(?:いいかわかりません",
-                r"(?:助けて|教えて).*(?:ください",
+                r"(?:どうすれば|どのように).*(?:いいかわかりません)",
+                r"(?:助けて|教えて).*(?:ください)",
                 r"(?:具体的な|詳細な).*(?:方法は？|やり方は？)"
             ]
         }
@@ -138,51 +283,68 @@ class CriticalListeningSystem:
             ]
         }
         
-        # 検知履歴
-        self.analysis_history = []
+        # 矛盾検知スキャナー（パターンを一括コンパイル）
+        self.scanner = ContradictionScanner(self.contradiction_patterns)
+        
+        # 検知履歴（直近MAX_HISTORY件のみ保持）
+        self.analysis_history = deque(maxlen=MAX_HISTORY)
+    
+    def _prepare_input(self, user_input: str) -> str:
+        """貼り付けられたコードを除外し、長すぎる入力は先頭と末尾に絞る"""
+        text = user_input
+        if '```' in text:
+            text = _CODE_BLOCK_PATTERN.sub('\n', text)
+        if len(text) > MAX_ANALYSIS_CHARS:
+            half = MAX_ANALYSIS_CHARS // 2
+            text = text[:half] + '\n' + text[-half:]
+        return text
     
     def analyze_user_input(self, user_input: str, context: Dict = None) -> List[ContradictionFinding]:
         """ユーザー入力を分析して矛盾を検知"""
-        findings = []
-        
-        # 各矛盾タイプをチェック
-        for contradiction_type, patterns in self.contradiction_patterns.items():
-            for pattern in patterns:
-                matches = re.finditer(pattern, user_input, re.IGNORECASE)
-                
-                for match in matches:
-                    # 重大度と確信度を計算
-                    severity = self._calculate_severity(contradiction_type, match.group(), user_input)
-                    confidence = self._calculate_confidence(contradiction_type, match.group(), user_input)
-                    
-                    # 説明文と質問を生成
-                    description = self._generate_description(contradiction_type, match.group(), user_input)
-                    suggested_question = self._generate_question(contradiction_type, match.group(), user_input)
-                    
-                    finding = ContradictionFinding(
-                        type=contradiction_type,
-                        severity=severity,
-                        description=description,
-                        suggested_question=suggested_question,
-                        context=match.group(),
-                        confidence=confidence
-                    )
-                    
-                    findings.append(finding)
-        
-        # 検知結果をフィルタリング
-        filtered_findings = self._filter_findings(findings)
+        text = self._prepare_input(user_input)
+        
+        # 重大度・確信度は入力全体で決まるため、タイプ・一致長ごとに1回だけ計算
+        severities = {}
+        confidences = {}
+        candidates = []
+        for contradiction_type, matched_text in self.scanner.scan(text):
+            if contradiction_type not in severities:
+                severities[contradiction_type] = self._calculate_severity(contradiction_type, matched_text, text)
+            confidence_key = (contradiction_type, len(matched_text) > 10)
+            if confidence_key not in confidences:
+                confidences[confidence_key] = self._calculate_confidence(contradiction_type, matched_text, text)
+            candidates.append((contradiction_type, matched_text,
+                               severities[contradiction_type], confidences[confidence_key]))
+        
+        # 説明文と質問は採用される上位の検知結果についてのみ生成
+        filtered_findings = [
+            ContradictionFinding(
+                type=contradiction_type,
+                severity=severity,
+                description=self._generate_description(contradiction_type, matched_text, text),
+                suggested_question=self._generate_question(contradiction_type, matched_text, text),
+                context=matched_text,
+                confidence=confidence
+            )
+            for contradiction_type, matched_text, severity, confidence in self._filter_candidates(candidates)
+        ]
         
         # 履歴に保存
         self.analysis_history.append({
             'timestamp': datetime.now().isoformat(),
-            'user_input': user_input,
+            'user_input': user_input[:500],
             'findings': [f.__dict__ for f in filtered_findings],
             'context': context
         })
         
         return filtered_findings
     
+    def _filter_candidates(self, candidates: List[Tuple]) -> List[Tuple]:
+        """_filter_findings と同じ基準で候補を絞り込み"""
+        filtered = [c for c in candidates if c[3] > 0.5]
+        filtered.sort(key=lambda c: c[2], reverse=True)
+        return filtered[:3]
+    
     def _calculate_severity(self, contradiction_type: ContradictionType, matched_text: str, full_input: str) -> float:
         """重大度を計算"""
         base_severity = {
@@ -263,7 +425,11 @@ class CriticalListeningSystem:
         elif contradiction_type == ContradictionType.COMPLETENESS:
             return template.format(missing_part=matched_text)
         
-        return template.format(context=matched_text)
+        # 対立部分を抽出できなかった場合は文脈のみを使うテンプレートで質問
+        for fallback in templates:
+            if '{context}' in fallback and '{part' not in fallback:
+                return fallback.format(context=matched_text)
+        return f"この「{matched_text}」について、もう少し詳しく教えてくれないかな？"
     
     def _extract_contradictory_parts(self, text: str) -> List[str]:
         """矛盾する部分を抽出"""
@@ -355,7 +521,7 @@ class CriticalListeningSystem:
         total_severity = 0.0
         
         for analysis in self.analysis_history:
-            for finding in analysis['findings']:
+            for finding in analysis.get('findings', []):
                 finding_type = finding['type']
                 type_counts[finding_type] = type_counts.get(finding_type, 0) + 1
                 total_severity += finding['severity']
@@ -366,7 +532,7 @@ class CriticalListeningSystem:
         return {
             'total_analyses': len(self.analysis_history),
             'contradiction_types': type_counts,
-            'average_severity': total_severity / sum(len(a['findings']) for a in self.analysis_history) if self.analysis_history else 0.0,
+            'average_severity': total_severity / sum(type_counts.values()) if type_counts else 0.0,
             'most_common_type': most_common_type
         }
 
@@ -435,7 +601,7 @@ def create_critical_listening_gui(critical_system: CriticalListeningSystem):
     # 最近の分析履歴
     if st.button("📋 分析履歴"):
         if critical_system.analysis_history:
-            recent_analyses = critical_system.analysis_history[-5:]
+            recent_analyses = list(critical_system.analysis_history)[-5:]
             for i, analysis in enumerate(recent_analyses, 1):
                 with st.expander(f"分析 {i}: {analysis['timestamp'][:19]}"):
                     st.write(f"入力: {analysis.get('user_input', 'N/A')[:100]}...")
@@ -5,25 +5,126 @@
 """
 
 import os
-import subprocess
+import re
 import json
 import time
 import asyncio
-from typing import Dict, List, Optional, Any, Union
+import threading
+from typing import Dict, List, Optional, Any, Union, Tuple
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import shutil
 import base64
 import hashlib
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import aiofiles
 import qrcode
 from io import BytesIO
 import streamlit as st
+from services.adb_channel import AdbError, get_adb_channel_manager
 from dataclasses import dataclass, field
 from enum import Enum
 
+# ハッシュ計算・ストリーミング転送のチャンクサイズ（ファイル全体をメモリに載せない）
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+# 端末からの分割アップロードで推奨するチャンクサイズ
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Linux の reflink（FICLONE ioctl）
+FICLONE = 0x40049409
+# 保存ファイル名に埋め込む端末IDの形式（パス区切りを含まない1要素）
+DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]+")
+
+def file_md5(path: Union[str, Path], chunk_size: int = TRANSFER_CHUNK_SIZE) -> str:
+    """ファイルのMD5をチャンク単位で計算"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(source: Path, destination: Path) -> str:
+    """reflink → ハードリンク → コピーの順に試し、使った方法を返す
+
+    reflink は元ファイルと独立したスナップショットになる。ハードリンクは元ファイルと実体を共有するため、
+    元ファイルが書き換えられると配信内容も変わる（配信前に file_unchanged で確認する）。
+    """
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(source, destination)
+        return "reflink"
+    except (ImportError, OSError):
+        destination.unlink(missing_ok=True)
+    
+    try:
+        os.link(source, destination)
+        return "hardlink"
+    except OSError:
+        pass
+    
+    shutil.copy2(source, destination)
+    return "copy"
+
+def upload_target_path(upload_dir: Path, device_id: str, filename: str) -> Path:
+    """アップロードの保存先（端末IDとファイル名がアップロードディレクトリ外を指す場合は ValueError）"""
+    if not isinstance(device_id, str) or not DEVICE_ID_PATTERN.fullmatch(device_id) or device_id in (".", ".."):
+        raise ValueError(f"不正な端末IDです: {device_id!r}")
+    name = Path(filename or "").name
+    if not name or name in (".", ".."):
+        raise ValueError(f"不正なファイル名です: {filename!r}")
+    target = Path(upload_dir) / f"{device_id}_{name}"
+    if target.resolve().parent != Path(upload_dir).resolve():
+        raise ValueError(f"アップロードディレクトリ外への保存はできません: {target}")
+    return target
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """単一の Range ヘッダー（bytes=start-end / bytes=-suffix）を (開始, 終了) に変換。不正ならNone"""
+    try:
+        unit, _, spec = range_header.partition('=')
+        if unit.strip() != 'bytes' or ',' in spec:
+            return None
+        start_text, _, end_text = spec.strip().partition('-')
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            suffix = int(end_text)
+            if suffix <= 0:
+                return None
+            start = max(file_size - suffix, 0)
+            end = file_size - 1
+        end = min(end, file_size - 1)
+        if start > end or start >= file_size:
+            return None
+        return start, end
+    except ValueError:
+        return None
+
+def iter_file_range(path: Union[str, Path], start: int, end: int, chunk_size: int = TRANSFER_CHUNK_SIZE):
+    """ファイルの start〜end バイトをチャンク単位で返す"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def iter_served_range(collaboration: "CrossDeviceCollaboration", transfer_id: str,
+                      path: Union[str, Path], start: int, end: int):
+    """iter_file_range と同じだが、切断などで送れなかった分の送信量の予約を戻す"""
+    remaining = end - start + 1
+    try:
+        for chunk in iter_file_range(path, start, end):
+            yield chunk
+            remaining -= len(chunk)
+    finally:
+        collaboration.release_download_bytes(transfer_id, remaining)
+
 class DeviceType(Enum):
     """デバイスタイプ"""
     ANDROID = "android"
@@ -60,6 +161,37 @@ class FileTransfer:
     expires_at: datetime
     download_count: int = 0
     max_downloads: int = 10
+    link_mode: str = "copy"
+    # 作成時の転送ファイルの更新時刻（ハードリンク先の元ファイルが書き換えられたことの検出用）
+    file_mtime_ns: int = 0
+    # 送信済みバイト数（Rangeでの続きの取得も含めて max_downloads 回分のサイズまで）
+    bytes_served: int = 0
+    
+    @property
+    def byte_budget(self) -> int:
+        return self.file_size * self.max_downloads
+    
+    def file_unchanged(self) -> bool:
+        """転送ファイルが作成時のサイズ・更新時刻のままか（変わっていればチェックサム・ETagが古い）"""
+        try:
+            stat_result = os.stat(self.file_path)
+        except OSError:
+            return False
+        if stat_result.st_size != self.file_size:
+            return False
+        return not self.file_mtime_ns or stat_result.st_mtime_ns == self.file_mtime_ns
+
+@dataclass
+class UploadSession:
+    """再開可能な分割アップロード"""
+    upload_id: str
+    device_id: str
+    filename: str
+    file_size: int
+    part_path: str
+    created_at: datetime
+    expires_at: datetime
+    checksum: Optional[str] = None
 
 @dataclass
 class AgentCommand:
@@ -84,30 +216,38 @@ class CrossDeviceCollaboration:
         self.connected_devices = {}
         self.device_info_file = "connected_devices.json"
         
-        # ファイル転送管理
+        # ファイル転送管理（再起動後も転送リンクが有効なよう一覧を保存）
         self.file_transfers = {}
         self.transfer_dir = Path("file_transfers")
         self.transfer_dir.mkdir(exist_ok=True)
+        self.transfer_index_file = self.transfer_dir / "transfers.json"
+        self._transfer_lock = threading.RLock()
+        
+        # 端末からの分割アップロード
+        self.upload_sessions = {}
+        self.upload_dir = Path("uploads")
+        self.partial_upload_dir = self.upload_dir / ".partial"
+        self.partial_upload_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_session_file = self.partial_upload_dir / "sessions.json"
         
         # エージェント通信
         self.agent_commands = {}
         self.command_history = []
         
-        # ADB設定
+        # ADB設定（adb サーバーとソケットで直接通信）
+        self.adb = get_adb_channel_manager()
         self.adb_available = self._check_adb_availability()
         self.connected_android_devices = []
         
         # 初期化
         self._load_device_info()
+        self._load_file_transfers()
+        self._load_upload_sessions()
         self._scan_android_devices()
     
     def _check_adb_availability(self) -> bool:
         """ADBの利用可能性をチェック"""
-        try:
-            result = subprocess.run(["adb", "version"], capture_output=True, text=True, timeout=5)
-            return result.returncode == 0
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            return False
+        return self.adb.is_available()
     
     def _load_device_info(self):
         """デバイス情報を読み込み"""
@@ -147,55 +287,32 @@ class CrossDeviceCollaboration:
             print(f"デバイス情報保存エラー: {str(e)}")
     
     def _scan_android_devices(self):
-        """Androidデバイスをスキャン"""
+        """Androidデバイスをスキャン（端末情報は並行取得）"""
         if not self.adb_available:
             return
         
         try:
-            result = subprocess.run(["adb", "devices"], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')[1:]  # ヘッダーを除外
-                self.connected_android_devices = []
-                
-                for line in lines:
-                    if line.strip():
-                        parts = line.split('\t')
-                        if len(parts) >= 2:
-                            device_id = parts[0].strip()
-                            status = parts[1].strip()
-                            
-                            if status == "device":
-                                self.connected_android_devices.append(device_id)
-                                
-                                # デバイス情報を取得
-                                device_info = self._get_android_device_info(device_id)
-                                if device_info:
-                                    self.connected_devices[device_id] = device_info
+            self.connected_android_devices = [
+                device_id for device_id, status in self.adb.devices() if status == "device"
+            ]
+            
+            # デバイス情報を取得
+            device_infos = self.adb.map_devices(self._get_android_device_info, self.connected_android_devices)
+            for device_id, device_info in device_infos.items():
+                if isinstance(device_info, DeviceInfo):
+                    self.connected_devices[device_id] = device_info
         except Exception as e:
             print(f"Androidデバイススキャンエラー: {str(e)}")
     
     def _get_android_device_info(self, device_id: str) -> Optional[DeviceInfo]:
-        """Androidデバイス情報を取得"""
+        """Androidデバイス情報を取得（プロパティ・IPを1回の問い合わせで取得）"""
         try:
-            # デバイスモデルを取得
-            result = subprocess.run(["adb", "-s", device_id, "shell", "getprop", "ro.product.model"], 
-                                  capture_output=True, text=True, timeout=5)
-            model = result.stdout.strip() if result.returncode == 0 else "Unknown"
-            
-            # IPアドレスを取得（WiFi接続の場合）
-            ip_result = subprocess.run(["adb", "-s", device_id, "shell", "ip", "addr", "show", "wlan0"], 
-                                      capture_output=True, text=True, timeout=5)
-            ip_address = "Unknown"
-            if ip_result.returncode == 0:
-                import re
-                ip_match = re.search(r"inet ([0-9\.]+)", ip_result.stdout)
-                if ip_match:
-                    ip_address = ip_match.group(1)
+            snapshot = self.adb.get_device_snapshot(device_id)
             
             return DeviceInfo(
                 device_id=device_id,
                 device_type=DeviceType.ANDROID,
-                ip_address=ip_address,
+                ip_address=snapshot["ip_address"],
                 last_seen=datetime.now(),
                 capabilities=["file_transfer", "remote_operation", "app_install"],
                 status="online"
@@ -224,25 +341,57 @@ class CrossDeviceCollaboration:
             print(f"デバイス登録エラー: {str(e)}")
             return False
     
+    def _load_file_transfers(self):
+        """ファイル転送一覧を読み込み（実体が消えたものは捨てる）"""
+        try:
+            if self.transfer_index_file.exists():
+                with open(self.transfer_index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for transfer_id, info in data.items():
+                    if not Path(info["file_path"]).exists():
+                        continue
+                    info["created_at"] = datetime.fromisoformat(info["created_at"])
+                    info["expires_at"] = datetime.fromisoformat(info["expires_at"])
+                    self.file_transfers[transfer_id] = FileTransfer(**info)
+        except Exception as e:
+            print(f"ファイル転送一覧読み込みエラー: {str(e)}")
+    
+    def _save_file_transfers(self):
+        """ファイル転送一覧を保存"""
+        try:
+            with self._transfer_lock:
+                data = {
+                    transfer_id: {
+                        **transfer.__dict__,
+                        "created_at": transfer.created_at.isoformat(),
+                        "expires_at": transfer.expires_at.isoformat()
+                    }
+                    for transfer_id, transfer in self.file_transfers.items()
+                }
+            temp_file = self.transfer_index_file.with_suffix(".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.transfer_index_file)
+        except Exception as e:
+            print(f"ファイル転送一覧保存エラー: {str(e)}")
+    
     def create_file_transfer(self, file_path: str, max_downloads: int = 10, 
                            expires_hours: int = 24) -> Optional[FileTransfer]:
-        """ファイル転送を作成"""
+        """ファイル転送を作成（reflink/ハードリンクで実体を共有し、コピーは最後の手段）"""
         try:
             path = Path(file_path)
             if not path.exists():
                 return None
             
-            # ファイル情報を取得
-            file_size = path.stat().st_size
-            
-            # チェックサムを計算
-            with open(path, 'rb') as f:
-                checksum = hashlib.md5(f.read()).hexdigest()
-            
-            # 転送用ファイルをコピー
+            # 転送用ファイルを配置
             transfer_id = hashlib.md5(f"{file_path}{datetime.now()}".encode()).hexdigest()[:8]
             transfer_path = self.transfer_dir / f"{transfer_id}_{path.name}"
-            shutil.copy2(path, transfer_path)
+            link_mode = link_or_copy(path, transfer_path)
+            
+            # 配置した実体からサイズ・更新時刻を取り、チェックサムをチャンク単位で計算
+            stat_result = transfer_path.stat()
+            file_size = stat_result.st_size
+            checksum = file_md5(transfer_path)
             
             # ファイル転送情報を作成
             file_transfer = FileTransfer(
@@ -253,17 +402,21 @@ class CrossDeviceCollaboration:
                 checksum=checksum,
                 created_at=datetime.now(),
                 expires_at=datetime.now() + timedelta(hours=expires_hours),
-                max_downloads=max_downloads
+                max_downloads=max_downloads,
+                link_mode=link_mode,
+                file_mtime_ns=stat_result.st_mtime_ns
             )
             
-            self.file_transfers[transfer_id] = file_transfer
+            with self._transfer_lock:
+                self.file_transfers[transfer_id] = file_transfer
+            self._save_file_transfers()
             return file_transfer
         except Exception as e:
             print(f"ファイル転送作成エラー: {str(e)}")
             return None
     
-    def get_file_transfer(self, transfer_id: str) -> Optional[FileTransfer]:
-        """ファイル転送情報を取得"""
+    def get_file_transfer(self, transfer_id: str, resuming: bool = False) -> Optional[FileTransfer]:
+        """ファイル転送情報を取得（resuming=True は開始済みダウンロードの続き）"""
         transfer = self.file_transfers.get(transfer_id)
         
         if transfer:
@@ -272,30 +425,180 @@ class CrossDeviceCollaboration:
                 self.cleanup_file_transfer(transfer_id)
                 return None
             
-            # ダウンロード回数チェック
-            if transfer.download_count >= transfer.max_downloads:
+            # 続きの取得は開始済みのダウンロードがあり、送信量に残りがある場合だけ
+            if resuming:
+                if transfer.download_count == 0 or transfer.bytes_served >= transfer.byte_budget:
+                    return None
+            elif transfer.download_count >= transfer.max_downloads:
                 return None
         
         return transfer
     
     def increment_download_count(self, transfer_id: str) -> bool:
         """ダウンロード回数を増加"""
-        transfer = self.file_transfers.get(transfer_id)
-        if transfer:
+        with self._transfer_lock:
+            transfer = self.file_transfers.get(transfer_id)
+            if not transfer:
+                return False
             transfer.download_count += 1
-            return True
-        return False
+        self._save_file_transfers()
+        return True
+    
+    def reserve_download_bytes(self, transfer_id: str, length: int) -> bool:
+        """送信量を予約（max_downloads 回分のサイズを超える場合は拒否）"""
+        with self._transfer_lock:
+            transfer = self.file_transfers.get(transfer_id)
+            if not transfer or transfer.bytes_served + length > transfer.byte_budget:
+                return False
+            transfer.bytes_served += length
+        self._save_file_transfers()
+        return True
+    
+    def release_download_bytes(self, transfer_id: str, length: int):
+        """送信できなかった分の予約を戻す（途中で切断されたダウンロード）"""
+        if length <= 0:
+            return
+        with self._transfer_lock:
+            transfer = self.file_transfers.get(transfer_id)
+            if not transfer:
+                return
+            transfer.bytes_served = max(0, transfer.bytes_served - length)
+        self._save_file_transfers()
     
     def cleanup_file_transfer(self, transfer_id: str):
-        """ファイル転送をクリーンアップ"""
+        """ファイル転送をクリーンアップ（リンクを外すだけなので元ファイルは残る）"""
         transfer = self.file_transfers.get(transfer_id)
         if transfer:
             try:
                 Path(transfer.file_path).unlink(missing_ok=True)
-                del self.file_transfers[transfer_id]
+                with self._transfer_lock:
+                    self.file_transfers.pop(transfer_id, None)
+                self._save_file_transfers()
             except Exception as e:
                 print(f"ファイル転送クリーンアップエラー: {str(e)}")
     
+    def _load_upload_sessions(self):
+        """分割アップロードのセッションを読み込み"""
+        try:
+            if self.upload_session_file.exists():
+                with open(self.upload_session_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for upload_id, info in data.items():
+                    info["created_at"] = datetime.fromisoformat(info["created_at"])
+                    info["expires_at"] = datetime.fromisoformat(info["expires_at"])
+                    self.upload_sessions[upload_id] = UploadSession(**info)
+        except Exception as e:
+            print(f"アップロードセッション読み込みエラー: {str(e)}")
+    
+    def _save_upload_sessions(self):
+        """分割アップロードのセッションを保存"""
+        try:
+            with self._transfer_lock:
+                data = {
+                    upload_id: {
+                        **session.__dict__,
+                        "created_at": session.created_at.isoformat(),
+                        "expires_at": session.expires_at.isoformat()
+                    }
+                    for upload_id, session in self.upload_sessions.items()
+                }
+            temp_file = self.upload_session_file.with_suffix(".tmp")
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.upload_session_file)
+        except Exception as e:
+            print(f"アップロードセッション保存エラー: {str(e)}")
+    
+    def create_upload_session(self, device_id: str, filename: str, file_size: int,
+                              checksum: Optional[str] = None, expires_hours: int = 24) -> UploadSession:
+        """分割アップロードを開始（端末ID・ファイル名が不正なら ValueError）"""
+        upload_target_path(self.upload_dir, device_id, filename)
+        upload_id = hashlib.md5(f"{device_id}{filename}{datetime.now()}".encode()).hexdigest()[:12]
+        part_path = self.partial_upload_dir / f"{upload_id}.part"
+        part_path.touch()
+        
+        session = UploadSession(
+            upload_id=upload_id,
+            device_id=device_id,
+            filename=Path(filename).name,
+            file_size=file_size,
+            part_path=str(part_path),
+            created_at=datetime.now(),
+            expires_at=datetime.now() + timedelta(hours=expires_hours),
+            checksum=checksum
+        )
+        
+        with self._transfer_lock:
+            self.upload_sessions[upload_id] = session
+        self._save_upload_sessions()
+        return session
+    
+    def get_upload_session(self, upload_id: str) -> Optional[UploadSession]:
+        """分割アップロードのセッションを取得（期限切れは破棄）"""
+        session = self.upload_sessions.get(upload_id)
+        if session and datetime.now() > session.expires_at:
+            self.cancel_upload(upload_id)
+            return None
+        return session
+    
+    def get_upload_offset(self, session: UploadSession) -> int:
+        """受信済みバイト数（途中ファイルのサイズが正）"""
+        part_path = Path(session.part_path)
+        return part_path.stat().st_size if part_path.exists() else 0
+    
+    def complete_upload(self, upload_id: str) -> Dict:
+        """全チャンク受信後にサイズ・チェックサムを検証して確定"""
+        session = self.get_upload_session(upload_id)
+        if not session:
+            return {"success": False, "error": "アップロードセッションが見つかりません"}
+        
+        received = self.get_upload_offset(session)
+        if received != session.file_size:
+            return {"success": False, "error": f"受信サイズが不足しています ({received}/{session.file_size})",
+                    "offset": received}
+        
+        checksum = file_md5(session.part_path)
+        if session.checksum and session.checksum.lower() != checksum:
+            self.cancel_upload(upload_id)
+            return {"success": False, "error": "チェックサムが一致しません"}
+        
+        try:
+            file_path = upload_target_path(self.upload_dir, session.device_id, session.filename)
+        except ValueError as e:
+            self.cancel_upload(upload_id)
+            return {"success": False, "error": str(e)}
+        os.replace(session.part_path, file_path)
+        with self._transfer_lock:
+            self.upload_sessions.pop(upload_id, None)
+        self._save_upload_sessions()
+        self._register_uploading_device(session.device_id)
+        
+        return {
+            "success": True,
+            "filename": session.filename,
+            "file_path": str(file_path),
+            "size": received,
+            "checksum": checksum
+        }
+    
+    def cancel_upload(self, upload_id: str):
+        """分割アップロードを破棄"""
+        with self._transfer_lock:
+            session = self.upload_sessions.pop(upload_id, None)
+        if session:
+            Path(session.part_path).unlink(missing_ok=True)
+            self._save_upload_sessions()
+    
+    def _register_uploading_device(self, device_id: str):
+        """アップロード元デバイスを登録（まだの場合）"""
+        if device_id not in self.connected_devices:
+            self.register_device(
+                device_id=device_id,
+                device_type=DeviceType.UNKNOWN,
+                ip_address="unknown",
+                capabilities=["file_upload"]
+            )
+    
     def create_agent_command(self, command_type: CommandType, source_device: str, 
                            target_device: str, payload: Dict) -> Optional[str]:
         """エージェントコマンドを作成"""
@@ -326,20 +629,12 @@ class CrossDeviceCollaboration:
         if device_id not in self.connected_android_devices:
             return {"success": False, "error": "デバイスが接続されていません"}
         
-        try:
-            # コマンドを実行
-            result = subprocess.run(["adb", "-s", device_id, "shell", command], 
-                                  capture_output=True, text=True, timeout=30)
-            
-            return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr if result.returncode != 0 else None
-            }
-        except subprocess.TimeoutExpired:
-            return {"success": False, "error": "コマンドタイムアウト"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self.adb.shell(device_id, command, timeout=30)
+    
+    def execute_adb_commands(self, commands: Dict[str, str]) -> Dict[str, Dict]:
+        """複数デバイスへのコマンドを並行実行 {デバイスID: コマンド} → {デバイスID: 結果}"""
+        return self.adb.map_devices(lambda device_id: self.execute_adb_command(device_id, commands[device_id]),
+                                    commands.keys())
     
     def remote_adb_operation(self, device_id: str, operation: str, **kwargs) -> Dict:
         """リモートADB操作"""
@@ -359,45 +654,15 @@ class CrossDeviceCollaboration:
     
     def _adb_send_file(self, device_id: str, local_path: str, remote_path: str) -> Dict:
         """ファイルをAndroidデバイスに送信"""
-        try:
-            result = subprocess.run(["adb", "-s", device_id, "push", local_path, remote_path], 
-                                  capture_output=True, text=True, timeout=60)
-            
-            return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr if result.returncode != 0 else None
-            }
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self.adb.push(device_id, local_path, remote_path)
     
     def _adb_pull_file(self, device_id: str, remote_path: str, local_path: str) -> Dict:
         """Androidデバイスからファイルを取得"""
-        try:
-            result = subprocess.run(["adb", "-s", device_id, "pull", remote_path, local_path], 
-                                  capture_output=True, text=True, timeout=60)
-            
-            return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr if result.returncode != 0 else None
-            }
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self.adb.pull(device_id, remote_path, local_path)
     
     def _adb_install_apk(self, device_id: str, apk_path: str) -> Dict:
         """APKをインストール"""
-        try:
-            result = subprocess.run(["adb", "-s", device_id, "install", apk_path], 
-                                  capture_output=True, text=True, timeout=120)
-            
-            return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr if result.returncode != 0 else None
-            }
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self.adb.install(device_id, apk_path)
     
     def _adb_delete_file(self, device_id: str, remote_path: str) -> Dict:
         """ファイルを削除"""
@@ -415,28 +680,15 @@ class CrossDeviceCollaboration:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def _adb_get_device_info(self, device_id: str) -> Dict:
-        """デバイス情報を取得"""
+    def _adb_get_device_info(self, device_id: str, refresh: bool = False) -> Dict:
+        """デバイス情報を取得（キャッシュが古ければ1回の問い合わせでまとめて更新）"""
         try:
-            info = {}
-            
-            # モデル情報
-            model_result = self.execute_adb_command(device_id, "getprop ro.product.model")
-            if model_result["success"]:
-                info["model"] = model_result["output"].strip()
-            
-            # Androidバージョン
-            version_result = self.execute_adb_command(device_id, "getprop ro.build.version.release")
-            if version_result["success"]:
-                info["android_version"] = version_result["output"].strip()
-            
-            # バッテリー情報
-            battery_result = self.execute_adb_command(device_id, "dumpsys battery | grep level")
-            if battery_result["success"]:
-                info["battery_level"] = battery_result["output"].strip()
-            
+            snapshot = self.adb.get_device_snapshot(device_id, refresh=refresh)
+            info = {"model": snapshot["model"], "android_version": snapshot["android_version"]}
+            if snapshot["battery_level"]:
+                info["battery_level"] = snapshot["battery_level"]
             return {"success": True, "info": info}
-        except Exception as e:
+        except (OSError, AdbError) as e:
             return {"success": False, "error": str(e)}
     
     def generate_universal_link(self, transfer_id: str, base_url: str) -> str:
@@ -479,12 +731,17 @@ class CrossDeviceCollaboration:
         current_time = datetime.now()
         expired_transfers = []
         
-        for transfer_id, transfer in self.file_transfers.items():
+        for transfer_id, transfer in list(self.file_transfers.items()):
             if current_time > transfer.expires_at:
                 expired_transfers.append(transfer_id)
         
         for transfer_id in expired_transfers:
             self.cleanup_file_transfer(transfer_id)
+        
+        expired_uploads = [upload_id for upload_id, session in self.upload_sessions.items()
+                           if current_time > session.expires_at]
+        for upload_id in expired_uploads:
+            self.cancel_upload(upload_id)
     
     def get_system_status(self) -> Dict:
         """システムステータスを取得"""
@@ -493,6 +750,7 @@ class CrossDeviceCollaboration:
             "connected_android_devices": len(self.connected_android_devices),
             "total_connected_devices": len(self.connected_devices),
             "active_file_transfers": len(self.file_transfers),
+            "active_upload_sessions": len(self.upload_sessions),
             "pending_commands": len([cmd for cmd in self.agent_commands.values() if cmd.status == "pending"]),
             "device_types": {
                 device_type.value: len([d for d in self.connected_devices.values() if d.device_type == device_type])
@@ -577,6 +835,7 @@ class CrossDeviceGUI:
         # Androidデバイススキャン
         if st.button("🔍 Androidデバイスをスキャン"):
             with st.spinner("スキャン中..."):
+                self.collaboration.adb.invalidate()
                 self.collaboration._scan_android_devices()
                 self.collaboration._save_device_info()
                 st.success("スキャン完了！")
@@ -705,58 +964,182 @@ class CrossDeviceGUI:
 def setup_cross_device_endpoints(app: FastAPI, collaboration: CrossDeviceCollaboration):
     """クロスデバイス連携用のFastAPIエンドポイントを設定"""
     
+    # 分割アップロードごとのロック（チャンクの offset 確認と追記をまとめて行う）
+    upload_locks: Dict[str, asyncio.Lock] = {}
+    
     @app.get("/download/{transfer_id}")
-    async def download_file(transfer_id: str):
-        """ファイルダウンロードエンドポイント"""
-        transfer = collaboration.get_file_transfer(transfer_id)
+    async def download_file(transfer_id: str, request: Request):
+        """ファイルダウンロードエンドポイント（Range指定で途中から再開可能）"""
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
         
+        fresh = collaboration.get_file_transfer(transfer_id)
+        resumable = collaboration.get_file_transfer(transfer_id, resuming=True)
+        transfer = fresh or resumable
         if not transfer:
             raise HTTPException(status_code=404, detail="ファイル転送が見つかりません")
+        if not transfer.file_unchanged():
+            # ハードリンク先の元ファイルが書き換えられた（チェックサム・ETagと内容が一致しない）
+            collaboration.cleanup_file_transfer(transfer_id)
+            raise HTTPException(status_code=410, detail="元ファイルが変更されたため、この転送は無効になりました")
+        
+        byte_range = None
+        if range_header and (not if_range or if_range.strip('"') == transfer.checksum):
+            byte_range = parse_range_header(range_header, transfer.file_size)
+            if byte_range is None:
+                raise HTTPException(status_code=416, detail="Rangeが不正です",
+                                    headers={"Content-Range": f"bytes */{transfer.file_size}"})
+        
+        if byte_range and byte_range[0] > 0:
+            # 開始済みダウンロードの続きは回数に含めない（送信量の上限で制限する）
+            if not resumable:
+                raise HTTPException(status_code=404, detail="ファイル転送が見つかりません")
+        elif not fresh:
+            raise HTTPException(status_code=404, detail="ファイル転送が見つかりません")
         
-        # ダウンロード回数を増加
-        collaboration.increment_download_count(transfer_id)
+        start, end = byte_range or (0, transfer.file_size - 1)
+        length = end - start + 1
+        if not collaboration.reserve_download_bytes(transfer_id, length):
+            raise HTTPException(status_code=404, detail="ファイル転送が見つかりません")
+        if start == 0:
+            collaboration.increment_download_count(transfer_id)
+        
+        headers = {"Accept-Ranges": "bytes", "ETag": f'"{transfer.checksum}"'}
+        
+        if byte_range is None:
+            # FileResponse はチャンク送信（サーバーが対応していれば sendfile）でメモリに載せない
+            return FileResponse(
+                transfer.file_path,
+                media_type='application/octet-stream',
+                filename=transfer.filename,
+                headers=headers
+            )
         
-        # ファイルを返す
-        return FileResponse(
-            transfer.file_path,
+        headers.update({
+            "Content-Range": f"bytes {start}-{end}/{transfer.file_size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f'attachment; filename="{transfer.filename}"'
+        })
+        return StreamingResponse(
+            iter_served_range(collaboration, transfer_id, transfer.file_path, start, end),
+            status_code=206,
             media_type='application/octet-stream',
-            filename=transfer.filename
+            headers=headers
         )
     
     @app.post("/upload")
     async def upload_file(file: UploadFile = File(...), device_id: str = Form(...)):
-        """ファイルアップロードエンドポイント"""
+        """ファイルアップロードエンドポイント（小さいファイル向け。大きいものは /upload/session を使用）"""
+        try:
+            file_path = upload_target_path(collaboration.upload_dir, device_id, file.filename)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         try:
             # アップロードディレクトリを作成
-            upload_dir = Path("uploads")
-            upload_dir.mkdir(exist_ok=True)
+            collaboration.upload_dir.mkdir(exist_ok=True)
             
-            # ファイルを保存
-            file_path = upload_dir / f"{device_id}_{file.filename}"
+            # ファイルをチャンク単位で保存
+            size = 0
             
             async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+                while chunk := await file.read(TRANSFER_CHUNK_SIZE):
+                    size += len(chunk)
+                    await f.write(chunk)
             
             # デバイスを登録（まだの場合）
-            if device_id not in collaboration.connected_devices:
-                collaboration.register_device(
-                    device_id=device_id,
-                    device_type=DeviceType.UNKNOWN,
-                    ip_address="unknown",
-                    capabilities=["file_upload"]
-                )
+            collaboration._register_uploading_device(device_id)
             
             return {
                 "success": True,
                 "filename": file.filename,
                 "file_path": str(file_path),
-                "size": len(content)
+                "size": size
             }
         
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"アップロードエラー: {str(e)}")
     
+    @app.post("/upload/session")
+    async def create_upload_session(upload_info: Dict):
+        """分割アップロード開始エンドポイント"""
+        device_id = upload_info.get("device_id")
+        filename = upload_info.get("filename")
+        file_size = upload_info.get("file_size")
+        if not device_id or not filename or not isinstance(file_size, int) or file_size < 0:
+            raise HTTPException(status_code=400, detail="device_id・filename・file_sizeが必要です")
+        
+        try:
+            session = collaboration.create_upload_session(device_id, filename, file_size,
+                                                          checksum=upload_info.get("checksum"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            "success": True,
+            "upload_id": session.upload_id,
+            "offset": 0,
+            "chunk_size": UPLOAD_CHUNK_SIZE,
+            "expires_at": session.expires_at.isoformat()
+        }
+    
+    @app.get("/upload/{upload_id}")
+    async def get_upload_status(upload_id: str):
+        """分割アップロードの受信状況（再開位置の確認用）"""
+        session = collaboration.get_upload_session(upload_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="アップロードセッションが見つかりません")
+        
+        return {
+            "upload_id": upload_id,
+            "offset": collaboration.get_upload_offset(session),
+            "file_size": session.file_size,
+            "chunk_size": UPLOAD_CHUNK_SIZE
+        }
+    
+    @app.put("/upload/{upload_id}")
+    async def upload_chunk(upload_id: str, request: Request, offset: int):
+        """チャンク受信エンドポイント（offset は受信済みバイト数と一致する必要がある）"""
+        session = collaboration.get_upload_session(upload_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="アップロードセッションが見つかりません")
+        
+        # 同じアップロードへの並行したPUTを直列化し、ロック内で受信済みサイズを確かめてから追記する
+        async with upload_locks.setdefault(upload_id, asyncio.Lock()):
+            current_offset = collaboration.get_upload_offset(session)
+            if offset != current_offset:
+                return JSONResponse(status_code=409, content={
+                    "success": False,
+                    "error": "offsetが受信済みサイズと一致しません",
+                    "offset": current_offset
+                })
+            
+            received = current_offset
+            async with aiofiles.open(session.part_path, 'ab') as f:
+                async for chunk in request.stream():
+                    received += len(chunk)
+                    if received > session.file_size:
+                        break
+                    await f.write(chunk)
+            
+            if received > session.file_size:
+                # 超過分は書かずに途中ファイルを元のサイズへ戻す
+                os.truncate(session.part_path, current_offset)
+                raise HTTPException(status_code=413, detail="宣言されたファイルサイズを超えています")
+        
+        return {"success": True, "upload_id": upload_id, "offset": received,
+                "complete": received == session.file_size}
+    
+    @app.post("/upload/{upload_id}/complete")
+    async def complete_upload(upload_id: str):
+        """分割アップロード確定エンドポイント"""
+        async with upload_locks.setdefault(upload_id, asyncio.Lock()):
+            result = await asyncio.to_thread(collaboration.complete_upload, upload_id)
+        if upload_id not in collaboration.upload_sessions:
+            upload_locks.pop(upload_id, None)
+        if not result["success"]:
+            return JSONResponse(status_code=409, content=result)
+        return result
+    
     @app.post("/agent/command")
     async def agent_command(command: Dict):
         """エージェントコマンド受信エンドポイント"""
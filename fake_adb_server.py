@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+偽の adb サーバー
+adb サーバーのソケットプロトコルを最小限だけ実装し、実機なしで ADB チャネルを検証する
+
+- host:version / host:devices / host:transport:<serial>
+- shell:<command>（getprop・ip addr・dumpsys battery・echo・ls・cat・rm・pm install と "|", ";", "$?" を解釈）
+- sync:（SEND / RECV / QUIT。端末ごとのメモリ上のファイルシステム）
+- latency で1接続ごとの往復遅延（USB・Wi-Fi越しの応答時間）を再現
+"""
+
+import argparse
+import shlex
+import socketserver
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+ADB_SERVER_VERSION = 41
+
+
+@dataclass
+class FakeDevice:
+    """偽の端末"""
+    serial: str
+    state: str = "device"
+    properties: Dict[str, str] = field(default_factory=dict)
+    ip_address: str = "192.168.0.10"
+    battery_level: int = 80
+    files: Dict[str, bytes] = field(default_factory=dict)
+    installed: List[str] = field(default_factory=list)
+
+    @classmethod
+    def create(cls, index: int) -> "FakeDevice":
+        return cls(
+            serial=f"emulator-{5554 + index * 2}",
+            properties={
+                "ro.product.model": f"Pixel Fake {index}",
+                "ro.product.manufacturer": "Google",
+                "ro.build.version.release": "14",
+                "ro.build.version.sdk": "34",
+            },
+            ip_address=f"192.168.0.{10 + index}",
+            battery_level=80 - index
+        )
+
+
+class FakeShell:
+    """shell: サービスのコマンドを解釈する"""
+
+    def __init__(self, device: FakeDevice):
+        self.device = device
+        self.last_status = 0
+
+    def run(self, command_line: str) -> str:
+        output = []
+        for command in command_line.split(";"):
+            command = command.replace("2>/dev/null", "").strip()
+            if not command:
+                continue
+            text = None
+            status = 0
+            for stage in command.split("|"):
+                text, status = self._run_stage(stage.strip(), text)
+            self.last_status = status
+            output.append(text)
+        return "".join(output)
+
+    def _run_stage(self, stage: str, stdin: Optional[str]) -> Tuple[str, int]:
+        stage = stage.replace("$?", str(self.last_status))
+        args = shlex.split(stage)
+        if not args:
+            return "", 0
+        name, rest = args[0], args[1:]
+        device = self.device
+
+        if name == "grep":
+            pattern = rest[-1] if rest else ""
+            lines = [line for line in (stdin or "").splitlines() if pattern in line]
+            return "".join(line + "\n" for line in lines), 0 if lines else 1
+        if name == "echo":
+            return " ".join(rest) + "\n", 0
+        if name == "getprop":
+            if rest:
+                return device.properties.get(rest[0], "") + "\n", 0
+            return "".join(f"[{key}]: [{value}]\n" for key, value in sorted(device.properties.items())), 0
+        if name == "ip":
+            return (f"3: wlan0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500\n"
+                    f"    inet {device.ip_address}/24 brd 192.168.0.255 scope global wlan0\n"), 0
+        if name == "dumpsys" and rest[:1] == ["battery"]:
+            return f"Current Battery Service state:\n  AC powered: false\n  level: {device.battery_level}\n  scale: 100\n", 0
+        if name == "ls":
+            paths = [arg for arg in rest if not arg.startswith("-")] or ["/"]
+            prefix = paths[0].rstrip("/") + "/"
+            names = sorted(path[len(prefix):] for path in device.files if path.startswith(prefix))
+            return "".join(name + "\n" for name in names), 0
+        if name == "cat" and rest:
+            if rest[0] not in device.files:
+                return f"cat: {rest[0]}: No such file or directory\n", 1
+            return device.files[rest[0]].decode("utf-8", errors="replace"), 0
+        if name == "rm":
+            paths = [arg for arg in rest if not arg.startswith("-")]
+            missing = [path for path in paths if device.files.pop(path, None) is None]
+            if missing and "-f" not in rest:
+                return f"rm: {missing[0]}: No such file or directory\n", 1
+            return "", 0
+        if name == "pm" and rest[:1] == ["install"]:
+            path = rest[-1]
+            if path not in device.files:
+                return "Failure [INSTALL_FAILED_INVALID_URI]\n", 1
+            device.installed.append(path.rsplit("/", 1)[-1])
+            return "Performing Streamed Install\nSuccess\n", 0
+        return f"/system/bin/sh: {name}: not found\n", 127
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    """1接続分のプロトコル処理"""
+
+    def _recv_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    def _read_request(self) -> str:
+        length = int(self._recv_exact(4), 16)
+        return self._recv_exact(length).decode("utf-8")
+
+    def _okay(self, payload: Optional[str] = None):
+        data = b"OKAY"
+        if payload is not None:
+            encoded = payload.encode("utf-8")
+            data += f"{len(encoded):04x}".encode("ascii") + encoded
+        self.request.sendall(data)
+
+    def _fail(self, message: str):
+        encoded = message.encode("utf-8")
+        self.request.sendall(b"FAIL" + f"{len(encoded):04x}".encode("ascii") + encoded)
+
+    def handle(self):
+        server: "FakeAdbServer" = self.server.fake  # type: ignore[attr-defined]
+        try:
+            request = self._read_request()
+            server.record(request)
+            if request == "host:version":
+                self._okay(f"{ADB_SERVER_VERSION:04x}")
+            elif request == "host:devices":
+                self._okay("".join(f"{d.serial}\t{d.state}\n" for d in server.devices.values()))
+            elif request.startswith("host:transport:"):
+                device = server.devices.get(request.split(":", 2)[2])
+                if not device or device.state != "device":
+                    self._fail(f"device '{request.split(':', 2)[2]}' not found")
+                    return
+                time.sleep(server.latency)
+                self._okay()
+                self._serve_device(server, device, self._read_request())
+            else:
+                self._fail(f"unknown host service: {request}")
+        except ConnectionError:
+            pass
+
+    def _serve_device(self, server: "FakeAdbServer", device: FakeDevice, service: str):
+        server.record(service)
+        if service.startswith("shell:"):
+            self._okay()
+            with server.lock:
+                output = FakeShell(device).run(service[len("shell:"):])
+            self.request.sendall(output.encode("utf-8"))
+        elif service == "sync:":
+            self._okay()
+            self._serve_sync(server, device)
+        else:
+            self._fail(f"unknown device service: {service}")
+
+    def _serve_sync(self, server: "FakeAdbServer", device: FakeDevice):
+        while True:
+            command = self._recv_exact(4)
+            length = struct.unpack("<I", self._recv_exact(4))[0]
+            if command == b"QUIT":
+                return
+            payload = self._recv_exact(length).decode("utf-8")
+            if command == b"SEND":
+                remote_path = payload.rsplit(",", 1)[0]
+                data = b""
+                while True:
+                    chunk_id = self._recv_exact(4)
+                    chunk_length = struct.unpack("<I", self._recv_exact(4))[0]
+                    if chunk_id == b"DONE":
+                        break
+                    data += self._recv_exact(chunk_length)
+                with server.lock:
+                    device.files[remote_path] = data
+                self.request.sendall(b"OKAY" + struct.pack("<I", 0))
+            elif command == b"RECV":
+                with server.lock:
+                    data = device.files.get(payload)
+                if data is None:
+                    message = b"No such file or directory"
+                    self.request.sendall(b"FAIL" + struct.pack("<I", len(message)) + message)
+                    continue
+                for offset in range(0, len(data), 64 * 1024):
+                    chunk = data[offset:offset + 64 * 1024]
+                    self.request.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                self.request.sendall(b"DONE" + struct.pack("<I", 0))
+            else:
+                return
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeAdbServer:
+    """偽の adb サーバー本体"""
+
+    def __init__(self, device_count: int = 1, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.devices: Dict[str, FakeDevice] = {}
+        for index in range(device_count):
+            self.add_device(FakeDevice.create(index))
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests: List[str] = []
+        self._server = _ThreadingTCPServer((host, port), FakeAdbHandler)
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def add_device(self, device: FakeDevice):
+        self.devices[device.serial] = device
+
+    def record(self, request: str):
+        with self.lock:
+            self.requests.append(request)
+
+    def start_in_background(self) -> "FakeAdbServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="偽の adb サーバー")
+    parser.add_argument("--port", type=int, default=5037)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--devices", type=int, default=1, help="偽の端末数")
+    parser.add_argument("--latency", type=float, default=0.0, help="1接続ごとの往復遅延（秒）")
+    args = parser.parse_args()
+
+    server = FakeAdbServer(args.devices, args.host, args.port, args.latency)
+    print(f"🤖 偽の adb サーバーを起動: {args.host}:{server.address[1]} (端末 {args.devices}台)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
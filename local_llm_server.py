@@ -2,61 +2,453 @@
 # -*- coding: utf-8 -*-
 """
 自作ローカルLLM推論サーバー
+Ollama互換APIのシミュレーター（実モデルなしでクライアント・ルーター・オーケストレーターを検証する）
+
+- /api/generate・/api/chat のNDJSONストリーミング（stream省略時はOllamaと同じくストリーミング）
+- 初回トークンまでの時間・トークン生成速度の分布、モデルロード時間（keep_alive経過で再ロード）
+- 同時実行数の上限と待ち行列（溢れた場合は503）、エラー注入（リクエスト失敗・ストリーム途中の失敗）
+- /api/embeddings・/api/embed はプロンプトから決定的なベクトルを返す
+
+応答本文はシードとリクエスト内容から決めるため、同じ設定・同じリクエストなら常に同じになる。
+エラー注入と所要時間はシードから始まるリクエストごとの乱数で抽選するため、同じリクエストの再試行でも
+error_rate どおりに成功・失敗が分かれる（同じ設定・同じ順序のリクエスト列なら再現する）。
+time_scale=0 にすると待機せずに応答する。
 """
 
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
 import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
+# 応答テキストの材料（決定的に選ぶ）
+FILLER_WORDS = [
+    "この", "処理", "では", "まず", "入力", "を", "確認", "し", "次に", "結果", "を", "返します", "。",
+    "The", "function", "returns", "a", "value", "after", "checking", "the", "input", ".",
+]
+
+
 class GenerateRequest(BaseModel):
     model: str
-    prompt: str
-    stream: bool = False
+    prompt: str = ""
+    system: Optional[str] = None
+    stream: bool = True
+    options: Optional[Dict[str, Any]] = None
+    keep_alive: Optional[Union[int, float, str]] = None
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str = ""
+
+
+class ChatRequest(BaseModel):
+    model: str
+    messages: List[ChatMessage] = []
+    stream: bool = True
+    options: Optional[Dict[str, Any]] = None
+    keep_alive: Optional[Union[int, float, str]] = None
+
+
+class EmbeddingsRequest(BaseModel):
+    model: str
+    prompt: str = ""
+
+
+class EmbedRequest(BaseModel):
+    model: str
+    input: Union[str, List[str]] = ""
+
+
+@dataclass
+class LatencyDistribution:
+    """待ち時間の分布（fixed / uniform / normal / lognormal、単位は秒またはトークン/秒）"""
+    kind: str = "fixed"
+    mean: float = 0.0
+    stddev: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+    minimum: float = 0.0
+
+    @classmethod
+    def from_spec(cls, spec) -> "LatencyDistribution":
+        """数値なら固定値、辞書ならその分布"""
+        if isinstance(spec, LatencyDistribution):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", mean=float(spec))
+        return cls(**spec)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.low, self.high)
+        elif self.kind == "normal":
+            value = rng.gauss(self.mean, self.stddev)
+        elif self.kind == "lognormal":
+            # mean/stddev は実際の値の平均・標準偏差として指定
+            variance = math.log(1 + (self.stddev / self.mean) ** 2) if self.mean else 0.0
+            value = rng.lognormvariate(math.log(self.mean) - variance / 2, math.sqrt(variance)) if self.mean else 0.0
+        else:
+            value = self.mean
+        return max(self.minimum, value)
+
+
+@dataclass
+class ModelProfile:
+    """シミュレートするモデルの性能特性"""
+    name: str
+    time_to_first_token: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed", 0.2))
+    tokens_per_second: LatencyDistribution = field(default_factory=lambda: LatencyDistribution("fixed", 40.0))
+    load_delay: float = 1.0
+    default_tokens: int = 64
+    embedding_dim: int = 384
+    parameter_size: str = "8B"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelProfile":
+        data = dict(data)
+        for key in ("time_to_first_token", "tokens_per_second"):
+            if key in data:
+                data[key] = LatencyDistribution.from_spec(data[key])
+        return cls(**data)
+
+
+@dataclass
+class SimulatorConfig:
+    """シミュレーター全体の設定"""
+    models: Dict[str, ModelProfile] = field(default_factory=lambda: {"local-llm": ModelProfile("local-llm")})
+    max_concurrency: int = 4
+    max_queue: int = 32
+    queue_timeout: float = 30.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    stream_error_rate: float = 0.0
+    keep_alive: float = 300.0
+    time_scale: float = 1.0
+    seed: int = 0
+    unknown_model_profile: bool = True  # 未定義のモデル名も既定の特性で受け付ける
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SimulatorConfig":
+        data = dict(data)
+        if "models" in data:
+            data["models"] = {
+                name: ModelProfile.from_dict({"name": name, **profile})
+                for name, profile in data["models"].items()
+            }
+        return cls(**data)
+
+    @classmethod
+    def from_file(cls, path: str) -> "SimulatorConfig":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class SimulatedError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _iso_now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime())
+
 
 class LocalLLMServer:
-    def __init__(self, port: int = 11435):
+    def __init__(self, port: int = 11435, config: Optional[SimulatorConfig] = None, host: str = "localhost"):
         self.port = port
+        self.host = host
+        self.config = config or SimulatorConfig()
         self.app = FastAPI(title="Local LLM Server")
+        self.loaded_models: Dict[str, float] = {}  # モデル名 → 最終利用時刻
+        self.stats = {"requests": 0, "completed": 0, "errors": 0, "rejected": 0, "model_loads": 0,
+                      "active": 0, "waiting": 0, "tokens": 0}
+        # エラー・遅延の抽選はリクエストごとに進む乱数で行う（同じプロンプトでも再試行すれば結果が変わる）
+        self._request_rng = random.Random(self.config.seed)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._server: Optional[uvicorn.Server] = None
         self.setup_app()
-    
+
     def setup_app(self):
         self.app.add_middleware(
             CORSMiddleware,
             allow_origins=["*"]
         )
         self.setup_routes()
-    
+
+    # シミュレーション
+    def profile_for(self, model: str) -> ModelProfile:
+        profile = self.config.models.get(model) or self.config.models.get(model.split(":")[0])
+        if profile is None:
+            if not self.config.unknown_model_profile:
+                raise SimulatedError(404, f"model '{model}' not found")
+            profile = ModelProfile(model)
+        return profile
+
+    def rng_for(self, kind: str, model: str, text: str) -> random.Random:
+        """シードとリクエスト内容から決まる乱数生成器（応答本文の生成用）"""
+        digest = hashlib.blake2b(f"{self.config.seed}|{kind}|{model}|{text}".encode("utf-8"), digest_size=8)
+        return random.Random(int.from_bytes(digest.digest(), "big"))
+
+    async def _sleep(self, seconds: float):
+        if seconds > 0 and self.config.time_scale > 0:
+            await asyncio.sleep(seconds * self.config.time_scale)
+
+    async def _acquire_slot(self):
+        """同時実行枠を確保（待ち行列が一杯・待ち時間超過は503）"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+        if self.stats["active"] + self.stats["waiting"] >= self.config.max_concurrency + self.config.max_queue:
+            self.stats["rejected"] += 1
+            raise SimulatedError(503, "server busy: queue is full")
+        self.stats["waiting"] += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.config.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise SimulatedError(503, "server busy: queue timeout")
+        finally:
+            self.stats["waiting"] -= 1
+        self.stats["active"] += 1
+
+    def _release_slot(self):
+        self.stats["active"] -= 1
+        self._semaphore.release()
+
+    async def _ensure_loaded(self, profile: ModelProfile) -> float:
+        """モデルロードを模擬し、ロード時間（秒）を返す（同時ロードは1回にまとめる）"""
+        lock = self._load_locks.setdefault(profile.name, asyncio.Lock())
+        async with lock:
+            last_used = self.loaded_models.get(profile.name)
+            now = time.monotonic()
+            if last_used is not None and now - last_used <= self.config.keep_alive:
+                self.loaded_models[profile.name] = now
+                return 0.0
+            await self._sleep(profile.load_delay)
+            self.stats["model_loads"] += 1
+            self.loaded_models[profile.name] = time.monotonic()
+            return profile.load_delay
+
+    def _inject_error(self, rng: random.Random):
+        if self.config.error_rate and rng.random() < self.config.error_rate:
+            raise SimulatedError(self.config.error_status, "simulated error")
+
+    def _plan(self, kind: str, model: str, text: str, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """応答トークンと所要時間を決定（本文は内容から決定的、エラー・遅延はリクエストごとに抽選）"""
+        profile = self.profile_for(model)
+        rng = self.rng_for(kind, model, text)
+        draw = random.Random(self._request_rng.getrandbits(64))
+        self._inject_error(draw)
+        num_predict = int((options or {}).get("num_predict") or profile.default_tokens)
+        if num_predict < 0:
+            num_predict = profile.default_tokens
+        head = f"Local LLM response for: {text[-200:]}"
+        tokens = [head] + [" " + rng.choice(FILLER_WORDS) for _ in range(max(0, num_predict - 1))]
+        tokens_per_second = max(0.1, profile.tokens_per_second.sample(draw))
+        fail_at = None
+        if self.config.stream_error_rate and draw.random() < self.config.stream_error_rate:
+            fail_at = draw.randrange(1, max(2, len(tokens)))
+        return {
+            "profile": profile,
+            "tokens": tokens[:max(1, num_predict)],
+            "ttft": profile.time_to_first_token.sample(draw),
+            "token_interval": 1.0 / tokens_per_second,
+            "prompt_eval_count": max(1, len(text) // 4),
+            "fail_at": fail_at
+        }
+
+    def _final_fields(self, plan: Dict[str, Any], load_duration: float) -> Dict[str, Any]:
+        """Ollamaの完了メッセージと同じ統計項目（ナノ秒）"""
+        eval_count = len(plan["tokens"])
+        eval_duration = plan["token_interval"] * max(0, eval_count - 1)
+        total = load_duration + plan["ttft"] + eval_duration
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int(total * 1e9),
+            "load_duration": int(load_duration * 1e9),
+            "prompt_eval_count": plan["prompt_eval_count"],
+            "prompt_eval_duration": int(plan["ttft"] * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(eval_duration * 1e9)
+        }
+
+    async def _run(self, kind: str, model: str, text: str, options, stream: bool, chunk):
+        """generate/chat の共通処理（chunk(token) は1トークン分の応答本体を返す）"""
+        self.stats["requests"] += 1
+        try:
+            plan = self._plan(kind, model, text, options)
+            await self._acquire_slot()
+        except SimulatedError as e:
+            if e.status != 503:
+                self.stats["errors"] += 1
+            return JSONResponse({"error": str(e)}, status_code=e.status)
+
+        try:
+            load_duration = await self._ensure_loaded(plan["profile"])
+        except BaseException:
+            self._release_slot()
+            raise
+
+        if not stream:
+            try:
+                await self._sleep(plan["ttft"] + plan["token_interval"] * (len(plan["tokens"]) - 1))
+                if plan["fail_at"] is not None:
+                    self.stats["errors"] += 1
+                    return JSONResponse({"error": "simulated error during generation"}, status_code=500)
+                self.stats["completed"] += 1
+                self.stats["tokens"] += len(plan["tokens"])
+                return {"model": model, "created_at": _iso_now(), **chunk("".join(plan["tokens"])),
+                        **self._final_fields(plan, load_duration)}
+            finally:
+                self._release_slot()
+
+        async def body():
+            try:
+                await self._sleep(plan["ttft"])
+                for index, token in enumerate(plan["tokens"]):
+                    if index:
+                        await self._sleep(plan["token_interval"])
+                    if plan["fail_at"] is not None and index == plan["fail_at"]:
+                        self.stats["errors"] += 1
+                        yield json.dumps({"error": "simulated error during generation"}) + "\n"
+                        return
+                    self.stats["tokens"] += 1
+                    yield json.dumps({"model": model, "created_at": _iso_now(), **chunk(token), "done": False},
+                                     ensure_ascii=False) + "\n"
+                self.stats["completed"] += 1
+                yield json.dumps({"model": model, "created_at": _iso_now(), **chunk(""),
+                                  **self._final_fields(plan, load_duration)}) + "\n"
+            finally:
+                self._release_slot()
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    def embedding(self, model: str, text: str) -> List[float]:
+        """テキストから決定的な単位ベクトルを生成"""
+        profile = self.profile_for(model)
+        rng = self.rng_for("embedding", model, text)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(profile.embedding_dim)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {**self.stats, "loaded_models": sorted(self.loaded_models)}
+
     def setup_routes(self):
         @self.app.get("/")
         async def root():
             return {"message": "Local LLM Server is running"}
-        
+
         @self.app.get("/api/tags")
         async def get_tags():
             return {
                 "models": [
                     {
-                        "name": "local-llm",
-                        "model": "local-llm",
-                        "modified_at": time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                        "name": name,
+                        "model": name,
+                        "modified_at": _iso_now(),
+                        "size": 0,
+                        "details": {"parameter_size": profile.parameter_size, "family": "simulator"}
                     }
+                    for name, profile in self.config.models.items()
                 ]
             }
-        
-        @self.app.post("/api/generate")
-        async def generate(request: GenerateRequest):
+
+        @self.app.get("/api/ps")
+        async def get_running_models():
+            now = time.monotonic()
             return {
-                "model": request.model,
-                "response": f"Local LLM response for: {request.prompt}",
-                "done": True,
-                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                "models": [
+                    {"name": name, "model": name, "expires_in": max(0.0, self.config.keep_alive - (now - used))}
+                    for name, used in self.loaded_models.items()
+                    if now - used <= self.config.keep_alive
+                ]
             }
-    
+
+        @self.app.post("/api/generate")
+        async def generate(request: GenerateRequest):
+            text = f"{request.system}\n{request.prompt}" if request.system else request.prompt
+            return await self._run("generate", request.model, text, request.options, request.stream,
+                                   lambda token: {"response": token})
+
+        @self.app.post("/api/chat")
+        async def chat(request: ChatRequest):
+            text = "\n".join(f"{m.role}: {m.content}" for m in request.messages)
+            return await self._run("chat", request.model, text, request.options, request.stream,
+                                   lambda token: {"message": {"role": "assistant", "content": token}})
+
+        @self.app.post("/api/embeddings")
+        async def embeddings(request: EmbeddingsRequest):
+            try:
+                return {"embedding": self.embedding(request.model, request.prompt)}
+            except SimulatedError as e:
+                return JSONResponse({"error": str(e)}, status_code=e.status)
+
+        @self.app.post("/api/embed")
+        async def embed(request: EmbedRequest):
+            inputs = [request.input] if isinstance(request.input, str) else request.input
+            try:
+                return {"model": request.model, "embeddings": [self.embedding(request.model, text) for text in inputs]}
+            except SimulatedError as e:
+                return JSONResponse({"error": str(e)}, status_code=e.status)
+
+        @self.app.get("/api/simulator/stats")
+        async def simulator_stats():
+            return self.get_statistics()
+
     def run(self):
-        uvicorn.run(self.app, host="localhost", port=self.port)
+        uvicorn.run(self.app, host=self.host, port=self.port)
 
-if __name__ == "__main__":
-    server = LocalLLMServer(port=11435)
+    def start_in_background(self, timeout: float = 10.0) -> threading.Thread:
+        """別スレッドでサーバーを起動し、待ち受け開始まで待つ（テスト・ベンチマーク用）"""
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning"))
+        thread = threading.Thread(target=self._server.run, name="local-llm-server", daemon=True)
+        thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not thread.is_alive():
+                raise RuntimeError(f"ローカルLLMサーバーの起動に失敗しました (port {self.port})")
+            time.sleep(0.02)
+        return thread
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama互換ローカルLLMシミュレーター")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--config", help="設定JSON（SimulatorConfigの項目）")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--time-scale", type=float, help="待機時間の倍率（0で待機なし）")
+    parser.add_argument("--max-concurrency", type=int)
+    parser.add_argument("--error-rate", type=float)
+    args = parser.parse_args()
+
+    config = SimulatorConfig.from_file(args.config) if args.config else SimulatorConfig()
+    for name in ("seed", "time_scale", "max_concurrency", "error_rate"):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(config, name, value)
+
+    server = LocalLLMServer(port=args.port, config=config, host=args.host)
     server.run()
+
+
+if __name__ == "__main__":
+    main()
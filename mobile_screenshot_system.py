@@ -10,7 +10,6 @@ import json
 import datetime
 import os
 import re
-import base64
 import shutil
 import hashlib
 from pathlib import Path
@@ -22,6 +21,8 @@ import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from ollama_vrm_integrated_app import OllamaClient, ConversationalEvolutionAgent
+from services.job_queue import JobQueue, QueueFullError, queue_full_response, register_job_routes
+from services.screenshot_ingest import ScreenshotIngestPipeline, save_metadata_file
 
 class MobileScreenshotSystem:
     def __init__(self):
@@ -29,6 +30,7 @@ class MobileScreenshotSystem:
         self.conversational_agent = ConversationalEvolutionAgent()
         self.debug_sessions = []
         self.debug_count = 0
+        self._session_lock = threading.Lock()
         
         # Docker保存先
         self.docker_screenshots_dir = Path("/app/screenshots")  # Docker内パス
@@ -45,6 +47,19 @@ class MobileScreenshotSystem:
         # 既存データを読み込み
         self.load_sessions()
         
+        # 取り込みパイプライン（重複排除・OCR/AI分析を上限付きジョブキューで実行）
+        self.jobs = JobQueue(self.data_dir / "mobile_jobs.db", max_workers=2, max_pending=16, name="mobile-screenshot")
+        self.ingest = ScreenshotIngestPipeline(
+            self.local_screenshots_dir,
+            self.docker_screenshots_dir,
+            ocr=self.extract_text_from_image,
+            analyze=self.analyze_with_ai,
+            finalize=self._record_session,
+            job_queue=self.jobs
+        )
+        for session in self.debug_sessions:
+            self.ingest.register(session)
+        
         # Flaskアプリケーション
         self.app = Flask(__name__)
         self.setup_routes()
@@ -106,34 +121,15 @@ class MobileScreenshotSystem:
     def save_screenshot_to_docker(self, image_data, filename, metadata=None):
         """スクリーンショットをDockerに保存"""
         try:
-            # Docker内パスとローカルパスの両方に保存
-            docker_path = self.docker_screenshots_dir / filename
-            local_path = self.local_screenshots_dir / filename
-            
-            # ローカルに保存
-            with open(local_path, "wb") as f:
-                f.write(image_data)
-            
-            # Docker内にも保存（Docker環境の場合）
-            if os.path.exists(str(self.docker_screenshots_dir)):
-                with open(docker_path, "wb") as f:
-                    f.write(image_data)
-            
-            # メタデータ保存
-            if metadata:
-                metadata_file = self.local_screenshots_dir / f"{filename}.meta.json"
-                with open(metadata_file, "w", encoding="utf-8") as f:
-                    json.dump(metadata, f, ensure_ascii=False, indent=2)
+            # ローカルに1回だけ書き込み、Docker内（Docker環境の場合）にはリンクを作成
+            save_result = self.ingest.store(image_data, filename)
+            save_metadata_file(self.local_screenshots_dir, filename, metadata)
             
             print(f"💾 スクリーンショットを保存: {filename}")
-            print(f"   Docker: {docker_path}")
-            print(f"   ローカル: {local_path}")
+            print(f"   Docker: {save_result['docker_path']}")
+            print(f"   ローカル: {save_result['local_path']}")
             
-            return {
-                "docker_path": str(docker_path),
-                "local_path": str(local_path),
-                "filename": filename
-            }
+            return save_result
             
         except Exception as e:
             print(f"❌ 保存エラー: {e}")
@@ -160,11 +156,7 @@ class MobileScreenshotSystem:
     def analyze_with_ai(self, image_path, text_content, metadata=None):
         """AIで画像とテキストを分析"""
         try:
-            # 画像をbase64にエンコード
-            with open(image_path, "rb") as f:
-                image_data = f.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-            
+            # 分析はテキストモデルで行うため画像本体は送らない（OCR結果とメタデータのみ）
             # メタデータ情報を構築
             meta_info = ""
             if metadata:
@@ -230,19 +222,21 @@ class MobileScreenshotSystem:
         print(f"\n🔍 モバイルスクリーンショット分析開始: {filename}")
         print("-" * 60)
         
-        # Dockerに保存
-        save_result = self.save_screenshot_to_docker(image_data, filename, metadata)
-        if not save_result:
-            print("❌ スクリーンショット保存に失敗しました")
+        # 保存・テキスト抽出・AI分析（同一/類似画像は過去の結果を再利用）
+        try:
+            return self.ingest.process(image_data, filename, metadata)
+        except Exception as e:
+            print(f"❌ デバッグ処理エラー: {e}")
             return None
-        
-        # テキスト抽出
-        print("📝 テキスト抽出中...")
-        text_content = self.extract_text_from_image(save_result["local_path"])
-        
-        # AI分析
-        print("🤖 AI分析中...")
-        ai_analysis = self.analyze_with_ai(save_result["local_path"], text_content, metadata)
+    
+    def submit_screenshot(self, image_data, filename, metadata=None):
+        """スクリーンショットデバッグをバックグラウンドで実行し、ジョブIDを返す"""
+        print(f"\n📥 モバイルスクリーンショット受付: {filename}")
+        return self.ingest.submit(image_data, filename, metadata)
+    
+    def _record_session(self, save_result, metadata, text_content, ai_analysis, dedup=None):
+        """分析結果をセッションとして記録（ワーカーから並行して呼ばれる）"""
+        save_metadata_file(self.local_screenshots_dir, save_result["filename"], metadata)
         
         # 結果表示
         print(f"\n📊 分析結果:")
@@ -254,34 +248,55 @@ class MobileScreenshotSystem:
         print(f"\n🤖 AI分析:")
         print(f"{ai_analysis}")
         
-        # セッション記録
-        session = {
-            "id": self.debug_count + 1,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "filename": filename,
-            "docker_path": save_result["docker_path"],
-            "local_path": save_result["local_path"],
-            "metadata": metadata or {},
-            "text_content": text_content[:500] if text_content else "",
-            "ai_analysis": ai_analysis,
-            "consciousness_before": self.conversational_agent.consciousness_level
-        }
-        
-        # 進化チェック
-        print("\n🧠 進化チェック中...")
-        evolution_result = self.check_evolution(ai_analysis, metadata)
-        if evolution_result:
-            session["evolution"] = evolution_result
-            print(f"✨ 自己進化が発生しました！")
-        
-        # セッション保存
-        self.debug_sessions.append(session)
-        self.debug_count += 1
-        self.save_sessions()
+        with self._session_lock:
+            # セッション記録
+            session = {
+                "id": self.debug_count + 1,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "filename": save_result["filename"],
+                "docker_path": save_result["docker_path"],
+                "local_path": save_result["local_path"],
+                "sha256": save_result.get("sha256"),
+                "phash": save_result.get("phash"),
+                "metadata": metadata or {},
+                "text_content": text_content[:500] if text_content else "",
+                "ai_analysis": ai_analysis,
+                "consciousness_before": self.conversational_agent.consciousness_level
+            }
+            
+            if dedup:
+                # 再利用した分析では進化チェックを繰り返さない
+                session["dedup"] = dedup
+            else:
+                # 進化チェック
+                print("\n🧠 進化チェック中...")
+                evolution_result = self.check_evolution(ai_analysis, metadata)
+                if evolution_result:
+                    session["evolution"] = evolution_result
+                    print(f"✨ 自己進化が発生しました！")
+            
+            # セッション保存
+            self.debug_sessions.append(session)
+            self.debug_count += 1
+            self.save_sessions()
         
         print(f"\n✅ デバッグセッション完了 (ID: {session['id']})")
         return session
     
+    def session_response(self, session):
+        """セッションをAPIレスポンス形式に変換"""
+        evolution_type = session.get("evolution", {}).get("evolution_type") if session.get("evolution") else None
+        return {
+            "success": True,
+            "filename": session["filename"],
+            "session_id": session["id"],
+            "consciousness_level": f"{self.conversational_agent.consciousness_level:.3f}",
+            "analysis": session["ai_analysis"],
+            "evolution": evolution_type,
+            "evolution_type": evolution_type,
+            "reused_from": session.get("dedup", {}).get("reused_from") if session.get("dedup") else None
+        }
+    
     def setup_routes(self):
         """Flaskルートを設定"""
         
@@ -376,7 +391,12 @@ class MobileScreenshotSystem:
                     body: formData
                 });
                 
-                const result = await response.json();
+                let result = await response.json();
+                
+                // 解析はバックグラウンドで実行されるため、完了までジョブをロングポーリング
+                while (result.success && result.status !== 'done') {
+                    result = await (await fetch(result.status_url + '?wait=25')).json();
+                }
                 
                 if (result.success) {
                     resultDiv.innerHTML = `
@@ -431,25 +451,25 @@ class MobileScreenshotSystem:
                 # 画像データ読み込み
                 image_data = file.read()
                 
-                # デバッグ実行
-                session = self.debug_screenshot(image_data, filename, metadata)
+                # デバッグはワーカーで実行し、ジョブIDを即座に返す
+                job_id = self.submit_screenshot(image_data, filename, metadata)
                 
-                if session:
-                    return jsonify({
-                        "success": True,
-                        "filename": filename,
-                        "session_id": session["id"],
-                        "consciousness_level": f"{self.conversational_agent.consciousness_level:.3f}",
-                        "analysis": session["ai_analysis"],
-                        "evolution": session.get("evolution", {}).get("evolution_type") if session.get("evolution") else None,
-                        "evolution_type": session.get("evolution", {}).get("evolution_type") if session.get("evolution") else None
-                    })
-                else:
-                    return jsonify({"success": False, "error": "デバッグ処理に失敗しました"})
+                return jsonify({
+                    "success": True,
+                    "status": "queued",
+                    "job_id": job_id,
+                    "filename": filename,
+                    "status_url": f"/api/jobs/{job_id}"
+                }), 202
                     
+            except QueueFullError as e:
+                return queue_full_response(e)
             except Exception as e:
                 return jsonify({"success": False, "error": str(e)})
         
+        # ジョブ状態（?wait=秒 でロングポーリング）・SSE・統計
+        register_job_routes(self.app, self.jobs, formatter=self.session_response)
+        
         @self.app.route('/api/sessions')
         def get_sessions():
             """セッション一覧API"""
@@ -466,7 +486,8 @@ class MobileScreenshotSystem:
                 "status": "running",
                 "sessions_count": len(self.debug_sessions),
                 "consciousness_level": self.conversational_agent.consciousness_level,
-                "evolution_count": len([s for s in self.debug_sessions if 'evolution' in s])
+                "evolution_count": len([s for s in self.debug_sessions if 'evolution' in s]),
+                "ingest": self.ingest.get_statistics()
             })
     
     def start_server(self, host='0.0.0.0', port=8080):
@@ -9,13 +9,17 @@ import json
 import re
 import time
 from typing import Dict, List, Optional, Tuple, Any, Union
-from datetime import datetime, timedelta
+from datetime import datetime
 from dataclasses import dataclass, field
 from enum import Enum
 import threading
 import queue
 from pathlib import Path
 import hashlib
+import math
+from bisect import bisect_left
+from collections import OrderedDict
+from core.context_budget import register_context_window
 
 class ModelRole(Enum):
     """モデル役割"""
@@ -42,6 +46,7 @@ class ModelConfig:
     description: str
     capabilities: List[str] = field(default_factory=list)
     avg_response_time: float = 0.0
+    p95_response_time: float = 0.0
     success_rate: float = 1.0
     last_used: datetime = field(default_factory=datetime.now)
 
@@ -55,6 +60,264 @@ class RoutingDecision:
     processing_time: float
     fallback_used: bool = False
 
+@dataclass(frozen=True)
+class RequestClassification:
+    """入力テキストの分類結果"""
+    complexity: TaskComplexity
+    keyword_count: int
+    has_image_keywords: bool
+    has_code: bool
+    has_technical_terms: bool
+
+class _MetricsBucket:
+    """固定幅の時間バケット"""
+    __slots__ = ('epoch', 'count', 'success', 'latency_sum', 'latency_max', 'histogram')
+
+    def __init__(self, epoch: int, bins: int):
+        self.epoch = epoch
+        self.count = 0
+        self.success = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * bins
+
+class RollingMetrics:
+    """モデル別の時間バケット型ローリングメトリクス
+
+    モデルごとに固定幅バケットのリングバッファを持ち、件数・成功数・
+    応答時間の合計と対数スケールのヒストグラムを集計する。
+    記録はO(1)、期間指定の集計は対象バケット数に比例する。
+    """
+
+    # 10ms から約9分まで25%刻みの上限値
+    LATENCY_BOUNDS = tuple(0.01 * 1.25 ** i for i in range(50))
+
+    def __init__(self, bucket_seconds: int = 60, retention_seconds: int = 24 * 3600):
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = math.ceil(retention_seconds / bucket_seconds)
+        self._rings: Dict[str, List[Optional[_MetricsBucket]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, success: bool, latency: float, now: Optional[float] = None):
+        """1件記録"""
+        epoch = int((time.time() if now is None else now) // self.bucket_seconds)
+        slot = epoch % self.num_buckets
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None:
+                ring = self._rings[key] = [None] * self.num_buckets
+            bucket = ring[slot]
+            if bucket is None or bucket.epoch != epoch:
+                bucket = ring[slot] = _MetricsBucket(epoch, len(self.LATENCY_BOUNDS) + 1)
+            bucket.count += 1
+            bucket.success += 1 if success else 0
+            bucket.latency_sum += latency
+            bucket.latency_max = max(bucket.latency_max, latency)
+            bucket.histogram[bisect_left(self.LATENCY_BOUNDS, latency)] += 1
+
+    def window(self, key: str, seconds: float, now: Optional[float] = None) -> Dict:
+        """直近seconds秒の集計（件数・成功率・平均・p50・p95）"""
+        current = int((time.time() if now is None else now) // self.bucket_seconds)
+        span = min(self.num_buckets, max(1, math.ceil(seconds / self.bucket_seconds)))
+        oldest = current - span + 1
+
+        count = success = 0
+        latency_sum = latency_max = 0.0
+        histogram = [0] * (len(self.LATENCY_BOUNDS) + 1)
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring:
+                for epoch in range(oldest, current + 1):
+                    bucket = ring[epoch % self.num_buckets]
+                    if bucket is None or bucket.epoch != epoch:
+                        continue
+                    count += bucket.count
+                    success += bucket.success
+                    latency_sum += bucket.latency_sum
+                    latency_max = max(latency_max, bucket.latency_max)
+                    for index, value in enumerate(bucket.histogram):
+                        if value:
+                            histogram[index] += value
+
+        if count == 0:
+            return {'count': 0}
+        return {
+            'count': count,
+            'success_rate': success / count,
+            'avg_response_time': latency_sum / count,
+            'p50_response_time': self._percentile(histogram, count, 0.50, latency_max),
+            'p95_response_time': self._percentile(histogram, count, 0.95, latency_max),
+            'max_response_time': latency_max
+        }
+
+    def _percentile(self, histogram: List[int], count: int, quantile: float, latency_max: float) -> float:
+        """ヒストグラムから分位点を推定（ビン内は線形補間）"""
+        target = quantile * count
+        cumulative = 0
+        for index, value in enumerate(histogram):
+            if not value:
+                continue
+            if cumulative + value >= target:
+                lower = self.LATENCY_BOUNDS[index - 1] if index > 0 else 0.0
+                upper = self.LATENCY_BOUNDS[index] if index < len(self.LATENCY_BOUNDS) else latency_max
+                fraction = (target - cumulative) / value
+                return min(latency_max, lower + (upper - lower) * fraction)
+            cumulative += value
+        return latency_max
+
+    def total_count(self, seconds: Optional[float] = None) -> int:
+        """全モデルの記録件数（既定は保持期間全体）"""
+        seconds = seconds or self.num_buckets * self.bucket_seconds
+        with self._lock:
+            keys = list(self._rings)
+        return sum(self.window(key, seconds).get('count', 0) for key in keys)
+
+    def reset(self):
+        with self._lock:
+            self._rings.clear()
+
+class RequestClassifier:
+    """コンパイル済みシングルパス分類器
+
+    キーワード辞書は先読みの1本の正規表現にまとめ、全位置を1回走査して
+    重なり合うキーワードも含めてすべて検出する（Aho-Corasickと同じ結果）。
+    コード・技術用語パターンも1本の選択パターンに結合し、結果は
+    正規化済み入力のハッシュをキーにLRUキャッシュする。
+    """
+
+    def __init__(self, routing_rules: Dict, cache_size: int = 1024):
+        self.length_thresholds = routing_rules['length_thresholds']
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[bytes, int], RequestClassification]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # キーワード -> 所属する複雑度（重複登録も元の判定どおり個別に数える）
+        self._keyword_classes: Dict[str, List[TaskComplexity]] = {}
+        for complexity, keywords in routing_rules['complexity_keywords'].items():
+            for keyword in keywords:
+                self._keyword_classes.setdefault(keyword.lower(), []).append(complexity)
+
+        # 同じ位置では最長一致のみ捕捉されるため、接頭辞となる短いキーワードを補完する
+        keywords = sorted(self._keyword_classes, key=len, reverse=True)
+        self._implied_keywords = {
+            keyword: [other for other in keywords if keyword.startswith(other)]
+            for keyword in keywords
+        }
+        self._keyword_pattern = re.compile(
+            "(?=(" + "|".join(re.escape(keyword) for keyword in keywords) + "))"
+        )
+
+        # コード・技術用語パターン（種別ごとの選択パターンと結合パターン）
+        code_patterns = routing_rules['code_patterns']
+        technical_patterns = routing_rules['technical_patterns']
+        self._code_pattern = re.compile("|".join(f"(?:{p})" for p in code_patterns), re.IGNORECASE)
+        self._technical_pattern = re.compile("|".join(f"(?:{p})" for p in technical_patterns), re.IGNORECASE)
+        self._combined_pattern = re.compile(
+            f"(?P<code>{self._code_pattern.pattern})|(?P<technical>{self._technical_pattern.pattern})",
+            re.IGNORECASE
+        )
+
+    def classify(self, text: str) -> RequestClassification:
+        """入力を分類（キャッシュ優先）"""
+        normalized = text.lower()
+        key = (hashlib.blake2b(normalized.encode('utf-8', 'surrogatepass'), digest_size=16).digest(), len(text))
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+            self.cache_misses += 1
+
+        result = self._classify_uncached(normalized, len(text))
+
+        with self._cache_lock:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _classify_uncached(self, normalized: str, input_length: int) -> RequestClassification:
+        """全複雑度のスコアを1回の走査で計算"""
+        matched = set()
+        for match in self._keyword_pattern.finditer(normalized):
+            keyword = match.group(1)
+            if keyword not in matched:
+                matched.update(self._implied_keywords[keyword])
+
+        complexity_scores = {comp: 0 for comp in TaskComplexity}
+        keyword_count = 0
+        for keyword in matched:
+            for complexity in self._keyword_classes[keyword]:
+                complexity_scores[complexity] += 1
+                keyword_count += 1
+
+        has_image = complexity_scores[TaskComplexity.VISION] > 0
+        has_code, has_technical = self._scan_patterns(normalized)
+
+        if has_image:
+            complexity = TaskComplexity.VISION
+        else:
+            if has_code:
+                complexity_scores[TaskComplexity.COMPLEX] += 3
+            if has_technical:
+                complexity_scores[TaskComplexity.MODERATE] += 2
+                complexity_scores[TaskComplexity.COMPLEX] += 1
+            for comp, (min_len, max_len) in self.length_thresholds.items():
+                if min_len <= input_length <= max_len:
+                    complexity_scores[comp] += 1
+
+            max_score = max(complexity_scores.values())
+            complexity = TaskComplexity.SIMPLE
+            if max_score > 0:
+                complexity = next(comp for comp, score in complexity_scores.items() if score == max_score)
+
+        return RequestClassification(
+            complexity=complexity,
+            keyword_count=keyword_count,
+            has_image_keywords=has_image,
+            has_code=has_code,
+            has_technical_terms=has_technical
+        )
+
+    def _scan_patterns(self, text: str) -> Tuple[bool, bool]:
+        """コード・技術用語を結合パターンで検出"""
+        has_code = has_technical = False
+        for match in self._combined_pattern.finditer(text):
+            if match.lastgroup == 'code':
+                has_code = True
+            else:
+                has_technical = True
+            if has_code and has_technical:
+                return True, True
+
+        # 片方のマッチが他方を飲み込んだ可能性があるため、未検出の種別のみ再確認
+        if has_code and not has_technical:
+            has_technical = self._technical_pattern.search(text) is not None
+        elif has_technical and not has_code:
+            has_code = self._code_pattern.search(text) is not None
+        return has_code, has_technical
+
+    def get_cache_statistics(self) -> Dict:
+        """キャッシュ統計を取得"""
+        with self._cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'size': len(self._cache),
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_rate': self.cache_hits / total if total else 0.0
+            }
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self.cache_hits = 0
+            self.cache_misses = 0
+
 class ModelRouter:
     """インテリジェント・モデル・ルーター"""
     
@@ -99,6 +362,10 @@ class ModelRouter:
             )
         }
         
+        # コンテキスト予算をモデル設定と揃える
+        for config in self.models.values():
+            register_context_window(config.ollama_name, config.context_window)
+        
         # ルーティング統計
         self.routing_stats = {
             'total_requests': 0,
@@ -108,8 +375,8 @@ class ModelRouter:
             'fallback_count': 0
         }
         
-        # パフォーマンス監視
-        self.performance_history = []
+        # パフォーマンス監視（1分幅・24時間保持）
+        self.performance_metrics = RollingMetrics(bucket_seconds=60, retention_seconds=24 * 3600)
         self.current_model = ModelRole.FAST  # デフォルト
         
         # 共有メモリ
@@ -118,6 +385,7 @@ class ModelRouter:
         
         # ルーティングルール
         self.routing_rules = self._initialize_routing_rules()
+        self.classifier = RequestClassifier(self.routing_rules)
     
     def _initialize_routing_rules(self) -> Dict:
         """ルーティングルールを初期化"""
@@ -173,6 +441,11 @@ class ModelRouter:
                 TaskComplexity.SIMPLE: (0, 50),
                 TaskComplexity.MODERATE: (51, 150),
                 TaskComplexity.COMPLEX: (151, float('inf'))
+            },
+            
+            # SMARTモデルに回す際のp95応答時間の上限（秒）
+            'latency_budgets': {
+                TaskComplexity.MODERATE: 8.0
             }
         }
     
@@ -206,64 +479,22 @@ class ModelRouter:
     def _analyze_task_complexity(self, user_input: str, context: Dict = None) -> TaskComplexity:
         """タスク複雑度を分析"""
         # 画像関連のチェック
-        if self._contains_image_keywords(user_input) or (context and context.get('has_image')):
+        if context and context.get('has_image'):
             return TaskComplexity.VISION
         
-        # キーワードベースの判定
-        complexity_scores = {comp: 0 for comp in TaskComplexity}
-        
-        for complexity, keywords in self.routing_rules['complexity_keywords'].items():
-            for keyword in keywords:
-                if keyword.lower() in user_input.lower():
-                    complexity_scores[complexity] += 1
-        
-        # コード検出
-        if self._contains_code(user_input):
-            complexity_scores[TaskComplexity.COMPLEX] += 3
-        
-        # 技術用語検出
-        if self._contains_technical_terms(user_input):
-            complexity_scores[TaskComplexity.MODERATE] += 2
-            complexity_scores[TaskComplexity.COMPLEX] += 1
-        
-        # 長さベースの判定
-        input_length = len(user_input)
-        for complexity, (min_len, max_len) in self.routing_rules['length_thresholds'].items():
-            if min_len <= input_length <= max_len:
-                complexity_scores[complexity] += 1
-        
-        # 最もスコアの高い複雑度を選択
-        if complexity_scores[TaskComplexity.VISION] > 0:
-            return TaskComplexity.VISION
-        
-        max_score = max(complexity_scores.values())
-        if max_score == 0:
-            return TaskComplexity.SIMPLE
-        
-        for complexity, score in complexity_scores.items():
-            if score == max_score:
-                return complexity
-        
-        return TaskComplexity.SIMPLE
+        return self.classifier.classify(user_input).complexity
     
     def _contains_image_keywords(self, text: str) -> bool:
         """画像関連キーワードを検出"""
-        image_keywords = self.routing_rules['complexity_keywords'][TaskComplexity.VISION]
-        return any(keyword.lower() in text.lower() for keyword in image_keywords)
+        return self.classifier.classify(text).has_image_keywords
     
     def _contains_code(self, text: str) -> bool:
         """コードを含むか検出"""
-        for pattern in self.routing_rules['code_patterns']:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        return False
+        return self.classifier.classify(text).has_code
     
     def _contains_technical_terms(self, text: str) -> bool:
         """技術用語を含むか検出"""
-        for pattern in self.routing_rules['technical_patterns']:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True
-        return False
+        return self.classifier.classify(text).has_technical_terms
     
     def _select_optimal_model(self, complexity: TaskComplexity, user_input: str, context: Dict = None) -> ModelRole:
         """最適なモデルを選択"""
@@ -286,6 +517,11 @@ class ModelRouter:
         # 過去のパフォーマンスをチェック
         recent_performance = self._get_recent_performance(ModelRole.SMART)
         
+        # SMARTモデルのp95応答時間が予算を超えている場合は高速モデルに回す
+        latency_budget = self.routing_rules['latency_budgets'][TaskComplexity.MODERATE]
+        if recent_performance['count'] > 0 and recent_performance['p95_response_time'] > latency_budget:
+            return False
+        
         # SMARTモデルの成功率が高い場合
         if recent_performance['success_rate'] > 0.8:
             return True
@@ -312,8 +548,7 @@ class ModelRouter:
         confidence = base_confidence.get(complexity, 0.5)
         
         # キーワードの明確さで調整
-        keyword_count = sum(1 for keywords in self.routing_rules['complexity_keywords'].values()
-                           for keyword in keywords if keyword.lower() in user_input.lower())
+        keyword_count = self.classifier.classify(user_input).keyword_count
         
         if keyword_count > 2:
             confidence += 0.1
@@ -403,52 +638,30 @@ class ModelRouter:
     
     def _get_recent_performance(self, role: ModelRole, minutes: int = 30) -> Dict:
         """最近のパフォーマンスを取得"""
-        cutoff_time = datetime.now() - timedelta(minutes=minutes)
-        
-        recent_performances = [
-            perf for perf in self.performance_history
-            if perf['model'] == role.value and perf['timestamp'] > cutoff_time
-        ]
-        
-        if not recent_performances:
-            return {'success_rate': 0.5, 'avg_response_time': 1.0, 'count': 0}
+        recent = self.performance_metrics.window(role.value, minutes * 60)
         
-        success_count = sum(1 for perf in recent_performances if perf['success'])
-        avg_response_time = sum(perf['response_time'] for perf in recent_performances) / len(recent_performances)
+        if not recent['count']:
+            return {'success_rate': 0.5, 'avg_response_time': 1.0, 'p50_response_time': 1.0,
+                    'p95_response_time': 1.0, 'count': 0}
         
-        return {
-            'success_rate': success_count / len(recent_performances),
-            'avg_response_time': avg_response_time,
-            'count': len(recent_performances)
-        }
+        return recent
     
     def record_performance(self, model_role: ModelRole, success: bool, response_time: float):
-        """パフォーマンスを記録"""
-        performance_record = {
-            'model': model_role.value,
-            'success': success,
-            'response_time': response_time,
-            'timestamp': datetime.now()
-        }
-        
-        self.performance_history.append(performance_record)
-        
-        # 古い記録を削除（24時間以上前）
-        cutoff_time = datetime.now() - timedelta(hours=24)
-        self.performance_history = [
-            perf for perf in self.performance_history if perf['timestamp'] > cutoff_time
-        ]
-        
-        # モデル設定を更新
-        model_config = self.get_model_config(model_role)
-        recent_perf = self._get_recent_performance(model_role, minutes=60)
-        
-        if recent_perf['count'] > 0:
-            model_config.success_rate = recent_perf['success_rate']
-            model_config.avg_response_time = recent_perf['avg_response_time']
+        """パフォーマンスを記録（古いバケットはリングバッファで自動的に上書き）"""
+        self.performance_metrics.record(model_role.value, success, response_time)
+    
+    def _refresh_model_configs(self):
+        """直近60分の集計をモデル設定に反映"""
+        for role, model_config in self.models.items():
+            recent_perf = self._get_recent_performance(role, minutes=60)
+            if recent_perf['count'] > 0:
+                model_config.success_rate = recent_perf['success_rate']
+                model_config.avg_response_time = recent_perf['avg_response_time']
+                model_config.p95_response_time = recent_perf['p95_response_time']
     
     def get_routing_statistics(self) -> Dict:
         """ルーティング統計を取得"""
+        self._refresh_model_configs()
         return {
             'routing_stats': self.routing_stats,
             'current_model': self.current_model.value,
@@ -456,11 +669,16 @@ class ModelRouter:
                 'name': config.model_name,
                 'description': config.description,
                 'avg_response_time': config.avg_response_time,
+                'p95_response_time': config.p95_response_time,
                 'success_rate': config.success_rate,
                 'last_used': config.last_used.isoformat()
             } for role, config in self.models.items()},
             'shared_memory_size': len(self.shared_memory),
-            'performance_history_size': len(self.performance_history)
+            'classifier_cache': self.classifier.get_cache_statistics(),
+            'performance_history_size': self.performance_metrics.total_count(),
+            'performance_metrics': {
+                role.value: self.performance_metrics.window(role.value, 60 * 60) for role in ModelRole
+            }
         }
     
     def reset_statistics(self):
@@ -472,7 +690,7 @@ class ModelRouter:
             'avg_routing_time': 0.0,
             'fallback_count': 0
         }
-        self.performance_history = []
+        self.performance_metrics.reset()
 
 class ModelRouterGUI:
     """モデルルーターGUI"""
@@ -558,6 +776,7 @@ class ModelRouterGUI:
             st.write(f"**モデル名**: {config['name']}")
             st.write(f"**説明**: {config['description']}")
             st.write(f"**平均応答時間**: {config['avg_response_time']:.2f}秒")
+            st.write(f"**p95応答時間**: {config['p95_response_time']:.2f}秒")
         
         with col2:
             st.write(f"**成功率**: {config['success_rate']:.2%}")
@@ -645,3 +864,39 @@ def create_model_router_gui(router: ModelRouter):
     """モデルルーターGUIを作成"""
     gui = ModelRouterGUI(router)
     gui.render()
+
+def benchmark_classifier(iterations: int = 200) -> Dict:
+    """リクエスト分類器のマイクロベンチマーク（キャッシュなし／キャッシュありの1件あたり時間）"""
+    router = ModelRouter()
+    long_code = "```python\n" + "def handler(request):\n    return process(request.data)  # 処理\n" * 400 + "```"
+    samples = {
+        'short_chat': "こんにちは、今日の天気はどう？",
+        'technical': "numpy.array の使い方と 1.26.0 での違いを説明して https://numpy.org",
+        'long_code': long_code + "\nこのコードを最適化して実装を改善してください",
+    }
+
+    results = {}
+    for name, text in samples.items():
+        classifier = RequestClassifier(router.routing_rules)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            classifier._classify_uncached(text.lower(), len(text))
+        uncached = (time.perf_counter() - start) / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            classifier.classify(text)
+        cached = (time.perf_counter() - start) / iterations
+
+        results[name] = {
+            'length': len(text),
+            'complexity': classifier.classify(text).complexity.value,
+            'uncached_ms': uncached * 1000,
+            'cached_ms': cached * 1000
+        }
+    return results
+
+if __name__ == "__main__":
+    for name, result in benchmark_classifier().items():
+        print(f"📊 {name}: {result['length']}文字 -> {result['complexity']} "
+              f"(分類 {result['uncached_ms']:.3f}ms / キャッシュ {result['cached_ms']:.3f}ms)")
@@ -4,18 +4,28 @@
 FastAPIによる外部APIインターフェース
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import json
 import asyncio
 import threading
 import time
+import uuid
 from datetime import datetime
 import uvicorn
 from pathlib import Path
+from services.event_bus import BROADCAST_CHANNEL, KEEPALIVE_EVENT_TYPE, EventBus
+
+# 全体のメッセージ履歴・セッション数の上限（無制限に増やさない）
+MESSAGE_HISTORY_LIMIT = 1000
+MAX_ACTIVE_SESSIONS = 500
+# SSE / WebSocket で無通信が続いたときの keep-alive 間隔（秒）
+KEEPALIVE_INTERVAL = 15.0
 
 # APIリクエストモデル
 class ChatRequest(BaseModel):
@@ -68,12 +78,16 @@ class MultiDeviceHub:
         self.vrm_avatar = None
         self.text_to_speech = None
         
-        # セッション管理
-        self.active_sessions = {}
-        self.message_history = []
+        # セッション管理（古いものから破棄）
+        self.active_sessions = OrderedDict()
+        self.message_history = deque(maxlen=MESSAGE_HISTORY_LIMIT)
         
-        # WebSocket接続管理
-        self.websocket_connections = []
+        # サーバープッシュ（トークン・感情・アバターのイベントをセッションごとに配信）
+        self.event_bus = EventBus()
+        self.websocket_connections = set()
+        self.response_tasks = set()
+        # エージェント実行は専用のスレッドで行い、リクエスト処理のワーカーを塞がない
+        self._agent_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hub-agent")
         
         # APIルートを設定
         self.setup_routes()
@@ -85,6 +99,133 @@ class MultiDeviceHub:
         self.vrm_avatar = vrm_avatar
         self.text_to_speech = text_to_speech
     
+    def _register_session(self, user_id: str) -> str:
+        """セッションを登録（上限を超えたら古いものから破棄）"""
+        session_id = f"{user_id}_{uuid.uuid4().hex[:12]}"
+        self.active_sessions[session_id] = {
+            "user_id": user_id,
+            "start_time": datetime.now().isoformat(),
+            "message_count": 0
+        }
+        while len(self.active_sessions) > MAX_ACTIVE_SESSIONS:
+            old_session_id, _ = self.active_sessions.popitem(last=False)
+            self.event_bus.close_session(old_session_id)
+        return session_id
+    
+    def _record_message(self, session_id: str, user_id: str, message: str):
+        self.message_history.append({
+            "timestamp": datetime.now().isoformat(),
+            "user_id": user_id,
+            "message": message,
+            "session_id": session_id
+        })
+        if session_id in self.active_sessions:
+            self.active_sessions[session_id]["message_count"] += 1
+    
+    def start_chat(self, request: ChatRequest, session_id: Optional[str] = None) -> str:
+        """メッセージを受け付け、応答生成を開始（イベントループのスレッドから呼ぶ）"""
+        self.event_bus.bind_loop()
+        if not session_id or session_id not in self.active_sessions:
+            session_id = self._register_session(request.user_id)
+        
+        self._record_message(session_id, request.user_id, request.message)
+        self.event_bus.publish(session_id, "user_message", {"user_id": request.user_id, "message": request.message})
+        
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self._respond(session_id, request))
+        self.response_tasks.add(task)
+        task.add_done_callback(self.response_tasks.discard)
+        return session_id
+    
+    async def _respond(self, session_id: str, request: ChatRequest):
+        """エージェントの応答を生成し、経過をイベントとして配信"""
+        loop = asyncio.get_running_loop()
+        publish = lambda event_type, data: self.event_bus.publish_threadsafe(session_id, event_type, data)
+        self.event_bus.publish(session_id, "response_started", {})
+        try:
+            ai_response = await loop.run_in_executor(
+                self._agent_executor, self._generate_response, request, publish
+            )
+            self._record_message(session_id, "ai", ai_response)
+            self.event_bus.publish(session_id, "message", {"user_id": "ai", "message": ai_response})
+        except Exception as e:
+            print(f"AI応答生成エラー: {str(e)}")
+            self.event_bus.publish(session_id, "error", {"error": str(e)})
+        finally:
+            self.event_bus.publish(session_id, "response_finished", {})
+    
+    def _generate_response(self, request: ChatRequest, publish: Callable[[str, Dict], None]) -> str:
+        """エージェント呼び出し・感情更新・音声合成・アバター同期（ワーカースレッドで実行）"""
+        ai_response = self._invoke_agent(request.message, lambda token: publish("token", {"text": token}))
+        
+        # 感情状態を更新
+        if self.emotional_state:
+            self.emotional_state.update_emotion_from_interaction(request.message, ai_response)
+            publish("emotion", self._emotion_payload())
+        
+        # アバターを更新（音声合成の前に口パク状態を届ける）
+        if self.vrm_avatar:
+            self.vrm_avatar.sync_with_ai_state({
+                "is_speaking": True,
+                "emotion": self.emotional_state.get_dominant_emotion() if self.emotional_state else "neutral"
+            })
+            publish("avatar", {"state": self.vrm_avatar.get_current_state()})
+        
+        # 音声合成
+        if request.voice_enabled and self.text_to_speech:
+            self.text_to_speech.speak_ai_response(ai_response)
+        
+        return ai_response
+    
+    def _invoke_agent(self, message: str, on_token: Callable[[str], None]) -> str:
+        """エージェントを呼び出す（LLMがストリーミング対応ならトークンごとに on_token を呼ぶ）"""
+        try:
+            from langchain_core.callbacks import BaseCallbackHandler
+            
+            class TokenForwarder(BaseCallbackHandler):
+                def on_llm_new_token(self, token: str, **kwargs):
+                    on_token(token)
+            
+            response = self.agent.invoke({"input": message}, config={"callbacks": [TokenForwarder()]})
+        except ImportError:
+            response = self.agent.invoke({"input": message})
+        
+        if isinstance(response, dict):
+            return response.get('output', '応答生成エラー')
+        return str(response)
+    
+    def _emotion_payload(self) -> Dict:
+        payload = {"emotions": self.emotional_state.get_emotional_state()}
+        if hasattr(self.emotional_state, "get_dominant_emotion"):
+            payload["dominant"] = self.emotional_state.get_dominant_emotion()
+        return payload
+    
+    def _event_stream_response(self, session_id: str, request: Request, include_broadcast: bool = True):
+        """イベントを Server-Sent Events で配信（Last-Event-ID から再開可能）"""
+        self.event_bus.bind_loop()
+        try:
+            last_event_id = int(request.headers.get("last-event-id") or request.query_params.get("last_event_id") or 0)
+        except ValueError:
+            last_event_id = 0
+        
+        async def event_generator():
+            async for event in self.event_bus.subscribe(session_id, last_event_id, include_broadcast,
+                                                        keepalive=KEEPALIVE_INTERVAL):
+                if event["type"] == KEEPALIVE_EVENT_TYPE:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                lines = f"event: {event['type']}\n"
+                if "id" in event:
+                    lines = f"id: {event['id']}\n" + lines
+                yield lines + f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        
+        return StreamingResponse(
+            event_generator(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+        )
+    
     def setup_routes(self):
         """APIルートを設定"""
         
@@ -120,72 +261,19 @@ class MultiDeviceHub:
             return status
         
         @self.app.post("/chat")
-        async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
-            """チャットメッセージを送信"""
-            try:
-                if not self.agent:
-                    raise HTTPException(status_code=503, detail="AIエージェントが利用できません")
-                
-                # セッション管理
-                session_id = f"{request.user_id}_{int(time.time())}"
-                self.active_sessions[session_id] = {
-                    "user_id": request.user_id,
-                    "start_time": datetime.now().isoformat(),
-                    "message_count": 0
-                }
-                
-                # メッセージ履歴に追加
-                self.message_history.append({
-                    "timestamp": datetime.now().isoformat(),
-                    "user_id": request.user_id,
-                    "message": request.message,
-                    "session_id": session_id
-                })
-                
-                # AI応答を生成（バックグラウンドで）
-                def generate_response():
-                    try:
-                        response = self.agent.invoke({"input": request.message})
-                        ai_response = response.get('output', '応答生成エラー')
-                        
-                        # 感情状態を更新
-                        if self.emotional_state:
-                            self.emotional_state.update_emotion_from_interaction(
-                                request.message, ai_response
-                            )
-                        
-                        # 音声合成
-                        if request.voice_enabled and self.text_to_speech:
-                            self.text_to_speech.speak_ai_response(ai_response)
-                        
-                        # アバターを更新
-                        if self.vrm_avatar:
-                            self.vrm_avatar.sync_with_ai_state({
-                                "is_speaking": True,
-                                "emotion": self.emotional_state.get_dominant_emotion() if self.emotional_state else "neutral"
-                            })
-                        
-                        # レスポンスを保存
-                        self.message_history.append({
-                            "timestamp": datetime.now().isoformat(),
-                            "user_id": "ai",
-                            "message": ai_response,
-                            "session_id": session_id
-                        })
-                        
-                    except Exception as e:
-                        print(f"AI応答生成エラー: {str(e)}")
-                
-                background_tasks.add_task(generate_response)
-                
-                return {
-                    "session_id": session_id,
-                    "message": "メッセージを受信しました",
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=str(e))
+        async def chat(request: ChatRequest):
+            """チャットメッセージを送信（応答は /sessions/{session_id}/events か /ws/{session_id} で受け取る）"""
+            if not self.agent:
+                raise HTTPException(status_code=503, detail="AIエージェントが利用できません")
+            
+            session_id = self.start_chat(request)
+            return {
+                "session_id": session_id,
+                "message": "メッセージを受信しました",
+                "events_url": f"/sessions/{session_id}/events",
+                "websocket_url": f"/ws/{session_id}",
+                "timestamp": datetime.now().isoformat()
+            }
         
         @self.app.post("/emotion")
         async def set_emotion(request: EmotionRequest):
@@ -206,6 +294,12 @@ class MultiDeviceHub:
                 if self.vrm_avatar:
                     self.vrm_avatar.update_emotion(request.emotion, request.intensity)
                 
+                # 接続中の全クライアントへ通知
+                self.event_bus.bind_loop()
+                self.event_bus.publish(BROADCAST_CHANNEL, "emotion", self._emotion_payload())
+                if self.vrm_avatar:
+                    self.event_bus.publish(BROADCAST_CHANNEL, "avatar", {"state": self.vrm_avatar.get_current_state()})
+                
                 return {
                     "message": f"感情を{request.emotion}に設定しました",
                     "intensity": request.intensity,
@@ -231,9 +325,13 @@ class MultiDeviceHub:
                 if request.gaze_direction:
                     self.vrm_avatar.update_gaze(request.gaze_direction)
                 
+                state = self.vrm_avatar.get_current_state()
+                self.event_bus.bind_loop()
+                self.event_bus.publish(BROADCAST_CHANNEL, "avatar", {"state": state})
+                
                 return {
                     "message": "アバターを更新しました",
-                    "state": self.vrm_avatar.get_current_state(),
+                    "state": state,
                     "timestamp": datetime.now().isoformat()
                 }
                 
@@ -288,11 +386,15 @@ class MultiDeviceHub:
                 raise HTTPException(status_code=500, detail=str(e))
         
         @self.app.get("/history")
-        async def get_history(limit: int = 50):
-            """メッセージ履歴を取得"""
+        async def get_history(limit: int = 50, session_id: Optional[str] = None):
+            """メッセージ履歴を取得（session_id 指定時はそのセッションのみ）"""
+            history = self.message_history
+            if session_id:
+                history = [message for message in history if message["session_id"] == session_id]
+            limit = max(0, min(limit, MESSAGE_HISTORY_LIMIT))
             return {
-                "history": self.message_history[-limit:],
-                "total": len(self.message_history),
+                "history": list(history)[-limit:] if limit else [],
+                "total": len(history),
                 "timestamp": datetime.now().isoformat()
             }
         
@@ -310,23 +412,66 @@ class MultiDeviceHub:
             """セッションを終了"""
             if session_id in self.active_sessions:
                 del self.active_sessions[session_id]
+                self.event_bus.close_session(session_id)
                 return {"message": "セッションを終了しました"}
             else:
                 raise HTTPException(status_code=404, detail="セッションが見つかりません")
         
+        @self.app.get("/sessions/{session_id}/events")
+        async def session_events(session_id: str, request: Request):
+            """セッションのイベントストリーム（トークン・応答・感情・アバター）"""
+            if session_id not in self.active_sessions:
+                raise HTTPException(status_code=404, detail="セッションが見つかりません")
+            return self._event_stream_response(session_id, request)
+        
         @self.app.get("/stream")
-        async def stream_events():
-            """イベントストリーム"""
-            async def event_generator():
+        async def stream_events(request: Request):
+            """全体向けイベントストリーム（感情・アバターの変化）"""
+            return self._event_stream_response(BROADCAST_CHANNEL, request, include_broadcast=False)
+        
+        @self.app.get("/events/stats")
+        async def event_stats():
+            """イベント配信の統計"""
+            return {
+                **self.event_bus.get_statistics(),
+                "websocket_connections": len(self.websocket_connections),
+                "pending_responses": len(self.response_tasks)
+            }
+        
+        @self.app.websocket("/ws/{session_id}")
+        async def websocket_events(websocket: WebSocket, session_id: str, last_event_id: int = 0):
+            """WebSocketでイベントを受信し、同じ接続からメッセージも送れる"""
+            await websocket.accept()
+            self.event_bus.bind_loop()
+            if session_id not in self.active_sessions:
+                session_id = self._register_session(session_id)
+                await websocket.send_json({"type": "session", "data": {"session_id": session_id}})
+            
+            self.websocket_connections.add(websocket)
+            
+            async def receive_messages():
+                # {"message": "...", "voice_enabled": true} を受け取ったらチャットとして処理
                 while True:
-                    yield f"data: {json.dumps({'timestamp': datetime.now().isoformat(), 'type': 'heartbeat'})}\n\n"
-                    await asyncio.sleep(1)
+                    payload = await websocket.receive_json()
+                    if payload.get("message") and self.agent:
+                        chat_request = ChatRequest(
+                            message=payload["message"],
+                            user_id=self.active_sessions[session_id]["user_id"],
+                            voice_enabled=payload.get("voice_enabled", True)
+                        )
+                        self.start_chat(chat_request, session_id)
             
-            return StreamingResponse(
-                event_generator(),
-                media_type="text/event-stream",
-                headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
-            )
+            receiver = asyncio.create_task(receive_messages())
+            try:
+                async for event in self.event_bus.subscribe(session_id, last_event_id, keepalive=KEEPALIVE_INTERVAL):
+                    if receiver.done():
+                        break
+                    await websocket.send_json(event)
+            except (WebSocketDisconnect, RuntimeError):
+                pass
+            finally:
+                receiver.cancel()
+                self.websocket_connections.discard(websocket)
     
     def run_server(self, host: str = "0.0.0.0", port: int = 8000):
         """サーバーを起動"""
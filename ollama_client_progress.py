@@ -4,15 +4,20 @@
 Ollama APIクライアント（240秒タイムアウト + 途中報告機能）
 """
 
+import os
 import requests
 import json
 import time
 import threading
 from queue import Queue
 
+class GenerationCancelled(Exception):
+    """キャンセルによって生成を中断した"""
+
+
 class OllamaClient:
-    def __init__(self, base_url="http://localhost:11434", model="llama3.1:8b", timeout=240):
-        self.base_url = base_url
+    def __init__(self, base_url=None, model="llama3.1:8b", timeout=240):
+        self.base_url = base_url or os.getenv('OLLAMA_HOST', 'http://localhost:11434')
         self.model = model
         self.timeout = timeout
         self.progress_queue = Queue()
@@ -153,6 +158,76 @@ class OllamaClient:
         finally:
             self.is_generating = False
 
+    def generate_cancellable(self, prompt, cancel_token=None, max_tokens=1000, progress_callback=None):
+        """ストリーミングで生成し、キャンセルされたらHTTP接続を閉じて中断する
+
+        cancel_token は is_cancelled() と add_callback() / remove_callback() を持つオブジェクト
+        （async_multi_ai.CancelToken）。接続を閉じるとOllama側の生成も止まるため、
+        不要になった応答でGPUを占有し続けない。エラーは文字列ではなく例外で返す。
+        """
+        if cancel_token is not None and cancel_token.is_cancelled():
+            raise GenerationCancelled("開始前にキャンセルされました")
+
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "num_predict": max_tokens
+            }
+        }
+        start_time = time.time()
+        parts = []
+        response = requests.post(f"{self.base_url}/api/generate", json=payload, stream=True,
+                                 timeout=(10, self.timeout))
+        # 初回トークン待ちで読み込みがブロックしていても、接続を閉じれば即座に抜けられる
+        abort = response.close
+        if cancel_token is not None:
+            cancel_token.add_callback(abort)
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel_token is not None and cancel_token.is_cancelled():
+                    raise GenerationCancelled("生成を中断しました")
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama APIエラー: {data['error']}")
+                if not parts and progress_callback:
+                    progress_callback({
+                        "step": "🧠 言語モデルが応答を生成中...",
+                        "progress": 50,
+                        "elapsed": time.time() - start_time,
+                        "remaining": max(self.timeout - (time.time() - start_time), 0)
+                    })
+                parts.append(data.get("response", ""))
+                if data.get("done"):
+                    break
+        except GenerationCancelled:
+            raise
+        except Exception:
+            # 別スレッドから接続を閉じた場合は読み込み側で例外になる
+            if cancel_token is not None and cancel_token.is_cancelled():
+                raise GenerationCancelled("生成を中断しました")
+            raise
+        finally:
+            if cancel_token is not None:
+                cancel_token.remove_callback(abort)
+            response.close()
+
+        if progress_callback:
+            progress_callback({
+                "step": "✅ 応答生成完了",
+                "progress": 100,
+                "elapsed": time.time() - start_time,
+                "remaining": 0,
+                "response_length": sum(len(part) for part in parts)
+            })
+        return "".join(parts)
+
 # テスト用
 if __name__ == "__main__":
     def progress_callback(progress_info):
@@ -2500,7 +2500,8 @@ def scan_generated_apps():
     
     try:
         if generated_apps_dir.exists():
-            python_files = [f.name for f in generated_apps_dir.glob("*.py") if f.is_file()]
+            from services.app_registry import get_app_registry
+            python_files = [Path(app['path']).name for app in get_app_registry().scan()]
             print(f"✅ {len(python_files)}個のPythonファイルをスキャンしました")
         else:
             print("📁 generated_appsディレクトリが存在しません")
@@ -3356,96 +3357,14 @@ def cleanup_conversation_history():
         print(f"❌ 履歴クリーンアップエラー: {e}")
 
 def scan_generated_apps():
-    """generated_appsフォルダ内のPythonファイルをスキャン"""
-    try:
-        from pathlib import Path
-        import importlib.util
-        import inspect
-        
-        apps_dir = Path("generated_apps")
-        if not apps_dir.exists():
-            return []
-        
-        apps = []
-        for py_file in apps_dir.glob("*.py"):
-            try:
-                # ファイルのメタデータを取得
-                file_stat = py_file.stat()
-                app_info = {
-                    'name': py_file.stem,
-                    'path': str(py_file),
-                    'size': file_stat.st_size,
-                    'modified': file_stat.st_mtime,
-                    'description': '',
-                    'functions': []
-                }
-                
-                # ファイル内容をスキャンして関数を取得
-                with open(py_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                # 簡単な関数抽出
-                import re
-                functions = re.findall(r'def\s+(\w+)\s*\(', content)
-                app_info['functions'] = functions[:5]  # 最大5個まで
-                
-                # ファイルの先頭コメントを説明として取得
-                lines = content.split('\n')
-                for line in lines:
-                    if line.strip().startswith('#') and not line.strip().startswith('#!'):
-                        app_info['description'] = line.strip('#').strip()
-                        break
-                
-                apps.append(app_info)
-                
-            except Exception as e:
-                print(f"アプリスキャンエラー {py_file}: {e}")
-                continue
-        
-        return sorted(apps, key=lambda x: x['modified'], reverse=True)
-    
-    except Exception as e:
-        print(f"アプリスキャン全体エラー: {e}")
-        return []
+    """generated_appsフォルダ内のPythonファイルをスキャン（変更のないファイルはキャッシュを使う）"""
+    from services.app_generator import scan_generated_apps as scan_registered_apps
+    return scan_registered_apps()
 
 def execute_app_inline(app_path, app_name):
-    """アプリをインラインで実行"""
-    try:
-        import sys
-        import importlib.util
-        from pathlib import Path
-        
-        # アプリファイルを動的にインポート
-        spec = importlib.util.spec_from_file_location(app_name, app_path)
-        app_module = importlib.util.module_from_spec(spec)
-        
-        # グローバル変数をクリーンにするための準備
-        original_globals = {}
-        
-        try:
-            # Streamlitのグローバル変数を一時保存
-            for key in ['st', 'streamlit']:
-                if key in globals():
-                    original_globals[key] = globals()[key]
-            
-            # アプリモジュールを実行
-            spec.loader.exec_module(app_module)
-            
-            # main関数があれば実行
-            if hasattr(app_module, 'main'):
-                return app_module.main()
-            
-            return f"✅ {app_name} を読み込みました"
-            
-        except Exception as app_error:
-            return f"❌ アプリ実行エラー: {str(app_error)}"
-        finally:
-            # グローバル変数を復元
-            for key, value in original_globals.items():
-                globals()[key] = value
-                
-    except Exception as e:
-        return f"❌ アプリ読み込みエラー: {str(e)}"
+    """アプリをインラインで実行（ファイルが変わるまでインポート済みモジュールを使い回す）"""
+    from services.app_generator import execute_app_inline as execute_registered_app
+    return execute_registered_app(app_path, app_name)
 
 def write_agent_diary(entry_type, content):
     """エージェント日記を書き込む"""
@@ -3581,6 +3500,8 @@ def self_repair_app(app_path, app_name, error_message):
             
             with open(app_path, 'w', encoding='utf-8') as f:
                 f.write(repaired_code)
+            from services.app_registry import get_app_registry
+            get_app_registry().invalidate(app_path)
             
             return True, repair_log
         
@@ -3712,86 +3633,10 @@ def load_workspace_state():
         return False
 
 def render_line_chat(conversation_history):
-    """LINE風チャットUIを描画"""
-    import datetime
-    
-    if not conversation_history:
-        return
+    """LINE風チャットUIを描画（直近のターンのみ。古いものは段階的に読み込む）"""
+    from ui.chat_view import render_chat_view
     
-    # LINE風コンテナ
-    st.markdown('<div class="line-chat-container">', unsafe_allow_html=True)
-    
-    for i, conv in enumerate(conversation_history):
-        timestamp = datetime.datetime.now().strftime("%H:%M")
-        
-        # ユーザーメッセージ
-        st.markdown(f'''
-        <div class="chat-message user-message">
-            <div class="message-content">
-                <div class="message-bubble user-bubble">
-                    {conv["user"]}
-                </div>
-                <div class="message-time">
-                    {timestamp}
-                    <span class="read-indicator">既読</span>
-                </div>
-            </div>
-            <div class="message-avatar user-avatar">👤</div>
-        </div>
-        ''', unsafe_allow_html=True)
-        
-        # AIメッセージ（エゾモモンガ）- HTMLウィジェットを許可
-        st.markdown(f'''
-        <div class="chat-message ai-message">
-            <div class="message-avatar ai-avatar">🐿️</div>
-            <div class="message-content">
-                <div class="message-bubble ai-bubble">
-                    {conv["assistant"]}
-                </div>
-                <div class="message-time">{timestamp}</div>
-            </div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # 自動スクロール用JavaScript
-    st.markdown("""
-    <script>
-    // メッセージが更新されるたびに最下部へスクロール（遅延付き）
-    setTimeout(function() {
-        window.scrollTo({
-            top: document.body.scrollHeight,
-            behavior: 'smooth'
-        });
-    }, 100);
-    
-    // 追加：DOM変更を監視して自動スクロール
-    const observer = new MutationObserver(function(mutations) {
-        setTimeout(function() {
-            window.scrollTo({
-                top: document.body.scrollHeight,
-                behavior: 'smooth'
-            });
-        }, 100);
-    });
-    
-    observer.observe(document.body, {
-        childList: true,
-        subtree: true
-    });
-    
-    // 追加：ページ読み込み完了時にもスクロール
-    window.addEventListener('load', function() {
-        setTimeout(function() {
-            window.scrollTo({
-                top: document.body.scrollHeight,
-                behavior: 'smooth'
-            });
-        }, 200);
-    });
-    </script>
-    """, unsafe_allow_html=True)
+    render_chat_view(conversation_history)
 
 def render_line_chat_input():
     """LINE風チャット入力欄を描画"""
@@ -4220,7 +4065,8 @@ Assistant: VRMアバターの表情変更、面白いですね！表情制御は
                             # 会話履歴に追加
                             st.session_state.conversation_history.append({
                                 "user": user_input,
-                                "assistant": response
+                                "assistant": response,
+                                "timestamp": datetime.datetime.now().isoformat()
                             })
                             
                             # 会話履歴をファイルに保存
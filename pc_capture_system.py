@@ -9,7 +9,7 @@ import json
 import datetime
 import os
 import re
-import base64
+import io
 import threading
 import time
 from pathlib import Path
@@ -19,6 +19,8 @@ from flask import Flask, request, jsonify, render_template_string
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from ollama_vrm_integrated_app import OllamaClient, ConversationalEvolutionAgent
+from services.job_queue import JobQueue, QueueFullError, queue_full_response, register_job_routes
+from services.screenshot_ingest import ScreenshotIngestPipeline, save_metadata_file
 
 # PC画面キャプチャ用ライブラリ
 try:
@@ -36,6 +38,7 @@ class PCCaptureSystem:
         self.conversational_agent = ConversationalEvolutionAgent()
         self.debug_sessions = []
         self.debug_count = 0
+        self._session_lock = threading.Lock()
         
         # 保存先
         self.docker_screenshots_dir = Path("/app/screenshots")
@@ -52,6 +55,19 @@ class PCCaptureSystem:
         # 既存データを読み込み
         self.load_sessions()
         
+        # 取り込みパイプライン（重複排除・OCR/AI分析を上限付きジョブキューで実行）
+        self.jobs = JobQueue(self.data_dir / "pc_capture_jobs.db", max_workers=2, max_pending=8, name="pc-capture")
+        self.ingest = ScreenshotIngestPipeline(
+            self.local_screenshots_dir,
+            self.docker_screenshots_dir,
+            ocr=self.extract_text_from_image,
+            analyze=self.analyze_with_ai,
+            finalize=self._record_session,
+            job_queue=self.jobs
+        )
+        for session in self.debug_sessions:
+            self.ingest.register(session)
+        
         # Flaskアプリケーション
         self.app = Flask(__name__)
         self.setup_routes()
@@ -114,30 +130,13 @@ class PCCaptureSystem:
     def save_screenshot(self, screenshot, filename, metadata=None):
         """スクリーンショットを保存"""
         try:
-            # Docker内パスとローカルパスの両方に保存
-            docker_path = self.docker_screenshots_dir / filename
-            local_path = self.local_screenshots_dir / filename
-            
-            # ローカルに保存
-            screenshot.save(local_path)
-            
-            # Docker内にも保存（Docker環境の場合）
-            if os.path.exists(str(self.docker_screenshots_dir)):
-                screenshot.save(docker_path)
-            
-            # メタデータ保存
-            if metadata:
-                metadata_file = self.local_screenshots_dir / f"{filename}.meta.json"
-                with open(metadata_file, "w", encoding="utf-8") as f:
-                    json.dump(metadata, f, ensure_ascii=False, indent=2)
+            # ローカルに1回だけ書き込み、Docker内（Docker環境の場合）にはリンクを作成
+            save_result = self.ingest.store(self.encode_screenshot(screenshot), filename)
+            save_metadata_file(self.local_screenshots_dir, filename, metadata)
             
             print(f"💾 PC画面を保存: {filename}")
             
-            return {
-                "docker_path": str(docker_path),
-                "local_path": str(local_path),
-                "filename": filename
-            }
+            return save_result
             
         except Exception as e:
             print(f"❌ 保存エラー: {e}")
@@ -163,11 +162,7 @@ class PCCaptureSystem:
     def analyze_with_ai(self, image_path, text_content, metadata=None):
         """AIでPC画面を分析"""
         try:
-            # 画像をbase64にエンコード
-            with open(image_path, "rb") as f:
-                image_data = f.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
-            
+            # 分析はテキストモデルで行うため画像本体は送らない（OCR結果とメタデータのみ）
             # メタデータ情報を構築
             meta_info = ""
             if metadata:
@@ -228,22 +223,21 @@ PC環境特有の問題点に注目して、実践的なデバッグアドバイ
         
         return None
     
-    def debug_pc_screen(self, capture_type="full", region=None):
-        """PC画面デバッグを実行"""
-        if not SCREEN_CAPTURE_AVAILABLE:
-            print("❌ 画面キャプチャ機能が利用できません")
-            return None
-        
-        print(f"\n🖥️ PC画面キャプチャ分析開始 ({capture_type})")
-        print("-" * 60)
-        
+    def encode_screenshot(self, screenshot):
+        """キャプチャ画像をメモリ上でPNGにエンコード"""
+        buffer = io.BytesIO()
+        screenshot.save(buffer, format="PNG")
+        return buffer.getvalue()
+    
+    def capture_for_debug(self, capture_type="full", region=None):
+        """画面をキャプチャし、(画像データ, ファイル名, メタデータ) を返す"""
         # 画面キャプチャ
         print("📸 画面キャプチャ中...")
         screenshot, error = self.capture_screen(region)
         
         if error:
             print(f"❌ キャプチャ失敗: {error}")
-            return None
+            return None, None, None
         
         # ファイル名生成
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
@@ -263,23 +257,43 @@ PC環境特有の問題点に注目して、実践的なデバッグアドバイ
             "active_window": self.get_active_window()
         }
         
-        # 保存
-        save_result = self.save_screenshot(screenshot, filename, metadata)
-        if not save_result:
-            print("❌ 画面保存に失敗しました")
+        return self.encode_screenshot(screenshot), filename, metadata
+    
+    def debug_pc_screen(self, capture_type="full", region=None):
+        """PC画面デバッグを実行"""
+        if not SCREEN_CAPTURE_AVAILABLE:
+            print("❌ 画面キャプチャ機能が利用できません")
             return None
         
-        # テキスト抽出
-        print("📝 テキスト抽出中...")
-        text_content = self.extract_text_from_image(save_result["local_path"])
+        print(f"\n🖥️ PC画面キャプチャ分析開始 ({capture_type})")
+        print("-" * 60)
         
-        # AI分析
-        print("🤖 AI分析中...")
-        ai_analysis = self.analyze_with_ai(save_result["local_path"], text_content, metadata)
+        image_data, filename, metadata = self.capture_for_debug(capture_type, region)
+        if image_data is None:
+            return None
+        
+        # 保存・テキスト抽出・AI分析（同一/類似画面は過去の結果を再利用）
+        try:
+            return self.ingest.process(image_data, filename, metadata)
+        except Exception as e:
+            print(f"❌ デバッグ処理エラー: {e}")
+            return None
+    
+    def submit_pc_screen(self, capture_type="full", region=None):
+        """画面をキャプチャして解析をバックグラウンドで実行し、(ジョブID, ファイル名) を返す"""
+        print(f"\n📥 PC画面キャプチャ受付 ({capture_type})")
+        image_data, filename, metadata = self.capture_for_debug(capture_type, region)
+        if image_data is None:
+            return None, None
+        return self.ingest.submit(image_data, filename, metadata), filename
+    
+    def _record_session(self, save_result, metadata, text_content, ai_analysis, dedup=None):
+        """分析結果をセッションとして記録（ワーカーから並行して呼ばれる）"""
+        save_metadata_file(self.local_screenshots_dir, save_result["filename"], metadata)
         
         # 結果表示
         print(f"\n📊 分析結果:")
-        print(f"📄 画面サイズ: {screen_size}")
+        print(f"📄 画面サイズ: {metadata.get('screen_size', '不明')}")
         if text_content:
             print(f"📄 抽出テキスト: {text_content[:200]}...")
         else:
@@ -288,34 +302,56 @@ PC環境特有の問題点に注目して、実践的なデバッグアドバイ
         print(f"\n🤖 AI分析:")
         print(f"{ai_analysis}")
         
-        # セッション記録
-        session = {
-            "id": self.debug_count + 1,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "filename": filename,
-            "docker_path": save_result["docker_path"],
-            "local_path": save_result["local_path"],
-            "metadata": metadata,
-            "text_content": text_content[:500] if text_content else "",
-            "ai_analysis": ai_analysis,
-            "consciousness_before": self.conversational_agent.consciousness_level
-        }
-        
-        # 進化チェック
-        print("\n🧠 進化チェック中...")
-        evolution_result = self.check_evolution(ai_analysis, metadata)
-        if evolution_result:
-            session["evolution"] = evolution_result
-            print(f"✨ 自己進化が発生しました！")
-        
-        # セッション保存
-        self.debug_sessions.append(session)
-        self.debug_count += 1
-        self.save_sessions()
+        with self._session_lock:
+            # セッション記録
+            session = {
+                "id": self.debug_count + 1,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "filename": save_result["filename"],
+                "docker_path": save_result["docker_path"],
+                "local_path": save_result["local_path"],
+                "sha256": save_result.get("sha256"),
+                "phash": save_result.get("phash"),
+                "metadata": metadata,
+                "text_content": text_content[:500] if text_content else "",
+                "ai_analysis": ai_analysis,
+                "consciousness_before": self.conversational_agent.consciousness_level
+            }
+            
+            if dedup:
+                # 再利用した分析では進化チェックを繰り返さない
+                session["dedup"] = dedup
+            else:
+                # 進化チェック
+                print("\n🧠 進化チェック中...")
+                evolution_result = self.check_evolution(ai_analysis, metadata)
+                if evolution_result:
+                    session["evolution"] = evolution_result
+                    print(f"✨ 自己進化が発生しました！")
+            
+            # セッション保存
+            self.debug_sessions.append(session)
+            self.debug_count += 1
+            self.save_sessions()
         
         print(f"\n✅ PC画面デバッグ完了 (ID: {session['id']})")
         return session
     
+    def session_response(self, session):
+        """セッションをAPIレスポンス形式に変換"""
+        evolution_type = session.get("evolution", {}).get("evolution_type") if session.get("evolution") else None
+        return {
+            "success": True,
+            "filename": session["filename"],
+            "session_id": session["id"],
+            "screen_size": session["metadata"]["screen_size"],
+            "consciousness_level": f"{self.conversational_agent.consciousness_level:.3f}",
+            "analysis": session["ai_analysis"],
+            "evolution": evolution_type,
+            "evolution_type": evolution_type,
+            "reused_from": session.get("dedup", {}).get("reused_from") if session.get("dedup") else None
+        }
+    
     def get_active_window(self):
         """アクティブウィンドウを取得"""
         try:
@@ -415,11 +451,16 @@ PC環境特有の問題点に注目して、実践的なデバッグアドバイ
                     })
                 });
                 
-                const result = await response.json();
+                let result = await response.json();
                 
                 if (result.success) {
                     showStatus('✅ キャプチャ成功！解析中...', 'success');
-                    setTimeout(() => showResult(result), 1000);
+                    // 解析はバックグラウンドで実行されるため、完了までジョブをロングポーリング
+                    while (result.success && result.status !== 'done') {
+                        result = await (await fetch(result.status_url + '?wait=25')).json();
+                    }
+                    showStatus(result.success ? '✅ 解析完了' : `❌ エラー: ${result.error}`, result.success ? 'success' : 'error');
+                    showResult(result);
                 } else {
                     showStatus(`❌ エラー: ${result.error}`, 'error');
                 }
@@ -442,26 +483,28 @@ PC環境特有の問題点に注目して、実践的なデバッグアドバイ
                 if not SCREEN_CAPTURE_AVAILABLE:
                     return jsonify({"success": False, "error": "キャプチャ機能が利用できません"})
                 
-                # キャプチャ実行
-                session = self.debug_pc_screen(capture_type)
+                # キャプチャのみ同期で行い、解析はワーカーで実行してジョブIDを即座に返す
+                job_id, filename = self.submit_pc_screen(capture_type)
                 
-                if session:
+                if job_id:
                     return jsonify({
                         "success": True,
-                        "filename": session["filename"],
-                        "session_id": session["id"],
-                        "screen_size": session["metadata"]["screen_size"],
-                        "consciousness_level": f"{self.conversational_agent.consciousness_level:.3f}",
-                        "analysis": session["ai_analysis"],
-                        "evolution": session.get("evolution", {}).get("evolution_type") if session.get("evolution") else None,
-                        "evolution_type": session.get("evolution", {}).get("evolution_type") if session.get("evolution") else None
-                    })
+                        "status": "queued",
+                        "job_id": job_id,
+                        "filename": filename,
+                        "status_url": f"/api/jobs/{job_id}"
+                    }), 202
                 else:
                     return jsonify({"success": False, "error": "キャプチャ処理に失敗しました"})
                     
+            except QueueFullError as e:
+                return queue_full_response(e)
             except Exception as e:
                 return jsonify({"success": False, "error": str(e)})
         
+        # ジョブ状態（?wait=秒 でロングポーリング）・SSE・統計
+        register_job_routes(self.app, self.jobs, formatter=self.session_response)
+        
         @self.app.route('/api/sessions')
         def get_sessions():
             """セッション一覧API"""
@@ -479,7 +522,8 @@ PC環境特有の問題点に注目して、実践的なデバッグアドバイ
                 "capture_available": SCREEN_CAPTURE_AVAILABLE,
                 "sessions_count": len(self.debug_sessions),
                 "consciousness_level": self.conversational_agent.consciousness_level,
-                "evolution_count": len([s for s in self.debug_sessions if 'evolution' in s])
+                "evolution_count": len([s for s in self.debug_sessions if 'evolution' in s]),
+                "ingest": self.ingest.get_statistics()
             })
     
     def start_server(self, host='0.0.0.0', port=8081):
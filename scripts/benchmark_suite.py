@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+"""
+ベンチマークスイート
+Ollama互換のローカルLLMシミュレーター（local_llm_server.py）をプロセス内で起動し、
+主要経路のレイテンシを計測してp50/p95をJSONで出力、保存済みベースラインと比較する
+
+シナリオ:
+  chat_router     ModelRouterで振り分け → /api/chat の往復
+  rag_1k / rag_10k / rag_100k
+                  AdvancedRAGSystem.search_knowledge（チャンク数別、クエリ埋め込みはシミュレーター）
+  voice_pipeline  VAD → ASR → LLM → TTS（scripts/fixtures/voice/*.wav、無ければ合成音を一時生成）
+  async_fanout    AsyncMultiAICodingSystem のOllama AI（高速・標準）を同時実行し、最初の成功まで（負けた側はキャンセル）
+  orchestrator    CodingTaskOrchestrator のプロジェクトを同時実行（エージェントは asyncio.sleep のスタブで
+                  LLMを呼ばないため、タスク分割・依存解決・並行実行のオーバーヘッドだけを計測する）
+
+依存パッケージが無いシナリオは skipped として結果に残す。
+
+使い方:
+  python scripts/benchmark_suite.py                                  # 全シナリオ
+  python scripts/benchmark_suite.py --scenarios chat_router,rag_10k --iterations 50
+  python scripts/benchmark_suite.py --save-baseline                  # 結果をベースラインとして保存
+  python scripts/benchmark_suite.py --fail-on-regression 0.2         # p50/p95が20%以上悪化で終了コード1
+  python scripts/benchmark_suite.py --llm-url http://localhost:11434 # 実Ollamaに対して計測
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import wave
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+DEFAULT_BASELINE = ROOT / "scripts" / "benchmark_baseline.json"
+VOICE_FIXTURES = ROOT / "scripts" / "fixtures" / "voice"
+
+# シミュレーターの既定プロファイル（ModelRouterが使うモデル名ごとに速度を変える）
+DEFAULT_SIMULATOR = {
+    "models": {
+        "llama3.2:3b": {"time_to_first_token": {"kind": "lognormal", "mean": 0.15, "stddev": 0.05},
+                        "tokens_per_second": 60, "load_delay": 0.5, "default_tokens": 48},
+        "llama3.1:8b": {"time_to_first_token": {"kind": "lognormal", "mean": 0.35, "stddev": 0.1},
+                        "tokens_per_second": 30, "load_delay": 1.5, "default_tokens": 64},
+        "llama3.2-vision": {"time_to_first_token": {"kind": "lognormal", "mean": 0.5, "stddev": 0.15},
+                            "tokens_per_second": 25, "load_delay": 2.0, "default_tokens": 64},
+    },
+    "max_concurrency": 4,
+    "max_queue": 64,
+}
+
+CHAT_PROMPTS = [
+    "こんにちは、今日の調子はどう？",
+    "Pythonでリストを逆順にする方法を教えて",
+    "def add(a, b): return a + b のテストを書いてください",
+    "マイクロサービスとモノリスの設計上のトレードオフを詳しく比較して",
+    "この画像に写っているエラーを説明して",
+    "明日の予定を短くまとめて",
+]
+
+RAG_QUERIES = [
+    "FastAPIでCORSを設定する方法",
+    "Dockerのビルドエラーの原因",
+    "音声認識のモデルを切り替えるには",
+    "SQLiteのWALモードの利点",
+]
+
+CODING_REQUESTS = [
+    ("PythonでGUIをクリックして操作できる電卓アプリを作成してください", "Python GUI電卓アプリ開発"),
+    ("HTMLで電卓アプリを作成してください", "Web電卓アプリ開発"),
+    ("AndroidでTODOアプリを作成してください", "Android TODOアプリ開発"),
+]
+
+
+class ScenarioSkipped(Exception):
+    """依存パッケージが無いなど、この環境では実行できないシナリオ"""
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    run: Callable[["BenchmarkContext", int], Dict]
+    default_iterations: int = 20
+
+
+@dataclass
+class BenchmarkContext:
+    llm_url: str
+    warmup: int
+    chat_model: str = "llama3.2:3b"
+    embed_model: str = "llama3.1:8b"
+    whisper_model: str = "base"
+    concurrent_projects: int = 3
+
+
+# 計測・集計
+def percentile(values: List[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))] if ordered else 0.0
+
+
+def summarize(samples: List[float]) -> Dict:
+    """秒単位のサンプルをミリ秒の統計に変換"""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def measure(func: Callable[[int], object], iterations: int, warmup: int = 0) -> Dict:
+    """func(i) を繰り返し実行してレイテンシを収集（例外はエラーとして数える）
+
+    func が秒数を返した場合は、呼び出し全体ではなくその値を計測値とする。
+    """
+    for i in range(warmup):
+        try:
+            func(i)
+        except Exception:
+            pass
+    samples, errors = [], []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        try:
+            value = func(i)
+            samples.append(value if isinstance(value, float) else time.perf_counter() - t0)
+        except Exception as e:
+            errors.append(str(e))
+    elapsed = time.perf_counter() - started
+    return {
+        "samples": samples,
+        "errors": len(errors),
+        "error_examples": errors[:3],
+        "throughput_per_sec": round(len(samples) / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+
+
+def require(*modules: str):
+    """必要なモジュールをインポートし、無ければ ScenarioSkipped"""
+    missing = []
+    for module in modules:
+        try:
+            __import__(module)
+        except Exception as e:
+            missing.append(f"{module} ({type(e).__name__})")
+    if missing:
+        raise ScenarioSkipped("依存パッケージがありません: " + ", ".join(missing))
+
+
+def post_json(url: str, payload: Dict, timeout: float = 120) -> Dict:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+# シナリオ: テキストチャット
+def run_chat_router(ctx: BenchmarkContext, iterations: int) -> Dict:
+    require("model_router")
+    from model_router import ModelRouter
+
+    router = ModelRouter()
+    selected: Dict[str, int] = {}
+    routing_times: List[float] = []
+
+    def once(i: int):
+        prompt = CHAT_PROMPTS[i % len(CHAT_PROMPTS)]
+        t0 = time.perf_counter()
+        decision = router.route_request(prompt)
+        routing_times.append(time.perf_counter() - t0)
+        model = router.get_model_config(decision.selected_model).ollama_name
+        selected[model] = selected.get(model, 0) + 1
+        started = time.perf_counter()
+        success = False
+        try:
+            response = post_json(f"{ctx.llm_url}/api/chat", {
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": False
+            })
+            success = bool(response.get("message", {}).get("content"))
+            if not success:
+                raise RuntimeError(response.get("error", "空の応答"))
+        finally:
+            router.record_performance(decision.selected_model, success, time.perf_counter() - started)
+
+    result = measure(once, iterations, ctx.warmup)
+    result["extra"] = {"selected_models": selected, "routing": summarize(routing_times)}
+    return result
+
+
+# シナリオ: RAG検索
+class SimulatorEmbedder:
+    """SentenceTransformer.encode 互換のクエリ埋め込み（シミュレーターの /api/embed を呼ぶ）"""
+
+    def __init__(self, llm_url: str, model: str):
+        self.llm_url = llm_url
+        self.model = model
+
+    def encode(self, texts: List[str]):
+        import numpy as np
+        response = post_json(f"{self.llm_url}/api/embed", {"model": self.model, "input": list(texts)})
+        return np.array(response["embeddings"], dtype="float32")
+
+
+def build_rag_system(ctx: BenchmarkContext, chunks: int):
+    """埋め込み済みチャンクを持つ AdvancedRAGSystem を構築（SentenceTransformerの読み込みは省く）"""
+    require("numpy", "faiss", "advanced_knowledge_system")
+    import faiss
+    import numpy as np
+    from advanced_knowledge_system import AdvancedRAGSystem, KnowledgeItem, SourceType
+
+    embedder = SimulatorEmbedder(ctx.llm_url, ctx.embed_model)
+    dim = embedder.encode(["次元確認"]).shape[1]
+
+    # コーパスの埋め込みは決定的な乱数ベクトル（計測対象は検索なので索引構築は高速化する）
+    rng = np.random.default_rng(chunks)
+    vectors = rng.standard_normal((chunks, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    rag = AdvancedRAGSystem.__new__(AdvancedRAGSystem)
+    rag.name = "advanced_rag"
+    rag.knowledge_base_path = Path(tempfile.gettempdir())
+    rag.embedding_model = embedder
+    rag.embedding_dim = dim
+    rag.index = faiss.IndexFlatL2(dim)
+    rag.index.add(vectors)
+    rag.knowledge_items = [
+        KnowledgeItem(content=f"ベンチマーク用チャンク {i}", embedding=vectors[i],
+                      source=SourceType.LOCAL_KNOWLEDGE, metadata={"original_file": f"chunk_{i // 100}.md"})
+        for i in range(chunks)
+    ]
+    return rag
+
+
+def make_rag_scenario(chunks: int) -> Callable[[BenchmarkContext, int], Dict]:
+    def run(ctx: BenchmarkContext, iterations: int) -> Dict:
+        t0 = time.perf_counter()
+        rag = build_rag_system(ctx, chunks)
+        build_time = time.perf_counter() - t0
+
+        def once(i: int):
+            results = rag.search_knowledge(RAG_QUERIES[i % len(RAG_QUERIES)], top_k=5)
+            if not results:
+                raise RuntimeError("検索結果が空です")
+
+        result = measure(once, iterations, ctx.warmup)
+        result["extra"] = {"chunks": chunks, "index_build_sec": round(build_time, 3)}
+        return result
+    return run
+
+
+# シナリオ: 音声パイプライン
+def synthesize_fixture(path: Path, seconds: float, seed: int, rate: int = 16000):
+    """録音が無い環境用の合成WAV（無音 → 母音風の倍音 → 無音）"""
+    frames = bytearray()
+    total = int(seconds * rate)
+    lead = int(0.3 * rate)
+    base = 120 + seed * 35
+    for n in range(total):
+        if lead <= n < total - lead:
+            t = n / rate
+            envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+            value = sum(math.sin(2 * math.pi * base * k * t) / k for k in (1, 2, 3, 5)) * 0.25 * envelope
+        else:
+            value = 0.0
+        frames += struct.pack("<h", int(max(-1.0, min(1.0, value)) * 32767))
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(bytes(frames))
+
+
+def load_voice_fixtures() -> List[Dict]:
+    """scripts/fixtures/voice/*.wav を読み込む（同名の .txt があれば想定書き起こし）"""
+    paths = sorted(VOICE_FIXTURES.glob("*.wav")) if VOICE_FIXTURES.exists() else []
+    synthesized = False
+    if not paths:
+        temp_dir = Path(tempfile.mkdtemp(prefix="voice_fixtures_"))
+        paths = []
+        for i, seconds in enumerate((1.5, 3.0, 5.0)):
+            path = temp_dir / f"synthetic_{i}.wav"
+            synthesize_fixture(path, seconds, i)
+            paths.append(path)
+        synthesized = True
+        print(f"⚠️ 録音済みWAVが無いため合成音で代用します（{VOICE_FIXTURES} に置くと使用されます）")
+
+    fixtures = []
+    for path in paths:
+        with wave.open(str(path), "rb") as f:
+            rate, width, channels = f.getframerate(), f.getsampwidth(), f.getnchannels()
+            pcm = f.readframes(f.getnframes())
+        if width != 2 or channels != 1 or rate not in (8000, 16000, 32000, 48000):
+            print(f"⚠️ {path.name}: 16bitモノラル（8/16/32/48kHz）以外のため除外")
+            continue
+        transcript_path = path.with_suffix(".txt")
+        fixtures.append({
+            "name": path.name,
+            "rate": rate,
+            "pcm": pcm,
+            "transcript": transcript_path.read_text(encoding="utf-8").strip() if transcript_path.exists() else "",
+            "synthesized": synthesized,
+        })
+    if not fixtures:
+        raise ScenarioSkipped("使用できるWAVフィクスチャがありません")
+    return fixtures
+
+
+def run_voice_pipeline(ctx: BenchmarkContext, iterations: int) -> Dict:
+    require("numpy", "webrtcvad", "faster_whisper", "pyttsx3")
+    import numpy as np
+    import pyttsx3
+    import webrtcvad
+    from faster_whisper import WhisperModel
+
+    fixtures = load_voice_fixtures()
+    vad = webrtcvad.Vad(2)
+    whisper = WhisperModel(ctx.whisper_model, compute_type="int8")
+    tts = pyttsx3.init()
+    output_dir = Path(tempfile.mkdtemp(prefix="voice_bench_"))
+    stages: Dict[str, List[float]] = {"vad": [], "asr": [], "llm": [], "tts": []}
+
+    def once(i: int):
+        fixture = fixtures[i % len(fixtures)]
+        rate, pcm = fixture["rate"], fixture["pcm"]
+
+        # VAD: 30msフレームで発話区間だけを残す
+        t0 = time.perf_counter()
+        frame_bytes = int(rate * 0.03) * 2
+        voiced = b"".join(
+            pcm[offset:offset + frame_bytes]
+            for offset in range(0, len(pcm) - frame_bytes + 1, frame_bytes)
+            if vad.is_speech(pcm[offset:offset + frame_bytes], rate)
+        )
+        t1 = time.perf_counter()
+
+        # ASR: faster-whisper は16kHzのfloat32配列を受け付ける
+        audio = np.frombuffer(voiced or pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        if rate != 16000:
+            audio = np.interp(np.arange(0, len(audio), rate / 16000), np.arange(len(audio)), audio).astype(np.float32)
+        segments, _ = whisper.transcribe(audio, language="ja", beam_size=5)
+        text = "".join(segment.text for segment in segments).strip() or fixture["transcript"] or "こんにちは"
+        t2 = time.perf_counter()
+
+        # LLM
+        response = post_json(f"{ctx.llm_url}/api/generate", {"model": ctx.chat_model, "prompt": text, "stream": False})
+        reply = response.get("response") or "はい"
+        t3 = time.perf_counter()
+
+        # TTS: 音声ファイルへの書き出しまで
+        tts.save_to_file(reply[:200], str(output_dir / f"reply_{i % len(fixtures)}.wav"))
+        tts.runAndWait()
+        t4 = time.perf_counter()
+
+        for stage, seconds in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+            stages[stage].append(seconds)
+
+    result = measure(once, iterations, ctx.warmup)
+    result["extra"] = {
+        "fixtures": [f["name"] for f in fixtures],
+        "synthesized_fixtures": fixtures[0]["synthesized"],
+        "whisper_model": ctx.whisper_model,
+        "stages": {stage: summarize(values) for stage, values in stages.items()},
+    }
+    return result
+
+
+# シナリオ: 非同期マルチAI
+def run_async_fanout(ctx: BenchmarkContext, iterations: int) -> Dict:
+    require("async_multi_ai", "requests")
+    from async_multi_ai import AIType, AsyncMultiAICodingSystem, HedgeTier, HedgingPolicy, OllamaCodingAI
+
+    # 即答する静的なAIが残ると最初の段で必ず勝ってLLMに1件も届かないため、Ollama AIだけを同時に起動する
+    policy = HedgingPolicy(tiers=[HedgeTier("llm", [AIType.OLLAMA_FAST, AIType.OLLAMA_STANDARD])])
+    system = AsyncMultiAICodingSystem(policy)
+    system.ais = [ai for ai in system.ais if isinstance(ai, OllamaCodingAI)]
+    winners: Dict[str, int] = {}
+
+    def once(i: int):
+        prompt, task = CODING_REQUESTS[i % len(CODING_REQUESTS)]
+        result = asyncio.run(system.generate_response_async(prompt, task))
+        if not result.get("success"):
+            raise RuntimeError(result.get("error", "すべてのAIが失敗"))
+        winners[result["ai_type"]] = winners.get(result["ai_type"], 0) + 1
+
+    try:
+        result = measure(once, iterations, ctx.warmup)
+    finally:
+        system.executor.shutdown(wait=True)
+    stats = system.get_statistics()
+    result["extra"] = {"winners": winners, "total_ais": len(system.ais), "launched": stats["launched"],
+                       "cancelled": stats["cancelled"],
+                       "wasted_seconds_per_request": round(stats["wasted_seconds_per_request"], 3)}
+    return result
+
+
+# シナリオ: コーディングタスクオーケストレーター
+def run_orchestrator(ctx: BenchmarkContext, iterations: int) -> Dict:
+    """coding_ai_agents のエージェントは asyncio.sleep の固定待機で応答するスタブなので、
+    計測値はLLM応答ではなくスタブの待機時間 + オーケストレーターのスケジューリングになる"""
+    require("coding_task_orchestrator")
+    from coding_task_orchestrator import CodingTaskOrchestrator
+    logging.getLogger("coding_task_orchestrator").setLevel(logging.WARNING)
+    logging.getLogger("coding_ai_agents").setLevel(logging.WARNING)
+
+    orchestrator = CodingTaskOrchestrator()
+    project_times: List[float] = []
+    task_counts: List[int] = []
+
+    def once(i: int):
+        async def run_projects():
+            async def run_one(k: int):
+                request, _ = CODING_REQUESTS[(i + k) % len(CODING_REQUESTS)]
+                project_id = orchestrator.create_project_from_request(request, ["Python", "FastAPI"])
+                t0 = time.perf_counter()
+                ok = await orchestrator.execute_project(project_id)
+                project_times.append(time.perf_counter() - t0)
+                task_counts.append(len(orchestrator.projects[project_id].tasks))
+                return ok
+            return await asyncio.gather(*[run_one(k) for k in range(ctx.concurrent_projects)])
+
+        if not all(asyncio.run(run_projects())):
+            raise RuntimeError("失敗したプロジェクトがあります")
+
+    result = measure(once, iterations, ctx.warmup)
+    result["extra"] = {"agents": "sleep_stub",
+                       "concurrent_projects": ctx.concurrent_projects,
+                       "per_project": summarize(project_times),
+                       "tasks_per_project": max(task_counts) if task_counts else 0}
+    return result
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("chat_router", "ModelRouter → /api/chat 往復", run_chat_router),
+    Scenario("rag_1k", "RAG検索（1,000チャンク）", make_rag_scenario(1_000), 50),
+    Scenario("rag_10k", "RAG検索（10,000チャンク）", make_rag_scenario(10_000), 50),
+    Scenario("rag_100k", "RAG検索（100,000チャンク）", make_rag_scenario(100_000), 30),
+    Scenario("voice_pipeline", "VAD → ASR → LLM → TTS", run_voice_pipeline, 6),
+    Scenario("async_fanout", "AsyncMultiAICodingSystem Ollama AI並列実行", run_async_fanout, 10),
+    Scenario("orchestrator", "CodingTaskOrchestrator プロジェクト実行（エージェントはsleepスタブ）", run_orchestrator, 2),
+]
+
+
+# 実行・比較
+def run_scenario(scenario: Scenario, ctx: BenchmarkContext, iterations: Optional[int]) -> Dict:
+    count = iterations or scenario.default_iterations
+    print(f"▶️ {scenario.name}: {scenario.description} ×{count}")
+    started = time.perf_counter()
+    try:
+        raw = scenario.run(ctx, count)
+    except ScenarioSkipped as e:
+        print(f"  ⏭️ スキップ: {e}")
+        return {"status": "skipped", "reason": str(e)}
+    except Exception as e:
+        print(f"  ❌ エラー: {e}")
+        return {"status": "error", "reason": f"{type(e).__name__}: {e}"}
+
+    result = {
+        "status": "ok" if raw["samples"] else "error",
+        "description": scenario.description,
+        "iterations": count,
+        "errors": raw["errors"],
+        "throughput_per_sec": raw["throughput_per_sec"],
+        "wall_time_sec": round(time.perf_counter() - started, 3),
+        **summarize(raw["samples"]),
+    }
+    if raw["error_examples"]:
+        result["error_examples"] = raw["error_examples"]
+    if raw.get("extra"):
+        result["extra"] = raw["extra"]
+    if result["status"] == "ok":
+        print(f"  ✅ p50 {result['p50_ms']:.1f}ms / p95 {result['p95_ms']:.1f}ms  エラー {raw['errors']}件")
+    else:
+        print(f"  ❌ 成功した試行がありません: {raw['error_examples'][:1]}")
+    return result
+
+
+def compare_with_baseline(results: Dict, baseline: Dict, threshold: float) -> Dict:
+    """p50/p95の変化率を計算し、threshold を超えた悪化を regression とする"""
+    comparison = {}
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if current.get("status") != "ok" or not previous or previous.get("status") != "ok":
+            continue
+        entry = {"regression": False}
+        for key in ("p50_ms", "p95_ms"):
+            before, after = previous[key], current[key]
+            change = (after - before) / before if before > 0 else 0.0
+            entry[key] = {"baseline": before, "current": after, "change": round(change, 4)}
+            if change > threshold:
+                entry["regression"] = True
+        comparison[name] = entry
+
+    settings_changed = {
+        key: {"baseline": baseline.get("settings", {}).get(key), "current": value}
+        for key, value in results["settings"].items()
+        if key != "iterations" and baseline.get("settings", {}).get(key) != value
+    }
+    return {
+        "baseline_created_at": baseline.get("created_at"),
+        "threshold": threshold,
+        "settings_changed": settings_changed,
+        "scenarios": comparison,
+        "regressions": sorted(name for name, entry in comparison.items() if entry["regression"]),
+    }
+
+
+def print_comparison(comparison: Dict):
+    print(f"\n📊 ベースライン比較 ({comparison['baseline_created_at']})")
+    if comparison["settings_changed"]:
+        print(f"  ⚠️ 計測条件がベースラインと異なります: {comparison['settings_changed']}")
+    for name, entry in comparison["scenarios"].items():
+        marks = []
+        for key in ("p50_ms", "p95_ms"):
+            data = entry[key]
+            marks.append(f"{key[:3]} {data['baseline']:.1f}→{data['current']:.1f}ms ({data['change'] * 100:+.1f}%)")
+        print(f"  {'🔴' if entry['regression'] else '🟢'} {name}: " + " / ".join(marks))
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def start_simulator(args) -> Tuple[object, str]:
+    from local_llm_server import LocalLLMServer, SimulatorConfig
+
+    config = SimulatorConfig.from_file(args.simulator_config) if args.simulator_config \
+        else SimulatorConfig.from_dict(DEFAULT_SIMULATOR)
+    config.seed = args.seed
+    config.time_scale = args.time_scale
+    port = args.llm_port or free_port()
+    server = LocalLLMServer(port=port, config=config, host="127.0.0.1")
+    server.start_in_background()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマークスイート（ローカルLLMシミュレーター使用）")
+    parser.add_argument("--scenarios", help="実行するシナリオ（カンマ区切り、既定は全て）: "
+                        + ", ".join(s.name for s in SCENARIOS))
+    parser.add_argument("--iterations", type=int, help="全シナリオの試行回数（省略時はシナリオごとの既定値）")
+    parser.add_argument("--warmup", type=int, default=1, help="計測前のウォームアップ回数")
+    parser.add_argument("--llm-url", help="既存のOllama互換サーバー（省略時はシミュレーターを起動）")
+    parser.add_argument("--llm-port", type=int, default=0, help="シミュレーターのポート（0で自動）")
+    parser.add_argument("--simulator-config", help="シミュレーター設定JSON（SimulatorConfigの項目）")
+    parser.add_argument("--time-scale", type=float, default=0.25, help="シミュレーターの待機時間倍率")
+    parser.add_argument("--seed", type=int, default=0, help="シミュレーターの乱数シード")
+    parser.add_argument("--whisper-model", default="base", help="音声パイプラインのWhisperモデル")
+    parser.add_argument("--concurrent-projects", type=int, default=3, help="オーケストレーターの同時プロジェクト数")
+    parser.add_argument("--output", help="結果JSONの保存先（省略時は標準出力のみ）")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="比較するベースラインJSON")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存")
+    parser.add_argument("--fail-on-regression", type=float, metavar="RATIO",
+                        help="p50/p95がこの割合を超えて悪化したら終了コード1（例: 0.2）")
+    args = parser.parse_args()
+
+    selected = SCENARIOS
+    if args.scenarios:
+        names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+        unknown = set(names) - {s.name for s in SCENARIOS}
+        if unknown:
+            parser.error(f"不明なシナリオ: {', '.join(sorted(unknown))}")
+        selected = [s for s in SCENARIOS if s.name in names]
+
+    server = None
+    if args.llm_url:
+        llm_url = args.llm_url.rstrip("/")
+    else:
+        server, llm_url = start_simulator(args)
+        print(f"🧪 ローカルLLMシミュレーター: {llm_url} (time_scale={args.time_scale}, seed={args.seed})")
+    # OLLAMA_HOST を参照するクライアント（async_multi_ai の Ollama AI など）も同じサーバーへ向ける
+    os.environ["OLLAMA_HOST"] = llm_url
+
+    ctx = BenchmarkContext(llm_url=llm_url, warmup=args.warmup, whisper_model=args.whisper_model,
+                           concurrent_projects=args.concurrent_projects)
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "settings": {
+            "llm": "external" if args.llm_url else "simulator",
+            "time_scale": None if args.llm_url else args.time_scale,
+            "seed": None if args.llm_url else args.seed,
+            "simulator_config": args.simulator_config,
+            "warmup": args.warmup,
+            "iterations": args.iterations,
+            "whisper_model": args.whisper_model,
+            "concurrent_projects": args.concurrent_projects,
+        },
+        "scenarios": {},
+    }
+    try:
+        for scenario in selected:
+            results["scenarios"][scenario.name] = run_scenario(scenario, ctx, args.iterations)
+    finally:
+        if server is not None:
+            results["simulator"] = server.get_statistics()
+            server.stop()
+
+    exit_code = 0
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists() and not args.save_baseline:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        results["comparison"] = compare_with_baseline(results, baseline, args.fail_on_regression or 0.2)
+        print_comparison(results["comparison"])
+        if args.fail_on_regression is not None and results["comparison"]["regressions"]:
+            print(f"🔴 性能劣化: {', '.join(results['comparison']['regressions'])}")
+            exit_code = 1
+
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+        print(f"💾 結果を保存: {args.output}")
+    if args.save_baseline:
+        baseline_path.write_text(payload, encoding="utf-8")
+        print(f"💾 ベースラインを保存: {baseline_path}")
+    if not args.output:
+        print(payload)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
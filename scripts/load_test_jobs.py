@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+ジョブキュー負荷テストスクリプト
+実際のモバイルスクリーンショットサーバー（MobileScreenshotSystem）に複数端末からの同時アップロードを再現する
+
+モデルサーバーだけをOllama互換シミュレーター（local_llm_server.py）に置き換え、
+アップロード処理・重複排除・OCR・AI分析・ジョブキューは本番と同じコードを通す。
+
+使い方:
+  # 自己完結モード: シミュレーター + MobileScreenshotSystem をプロセス内で起動（一時ディレクトリで実行）
+  python scripts/load_test_jobs.py --clients 20 --model-delay 2
+
+  # 実サーバーモード: 起動済みのモバイルスクリーンショットサーバーへ送信
+  # （サーバーの OllamaClient が http://localhost:11434 を向くため、シミュレーターを11434で起動する）
+  python scripts/load_test_jobs.py --target http://localhost:8080 --model-port 11434
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# MobileScreenshotSystem の OllamaClient が使うモデル
+ANALYSIS_MODEL = "llama3.1:8b"
+
+
+def start_model_simulator(port: int, delay: float, error_rate: float, config_path=None):
+    """Ollama互換シミュレーターを起動（既定では初回トークンまで delay 秒、生成は高速）"""
+    from local_llm_server import LocalLLMServer, SimulatorConfig
+
+    if config_path:
+        config = SimulatorConfig.from_file(config_path)
+    else:
+        config = SimulatorConfig.from_dict({
+            "models": {ANALYSIS_MODEL: {"time_to_first_token": delay, "tokens_per_second": 500, "load_delay": 0}}
+        })
+    config.error_rate = error_rate
+    server = LocalLLMServer(port=port, config=config, host="127.0.0.1")
+    if not port:
+        # ポート自動割り当て（uvicorn に 0 を渡すと実際のポートが分からないため先に確保する）
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            server.port = sock.getsockname()[1]
+    server.start_in_background()
+    return server, f"http://127.0.0.1:{server.port}"
+
+
+def start_local_app(model_url: str, workdir: str):
+    """MobileScreenshotSystem をプロセス内で起動（screenshots/・data/ は workdir に作られる）"""
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    os.chdir(workdir)
+    from mobile_screenshot_system import MobileScreenshotSystem
+
+    system = MobileScreenshotSystem()
+    system.ollama_client.base_url = model_url
+    server = make_server("127.0.0.1", 0, system.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_image(index: int) -> bytes:
+    """端末ごとに異なるテスト画像（知覚ハッシュで類似画像と判定されないよう図形を乱数で配置）"""
+    try:
+        from PIL import Image, ImageDraw
+        rng = random.Random(index)
+        image = Image.new("RGB", (360, 640), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randrange(300), rng.randrange(580)
+            shade = rng.randrange(256)
+            draw.rectangle((x, y, x + rng.randrange(20, 160), y + rng.randrange(20, 160)), fill=(shade, shade, shade))
+        draw.text((20, 20), f"device {index}", fill="black")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    except ImportError:
+        return f"dummy image {index} {uuid.uuid4()}".encode("utf-8")
+
+
+def post_multipart(url: str, image_data: bytes, filename: str, fields: dict):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8"))
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="screenshot"; filename="{filename}"\r\n'
+        f'Content-Type: image/png\r\n\r\n'.encode("utf-8") + image_data + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    request = urllib.request.Request(url, data=b"".join(parts),
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def get_json(url: str, timeout: float = 90):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run_client(base_url: str, index: int) -> dict:
+    """1端末分: アップロード → ロングポーリングで結果取得"""
+    image_data = make_image(index)
+    started = time.perf_counter()
+    status, result = post_multipart(f"{base_url}/upload", image_data, f"load_{index}.png",
+                                    {"device_type": "smartphone", "description": "負荷テスト"})
+    accepted_in = time.perf_counter() - started
+    if status == 429:
+        return {"outcome": "rejected", "accept_time": accepted_in, "retry_after": result.get("retry_after")}
+    if not result.get("success"):
+        return {"outcome": "error", "accept_time": accepted_in, "error": result.get("error")}
+
+    while result.get("success") and result.get("status") != "done":
+        result = get_json(f"{base_url}{result['status_url']}?wait=25")
+    return {
+        "outcome": "done" if result.get("success") else "error",
+        "accept_time": accepted_in,
+        "total_time": time.perf_counter() - started,
+        "error": result.get("error")
+    }
+
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ジョブキュー負荷テスト")
+    parser.add_argument("--clients", type=int, default=20, help="同時アップロード数")
+    parser.add_argument("--model-delay", type=float, default=1.0, help="シミュレーターの初回トークンまでの時間（秒）")
+    parser.add_argument("--model-error-rate", type=float, default=0.0, help="シミュレーターのエラー注入率")
+    parser.add_argument("--model-port", type=int, default=0, help="シミュレーターのポート（0で自動）")
+    parser.add_argument("--simulator-config", help="シミュレーター設定JSON（指定時は --model-delay より優先）")
+    parser.add_argument("--target", help="既存サーバーのURL（省略時はプロセス内で MobileScreenshotSystem を起動）")
+    args = parser.parse_args()
+
+    simulator, model_url = start_model_simulator(args.model_port, args.model_delay, args.model_error_rate,
+                                                 args.simulator_config)
+    print(f"🧪 ローカルLLMシミュレーター: {model_url} (初回トークン {args.model_delay}秒)")
+
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        workdir = tempfile.mkdtemp(prefix="load_test_jobs_")
+        _, base_url = start_local_app(model_url, workdir)
+        print(f"📁 作業ディレクトリ: {workdir}")
+    print(f"🌐 送信先: {base_url}  同時クライアント数: {args.clients}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = list(executor.map(lambda i: run_client(base_url, i), range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    done = [r for r in results if r["outcome"] == "done"]
+    rejected = [r for r in results if r["outcome"] == "rejected"]
+    errors = [r for r in results if r["outcome"] == "error"]
+    accept_times = [r["accept_time"] for r in results]
+    total_times = [r["total_time"] for r in done]
+
+    print("\n📊 負荷テスト結果")
+    print(f"  ✅ 完了: {len(done)}  🚦 429拒否: {len(rejected)}  ❌ エラー: {len(errors)}")
+    print(f"  ⏱️ 受付応答: 平均 {statistics.mean(accept_times) * 1000:.1f}ms / "
+          f"p95 {percentile(accept_times, 0.95) * 1000:.1f}ms / 最大 {max(accept_times) * 1000:.1f}ms")
+    if total_times:
+        print(f"  ⏱️ 完了まで: p50 {percentile(total_times, 0.5):.2f}秒 / p95 {percentile(total_times, 0.95):.2f}秒")
+    print(f"  🚀 スループット: {len(done) / elapsed:.2f}件/秒 (経過 {elapsed:.2f}秒)")
+    if rejected:
+        print(f"  🔁 Retry-After: {sorted(set(r['retry_after'] for r in rejected))}")
+    for r in errors[:5]:
+        print(f"  ❌ {r.get('error')}")
+
+    try:
+        print(f"  📈 ジョブ統計: {get_json(f'{base_url}/api/jobs', timeout=5)}")
+        print(f"  🗂️ 取り込み統計: {get_json(f'{base_url}/api/status', timeout=5).get('ingest')}")
+    except Exception:
+        pass
+    print(f"  🧪 モデル統計: {simulator.get_statistics()}")
+    simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
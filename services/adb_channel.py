@@ -0,0 +1,336 @@
+"""
+ADBチャネルモジュール
+adb コマンドをその都度起動せず、adb サーバーのソケットプロトコルで直接通信する
+
+- シェル実行・ファイル送受信（sync サービス）・APKインストールを1接続ずつ処理（プロセス起動なし）
+- 端末情報は getprop・IP・バッテリーを1回のシェル実行にまとめて取得し、TTL付きでキャッシュ
+- 複数端末への操作はスレッドプールで並行実行
+- 接続先は ADB_SERVER_HOST / ANDROID_ADB_SERVER_PORT で変更でき、偽の adb サーバーでも検証可能
+"""
+
+import os
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+ADB_SERVER_HOST = os.getenv("ADB_SERVER_HOST", "127.0.0.1")
+ADB_SERVER_PORT = int(os.getenv("ANDROID_ADB_SERVER_PORT", "5037"))
+
+# シェルの終了コードを取り出すための目印（旧来の shell: サービスは終了コードを返さない）
+EXIT_MARKER = "__ADB_EXIT__"
+# 1回の実行で端末情報をまとめて取るときの区切り
+SECTION_MARKER = "__ADB_SECTION__"
+# sync サービスの DATA チャンク上限
+SYNC_CHUNK_SIZE = 64 * 1024
+DEFAULT_FILE_MODE = 0o100644
+
+
+class AdbError(Exception):
+    """adb サーバーが FAIL を返した、または通信に失敗した"""
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("adb サーバーとの接続が切断されました")
+        data += chunk
+    return data
+
+
+def _recv_all(sock: socket.socket) -> bytes:
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def parse_getprop(output: str) -> Dict[str, str]:
+    """getprop の "[key]: [value]" 形式を辞書に変換"""
+    properties = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith("[") or "]: [" not in line:
+            continue
+        key, _, value = line[1:].partition("]: [")
+        properties[key] = value[:-1] if value.endswith("]") else value
+    return properties
+
+
+class AdbChannel:
+    """adb サーバーのソケットプロトコル（host / transport / shell / sync）"""
+
+    def __init__(self, host: str = ADB_SERVER_HOST, port: int = ADB_SERVER_PORT, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _connect(self, timeout: Optional[float] = None) -> socket.socket:
+        sock = socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        sock.settimeout(timeout or self.timeout)
+        return sock
+
+    def _request(self, sock: socket.socket, payload: str):
+        """4桁16進の長さ + ペイロードを送り、OKAY/FAIL を確認"""
+        data = payload.encode("utf-8")
+        sock.sendall(f"{len(data):04x}".encode("ascii") + data)
+        status = _recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(self._read_length_prefixed(sock))
+        raise AdbError(f"不明な応答: {status!r}")
+
+    def _read_length_prefixed(self, sock: socket.socket) -> str:
+        length = int(_recv_exact(sock, 4), 16)
+        return _recv_exact(sock, length).decode("utf-8", errors="replace")
+
+    def host_query(self, payload: str) -> str:
+        """host:version / host:devices などの問い合わせ"""
+        with self._connect() as sock:
+            self._request(sock, payload)
+            return self._read_length_prefixed(sock)
+
+    def _open_device(self, serial: str, service: str, timeout: Optional[float] = None) -> socket.socket:
+        sock = self._connect(timeout)
+        try:
+            self._request(sock, f"host:transport:{serial}")
+            self._request(sock, service)
+            return sock
+        except Exception:
+            sock.close()
+            raise
+
+    def shell(self, serial: str, command: str, timeout: Optional[float] = None) -> Tuple[int, str]:
+        """シェルコマンドを実行し (終了コード, 出力) を返す"""
+        with self._open_device(serial, f"shell:{command}; echo {EXIT_MARKER}$?", timeout) as sock:
+            output = _recv_all(sock).decode("utf-8", errors="replace").replace("\r\n", "\n")
+
+        body, marker, tail = output.rpartition(EXIT_MARKER)
+        if not marker:
+            return -1, output
+        try:
+            return int(tail.strip()), body
+        except ValueError:
+            return -1, body
+
+    def push(self, serial: str, local_path: str, remote_path: str, mode: int = DEFAULT_FILE_MODE,
+             timeout: Optional[float] = None) -> int:
+        """sync サービスでファイルを送信し、送ったバイト数を返す"""
+        local = Path(local_path)
+        sent = 0
+        with self._open_device(serial, "sync:", timeout) as sock:
+            header = f"{remote_path},{mode}".encode("utf-8")
+            sock.sendall(b"SEND" + struct.pack("<I", len(header)) + header)
+            with open(local, "rb") as f:
+                for chunk in iter(lambda: f.read(SYNC_CHUNK_SIZE), b""):
+                    sock.sendall(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                    sent += len(chunk)
+            sock.sendall(b"DONE" + struct.pack("<I", int(local.stat().st_mtime)))
+
+            status = _recv_exact(sock, 4)
+            length = struct.unpack("<I", _recv_exact(sock, 4))[0]
+            if status == b"FAIL":
+                raise AdbError(_recv_exact(sock, length).decode("utf-8", errors="replace"))
+            if status != b"OKAY":
+                raise AdbError(f"不明な応答: {status!r}")
+            sock.sendall(b"QUIT" + struct.pack("<I", 0))
+        return sent
+
+    def pull(self, serial: str, remote_path: str, local_path: str, timeout: Optional[float] = None) -> int:
+        """sync サービスでファイルを受信し、受け取ったバイト数を返す"""
+        received = 0
+        local = Path(local_path)
+        temp_path = local.with_name(local.name + ".part")
+        with self._open_device(serial, "sync:", timeout) as sock:
+            path = remote_path.encode("utf-8")
+            sock.sendall(b"RECV" + struct.pack("<I", len(path)) + path)
+            try:
+                with open(temp_path, "wb") as f:
+                    while True:
+                        status = _recv_exact(sock, 4)
+                        length = struct.unpack("<I", _recv_exact(sock, 4))[0]
+                        if status == b"DATA":
+                            f.write(_recv_exact(sock, length))
+                            received += length
+                        elif status == b"DONE":
+                            break
+                        elif status == b"FAIL":
+                            raise AdbError(_recv_exact(sock, length).decode("utf-8", errors="replace"))
+                        else:
+                            raise AdbError(f"不明な応答: {status!r}")
+            except Exception:
+                temp_path.unlink(missing_ok=True)
+                raise
+            sock.sendall(b"QUIT" + struct.pack("<I", 0))
+        os.replace(temp_path, local)
+        return received
+
+
+class AdbChannelManager:
+    """端末ごとの操作を adb サーバー経由で並行実行し、端末情報をキャッシュする"""
+
+    def __init__(self, host: str = ADB_SERVER_HOST, port: int = ADB_SERVER_PORT,
+                 max_workers: int = 8, info_ttl: float = 30.0):
+        self.channel = AdbChannel(host, port)
+        self.info_ttl = info_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="adb")
+        self._info_cache: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+        self._server_checked = False
+        self.stats = {"shell_calls": 0, "info_cache_hits": 0, "info_queries": 0}
+
+    def is_available(self) -> bool:
+        """adb サーバーに接続できるか（起動していなければ一度だけ adb start-server を試す）"""
+        try:
+            self.channel.host_query("host:version")
+            return True
+        except (OSError, AdbError):
+            pass
+
+        with self._lock:
+            if self._server_checked:
+                return False
+            self._server_checked = True
+        try:
+            subprocess.run(["adb", "start-server"], capture_output=True, timeout=10)
+            self.channel.host_query("host:version")
+            return True
+        except (OSError, subprocess.TimeoutExpired, AdbError):
+            return False
+
+    def devices(self) -> List[Tuple[str, str]]:
+        """[(シリアル, 状態)]"""
+        output = self.channel.host_query("host:devices")
+        devices = []
+        for line in output.splitlines():
+            parts = line.split("\t")
+            if len(parts) >= 2 and parts[0].strip():
+                devices.append((parts[0].strip(), parts[1].strip()))
+        return devices
+
+    def shell(self, serial: str, command: str, timeout: float = 30.0) -> Dict:
+        """execute_adb_command と同じ形式で結果を返す"""
+        self.stats["shell_calls"] += 1
+        try:
+            exit_code, output = self.channel.shell(serial, command, timeout)
+            return {
+                "success": exit_code == 0,
+                "output": output,
+                "error": None if exit_code == 0 else (output.strip() or f"終了コード {exit_code}"),
+                "exit_code": exit_code
+            }
+        except socket.timeout:
+            return {"success": False, "error": "コマンドタイムアウト"}
+        except (OSError, AdbError) as e:
+            return {"success": False, "error": str(e)}
+
+    def get_device_snapshot(self, serial: str, refresh: bool = False) -> Dict:
+        """全プロパティ・Wi-Fi IP・バッテリーを1回のシェル実行でまとめて取得（TTLキャッシュ）"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._info_cache.get(serial)
+            if cached and not refresh and now - cached[0] < self.info_ttl:
+                self.stats["info_cache_hits"] += 1
+                return cached[1]
+
+        self.stats["info_queries"] += 1
+        script = (f"getprop; echo {SECTION_MARKER}; ip addr show wlan0 2>/dev/null; "
+                  f"echo {SECTION_MARKER}; dumpsys battery 2>/dev/null | grep level")
+        result = self.shell(serial, script)
+        if "output" not in result:
+            raise AdbError(result.get("error", "端末情報を取得できません"))
+
+        sections = result["output"].split(SECTION_MARKER)
+        sections += [""] * (3 - len(sections))
+        properties = parse_getprop(sections[0])
+        ip_address = "Unknown"
+        for token in sections[1].split():
+            if token.count(".") == 3 and token[0].isdigit():
+                ip_address = token.split("/")[0]
+                break
+
+        snapshot = {
+            "properties": properties,
+            "model": properties.get("ro.product.model", "Unknown"),
+            "android_version": properties.get("ro.build.version.release", ""),
+            "ip_address": ip_address,
+            "battery_level": sections[2].strip()
+        }
+        with self._lock:
+            self._info_cache[serial] = (time.monotonic(), snapshot)
+        return snapshot
+
+    def invalidate(self, serial: Optional[str] = None):
+        """端末情報キャッシュを破棄"""
+        with self._lock:
+            if serial is None:
+                self._info_cache.clear()
+            else:
+                self._info_cache.pop(serial, None)
+
+    def map_devices(self, func: Callable[[str], object], serials: Iterable[str]) -> Dict[str, object]:
+        """端末ごとの処理を並行実行し {シリアル: 結果} を返す（例外は結果として格納）"""
+        futures = {serial: self._executor.submit(func, serial) for serial in serials}
+        results = {}
+        for serial, future in futures.items():
+            try:
+                results[serial] = future.result()
+            except Exception as e:
+                results[serial] = e
+        return results
+
+    def push(self, serial: str, local_path: str, remote_path: str) -> Dict:
+        try:
+            sent = self.channel.push(serial, local_path, remote_path, timeout=60)
+            return {"success": True, "output": f"{local_path}: {sent} bytes pushed", "error": None}
+        except (OSError, AdbError) as e:
+            return {"success": False, "error": str(e)}
+
+    def pull(self, serial: str, remote_path: str, local_path: str) -> Dict:
+        try:
+            received = self.channel.pull(serial, remote_path, local_path, timeout=60)
+            return {"success": True, "output": f"{remote_path}: {received} bytes pulled", "error": None}
+        except (OSError, AdbError) as e:
+            return {"success": False, "error": str(e)}
+
+    def install(self, serial: str, apk_path: str) -> Dict:
+        """一時領域へ送信して pm install（adb install の旧方式と同じ手順）"""
+        remote_path = f"/data/local/tmp/{Path(apk_path).name}"
+        pushed = self.push(serial, apk_path, remote_path)
+        if not pushed["success"]:
+            return pushed
+        result = self.shell(serial, f"pm install -r {shlex.quote(remote_path)}", timeout=120)
+        self.shell(serial, f"rm -f {shlex.quote(remote_path)}")
+        if result.get("success") and "Success" not in result.get("output", ""):
+            result.update(success=False, error=result["output"].strip())
+        return result
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "cached_devices": len(self._info_cache)}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_adb_channel_manager = None
+_adb_channel_manager_lock = threading.Lock()
+
+
+def get_adb_channel_manager() -> AdbChannelManager:
+    """共有ADBチャネルマネージャーを取得"""
+    global _adb_channel_manager
+    with _adb_channel_manager_lock:
+        if _adb_channel_manager is None:
+            _adb_channel_manager = AdbChannelManager()
+        return _adb_channel_manager
@@ -5,12 +5,12 @@
 
 import os
 import re
-import importlib.util
 import streamlit as st
 from pathlib import Path
 from typing import Optional, Dict, List, Any
 from core.constants import *
 from services.backup_manager import backup_manager
+from services.app_registry import get_app_registry
 
 class CodeExtractor:
     """コード抽出クラス"""
@@ -607,83 +607,21 @@ main();
         return self.generate_code_from_instruction(instruction, filename)
 
 def scan_generated_apps():
-    """generated_appsフォルダ内のPythonファイルをスキャン"""
+    """generated_appsフォルダ内のPythonファイルをスキャン（変更のないファイルはキャッシュを使う）"""
     try:
-        apps = []
-        if not GENERATED_APPS_DIR.exists():
-            return apps
-        
-        for py_file in GENERATED_APPS_DIR.glob("*.py"):
-            try:
-                # ファイルのメタデータを取得
-                file_stat = py_file.stat()
-                app_info = {
-                    'name': py_file.stem,
-                    'path': str(py_file),
-                    'size': file_stat.st_size,
-                    'modified': file_stat.st_mtime,
-                    'description': '',
-                    'functions': []
-                }
-                
-                # ファイル内容をスキャンして関数を取得
-                with open(py_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # 関数抽出
-                functions = re.findall(r'def\s+(\w+)\s*\(', content)
-                app_info['functions'] = functions[:5]
-                
-                # ファイルの先頭コメントを説明として取得
-                lines = content.split('\n')
-                for line in lines:
-                    if line.strip().startswith('#') and not line.strip().startswith('#!'):
-                        app_info['description'] = line.strip('#').strip()
-                        break
-                
-                apps.append(app_info)
-                
-            except Exception as e:
-                print(f"アプリスキャンエラー {py_file}: {e}")
-                continue
-        
-        return sorted(apps, key=lambda x: x['modified'], reverse=True)
-    
+        return get_app_registry().scan()
     except Exception as e:
         print(f"アプリスキャン全体エラー: {e}")
         return []
 
 def execute_app_inline(app_path, app_name):
-    """アプリをインラインで実行"""
+    """アプリをインラインで実行（ファイルが変わるまでインポート済みモジュールを使い回す）"""
     try:
-        # アプリファイルを動的にインポート
-        spec = importlib.util.spec_from_file_location(app_name, app_path)
-        app_module = importlib.util.module_from_spec(spec)
-        
-        # グローバル変数をクリーンにするための準備
-        original_globals = {}
-        
+        registry = get_app_registry()
         try:
-            # Streamlitのグローバル変数を一時保存
-            for key in ['st', 'streamlit']:
-                if key in globals():
-                    original_globals[key] = globals()[key]
-            
-            # アプリモジュールを実行
-            spec.loader.exec_module(app_module)
-            
-            # main関数があれば実行
-            if hasattr(app_module, 'main'):
-                return app_module.main()
-            
-            return f"✅ {app_name} を読み込みました"
-            
+            return registry.execute(app_path, app_name)
         except Exception as app_error:
             return f"❌ アプリ実行エラー: {str(app_error)}"
-        finally:
-            # グローバル変数を復元
-            for key, value in original_globals.items():
-                globals()[key] = value
                 
     except Exception as e:
         return f"❌ アプリ読み込みエラー: {str(e)}"
@@ -721,6 +659,7 @@ def self_repair_app(app_path, app_name, error_message):
             
             with open(app_path, 'w', encoding='utf-8') as f:
                 f.write(repaired_code)
+            get_app_registry().invalidate(app_path)
             
             return True, repair_log
         
@@ -0,0 +1,212 @@
+"""
+生成アプリ登録簿モジュール
+generated_apps/ のアプリ情報とインポート済みモジュールを (パス, mtime, サイズ) でキャッシュする
+
+- 一覧取得ではディレクトリを stat するだけで、変更されたファイルだけを読み直す
+- 関数名・説明は正規表現ではなく AST から抽出（構文エラーのファイルは正規表現にフォールバック）
+- 実行時はファイルが変わるまでコンパイル結果を使い回す（トップレベルは毎回実行し直す）
+"""
+
+import ast
+import importlib.util
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from types import CodeType, ModuleType
+from typing import Dict, List, Optional, Tuple
+
+from core.constants import GENERATED_APPS_DIR
+
+# 一覧に表示する関数名の上限
+MAX_LISTED_FUNCTIONS = 5
+
+
+def _file_signature(stat_result: os.stat_result) -> Tuple[int, int]:
+    return stat_result.st_mtime_ns, stat_result.st_size
+
+
+def extract_app_metadata(source: str) -> Dict:
+    """ソースから関数名・クラス名・説明・main の有無を抽出"""
+    description = ""
+    for line in source.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('#') and not stripped.startswith('#!'):
+            description = stripped.strip('#').strip()
+            break
+
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        return {
+            'description': description,
+            'functions': re.findall(r'def\s+(\w+)\s*\(', source)[:MAX_LISTED_FUNCTIONS],
+            'classes': [],
+            'has_main': bool(re.search(r'^def\s+main\s*\(', source, re.MULTILINE)),
+            'syntax_error': str(e)
+        }
+
+    functions = sorted(
+        (node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))),
+        key=lambda node: (node.lineno, node.col_offset)
+    )
+    if not description:
+        docstring = ast.get_docstring(tree)
+        if docstring:
+            description = docstring.strip().split('\n')[0]
+
+    return {
+        'description': description,
+        'functions': [node.name for node in functions][:MAX_LISTED_FUNCTIONS],
+        'classes': [node.name for node in tree.body if isinstance(node, ast.ClassDef)],
+        'has_main': any(isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'main'
+                        for node in tree.body),
+        'syntax_error': None
+    }
+
+
+@dataclass
+class _CompiledApp:
+    """コンパイル済みのアプリ"""
+    signature: Tuple[int, int]
+    code: CodeType
+
+
+class AppRegistry:
+    """生成アプリの登録簿"""
+
+    def __init__(self, apps_dir: Path = GENERATED_APPS_DIR):
+        self.apps_dir = Path(apps_dir)
+        self._entries: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        self._listing: Optional[List[Dict]] = None
+        self._compiled_apps: Dict[str, _CompiledApp] = {}
+        self._lock = threading.RLock()
+        self.stats = {'parsed': 0, 'reused': 0, 'compiled': 0, 'compile_hits': 0}
+
+    def scan(self) -> List[Dict]:
+        """アプリ一覧（更新日時の新しい順）。変更のないファイルは読み直さない"""
+        if not self.apps_dir.exists():
+            return []
+
+        with self._lock:
+            seen = set()
+            changed = False
+            with os.scandir(self.apps_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.py') or not entry.is_file():
+                        continue
+                    path = entry.path
+                    seen.add(path)
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        continue
+                    signature = _file_signature(stat_result)
+                    cached = self._entries.get(path)
+                    if cached and cached[0] == signature:
+                        self.stats['reused'] += 1
+                        continue
+                    info = self._read_app(path, stat_result)
+                    if info is None:
+                        continue
+                    self._entries[path] = (signature, info)
+                    changed = True
+
+            for path in set(self._entries) - seen:
+                del self._entries[path]
+                self._compiled_apps.pop(os.path.abspath(path), None)
+                changed = True
+
+            if changed or self._listing is None:
+                self._listing = sorted((info for _, info in self._entries.values()),
+                                       key=lambda x: x['modified'], reverse=True)
+            return [dict(info) for info in self._listing]
+
+    def _read_app(self, path: str, stat_result: os.stat_result) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                source = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"アプリスキャンエラー {path}: {e}")
+            return None
+
+        self.stats['parsed'] += 1
+        return {
+            'name': Path(path).stem,
+            'path': path,
+            'size': stat_result.st_size,
+            'modified': stat_result.st_mtime,
+            **extract_app_metadata(source)
+        }
+
+    def _compiled(self, app_path: str) -> _CompiledApp:
+        """ファイルが変わっていればコンパイルし直す"""
+        key = os.path.abspath(app_path)
+        signature = _file_signature(os.stat(key))
+        compiled = self._compiled_apps.get(key)
+        if compiled and compiled.signature == signature:
+            self.stats['compile_hits'] += 1
+            return compiled
+
+        with open(key, 'rb') as f:
+            code = compile(f.read(), key, 'exec')
+        self.stats['compiled'] += 1
+        compiled = self._compiled_apps[key] = _CompiledApp(signature=signature, code=code)
+        return compiled
+
+    def load_module(self, app_path: str, app_name: str) -> ModuleType:
+        """アプリのモジュールを作成（コンパイル結果は使い回し、トップレベルは毎回実行する）"""
+        with self._lock:
+            code = self._compiled(app_path).code
+
+        spec = importlib.util.spec_from_file_location(app_name, os.path.abspath(app_path))
+        module = importlib.util.module_from_spec(spec)
+        exec(code, module.__dict__)
+        return module
+
+    def execute(self, app_path: str, app_name: str):
+        """アプリを実行。main があれば呼ぶ
+
+        Streamlitの再実行ごとに main の外（st.set_page_config・st.title など）も描画されるよう、
+        モジュールは使い回さずにトップレベルから実行し直す。
+        """
+        module = self.load_module(app_path, app_name)
+        if hasattr(module, 'main'):
+            return module.main()
+        return f"✅ {app_name} を読み込みました"
+
+    def invalidate(self, app_path: Optional[str] = None):
+        """キャッシュを破棄（省略時はすべて）"""
+        with self._lock:
+            if app_path is None:
+                self._entries.clear()
+                self._compiled_apps.clear()
+                self._listing = None
+                return
+            key = os.path.abspath(app_path)
+            self._compiled_apps.pop(key, None)
+            for path in [path for path in self._entries if os.path.abspath(path) == key]:
+                del self._entries[path]
+            self._listing = None
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                'apps': len(self._entries),
+                'compiled_apps': len(self._compiled_apps)
+            }
+
+
+_app_registry: Optional[AppRegistry] = None
+_app_registry_lock = threading.Lock()
+
+
+def get_app_registry() -> AppRegistry:
+    """共有の生成アプリ登録簿を取得"""
+    global _app_registry
+    with _app_registry_lock:
+        if _app_registry is None:
+            _app_registry = AppRegistry()
+        return _app_registry
@@ -0,0 +1,209 @@
+"""
+イベントバスモジュール
+セッションごとのチャネルにイベントを配信する asyncio ベースのサーバープッシュ基盤
+
+- セッションごとに直近のイベントだけを保持（履歴は上限付き）。再接続時は Last-Event-ID 以降を再送
+- 購読者ごとに上限付きのキューを持ち、遅いクライアントは古いイベントから捨て、
+  捨てた数が上限を超えたら切断する（再接続して履歴から取り直す）
+- 別スレッド（エージェント実行中のワーカーなど）からも publish_threadsafe で安全に発行できる
+"""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional, Set
+
+# セッションに紐付かない全体向けイベント（感情・アバターの変化など）
+BROADCAST_CHANNEL = "broadcast"
+
+# 遅い購読者に送る切断通知
+LAGGED_EVENT_TYPE = "lagged"
+
+# 無通信が続いたときに購読側へ返す keep-alive（履歴には残らない）
+KEEPALIVE_EVENT_TYPE = "keepalive"
+
+
+class Subscriber:
+    """1クライアント分の購読（上限付きキュー）"""
+
+    def __init__(self, channels: Iterable[str], queue_size: int, max_dropped: int):
+        self.channels = tuple(channels)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.max_dropped = max_dropped
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, event: Dict):
+        """イベントを積む。満杯なら最も古いものを捨てる"""
+        if self.closed:
+            return
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            self.dropped += 1
+            if self.dropped > self.max_dropped:
+                self.close(lagged=True)
+                return
+        self.queue.put_nowait(event)
+
+    def close(self, lagged: bool = False):
+        if self.closed:
+            return
+        self.closed = True
+        # 切断通知は必ず届くよう、キューを空けてから積む
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait({"type": LAGGED_EVENT_TYPE if lagged else "closed", "data": {"dropped": self.dropped}})
+
+
+class SessionChannel:
+    """セッション1つ分のチャネル"""
+
+    def __init__(self, history_size: int):
+        self.history: Deque[Dict] = deque(maxlen=history_size)
+        self.subscribers: Set[Subscriber] = set()
+        self.last_activity = time.monotonic()
+
+
+class EventBus:
+    """セッション単位のイベントバス"""
+
+    def __init__(self, history_size: int = 200, queue_size: int = 256, max_dropped: int = 1024,
+                 max_sessions: int = 500, session_ttl: float = 3600.0):
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self.max_dropped = max_dropped
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.channels: "OrderedDict[str, SessionChannel]" = OrderedDict()
+        self._event_ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "lagged_disconnects": 0}
+
+    def bind_loop(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """配信に使うイベントループを設定（省略時は実行中のループ）"""
+        self._loop = loop or asyncio.get_running_loop()
+
+    def _channel(self, session_id: str) -> SessionChannel:
+        channel = self.channels.get(session_id)
+        if channel is None:
+            channel = self.channels[session_id] = SessionChannel(self.history_size)
+            self._prune()
+        else:
+            self.channels.move_to_end(session_id)
+        channel.last_activity = time.monotonic()
+        return channel
+
+    def _prune(self):
+        """購読者のいない古いセッションを破棄（履歴が無制限に増えないように）"""
+        now = time.monotonic()
+        for session_id in list(self.channels):
+            channel = self.channels[session_id]
+            if len(self.channels) <= self.max_sessions and now - channel.last_activity <= self.session_ttl:
+                break
+            if channel.subscribers or session_id == BROADCAST_CHANNEL:
+                continue
+            del self.channels[session_id]
+
+    def publish(self, session_id: str, event_type: str, data: Optional[Dict] = None) -> Dict:
+        """イベントを発行（イベントループのスレッドから呼ぶ）"""
+        event = {
+            "id": next(self._event_ids),
+            "type": event_type,
+            "session_id": session_id,
+            "timestamp": datetime.now().isoformat(),
+            "data": data or {}
+        }
+        channel = self._channel(session_id)
+        channel.history.append(event)
+        self.stats["published"] += 1
+
+        for subscriber in list(channel.subscribers):
+            dropped_before = subscriber.dropped
+            subscriber.offer(event)
+            self.stats["dropped"] += subscriber.dropped - dropped_before
+            if subscriber.closed:
+                self.stats["lagged_disconnects"] += 1
+                self._detach(subscriber)
+            else:
+                self.stats["delivered"] += 1
+        return event
+
+    def publish_threadsafe(self, session_id: str, event_type: str, data: Optional[Dict] = None):
+        """別スレッドからイベントを発行"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is loop:
+            self.publish(session_id, event_type, data)
+        else:
+            loop.call_soon_threadsafe(self.publish, session_id, event_type, data)
+
+    def history(self, session_id: str, after_id: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """after_id より後のイベント履歴"""
+        channel = self.channels.get(session_id)
+        if channel is None:
+            return []
+        events = [event for event in channel.history if event["id"] > after_id]
+        return events[-limit:] if limit else events
+
+    def _detach(self, subscriber: Subscriber):
+        for session_id in subscriber.channels:
+            channel = self.channels.get(session_id)
+            if channel:
+                channel.subscribers.discard(subscriber)
+
+    async def subscribe(self, session_id: str, last_event_id: int = 0, include_broadcast: bool = True,
+                        keepalive: Optional[float] = None) -> AsyncIterator[Dict]:
+        """セッションのイベントを購読（last_event_id より後の履歴を先に再送）
+
+        keepalive 秒イベントが無ければ keep-alive を返す（接続維持・切断検知用）
+        """
+        channels = [session_id] + ([BROADCAST_CHANNEL] if include_broadcast and session_id != BROADCAST_CHANNEL else [])
+        subscriber = Subscriber(channels, self.queue_size, self.max_dropped)
+
+        replay = []
+        for name in channels:
+            self._channel(name).subscribers.add(subscriber)
+            replay.extend(self.history(name, after_id=last_event_id))
+        replay.sort(key=lambda event: event["id"])
+
+        try:
+            for event in replay:
+                yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield {"type": KEEPALIVE_EVENT_TYPE, "data": {}}
+                    continue
+                if event["type"] in (LAGGED_EVENT_TYPE, "closed") and subscriber.closed:
+                    yield event
+                    return
+                yield event
+        finally:
+            subscriber.closed = True
+            self._detach(subscriber)
+
+    def close_session(self, session_id: str):
+        """セッションの購読者を切断して履歴を破棄"""
+        channel = self.channels.pop(session_id, None)
+        if channel:
+            for subscriber in list(channel.subscribers):
+                subscriber.close()
+                self._detach(subscriber)
+
+    def get_statistics(self) -> Dict:
+        return {
+            **self.stats,
+            "sessions": len(self.channels),
+            "subscribers": sum(len(channel.subscribers) for channel in self.channels.values())
+        }
@@ -0,0 +1,278 @@
+"""
+画像パイプラインモジュール
+画面キャプチャの変化検知・知覚ハッシュ・差分領域の切り出し・メモリ上でのエンコードを提供
+
+変化検知は縮小したグレースケール画像で行い、フル解像度の画像は
+変化した領域を切り出してビジョンモデルへ送る時にだけ扱う。
+ビジョンモデルへ送る画像はモデルの入力解像度に縮小してメモリ上でエンコードし、
+画像ハッシュをキーにエンコード済みデータをキャッシュする（VisionPreprocessor）。
+"""
+
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+
+# llama3.2-vision は560pxタイルを最大2×2で入力するため、長辺1120pxを超える部分は縮小される
+VISION_MAX_SIDE = 1120
+
+# 1リクエストで送れる画像数（llama3.2-vision は1枚のみ対応）
+MODEL_IMAGE_LIMITS = {
+    "llama3.2-vision": 1,
+}
+DEFAULT_IMAGE_LIMIT = 4
+
+
+def to_pil(image) -> Image.Image:
+    """PIL画像またはnumpy配列をPIL画像に変換"""
+    if isinstance(image, Image.Image):
+        return image
+    return Image.fromarray(image)
+
+
+def load_image(source) -> Image.Image:
+    """PIL画像・numpy配列・バイト列・ファイルパス・ファイルオブジェクトを読み込む"""
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, (str, Path)):
+        return Image.open(source)
+    if hasattr(source, "read"):
+        return Image.open(source)
+    return to_pil(source)
+
+
+def downsample(image, size: Tuple[int, int] = (160, 90)) -> Image.Image:
+    """変化検知用の縮小グレースケール画像を作成（縮小してから変換）"""
+    return to_pil(image).resize(size, Image.BILINEAR, reducing_gap=2.0).convert("L")
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差分ハッシュ（dHash）を計算"""
+    gray = to_pil(image).convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def crop_region(image, bbox: Tuple[int, int, int, int], max_side: Optional[int] = None) -> Image.Image:
+    """領域を切り出し、必要に応じて長辺max_sideに縮小"""
+    region = to_pil(image).crop(bbox)
+    if max_side and max(region.size) > max_side:
+        region = region.copy()
+        region.thumbnail((max_side, max_side), Image.LANCZOS)
+    return region
+
+
+def encode_image(image, max_side: Optional[int] = 1024, fmt: str = "JPEG", quality: int = 80) -> bytes:
+    """画像をメモリ上でエンコード（一時ファイルを作らない）"""
+    pil_image = to_pil(image)
+    if max_side and max(pil_image.size) > max_side:
+        pil_image = pil_image.copy()
+        pil_image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if fmt.upper() in ("JPEG", "JPG") and pil_image.mode not in ("RGB", "L"):
+        pil_image = pil_image.convert("RGB")
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format=fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_image_base64(image, max_side: Optional[int] = 1024, fmt: str = "JPEG", quality: int = 80) -> str:
+    return base64.b64encode(encode_image(image, max_side, fmt, quality)).decode("ascii")
+
+
+@dataclass
+class FrameChange:
+    """検知された画面変化"""
+    bbox: Tuple[int, int, int, int]  # フル解像度での変化領域 (left, top, right, bottom)
+    dirty_tiles: int
+    total_tiles: int
+    frame_hash: int
+    small_frame: Image.Image
+
+    @property
+    def dirty_ratio(self) -> float:
+        return self.dirty_tiles / self.total_tiles if self.total_tiles else 0.0
+
+
+class FrameChangeDetector:
+    """タイル単位の差分と知覚ハッシュによる画面変化検知
+
+    比較の基準は最後に採用（accept）したフレームなので、解析中で見送ったフレームの
+    変化も次回にまとめて検知される。以前に解析した画面へ戻っただけの場合は重複として扱う
+    （知覚ハッシュで候補を絞り、タイル差分で確認する）。
+    """
+
+    def __init__(self, detect_size: Tuple[int, int] = (160, 90), grid: Tuple[int, int] = (16, 9),
+                 tile_threshold: float = 12.0, duplicate_distance: int = 2, recent_frames: int = 8):
+        self.detect_size = detect_size
+        self.grid = grid
+        self.tile_threshold = tile_threshold
+        self.duplicate_distance = duplicate_distance
+        self.reference: Optional[Image.Image] = None
+        # 直近に採用したフレームの (ハッシュ, 縮小画像)。末尾が現在の基準
+        self.recent_frames = deque(maxlen=recent_frames)
+
+    def check(self, image) -> Tuple[str, Optional[FrameChange]]:
+        """("initial" | "unchanged" | "duplicate" | "changed", 変化情報) を返す"""
+        pil_image = to_pil(image)
+        small = downsample(pil_image, self.detect_size)
+        frame_hash = dhash(small)
+
+        if self.reference is None:
+            self.accept(FrameChange((0, 0) + pil_image.size, 0, 0, frame_hash, small))
+            return "initial", None
+
+        dirty = self._dirty_tiles(self.reference, small)
+        if not dirty:
+            return "unchanged", None
+
+        # 以前に解析した画面へ戻っただけなら、解析せずにその画面を基準として採用
+        for entry in list(self.recent_frames)[:-1]:
+            previous_hash, previous_frame = entry
+            if hamming_distance(frame_hash, previous_hash) <= self.duplicate_distance \
+                    and not self._dirty_tiles(previous_frame, small):
+                self.recent_frames.remove(entry)
+                self.recent_frames.append(entry)
+                self.reference = previous_frame
+                return "duplicate", None
+
+        # 変化タイルの外接矩形を1タイル分広げてフル解像度に換算
+        cols, rows = self.grid
+        total_tiles = cols * rows
+        dirty_cols = [index % cols for index in dirty]
+        dirty_rows = [index // cols for index in dirty]
+        width, height = pil_image.size
+        left = max(0, min(dirty_cols) - 1) * width // cols
+        right = min(cols, max(dirty_cols) + 2) * width // cols
+        top = max(0, min(dirty_rows) - 1) * height // rows
+        bottom = min(rows, max(dirty_rows) + 2) * height // rows
+        return "changed", FrameChange((left, top, right, bottom), len(dirty), total_tiles, frame_hash, small)
+
+    def _dirty_tiles(self, reference: Image.Image, small: Image.Image) -> list:
+        """平均差分がしきい値を超えるタイル番号（差分画像をグリッドサイズへ面積平均で縮小）"""
+        tile_means = ImageChops.difference(reference, small).resize(self.grid, Image.BOX).getdata()
+        return [index for index, value in enumerate(tile_means) if value > self.tile_threshold]
+
+    def accept(self, change: FrameChange):
+        """解析に回したフレームを次回の比較基準にする"""
+        self.reference = change.small_frame
+        self.recent_frames.append((change.frame_hash, change.small_frame))
+
+    def reset(self):
+        self.reference = None
+        self.recent_frames.clear()
+
+
+class VisionPreprocessor:
+    """ビジョンモデル向けの画像前処理（縮小・再エンコード・キャッシュ・バッチ分割）
+
+    画像の内容（ファイルのバイト列または画素データ）のハッシュをキーに、
+    エンコード済みのbase64をLRUキャッシュする。同じ画面を何度も分析する場合は
+    縮小とエンコードを省略できる。
+    """
+
+    def __init__(self, max_side: int = VISION_MAX_SIDE, fmt: str = "JPEG", quality: int = 85,
+                 cache_size: int = 64):
+        self.max_side = max_side
+        self.fmt = fmt
+        self.quality = quality
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def image_key(self, source) -> Tuple[str, Optional[bytes]]:
+        """(内容ハッシュ, 元のバイト列) を返す（ファイル・バイト列はバイト列のハッシュ）"""
+        if isinstance(source, (str, Path)):
+            source = Path(source).read_bytes()
+        elif hasattr(source, "read"):
+            source = source.read()
+        if isinstance(source, (bytes, bytearray)):
+            return hashlib.blake2b(source, digest_size=16).hexdigest(), bytes(source)
+        image = to_pil(source)
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(f"{image.mode}{image.size}".encode("ascii"))
+        return digest.hexdigest(), None
+
+    def prepare(self, source) -> str:
+        """画像をモデル入力サイズのbase64に変換（キャッシュ利用）"""
+        digest, raw = self.image_key(source)
+        key = (digest, self.max_side, self.fmt, self.quality)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+
+        image = load_image(raw if raw is not None else source)
+        if image.format in ("JPEG", "MPO"):
+            # JPEGはデコード時に縮小できる（draftは1/2,1/4,1/8単位で目標以上のサイズを保つ）
+            image.draft("RGB", (self.max_side, self.max_side))
+        encoded = encode_image(image, self.max_side, self.fmt, self.quality)
+        payload = base64.b64encode(encoded).decode("ascii")
+
+        with self._lock:
+            self.stats["misses"] += 1
+            self.stats["bytes_in"] += len(raw) if raw is not None else image.width * image.height * 3
+            self.stats["bytes_out"] += len(encoded)
+            self._cache[key] = payload
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return payload
+
+    def prepare_many(self, sources) -> List[str]:
+        return [self.prepare(source) for source in sources]
+
+    def batches(self, sources, model: str) -> List[List[str]]:
+        """モデルが1リクエストで受け付ける枚数ごとに分割"""
+        payloads = self.prepare_many(sources)
+        limit = image_limit(model)
+        return [payloads[i:i + limit] for i in range(0, len(payloads), limit)]
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "cache_entries": len(self._cache),
+                "hit_rate": self.stats["hits"] / total if total else 0.0
+            }
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def image_limit(model: str) -> int:
+    """モデルが1リクエストで受け付ける画像数"""
+    base = model.split(":")[0]
+    return MODEL_IMAGE_LIMITS.get(base, DEFAULT_IMAGE_LIMIT)
+
+
+_vision_preprocessor = None
+_vision_preprocessor_lock = threading.Lock()
+
+
+def get_vision_preprocessor() -> VisionPreprocessor:
+    """共有のビジョン前処理を取得（初回利用時に作成）"""
+    global _vision_preprocessor
+    with _vision_preprocessor_lock:
+        if _vision_preprocessor is None:
+            _vision_preprocessor = VisionPreprocessor()
+        return _vision_preprocessor
@@ -9,6 +9,7 @@ import importlib
 from pathlib import Path
 from typing import Dict, List, Set, Optional, Tuple
 from core.constants import *
+from core.project_index import ProjectIndex, get_project_index
 
 class ImportAnalyzer:
     """インポート分析クラス"""
@@ -86,17 +87,9 @@ class ImportAnalyzer:
 class ImportSynchronizer:
     """インポート同期クラス"""
     
-    def __init__(self):
+    def __init__(self, index: Optional[ProjectIndex] = None):
         self.analyzer = ImportAnalyzer()
-        self.file_map = {
-            "main_app_new.py": ["ui/styles", "ui/components", "core/*", "services/*"],
-            "ui/components.py": ["core/constants", "services/state_manager", "services/app_generator"],
-            "ui/styles.py": ["core/constants"],
-            "core/llm_client.py": ["core/constants", "core/self_mutation", "core/file_map"],
-            "core/vrm_controller.py": ["core/constants"],
-            "services/app_generator.py": ["core/constants", "services/backup_manager"],
-            "services/state_manager.py": ["core/constants", "core/file_map"]
-        }
+        self.index = index or get_project_index()
     
     def sync_imports_after_mutation(self, modified_file: str) -> Dict:
         """モジュール修正後のインポート同期"""
@@ -108,8 +101,9 @@ class ImportSynchronizer:
                 "synced_imports": []
             }
             
-            # 修正されたファイルの新しいエクスポートを取得
-            modified_imports = self.analyzer.extract_imports(modified_file)
+            # 修正されたファイルを索引に反映し、新しいエクスポートを取得
+            self.index.update_file(modified_file)
+            modified_imports = self.index.extract_imports(modified_file)
             
             # このファイルをインポートしているファイルを特定
             dependent_files = self._find_dependent_files(modified_file)
@@ -117,7 +111,7 @@ class ImportSynchronizer:
             for dependent_file in dependent_files:
                 try:
                     # 依存ファイルの現在のインポートを分析
-                    current_imports = self.analyzer.extract_imports(dependent_file)
+                    current_imports = self.index.extract_imports(dependent_file)
                     
                     # 同期が必要かチェック
                     needed_sync = self._check_sync_needed(
@@ -156,18 +150,8 @@ class ImportSynchronizer:
             }
     
     def _find_dependent_files(self, modified_file: str) -> List[str]:
-        """修正されたファイルに依存するファイルを検出"""
-        dependent_files = []
-        
-        # ファイルマップから逆引き
-        modified_module = self._path_to_module(modified_file)
-        
-        for file_path, modules in self.file_map.items():
-            for module in modules:
-                if self._module_matches(modified_module, module):
-                    dependent_files.append(file_path)
-        
-        return dependent_files
+        """修正されたファイルに依存するファイルを検出（索引の逆引き）"""
+        return self.index.dependent_files(modified_file)
     
     def _path_to_module(self, file_path: str) -> str:
         """ファイルパスをモジュール名に変換"""
@@ -175,15 +159,6 @@ class ImportSynchronizer:
             file_path = file_path[:-3]
         return file_path.replace('/', '.')
     
-    def _module_matches(self, target_module: str, pattern: str) -> bool:
-        """モジュールパターンマッチング"""
-        if pattern == target_module:
-            return True
-        elif pattern.endswith('*'):
-            base_pattern = pattern[:-1]
-            return target_module.startswith(base_pattern)
-        return False
-    
     def _check_sync_needed(self, dependent_file: str, modified_file: str, 
                           current_imports: Dict, modified_imports: Dict) -> Dict:
         """同期が必要かチェック"""
@@ -226,6 +201,7 @@ class ImportSynchronizer:
             # 更新された内容を保存
             with open(dependent_file, 'w', encoding='utf-8') as f:
                 f.write(content)
+            self.index.update_file(dependent_file)
             
             return {
                 "success": True,
@@ -9,6 +9,7 @@ import importlib
 from pathlib import Path
 from typing import Dict, List, Set, Optional, Tuple
 from core.constants import *
+from core.project_index import ProjectIndex, get_project_index
 
 class ImportErrorDetector:
     """インポートエラー検知クラス"""
@@ -153,11 +154,16 @@ class AutoImportFixer:
         module_name = error_info['module_name']
         missing_name = error_info['missing_name']
         
+        # 索引から実際にその名前を定義しているモジュールを優先
+        if missing_name:
+            for defining_module in sorted(get_project_index().where_defined(missing_name)):
+                candidates.append(f'from {defining_module} import {missing_name}')
+        
         if module_name in self.module_mappings:
             for submodule in self.module_mappings[module_name]:
                 candidates.append(f'from {module_name}.{submodule} import {missing_name}')
         
-        return list(set(candidates))  # 重複を除去
+        return list(dict.fromkeys(candidates))  # 重複を除去（優先順は維持）
     
     def _apply_import_fix(self, target_file: str, import_statement: str) -> Dict:
         """インポート修正を適用"""
@@ -219,57 +225,20 @@ class AutoImportFixer:
 class CircularDependencyChecker:
     """循環参照チェッカー"""
     
-    def __init__(self):
+    def __init__(self, index: Optional[ProjectIndex] = None):
+        self.index = index or get_project_index()
         self.dependency_graph = {}
         self.build_dependency_graph()
     
     def build_dependency_graph(self):
-        """依存関係グラフを構築"""
-        # プロジェクトの依存関係を定義
-        self.dependency_graph = {
-            'main_app_new': ['ui.styles', 'ui.components', 'core.constants', 'core.llm_client', 
-                           'core.vrm_controller', 'services.app_generator', 'services.state_manager'],
-            'ui.styles': ['core.constants'],
-            'ui.components': ['core.constants', 'services.state_manager', 'services.app_generator'],
-            'core.llm_client': ['core.constants', 'core.self_mutation', 'core.file_map'],
-            'core.vrm_controller': ['core.constants'],
-            'services.app_generator': ['core.constants', 'services.backup_manager'],
-            'services.state_manager': ['core.constants', 'core.file_map'],
-            'services.import_sync': ['core.constants'],
-            'services.backup_manager': [],
-            'core.file_map': [],
-            'core.self_mutation': ['core.constants']
-        }
+        """依存関係グラフを構築（プロジェクト索引のASTから導出）"""
+        self.dependency_graph = self.index.dependency_graph()
     
     def check_circular_dependencies(self) -> Dict:
         """循環参照をチェック"""
         try:
-            visited = set()
-            rec_stack = set()
-            circular_deps = []
-            
-            def dfs(node, path):
-                if node in rec_stack:
-                    # 循環を検出
-                    cycle_start = path.index(node)
-                    circular_deps.append(path[cycle_start:] + [node])
-                    return
-                
-                if node in visited:
-                    return
-                
-                visited.add(node)
-                rec_stack.add(node)
-                
-                for neighbor in self.dependency_graph.get(node, []):
-                    dfs(neighbor, path + [node])
-                
-                rec_stack.remove(node)
-            
-            # すべてのノードでDFSを実行
-            for node in self.dependency_graph:
-                if node not in visited:
-                    dfs(node, [])
+            circular_deps = self.index.find_cycles()
+            self.build_dependency_graph()
             
             if circular_deps:
                 return {
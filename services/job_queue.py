@@ -0,0 +1,342 @@
+"""
+ジョブキューモジュール
+Flaskサーバーの重い処理（OCR・LLM分析など）を上限付きワーカープールで実行し、状態をSQLiteに記録
+
+- submit() はジョブIDを即座に返し、待ち行列が上限に達していれば QueueFullError（HTTP 429）
+- ジョブの状態・結果はSQLite（WALモード）に1件ずつ書き込むため、サーバー再起動後も参照できる
+- register_job_routes() で状態取得（ロングポーリング）とSSEのエンドポイントを追加
+"""
+
+import json
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+FINISHED_STATUSES = ("done", "error")
+
+# ロングポーリング・SSEの最大待機時間（秒）
+MAX_WAIT_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+class QueueFullError(Exception):
+    """待ち行列が上限に達した場合の例外"""
+
+    def __init__(self, name: str, limit: int, retry_after: int):
+        super().__init__(f"{name}: 処理待ちのジョブが上限（{limit}件）に達しています")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """SQLiteベースのジョブテーブル（db_path=None の場合はメモリ上）"""
+
+    def __init__(self, db_path: Optional[Path] = None, retention: int = 1000):
+        self.retention = retention
+        self._lock = threading.RLock()
+        if db_path is None:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        else:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._inserts = 0
+
+    def insert(self, job: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs(job_id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job["job_id"], job["kind"], job["status"], _dumps(job.get("payload")), job["created_at"])
+            )
+            self._inserts += 1
+            if self._inserts % 100 == 0:
+                self.prune()
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = _dumps(fields["result"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, kind, status, payload, result, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("job_id", "kind", "status", "payload", "result", "error", "created_at", "started_at", "finished_at")
+        job = dict(zip(keys, row))
+        for key in ("payload", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def recover_interrupted(self) -> int:
+        """前回のプロセスで未完了のまま残ったジョブをエラーとして確定"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'error', error = ?, finished_at = ? WHERE status IN ('queued', 'running')",
+                ("サーバー再起動により中断されました", time.time())
+            )
+            return cursor.rowcount
+
+    def prune(self):
+        """古いジョブを削除して保持件数を保つ"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE job_id NOT IN (SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                (self.retention,)
+            )
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobQueue:
+    """上限付きワーカープールとジョブテーブルによる非同期ジョブ実行"""
+
+    def __init__(self, db_path: Optional[Path] = None, max_workers: int = 2, max_pending: int = 16,
+                 name: str = "jobs", retention: int = 1000):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.store = JobStore(db_path, retention)
+        recovered = self.store.recover_interrupted()
+        if recovered:
+            print(f"⚠️ 中断されたジョブを{recovered}件エラーとして記録しました ({name})")
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._condition = threading.Condition()
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._finished: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._average_duration = 0.0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def capacity(self) -> int:
+        """実行中と待機中を合わせた受け入れ上限"""
+        return self.max_workers + self.max_pending
+
+    def submit(self, kind: str, func: Callable, *args, payload: Optional[Dict] = None,
+               job_id: Optional[str] = None, **kwargs) -> str:
+        """ジョブを登録してIDを返す（上限超過時は QueueFullError）"""
+        job_id = job_id or new_job_id()
+        with self._condition:
+            if len(self._active) >= self.capacity:
+                self.stats["rejected"] += 1
+                raise QueueFullError(self.name, self.capacity, self._retry_after())
+            job = {
+                "job_id": job_id,
+                "kind": kind,
+                "status": "queued",
+                "payload": payload,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "version": 0
+            }
+            self._active[job_id] = job
+            self.stats["submitted"] += 1
+        self.store.insert(job)
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _retry_after(self) -> int:
+        """待ち行列が空くまでの目安（秒）"""
+        average = self._average_duration or 1.0
+        return max(1, math.ceil(average * len(self._active) / self.max_workers))
+
+    def _run(self, job_id: str, func: Callable, args, kwargs):
+        self._set(job_id, status="running", started_at=time.time())
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            print(f"❌ ジョブ実行エラー ({self.name}/{job_id}): {e}")
+            self._set(job_id, status="error", error=str(e), finished_at=time.time())
+        else:
+            self._set(job_id, status="done", result=result, finished_at=time.time())
+
+    def _set(self, job_id: str, **fields):
+        """状態を更新してテーブルに記録し、待機中の呼び出しを起こす"""
+        try:
+            self.store.update(job_id, **fields)
+        except Exception as e:
+            print(f"⚠️ ジョブ状態の保存エラー ({self.name}/{job_id}): {e}")
+        with self._condition:
+            job = self._active.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job["version"] += 1
+            if job["status"] in FINISHED_STATUSES:
+                del self._active[job_id]
+                self._finished[job_id] = job
+                while len(self._finished) > 200:
+                    self._finished.popitem(last=False)
+                duration = job["finished_at"] - (job["started_at"] or job["created_at"])
+                self._average_duration = duration if not self._average_duration \
+                    else self._average_duration * 0.8 + duration * 0.2
+                self.stats["completed" if job["status"] == "done" else "failed"] += 1
+            self._condition.notify_all()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブ状態を取得（メモリになければテーブルから）"""
+        with self._condition:
+            job = self._active.get(job_id) or self._finished.get(job_id)
+            if job is not None:
+                job = dict(job)
+                if job["status"] == "queued":
+                    job["queue_position"] = self._queue_position(job_id)
+                return job
+        return self.store.get(job_id)
+
+    def _queue_position(self, job_id: str) -> int:
+        queued = [key for key, job in self._active.items() if job["status"] == "queued"]
+        return queued.index(job_id) + 1 if job_id in queued else 0
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, since_version: int = -1) -> Optional[Dict[str, Any]]:
+        """ジョブが完了するか、since_version より新しい状態になるまで待機"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                job = self._active.get(job_id)
+                if job is None or job["version"] > since_version >= 0:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        return self.get(job_id)
+
+    def events(self, job_id: str, timeout: float = 300) -> Iterator[Optional[Dict[str, Any]]]:
+        """状態が変わるたびにジョブを返す（変化がない間は一定間隔でNoneを返す）"""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        version = None
+        while job is not None:
+            if job.get("version") != version or job["status"] in FINISHED_STATUSES:
+                version = job.get("version")
+                yield job
+            else:
+                yield None
+            if job["status"] in FINISHED_STATUSES or time.monotonic() >= deadline:
+                return
+            job = self.wait(job_id, SSE_KEEPALIVE_SECONDS, since_version=version or 0)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._condition:
+            running = sum(1 for job in self._active.values() if job["status"] == "running")
+            return {
+                **self.stats,
+                "running": running,
+                "queued": len(self._active) - running,
+                "capacity": self.capacity,
+                "average_duration": round(self._average_duration, 3)
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def job_response(job: Optional[Dict[str, Any]], formatter: Optional[Callable] = None) -> Dict[str, Any]:
+    """ジョブをAPIレスポンス形式に変換（完了時は formatter で結果を整形）"""
+    if job is None:
+        return {"success": False, "error": "ジョブが見つかりません"}
+    base = {"job_id": job["job_id"], "status": job["status"]}
+    if job["status"] == "done":
+        result = job["result"]
+        if formatter is not None:
+            result = formatter(result)
+        if isinstance(result, dict):
+            return {"success": True, **result, **base}
+        return {"success": True, "result": result, **base}
+    if job["status"] == "error":
+        return {"success": False, "error": job["error"] or "ジョブの実行に失敗しました", **base}
+    response = {"success": True, "status_url": f"/api/jobs/{job['job_id']}", **base}
+    if job.get("queue_position"):
+        response["queue_position"] = job["queue_position"]
+    return response
+
+
+def queue_full_response(error: QueueFullError):
+    """429レスポンスを作成（Retry-Afterヘッダー付き）"""
+    from flask import jsonify
+    response = jsonify({
+        "success": False,
+        "error": "サーバーが混雑しています。しばらくしてから再試行してください",
+        "retry_after": error.retry_after
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def register_job_routes(app, job_queue: JobQueue, formatter: Optional[Callable] = None,
+                        url_prefix: str = "/api/jobs"):
+    """ジョブ状態（?wait=秒 でロングポーリング）とSSEのエンドポイントを登録"""
+    from flask import Response, jsonify, request
+
+    @app.route(f"{url_prefix}/<job_id>")
+    def get_job_status(job_id):
+        """ジョブ状態API（完了時は結果を含む）"""
+        wait = min(request.args.get("wait", 0, type=float), MAX_WAIT_SECONDS)
+        job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+        return jsonify(job_response(job, formatter)), 200 if job else 404
+
+    @app.route(f"{url_prefix}/<job_id>/events")
+    def stream_job_events(job_id):
+        """ジョブ状態のServer-Sent Events"""
+        if job_queue.get(job_id) is None:
+            return jsonify(job_response(None)), 404
+
+        def generate():
+            for job in job_queue.events(job_id):
+                if job is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: {job['status']}\ndata: {_dumps(job_response(job, formatter))}\n\n"
+
+        return Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.route(f"{url_prefix}")
+    def get_job_statistics():
+        """ジョブキュー統計API"""
+        return jsonify(job_queue.get_statistics())
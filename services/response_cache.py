@@ -0,0 +1,375 @@
+"""
+応答キャッシュモジュール
+LLMの生成結果を (モデル, オプション, 正規化したプロンプト) をキーにSQLiteへ保存し、プロセス間・再起動後も再利用する
+
+- 完全一致層: 正規化したプロンプトのハッシュで検索。cached_generate では決定的（温度0）か明示的に指定した呼び出しだけ
+- 類似層（任意）: 埋め込みのコサイン類似度が閾値以上なら再利用。温度が低い（決定的な）呼び出しに限る
+- 有効期限（TTL）と件数上限（最終アクセスが古いものから削除）、ヒット率の統計、呼び出しごとのバイパス
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.constants import RESPONSE_CACHE_DB_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    options TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    metadata TEXT,
+    embedding BLOB,
+    created_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_group ON responses(model, options);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(last_accessed);
+"""
+
+# 類似層を使う温度の上限（これより高い温度の応答は似た質問でも別の応答になり得る）
+SEMANTIC_MAX_TEMPERATURE = 0.3
+
+
+# コードを含むプロンプトの目印（コードブロック・定義文・インデントされた行）
+CODE_PATTERN = re.compile(r"```|^[ \t]*(?:def|class|import|from)\s|^(?:\t| {4})\S", re.MULTILINE)
+
+
+def looks_like_code(prompt: str) -> bool:
+    return bool(CODE_PATTERN.search(prompt))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """キャッシュキー用にプロンプトを正規化（全角・大文字・連続空白を統一）
+
+    コードを含むプロンプトは大文字小文字やインデントで意味が変わるため、前後の空白以外はそのまま使う
+    """
+    if looks_like_code(prompt):
+        return prompt.strip()
+    return " ".join(unicodedata.normalize("NFKC", prompt).lower().split())
+
+
+def is_deterministic(options: Optional[Dict[str, Any]]) -> bool:
+    """温度0の呼び出しか（温度未指定はOllama既定の0.8とみなす）"""
+    temperature = (options or {}).get("temperature")
+    return temperature is not None and float(temperature) == 0
+
+
+def scoped_model(model: str, endpoint: Optional[str] = None) -> str:
+    """接続先ごとにキャッシュを分けるためのモデル名（同名モデルでもサーバーが違えば別の応答）"""
+    return f"{model}@{endpoint.rstrip('/')}" if endpoint else model
+
+
+def _options_key(options: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(options or {}, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _pack(vector: List[float]) -> bytes:
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def _unpack(blob: bytes) -> Tuple[float, ...]:
+    return struct.unpack(f"<{len(blob) // 4}f", blob)
+
+
+def _normalize_vector(vector: List[float]) -> List[float]:
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+class OllamaEmbedder:
+    """Ollamaの /api/embeddings で埋め込みを取得（失敗時はしばらく類似層を休止）"""
+
+    def __init__(self, model: str = "nomic-embed-text", base_url: Optional[str] = None,
+                 timeout: float = 10.0, retry_after: float = 60.0):
+        self.model = model
+        self.base_url = base_url or os.getenv('OLLAMA_HOST', 'http://localhost:11434')
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._disabled_until = 0.0
+
+    def __call__(self, text: str) -> Optional[List[float]]:
+        if time.monotonic() < self._disabled_until:
+            return None
+        try:
+            request = urllib.request.Request(
+                f"{self.base_url}/api/embeddings",
+                data=json.dumps({"model": self.model, "prompt": text}).encode("utf-8"),
+                headers={"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                embedding = json.loads(response.read()).get("embedding")
+            return embedding or None
+        except Exception as e:
+            print(f"⚠️ 埋め込み取得エラー（{self.retry_after:.0f}秒間は類似検索を休止）: {e}")
+            self._disabled_until = time.monotonic() + self.retry_after
+            return None
+
+
+class ResponseCache:
+    """SQLiteベースのLLM応答キャッシュ"""
+
+    def __init__(self, db_path: Path = RESPONSE_CACHE_DB_FILE, ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 5000, embedder: Optional[Callable[[str], Optional[List[float]]]] = None,
+                 semantic_threshold: float = 0.95, semantic_max_temperature: float = SEMANTIC_MAX_TEMPERATURE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embedder = embedder
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_temperature = semantic_max_temperature
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        # 類似検索用の埋め込み（モデル・オプションごとに初回検索時に読み込む）
+        self._vectors: Dict[Tuple[str, str], Dict[str, Tuple[float, ...]]] = {}
+        self._puts_since_prune = 0
+        self.stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                      "bypassed": 0, "uncached": 0, "stores": 0, "evictions": 0}
+
+    # キー・判定
+    def make_key(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                 endpoint: Optional[str] = None) -> str:
+        material = "\x00".join((scoped_model(model, endpoint), _options_key(options), normalize_prompt(prompt)))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def semantic_eligible(self, options: Optional[Dict[str, Any]], semantic: Optional[bool] = None) -> bool:
+        """類似層を使えるか（semantic 未指定なら温度で判定。温度未指定はOllama既定の0.8とみなす）"""
+        if self.embedder is None or semantic is False:
+            return False
+        if semantic:
+            return True
+        temperature = (options or {}).get("temperature")
+        return temperature is not None and float(temperature) <= self.semantic_max_temperature
+
+    # 検索
+    def lookup(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+               bypass: bool = False, semantic: Optional[bool] = None,
+               endpoint: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """キャッシュを検索し {"response", "match", "similarity", "metadata"} を返す（なければNone）"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            if bypass:
+                self.stats["bypassed"] += 1
+                return None
+
+        key = self.make_key(model, prompt, options, endpoint)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, metadata, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[2] <= self.ttl_seconds:
+                self._touch(key, now)
+                self.stats["exact_hits"] += 1
+                return {"response": row[0], "match": "exact", "similarity": 1.0,
+                        "metadata": json.loads(row[1]) if row[1] else None}
+            if row:
+                self._delete([key])
+
+        if self.semantic_eligible(options, semantic):
+            hit = self._semantic_lookup(scoped_model(model, endpoint), prompt, options, now)
+            if hit:
+                return hit
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def get(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+            bypass: bool = False, semantic: Optional[bool] = None, endpoint: Optional[str] = None) -> Optional[str]:
+        hit = self.lookup(model, prompt, options, bypass=bypass, semantic=semantic, endpoint=endpoint)
+        return hit["response"] if hit else None
+
+    def _semantic_lookup(self, model: str, prompt: str, options: Optional[Dict[str, Any]],
+                         now: float) -> Optional[Dict[str, Any]]:
+        query = self.embedder(normalize_prompt(prompt))
+        if not query:
+            return None
+        query = _normalize_vector(query)
+        group = (model, _options_key(options))
+
+        with self._lock:
+            vectors = self._group_vectors(group)
+            best_key, best_score = None, self.semantic_threshold
+            for key, vector in vectors.items():
+                if len(vector) != len(query):
+                    continue
+                score = sum(a * b for a, b in zip(query, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+
+            row = self._conn.execute(
+                "SELECT response, metadata, created_at FROM responses WHERE key = ?", (best_key,)
+            ).fetchone()
+            if not row or now - row[2] > self.ttl_seconds:
+                self._delete([best_key])
+                return None
+            self._touch(best_key, now)
+            self.stats["semantic_hits"] += 1
+            return {"response": row[0], "match": "semantic", "similarity": round(best_score, 4),
+                    "metadata": json.loads(row[1]) if row[1] else None}
+
+    def _group_vectors(self, group: Tuple[str, str]) -> Dict[str, Tuple[float, ...]]:
+        if group not in self._vectors:
+            rows = self._conn.execute(
+                "SELECT key, embedding FROM responses WHERE model = ? AND options = ? AND embedding IS NOT NULL",
+                group
+            ).fetchall()
+            self._vectors[group] = {key: _unpack(blob) for key, blob in rows}
+        return self._vectors[group]
+
+    def _touch(self, key: str, now: float):
+        self._conn.execute("UPDATE responses SET last_accessed = ?, hits = hits + 1 WHERE key = ?", (now, key))
+
+    # 保存
+    def put(self, model: str, prompt: str, response: str, options: Optional[Dict[str, Any]] = None,
+            metadata: Optional[Dict[str, Any]] = None, semantic: Optional[bool] = None,
+            endpoint: Optional[str] = None):
+        """応答を保存（類似層の対象なら埋め込みも保存）"""
+        if not response:
+            return
+        key = self.make_key(model, prompt, options, endpoint)
+        group = (scoped_model(model, endpoint), _options_key(options))
+        normalized = normalize_prompt(prompt)
+        embedding = None
+        if self.semantic_eligible(options, semantic):
+            vector = self.embedder(normalized)
+            if vector:
+                embedding = _normalize_vector(vector)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, model, options, prompt, response, metadata, embedding,"
+                " created_at, last_accessed, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, model, group[1], normalized, response,
+                 json.dumps(metadata, ensure_ascii=False) if metadata else None,
+                 _pack(embedding) if embedding else None, now, now)
+            )
+            if group in self._vectors:
+                if embedding:
+                    self._vectors[group][key] = tuple(embedding)
+                else:
+                    self._vectors[group].pop(key, None)
+            self.stats["stores"] += 1
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 50:
+                self.prune()
+
+    def cached_generate(self, model: str, prompt: str, generate: Callable[[], str],
+                        options: Optional[Dict[str, Any]] = None, bypass: bool = False,
+                        semantic: Optional[bool] = None, is_valid: Optional[Callable[[str], bool]] = None,
+                        endpoint: Optional[str] = None, cache: Optional[bool] = None) -> str:
+        """キャッシュにあれば返し、なければ generate() の結果を保存して返す
+
+        cache 未指定なら決定的な（温度0の）呼び出しだけをキャッシュする。cache=True で明示的に対象にする。
+        bypass=True でもキャッシュを読まないだけで、新しい結果で上書きする。
+        is_valid が False を返す結果（エラーメッセージなど）は保存しない。
+        """
+        if cache is False or (cache is None and not is_deterministic(options)):
+            with self._lock:
+                self.stats["uncached"] += 1
+            return generate()
+
+        hit = self.lookup(model, prompt, options, bypass=bypass, semantic=semantic, endpoint=endpoint)
+        if hit:
+            return hit["response"]
+        response = generate()
+        if response and (is_valid is None or is_valid(response)):
+            self.put(model, prompt, response, options, semantic=semantic, endpoint=endpoint)
+        return response
+
+    # 削除
+    def _delete(self, keys: List[str]):
+        if not keys:
+            return
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+        for vectors in self._vectors.values():
+            for key in keys:
+                vectors.pop(key, None)
+        self.stats["evictions"] += len(keys)
+
+    def prune(self) -> int:
+        """期限切れと件数上限を超えた分（最終アクセスが古い順）を削除"""
+        with self._lock:
+            self._puts_since_prune = 0
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT key FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )]
+            self._delete(expired)
+            overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            evicted = []
+            if overflow > 0:
+                evicted = [row[0] for row in self._conn.execute(
+                    "SELECT key FROM responses ORDER BY last_accessed ASC LIMIT ?", (overflow,)
+                )]
+                self._delete(evicted)
+            return len(expired) + len(evicted)
+
+    def invalidate(self, model: Optional[str] = None) -> int:
+        """全件（model 指定時はそのモデルの分。接続先ごとの分も含む）を削除"""
+        with self._lock:
+            if model is None:
+                keys = [row[0] for row in self._conn.execute("SELECT key FROM responses")]
+            else:
+                keys = [row[0] for row in self._conn.execute(
+                    "SELECT key FROM responses WHERE model = ? OR substr(model, 1, ?) = ?",
+                    (model, len(model) + 1, model + "@")
+                )]
+            self._delete(keys)
+            return len(keys)
+
+    # 統計
+    def get_statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            entries, with_embedding = self._conn.execute(
+                "SELECT COUNT(*), COUNT(embedding) FROM responses"
+            ).fetchone()
+        answered = stats["lookups"] - stats["bypassed"]
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats.update(
+            entries=entries,
+            semantic_entries=with_embedding,
+            hit_rate=round(hits / answered, 4) if answered else 0.0,
+            semantic_enabled=self.embedder is not None
+        )
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """共有応答キャッシュを取得（RESPONSE_CACHE_EMBED_MODEL を設定すると類似層を有効化）"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            embed_model = os.getenv("RESPONSE_CACHE_EMBED_MODEL")
+            _response_cache = ResponseCache(embedder=OllamaEmbedder(embed_model) if embed_model else None)
+        return _response_cache
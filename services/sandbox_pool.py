@@ -0,0 +1,467 @@
+"""
+サンドボックスワーカープールモジュール
+生成コードの検証・実行を、常駐するウォーム済みインタプリタで行う
+
+各ワーカーはモジュールを事前読み込みしたPythonプロセス（ザイゴート）で、
+パイプ経由でコードを受け取るたびに自身をforkし、子プロセスに
+リソース制限（CPU時間・メモリ）とネットワーク遮断を適用して実行する。
+インタプリタ起動コストは初回のみで、実行ごとの状態は子プロセスに閉じる。
+fork が使えない環境では一時ファイル + subprocess の従来方式にフォールバックする。
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import struct
+import tempfile
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any
+
+# ワーカーで事前読み込みするモジュール（生成コードでよく使われるもの）
+DEFAULT_PRELOAD = [
+    "json", "math", "random", "re", "datetime", "collections",
+    "itertools", "functools", "typing", "dataclasses", "pathlib",
+]
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MEMORY_MB = 1024
+DEFAULT_MAX_OUTPUT = 256 * 1024
+
+_HEADER = struct.Struct(">I")
+# 呼び出し側の sys.path をワーカーへ渡す環境変数（PYTHONPATH 経由のプロジェクトモジュールを import できるように）
+SYS_PATH_ENV = "SANDBOX_POOL_SYS_PATH"
+
+
+@dataclass
+class SandboxResult:
+    """サンドボックス実行結果"""
+    success: bool
+    stdout: str = ""
+    stderr: str = ""
+    returncode: Optional[int] = None
+    timed_out: bool = False
+    duration: float = 0.0
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _write_message(stream, payload: Dict[str, Any]):
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def _read_exact(fd: int, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = os.read(fd, size)
+        if not chunk:
+            raise EOFError("サンドボックスワーカーが終了しました")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _read_message(fd: int) -> Dict[str, Any]:
+    (length,) = _HEADER.unpack(_read_exact(fd, _HEADER.size))
+    return json.loads(_read_exact(fd, length).decode("utf-8"))
+
+
+# ---------------------------------------------------------------------------
+# ワーカー側（ザイゴートプロセス内で実行）
+# ---------------------------------------------------------------------------
+
+def _block_network():
+    """子プロセスのネットワークを遮断（可能ならネットワーク名前空間を分離）"""
+    unshare = getattr(os, "unshare", None)
+    if unshare is not None and hasattr(os, "CLONE_NEWNET"):
+        try:
+            unshare(os.CLONE_NEWNET)
+            return
+        except OSError:
+            pass
+
+    # socket モジュールの差し替えは _socket を直接使えば回避できるため、監査フックで
+    # C実装の呼び出しそのものを止める（監査フックは一度登録すると外せない）
+    import socket
+
+    lookup_events = {"socket.getaddrinfo", "socket.gethostbyname", "socket.gethostbyname_ex",
+                     "socket.gethostbyaddr", "socket.getnameinfo"}
+    address_events = {"socket.connect", "socket.bind", "socket.sendto", "socket.sendmsg"}
+    denied = "サンドボックス内ではネットワークは使用できません"
+
+    def _audit(event, args):
+        if event == "socket.__new__":
+            family = args[1]
+            # family=-1 は fileno から決まるので、接続・送信時に判定する
+            if family not in (socket.AF_UNIX, -1):
+                raise PermissionError(denied)
+        elif event in address_events:
+            if getattr(args[0], "family", None) != socket.AF_UNIX:
+                raise PermissionError(denied)
+        elif event in lookup_events:
+            raise PermissionError(denied)
+
+    sys.addaudithook(_audit)
+
+
+def _apply_limits(cpu_seconds: int, memory_mb: int):
+    import resource
+
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _exec_child(request: Dict[str, Any], stdout_w: int, stderr_w: int, closing: List[int]):
+    """fork後の子プロセスでコードを実行（戻らない）"""
+    exit_code = 1
+    try:
+        os.setpgid(0, 0)
+        for fd in closing:
+            os.close(fd)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_w, 1)
+        os.dup2(stderr_w, 2)
+
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        _apply_limits(request.get("cpu_seconds", 0), request.get("memory_mb", 0))
+        if not request.get("allow_network", False):
+            _block_network()
+
+        import linecache
+        import traceback
+
+        code = request["code"]
+        filename = request.get("filename", "<sandbox>")
+        linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+        sys.argv = [filename]
+        namespace = {"__name__": "__main__", "__file__": filename, "__builtins__": __builtins__}
+        try:
+            exec(compile(code, filename, "exec"), namespace)
+            exit_code = 0
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException:
+            # サンドボックス自身のフレームは除いて表示
+            etype, value, tb = sys.exc_info()
+            traceback.print_exception(etype, value, tb.tb_next)
+            exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def _collect_output(pid: int, stdout_r: int, stderr_r: int, timeout: float, max_output: int):
+    """子プロセスの出力を読み取り、タイムアウト時はプロセスグループごと停止"""
+    import selectors
+    import signal
+
+    buffers = {stdout_r: bytearray(), stderr_r: bytearray()}
+    selector = selectors.DefaultSelector()
+    for fd in buffers:
+        selector.register(fd, selectors.EVENT_READ)
+
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    while selector.get_map():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            chunk = os.read(key.fd, 65536)
+            if not chunk:
+                selector.unregister(key.fd)
+                continue
+            buf = buffers[key.fd]
+            if len(buf) < max_output:
+                buf.extend(chunk[:max_output - len(buf)])
+    selector.close()
+
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    _, status = os.waitpid(pid, 0)
+    if os.WIFEXITED(status):
+        returncode = os.WEXITSTATUS(status)
+    else:
+        returncode = -os.WTERMSIG(status)
+        # CPU時間制限による停止もタイムアウトとして扱う
+        if os.WTERMSIG(status) == signal.SIGXCPU:
+            timed_out = True
+
+    os.close(stdout_r)
+    os.close(stderr_r)
+    return (
+        buffers[stdout_r].decode("utf-8", errors="replace"),
+        buffers[stderr_r].decode("utf-8", errors="replace"),
+        returncode,
+        timed_out,
+    )
+
+
+def _run_forked(request: Dict[str, Any], protocol_fds: List[int]) -> Dict[str, Any]:
+    started = time.monotonic()
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        _exec_child(request, stdout_w, stderr_w, protocol_fds + [stdout_r, stderr_r])
+    os.close(stdout_w)
+    os.close(stderr_w)
+
+    stdout, stderr, returncode, timed_out = _collect_output(
+        pid, stdout_r, stderr_r,
+        request.get("timeout", 30),
+        request.get("max_output", DEFAULT_MAX_OUTPUT),
+    )
+    return SandboxResult(
+        success=returncode == 0 and not timed_out,
+        stdout=stdout,
+        stderr=stderr,
+        returncode=returncode,
+        timed_out=timed_out,
+        duration=time.monotonic() - started,
+        error="実行タイムアウト" if timed_out else None,
+    ).to_dict()
+
+
+def _worker_main(preload: List[str]):
+    """ザイゴートプロセスのメインループ"""
+    # 先頭のこのスクリプトのディレクトリ（services/）ではなく、呼び出し側と同じ検索パスを使う
+    inherited_path = os.environ.pop(SYS_PATH_ENV, None)
+    if inherited_path is not None:
+        sys.path[:] = inherited_path.split(os.pathsep)
+    # プロトコル用のパイプを退避し、標準入出力は子プロセス用に空けておく
+    protocol_in = os.dup(0)
+    protocol_out = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    out_stream = os.fdopen(protocol_out, "wb")
+
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    _write_message(out_stream, {"ready": True, "pid": os.getpid()})
+    while True:
+        try:
+            request = _read_message(protocol_in)
+        except EOFError:
+            break
+        try:
+            result = _run_forked(request, [protocol_in, protocol_out])
+        except Exception as e:
+            result = SandboxResult(success=False, error=f"サンドボックスエラー: {e}").to_dict()
+        _write_message(out_stream, result)
+
+
+# ---------------------------------------------------------------------------
+# 呼び出し側
+# ---------------------------------------------------------------------------
+
+class SandboxWorker:
+    """ウォーム済みインタプリタ1つへのハンドル"""
+
+    def __init__(self, preload: List[str]):
+        # 従来の一時ファイル + subprocess 方式と同じく PYTHONPATH・ユーザーsite-packages は有効のまま起動する
+        env = {**os.environ, SYS_PATH_ENV: os.pathsep.join(sys.path)}
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", ",".join(preload)],
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.executions = 0
+        self._read_reply(timeout=30)
+
+    def _read_reply(self, timeout: float) -> Dict[str, Any]:
+        import select
+
+        fd = self.process.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            raise TimeoutError("サンドボックスワーカーが応答しません")
+        return _read_message(fd)
+
+    def execute(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        _write_message(self.process.stdin, request)
+        self.executions += 1
+        # ワーカー側でタイムアウトを処理するため、こちらは余裕を持って待つ
+        return self._read_reply(timeout=request["timeout"] + 10)
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=2)
+        except Exception:
+            self.process.kill()
+
+
+class SandboxPool:
+    """リソース制限付きサンドボックスワーカーのプール"""
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, preload: Optional[List[str]] = None,
+                 memory_mb: int = DEFAULT_MEMORY_MB, max_output: int = DEFAULT_MAX_OUTPUT,
+                 allow_network: bool = False):
+        self.size = size
+        self.preload = list(preload if preload is not None else DEFAULT_PRELOAD)
+        self.memory_mb = memory_mb
+        self.max_output = max_output
+        self.allow_network = allow_network
+        self.forking = hasattr(os, "fork")
+
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+
+    def _acquire(self) -> SandboxWorker:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._started < self.size:
+                    self._started += 1
+                    try:
+                        return SandboxWorker(self.preload)
+                    except Exception:
+                        self._started -= 1
+                        raise
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _release(self, worker: Optional[SandboxWorker]):
+        if worker is not None and worker.alive() and not self._closed:
+            self._idle.put(worker)
+            return
+        if worker is not None:
+            worker.close()
+        with self._lock:
+            self._started -= 1
+
+    def execute(self, code: str, timeout: float = 30, cwd: Optional[str] = None) -> SandboxResult:
+        """Pythonコードをサンドボックスで実行"""
+        if not self.forking:
+            return self._execute_subprocess(code, timeout, cwd)
+
+        request = {
+            "code": code,
+            "timeout": timeout,
+            "cwd": cwd,
+            "cpu_seconds": max(1, int(timeout) + 1),
+            "memory_mb": self.memory_mb,
+            "max_output": self.max_output,
+            "allow_network": self.allow_network,
+        }
+        worker = None
+        try:
+            worker = self._acquire()
+            reply = worker.execute(request)
+            return SandboxResult(**reply)
+        except (EOFError, OSError, TimeoutError, ValueError) as e:
+            # 壊れたワーカーは破棄し、次回の取得で作り直す
+            if worker is not None:
+                worker.process.kill()
+            return SandboxResult(success=False, error=f"サンドボックスワーカーエラー: {e}")
+        finally:
+            self._release(worker)
+
+    def _execute_subprocess(self, code: str, timeout: float, cwd: Optional[str]) -> SandboxResult:
+        """forkが使えない環境向けの従来方式"""
+        started = time.monotonic()
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".py", delete=False, encoding="utf-8") as f:
+            f.write(code)
+            temp_file = f.name
+        try:
+            result = subprocess.run(
+                [sys.executable, temp_file],
+                capture_output=True, text=True, encoding="utf-8",
+                timeout=timeout, cwd=cwd
+            )
+            return SandboxResult(
+                success=result.returncode == 0,
+                stdout=result.stdout,
+                stderr=result.stderr,
+                returncode=result.returncode,
+                duration=time.monotonic() - started,
+            )
+        except subprocess.TimeoutExpired:
+            return SandboxResult(success=False, timed_out=True, error="実行タイムアウト",
+                                 duration=time.monotonic() - started)
+        finally:
+            try:
+                os.unlink(temp_file)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        """全ワーカーを終了"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "started": self._started,
+            "idle": self._idle.qsize(),
+            "forking": self.forking,
+        }
+
+
+_sandbox_pool = None
+_sandbox_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    """プロセス共有のサンドボックスプールを取得（初回利用時に生成）"""
+    global _sandbox_pool
+    with _sandbox_pool_lock:
+        if _sandbox_pool is None:
+            _sandbox_pool = SandboxPool(size=int(os.environ.get("SANDBOX_POOL_SIZE", DEFAULT_POOL_SIZE)))
+            atexit.register(_sandbox_pool.shutdown)
+        return _sandbox_pool
+
+
+if __name__ == "__main__" and len(sys.argv) >= 2 and sys.argv[1] == "--worker":
+    _worker_main([m for m in (sys.argv[2] if len(sys.argv) > 2 else "").split(",") if m])
@@ -0,0 +1,216 @@
+"""
+スクリーンショット取り込みモジュール
+アップロードされた画像をハッシュで重複判定し、OCR・AI分析をワーカープールで実行する
+
+- 完全一致（SHA-256）と知覚ハッシュ（dHash）の近似一致では、過去のOCR結果とAI分析を再利用
+- 画像は1回だけ書き込み、2つ目の保存先（Docker側）にはハードリンク（不可ならシンボリックリンク）を作成
+- submit() はジョブIDを即座に返し、処理はジョブキュー（services.job_queue）で行う
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.job_queue import JobQueue, new_job_id
+
+
+def link_or_copy(source: Path, target: Path) -> str:
+    """ハードリンク→シンボリックリンク→コピーの順に試して配置"""
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    try:
+        os.link(source, target)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(source), target)
+        return "symlink"
+    except OSError:
+        shutil.copy2(source, target)
+        return "copy"
+
+
+class ScreenshotIngestPipeline:
+    """スクリーンショットの重複排除・保存・解析パイプライン
+
+    ocr(path) -> text、analyze(path, text, metadata) -> analysis、
+    finalize(save_result, metadata, text, analysis, dedup) -> session を呼び出し側が渡す。
+    finalize は save_result の sha256 / phash をセッションに記録し、これが重複判定の索引になる。
+    """
+
+    def __init__(self, local_dir: Path, mirror_dir: Optional[Path], ocr: Callable, analyze: Callable,
+                 finalize: Callable, job_queue: Optional[JobQueue] = None,
+                 near_duplicate_distance: int = 6, hash_size: int = 16):
+        self.local_dir = Path(local_dir)
+        self.mirror_dir = Path(mirror_dir) if mirror_dir else None
+        self.ocr = ocr
+        self.analyze = analyze
+        self.finalize = finalize
+        self.near_duplicate_distance = near_duplicate_distance
+        self.hash_size = hash_size
+
+        self.job_queue = job_queue or JobQueue(name="screenshot-ingest")
+        self._lock = threading.Lock()
+        self._by_sha: Dict[str, Dict] = {}
+        self._by_phash: List[Tuple[int, Dict]] = []
+        self._pending: Dict[str, str] = {}
+        self.stats = {"ingested": 0, "exact_duplicates": 0, "near_duplicates": 0, "analyzed": 0}
+
+    # 索引
+    def register(self, session: Dict):
+        """処理済みセッションを重複判定の索引に追加"""
+        with self._lock:
+            self._register_locked(session)
+
+    def _register_locked(self, session: Dict):
+        sha256 = session.get("sha256")
+        if sha256:
+            # 重複として記録されたセッションは、分析元の最初のセッションを索引に残す
+            if sha256 in self._by_sha:
+                return
+            self._by_sha[sha256] = session
+        phash = session.get("phash")
+        if phash:
+            self._by_phash.append((int(phash, 16), session))
+
+    def image_hashes(self, image_data: bytes) -> Tuple[str, Optional[str]]:
+        """(SHA-256, 知覚ハッシュ16進) を計算"""
+        sha256 = hashlib.sha256(image_data).hexdigest()
+        try:
+            # Pillowがない環境でも完全一致の重複排除は動くように遅延インポート
+            from PIL import Image
+            from services.image_pipeline import dhash
+            with Image.open(io.BytesIO(image_data)) as image:
+                image.draft("L", (self.hash_size * 8, self.hash_size * 8))
+                phash = dhash(image, self.hash_size)
+            return sha256, format(phash, f"0{self.hash_size * self.hash_size // 4}x")
+        except Exception as e:
+            print(f"⚠️ 知覚ハッシュ計算エラー: {e}")
+            return sha256, None
+
+    def find_duplicate(self, sha256: str, phash: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
+        """("exact" | "near" | None, 元セッション) を返す"""
+        with self._lock:
+            if sha256 in self._by_sha:
+                return "exact", self._by_sha[sha256]
+            if phash and self.near_duplicate_distance > 0:
+                value = int(phash, 16)
+                best = None
+                for previous, session in reversed(self._by_phash):
+                    distance = bin(value ^ previous).count("1")
+                    if distance <= self.near_duplicate_distance and (best is None or distance < best[0]):
+                        best = (distance, session)
+                        if distance == 0:
+                            break
+                if best:
+                    return "near", best[1]
+        return None, None
+
+    # 保存
+    def store(self, image_data: bytes, filename: str, existing_path: Optional[str] = None) -> Dict:
+        """画像を1回だけ書き込み、Docker側にはリンクを作成"""
+        local_path = self.local_dir / filename
+        if existing_path and Path(existing_path).exists():
+            link_or_copy(Path(existing_path), local_path)
+        else:
+            temp_path = local_path.with_name(f".{filename}.tmp")
+            with open(temp_path, "wb") as f:
+                f.write(image_data)
+            os.replace(temp_path, local_path)
+
+        docker_path = (self.mirror_dir or self.local_dir) / filename
+        if self.mirror_dir and self.mirror_dir.exists():
+            link_or_copy(local_path, docker_path)
+
+        return {
+            "docker_path": str(docker_path),
+            "local_path": str(local_path),
+            "filename": filename
+        }
+
+    # ジョブ
+    def submit(self, image_data: bytes, filename: str, metadata: Optional[Dict] = None) -> str:
+        """ジョブキューに登録してジョブIDを返す（混雑時は QueueFullError）"""
+        job_id = new_job_id()
+        sha256 = hashlib.sha256(image_data).hexdigest()
+        with self._lock:
+            # 同じ画像が処理中なら、そのジョブの完了を待って結果を再利用する
+            waiting_for = self._pending.get(sha256)
+            if waiting_for is None:
+                self._pending[sha256] = job_id
+        try:
+            self.job_queue.submit("screenshot", self._run_job, job_id, sha256, image_data, filename, metadata,
+                                  waiting_for, job_id=job_id, payload={"filename": filename, "sha256": sha256})
+        except Exception:
+            self._clear_pending(sha256, job_id)
+            raise
+        return job_id
+
+    def _clear_pending(self, sha256: str, job_id: str):
+        with self._lock:
+            if self._pending.get(sha256) == job_id:
+                del self._pending[sha256]
+
+    def _run_job(self, job_id: str, sha256: str, image_data: bytes, filename: str,
+                 metadata: Optional[Dict], waiting_for: Optional[str]) -> Dict:
+        try:
+            if waiting_for is not None:
+                # 先行ジョブは先に開始済み（FIFO）なので待機してもデッドロックしない
+                self.job_queue.wait(waiting_for)
+            session = self.process(image_data, filename, metadata)
+            if session is None:
+                raise RuntimeError("処理に失敗しました")
+            return session
+        finally:
+            self._clear_pending(sha256, job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.job_queue.get(job_id)
+
+    # 処理本体
+    def process(self, image_data: bytes, filename: str, metadata: Optional[Dict] = None) -> Optional[Dict]:
+        """同期的に1枚を処理（重複なら保存済みのOCR・分析を再利用）"""
+        sha256, phash = self.image_hashes(image_data)
+        kind, source = self.find_duplicate(sha256, phash)
+        self.stats["ingested"] += 1
+
+        save_result = self.store(image_data, filename,
+                                 existing_path=source.get("local_path") if kind == "exact" else None)
+        save_result.update(sha256=sha256, phash=phash)
+
+        if kind:
+            self.stats["exact_duplicates" if kind == "exact" else "near_duplicates"] += 1
+            print(f"♻️ {'同一' if kind == 'exact' else '類似'}画像のため分析結果を再利用 (元セッションID: {source.get('id')})")
+            text_content = source.get("text_content", "")
+            ai_analysis = source.get("ai_analysis", "")
+            dedup = {"match": kind, "reused_from": source.get("id")}
+        else:
+            print("📝 テキスト抽出中...")
+            text_content = self.ocr(save_result["local_path"])
+            print("🤖 AI分析中...")
+            ai_analysis = self.analyze(save_result["local_path"], text_content, metadata)
+            self.stats["analyzed"] += 1
+            dedup = None
+
+        session = self.finalize(save_result, metadata, text_content, ai_analysis, dedup)
+        if session is not None:
+            self.register(session)
+        return session
+
+    def get_statistics(self) -> Dict:
+        with self._lock:
+            indexed = len(self._by_sha)
+        return {**self.stats, "indexed_images": indexed, "jobs": self.job_queue.get_statistics()}
+
+
+def save_metadata_file(directory: Path, filename: str, metadata: Optional[Dict]):
+    """メタデータをJSONで保存"""
+    if metadata:
+        with open(Path(directory) / f"{filename}.meta.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,255 @@
+"""
+検索クライアントモジュール
+Web検索用のHTTPセッションをプロセス内で共有し、キャッシュ・重複排除・レート制限を行う
+
+aiohttpのセッションはイベントループに紐づくため、専用のバックグラウンドループで保持する。
+呼び出しごとに asyncio.run() で新しいループを作る場合でも同じ接続プールを再利用できる。
+"""
+
+import asyncio
+import atexit
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import aiohttp
+
+# ソースごとのリクエスト最小間隔（秒）
+DEFAULT_RATE_LIMITS = {
+    "duckduckgo": 1.0,
+    "arxiv": 3.0,   # arXiv APIの利用規約に合わせて3秒間隔
+    "github": 6.0,  # 未認証のGitHub検索APIは毎分10件まで
+}
+
+
+def normalize_query(query: str) -> str:
+    """キャッシュキー用にクエリを正規化（全角・大文字・連続空白を統一）"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+class SearchHTTPError(Exception):
+    """検索APIが200以外を返した場合の例外"""
+
+    def __init__(self, source: str, status: int):
+        super().__init__(f"{source}: HTTP {status}")
+        self.source = source
+        self.status = status
+
+
+class TTLCache:
+    """有効期限付きLRUキャッシュ"""
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, record: bool = True) -> Tuple[bool, Any]:
+        """(ヒットしたか, 値) を返す（record=False の場合は統計に数えない）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += record
+                    return True, value
+                del self._entries[key]
+            self.misses += record
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RateLimiter:
+    """最小間隔方式のレート制限（クライアントのループ上でのみ使用）"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_allowed = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        if self.min_interval <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_allowed - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+                now = time.monotonic()
+            self._next_allowed = now + self.min_interval
+
+
+class SearchClient:
+    """共有HTTPセッション・TTLキャッシュ・リクエスト合流・レート制限を備えた検索クライアント"""
+
+    def __init__(self, cache_ttl: float = 3600, cache_size: int = 256,
+                 rate_limits: Optional[Dict[str, float]] = None, timeout: float = 10,
+                 connection_limit: int = 20):
+        self.cache = TTLCache(cache_ttl, cache_size)
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._inflight: Dict[Any, asyncio.Task] = {}
+        self._start_lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "errors": 0}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """専用イベントループのスレッドを起動"""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=_run, name="search-client", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    async def fetch(self, source: str, query: str, url: str, params: Optional[Dict] = None,
+                    parser: Optional[Callable[[Any], Any]] = None, response_type: str = "text",
+                    cache_key_extra: Any = None) -> Any:
+        """検索APIを呼び出し、パース結果を返す（どのイベントループからでも呼び出し可能）
+
+        同じ (source, 接続先URL, 正規化クエリ) の結果はTTL内ならキャッシュから返し、
+        実行中の同一リクエストがあればその完了を待って結果を共有する。
+        接続先が違えば（テスト用サーバー・ミラーなど）別のエントリとして扱う。
+        """
+        key = (source, url, normalize_query(query), cache_key_extra)
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            raise RuntimeError("SearchClient.fetch はクライアント専用ループの外から呼び出してください")
+        coroutine = self._fetch_on_loop(key, source, url, params, parser, response_type)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    async def _fetch_on_loop(self, key, source: str, url: str, params: Optional[Dict],
+                             parser: Optional[Callable[[Any], Any]], response_type: str) -> Any:
+        """専用ループ上で実行（同一キーの実行中リクエストに合流）"""
+        hit, value = self.cache.get(key, record=False)
+        if hit:
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.get_running_loop().create_task(
+                self._request(key, source, url, params, parser, response_type)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # 呼び出し元がキャンセルされても、合流している他の呼び出しのために実行は継続する
+        return await asyncio.shield(task)
+
+    async def _request(self, key, source: str, url: str, params: Optional[Dict],
+                       parser: Optional[Callable[[Any], Any]], response_type: str) -> Any:
+        limiter = self._limiters.get(source)
+        if limiter is None:
+            limiter = self._limiters[source] = RateLimiter(self.rate_limits.get(source, 0.0))
+        await limiter.acquire()
+
+        session = self._get_session()
+        self.stats["requests"] += 1
+        try:
+            async with session.get(url, params=params) as response:
+                if response.status != 200:
+                    raise SearchHTTPError(source, response.status)
+                body = await (response.json(content_type=None) if response_type == "json" else response.text())
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+
+        value = parser(body) if parser else body
+        self.cache.set(key, value)
+        return value
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def get_statistics(self) -> Dict:
+        """統計情報を取得"""
+        total = self.cache.hits + self.cache.misses
+        return {
+            **self.stats,
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "cache_hit_rate": self.cache.hits / total if total else 0.0,
+            "inflight": len(self._inflight)
+        }
+
+    def close(self):
+        """セッションを閉じてループを停止"""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def _shutdown():
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"⚠️ 検索クライアント終了エラー: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._session = None
+        self._limiters.clear()
+
+
+_search_client = None
+_search_client_lock = threading.Lock()
+
+
+def get_search_client() -> SearchClient:
+    """共有検索クライアントを取得（初回利用時に作成）"""
+    global _search_client
+    with _search_client_lock:
+        if _search_client is None:
+            _search_client = SearchClient()
+            atexit.register(_search_client.close)
+        return _search_client
@@ -1,6 +1,6 @@
 """
 ステートマネージャーモジュール
-会話履歴、TODO、進化ルールのJSON保存・読み込みを管理
+会話履歴、TODO、進化ルールの保存・読み込みを管理（実体は services.workspace_store のSQLite）
 """
 
 import json
@@ -12,10 +12,17 @@ from typing import Optional, Dict, List, Any
 from core.constants import *
 from core.file_map import file_resolver, get_relevant_files, should_load_file
 from services.import_validator import import_error_detector, auto_import_fixer
+from services.workspace_store import get_workspace_store
 
 # ファイルキャッシュ（パフォーマンス向上）
 _file_cache = {}
 
+# personalities_custom.json の解析結果キャッシュ (mtime, 進化ルール)
+_personality_rules_cache = {}
+
+# 日記の表示件数
+DIARY_DISPLAY_LIMIT = 30
+
 def safe_function_call(module_path: str, function_name: str, *args, **kwargs):
     """安全な関数呼び出し with インポート不足検知"""
     try:
@@ -169,12 +176,8 @@ def save_workspace_state():
             'last_saved': datetime.datetime.now().isoformat()
         }
         
-        # dataディレクトリを作成
-        DATA_DIR.mkdir(exist_ok=True)
-        
         # 保存
-        with open(WORKSPACE_STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump(workspace_data, f, ensure_ascii=False, indent=2)
+        get_workspace_store().save_workspace(workspace_data)
         
         print("✅ ワークスペース状態を保存しました")
         return True
@@ -186,53 +189,17 @@ def save_workspace_state():
 def load_workspace_state() -> Dict[str, Any]:
     """ワークスペース状態を読み込み（進化ルール統合版）"""
     try:
-        workspace_file = DATA_DIR / "workspace_state.json"
-        
         # 基本ワークスペースデータを読み込み
-        if workspace_file.exists():
-            with open(workspace_file, 'r', encoding='utf-8') as f:
-                workspace_data = json.load(f)
-        else:
-            workspace_data = {}
+        workspace_data = get_workspace_store().get_workspace()
         
         # 必要なキーが存在することを保証
         if not isinstance(workspace_data, dict):
             workspace_data = {}
         
-        # personalities_custom.jsonから進化ルールを読み込み
-        personalities_file = DATA_DIR / "personalities_custom.json"
-        evolution_rules = []
-        
-        if personalities_file.exists():
-            try:
-                with open(personalities_file, 'r', encoding='utf-8') as f:
-                    personalities_data = json.load(f)
-                
-                # 進化ルールを抽出（性格設定と進化ルールを一元管理）
-                if isinstance(personalities_data, dict):
-                    # personalitiesから進化ルールを抽出
-                    if "personalities" in personalities_data:
-                        for personality_name, personality_data in personalities_data["personalities"].items():
-                            if isinstance(personality_data, dict) and "evolution_rules" in personality_data:
-                                for rule in personality_data["evolution_rules"]:
-                                    if isinstance(rule, dict):
-                                        rule["source_personality"] = personality_name
-                                        evolution_rules.append(rule)
-                    
-                    # 直接のevolution_rulesも読み込み
-                    if "evolution_rules" in personalities_data:
-                        for rule in personalities_data["evolution_rules"]:
-                            if isinstance(rule, dict):
-                                rule["source"] = "global"
-                                evolution_rules.append(rule)
-                
-                print(f"✅ personalities_custom.jsonから{len(evolution_rules)}件の進化ルールを読み込みました")
-                
-            except Exception as e:
-                print(f"⚠️ personalities_custom.json読み込みエラー: {e}")
+        # personalities_custom.jsonから進化ルールを読み込み（変更時のみ再解析）
+        evolution_rules = _load_personality_evolution_rules(DATA_DIR / "personalities_custom.json")
         
         # デフォルト構造とマージ
-        default_data = get_default_workspace_state()
         merged_data = merge_with_default_workspace_state(workspace_data)
         
         # 進化ルールを統合
@@ -247,6 +214,48 @@ def load_workspace_state() -> Dict[str, Any]:
         default_data = get_default_workspace_state()
         return default_data
 
+def _load_personality_evolution_rules(personalities_file: Path) -> List[Dict[str, Any]]:
+    """personalities_custom.jsonから進化ルールを抽出（mtimeでキャッシュ）"""
+    try:
+        mtime = personalities_file.stat().st_mtime
+    except OSError:
+        return []
+    
+    cached = _personality_rules_cache.get(personalities_file)
+    if cached and cached[0] == mtime:
+        return [dict(rule) for rule in cached[1]]
+    
+    evolution_rules = []
+    try:
+        with open(personalities_file, 'r', encoding='utf-8') as f:
+            personalities_data = json.load(f)
+        
+        # 進化ルールを抽出（性格設定と進化ルールを一元管理）
+        if isinstance(personalities_data, dict):
+            # personalitiesから進化ルールを抽出
+            if "personalities" in personalities_data:
+                for personality_name, personality_data in personalities_data["personalities"].items():
+                    if isinstance(personality_data, dict) and "evolution_rules" in personality_data:
+                        for rule in personality_data["evolution_rules"]:
+                            if isinstance(rule, dict):
+                                rule["source_personality"] = personality_name
+                                evolution_rules.append(rule)
+            
+            # 直接のevolution_rulesも読み込み
+            if "evolution_rules" in personalities_data:
+                for rule in personalities_data["evolution_rules"]:
+                    if isinstance(rule, dict):
+                        rule["source"] = "global"
+                        evolution_rules.append(rule)
+        
+        print(f"✅ personalities_custom.jsonから{len(evolution_rules)}件の進化ルールを読み込みました")
+        
+    except Exception as e:
+        print(f"⚠️ personalities_custom.json読み込みエラー: {e}")
+    
+    _personality_rules_cache[personalities_file] = (mtime, evolution_rules)
+    return [dict(rule) for rule in evolution_rules]
+
 def get_default_workspace_state() -> Dict[str, Any]:
     """デフォルトのワークスペース構造を生成"""
     return {
@@ -287,13 +296,9 @@ def merge_with_default_workspace_state(workspace_data: Dict[str, Any]) -> Dict[s
     return merged
 
 def save_conversation_history(conversation_history):
-    """会話履歴を保存"""
+    """会話履歴を保存（未保存の新しい会話のみ追記）"""
     try:
-        DATA_DIR.mkdir(exist_ok=True)
-        
-        history_file = DATA_DIR / "conversation_history.json"
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(conversation_history, f, ensure_ascii=False, indent=2)
+        get_workspace_store().sync_conversations(conversation_history)
         
         return True
         
@@ -301,16 +306,10 @@ def save_conversation_history(conversation_history):
         print(f"❌ 会話履歴保存エラー: {e}")
         return False
 
-def load_conversation_history():
-    """会話履歴を読み込む"""
+def load_conversation_history(limit: Optional[int] = None):
+    """会話履歴を読み込む（limit指定時は最新limit件）"""
     try:
-        history_file = DATA_DIR / "conversation_history.json"
-        
-        if history_file.exists():
-            with open(history_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        
-        return []
+        return get_workspace_store().get_conversations(limit=limit)
         
     except Exception as e:
         print(f"❌ 会話履歴読み込みエラー: {e}")
@@ -319,6 +318,9 @@ def load_conversation_history():
 def save_evolution_rules(evolution_rules):
     """進化ルールを保存"""
     try:
+        get_workspace_store().save_evolution_rules(evolution_rules)
+        
+        # personalities_custom.jsonを直接読むモジュール向けに同期
         custom_data = {
             "evolution_rules": evolution_rules,
             "last_updated": datetime.datetime.now().isoformat()
@@ -336,12 +338,7 @@ def save_evolution_rules(evolution_rules):
 def load_evolution_rules():
     """進化ルールを読み込み"""
     try:
-        if PERSONALITIES_CUSTOM_FILE.exists():
-            with open(PERSONALITIES_CUSTOM_FILE, "r", encoding="utf-8") as f:
-                custom_data = json.load(f)
-                return custom_data.get("evolution_rules", [])
-        
-        return []
+        return get_workspace_store().get_evolution_rules()
         
     except Exception as e:
         print(f"❌ 進化ルール読み込みエラー: {e}")
@@ -350,33 +347,8 @@ def load_evolution_rules():
 def write_agent_diary(entry_type, content):
     """エージェント日記を書き込む"""
     try:
-        diary_file = AGENT_DIARY_FILE
-        
-        # 既存の日記を読み込み
-        if diary_file.exists():
-            with open(diary_file, "r", encoding="utf-8") as f:
-                diary_data = json.load(f)
-        else:
-            diary_data = {"entries": []}
-        
-        # 新しいエントリーを作成
-        new_entry = {
-            "timestamp": datetime.datetime.now().isoformat(),
-            "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-            "type": entry_type,
-            "content": content
-        }
-        
-        diary_data["entries"].append(new_entry)
-        
-        # 最新30件のみ保持
-        if len(diary_data["entries"]) > 30:
-            diary_data["entries"] = diary_data["entries"][-30:]
-        
-        # 保存
-        diary_file.parent.mkdir(exist_ok=True)
-        with open(diary_file, "w", encoding="utf-8") as f:
-            json.dump(diary_data, f, ensure_ascii=False, indent=2)
+        # 新しいエントリーを追記
+        get_workspace_store().append_diary(entry_type, content)
         
         return True
         
@@ -387,12 +359,8 @@ def write_agent_diary(entry_type, content):
 def read_agent_diary():
     """エージェント日記を読み込む"""
     try:
-        if AGENT_DIARY_FILE.exists():
-            with open(AGENT_DIARY_FILE, "r", encoding="utf-8") as f:
-                diary_data = json.load(f)
-            return diary_data.get("entries", [])
-        
-        return []
+        # 最新30件を表示
+        return get_workspace_store().get_diary(limit=DIARY_DISPLAY_LIMIT)
         
     except Exception as e:
         print(f"日記読み込みエラー: {e}")
@@ -471,10 +439,12 @@ def archive_old_conversations():
 def get_system_status():
     """システムステータスを取得"""
     try:
+        store = get_workspace_store()
         status = {
-            "workspace_state_exists": WORKSPACE_STATE_FILE.exists(),
-            "conversation_history_exists": (DATA_DIR / "conversation_history.json").exists(),
-            "agent_diary_exists": AGENT_DIARY_FILE.exists(),
+            "workspace_state_exists": store.has_workspace(),
+            "conversation_history_exists": store.count_conversations() > 0,
+            "agent_diary_exists": bool(store.get_diary(limit=1)),
+            "workspace_db_exists": WORKSPACE_DB_FILE.exists(),
             "generated_apps_count": len(list(GENERATED_APPS_DIR.glob("*.py"))) if GENERATED_APPS_DIR.exists() else 0,
             "data_dir_exists": DATA_DIR.exists(),
             "custom_personalities_exists": PERSONALITIES_CUSTOM_FILE.exists()
@@ -489,35 +459,7 @@ def get_system_status():
 def export_all_data():
     """すべてのデータをエクスポート"""
     try:
-        export_data = {
-            "export_timestamp": datetime.datetime.now().isoformat(),
-            "workspace_state": {},
-            "conversation_history": [],
-            "agent_diary": [],
-            "evolution_rules": []
-        }
-        
-        # ワークスペース状態
-        if WORKSPACE_STATE_FILE.exists():
-            with open(WORKSPACE_STATE_FILE, "r", encoding="utf-8") as f:
-                export_data["workspace_state"] = json.load(f)
-        
-        # 会話履歴
-        history_file = DATA_DIR / "conversation_history.json"
-        if history_file.exists():
-            with open(history_file, "r", encoding="utf-8") as f:
-                export_data["conversation_history"] = json.load(f)
-        
-        # エージェント日記
-        if AGENT_DIARY_FILE.exists():
-            with open(AGENT_DIARY_FILE, "r", encoding="utf-8") as f:
-                diary_data = json.load(f)
-                export_data["agent_diary"] = diary_data.get("entries", [])
-        
-        # 進化ルール
-        export_data["evolution_rules"] = load_evolution_rules()
-        
-        return export_data
+        return get_workspace_store().export_all()
         
     except Exception as e:
         print(f"❌ データエクスポートエラー: {e}")
@@ -527,25 +469,21 @@ def import_all_data(import_data):
     """すべてのデータをインポート"""
     try:
         success_count = 0
+        store = get_workspace_store()
         
         # ワークスペース状態
         if import_data.get("workspace_state"):
-            with open(WORKSPACE_STATE_FILE, "w", encoding="utf-8") as f:
-                json.dump(import_data["workspace_state"], f, ensure_ascii=False, indent=2)
+            store.save_workspace(import_data["workspace_state"])
             success_count += 1
         
         # 会話履歴
         if import_data.get("conversation_history"):
-            history_file = DATA_DIR / "conversation_history.json"
-            with open(history_file, "w", encoding="utf-8") as f:
-                json.dump(import_data["conversation_history"], f, ensure_ascii=False, indent=2)
+            store.replace_conversations(import_data["conversation_history"])
             success_count += 1
         
         # エージェント日記
         if import_data.get("agent_diary"):
-            diary_data = {"entries": import_data["agent_diary"]}
-            with open(AGENT_DIARY_FILE, "w", encoding="utf-8") as f:
-                json.dump(diary_data, f, ensure_ascii=False, indent=2)
+            store.replace_diary(import_data["agent_diary"])
             success_count += 1
         
         # 進化ルール
@@ -0,0 +1,326 @@
+"""
+ワークスペースストアモジュール
+TODO・メモ・会話履歴・進化ルール・エージェント日記を単一のSQLiteデータベースで管理
+
+WALモードで1件ずつ追記するため、書き込みコストは履歴の長さに依存しない。
+初回起動時には既存のJSONファイルから自動的に移行する。
+"""
+
+import json
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
+from typing import Optional, Dict, List, Any
+from core.constants import *
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    personality TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations(timestamp);
+CREATE TABLE IF NOT EXISTS diary (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_diary_timestamp ON diary(timestamp);
+CREATE INDEX IF NOT EXISTS idx_diary_type ON diary(type, timestamp);
+CREATE TABLE IF NOT EXISTS todos (
+    position INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS memos (
+    position INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evolution_rules (
+    position INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workspace (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# 一覧として保持するワークスペースの要素とテーブルの対応
+LIST_TABLES = {
+    "todo_list": "todos",
+    "quick_memos": "memos",
+}
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _fill_timestamps(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """タイムスタンプの無い会話に現在時刻を補う（呼び出し元の辞書にも反映し、次回の差分判定と一致させる）"""
+    now = datetime.datetime.now().isoformat()
+    for entry in entries:
+        if not entry.get("timestamp"):
+            entry["timestamp"] = now
+    return entries
+
+
+class WorkspaceStore:
+    """SQLiteベースのワークスペースストア"""
+
+    def __init__(self, db_path: Path = WORKSPACE_DB_FILE):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _transaction(self, statements):
+        """複数の書き込みを1トランザクションで実行"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    if isinstance(params, list):
+                        self._conn.executemany(sql, params)
+                    else:
+                        self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # メタ情報
+    def get_meta(self, key: str) -> Optional[str]:
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_meta(self, key: str, value: str):
+        self._transaction([("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))])
+
+    # 会話履歴
+    def append_conversation(self, entry: Dict[str, Any]):
+        """会話を1件追記"""
+        self.append_conversations([entry])
+
+    def append_conversations(self, entries: List[Dict[str, Any]]):
+        if not entries:
+            return
+        rows = [(e.get("timestamp"), e.get("personality"), _dumps(e)) for e in _fill_timestamps(entries)]
+        self._transaction([
+            ("INSERT INTO conversations(timestamp, personality, data) VALUES (?, ?, ?)", rows)
+        ])
+
+    def sync_conversations(self, conversation_history: List[Dict[str, Any]]) -> int:
+        """メモリ上の会話履歴のうち未保存の末尾だけを追記
+
+        最後に保存した会話を履歴の末尾から探し、それ以降の分のみを書き込む。
+        """
+        last = self._query("SELECT data FROM conversations ORDER BY id DESC LIMIT 1")
+        if not last:
+            new_entries = list(conversation_history)
+        else:
+            last_entry = json.loads(last[0][0])
+            new_entries = None
+            for index in range(len(conversation_history) - 1, -1, -1):
+                if conversation_history[index] == last_entry:
+                    new_entries = conversation_history[index + 1:]
+                    break
+            if new_entries is None:
+                # 保存済みの会話が見つからない場合はタイムスタンプで判定（保存時に必ず補うので、無いものは未保存）
+                last_timestamp = last_entry.get("timestamp") or ""
+                new_entries = [e for e in conversation_history
+                               if not e.get("timestamp") or e["timestamp"] > last_timestamp]
+
+        self.append_conversations(new_entries)
+        return len(new_entries)
+
+    def get_conversations(self, limit: Optional[int] = None, since: Optional[str] = None,
+                          personality: Optional[str] = None) -> List[Dict[str, Any]]:
+        """会話履歴を古い順に取得（limit指定時は最新limit件）"""
+        clauses, params = [], []
+        if since:
+            # タイムスタンプを補う前に保存された行は除外しない
+            clauses.append("(timestamp IS NULL OR timestamp >= ?)")
+            params.append(since)
+        if personality:
+            clauses.append("personality = ?")
+            params.append(personality)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT data FROM conversations {where} ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._query(sql, params)
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def count_conversations(self) -> int:
+        return self._query("SELECT COUNT(*) FROM conversations")[0][0]
+
+    def replace_conversations(self, entries: List[Dict[str, Any]]):
+        rows = [(e.get("timestamp"), e.get("personality"), _dumps(e)) for e in _fill_timestamps(entries)]
+        self._transaction([
+            ("DELETE FROM conversations", ()),
+            ("INSERT INTO conversations(timestamp, personality, data) VALUES (?, ?, ?)", rows),
+        ])
+
+    # エージェント日記
+    def append_diary(self, entry_type: str, content: str, timestamp: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+        """日記を1件追記"""
+        timestamp = timestamp or datetime.datetime.now()
+        entry = {
+            "timestamp": timestamp.isoformat(),
+            "date": timestamp.strftime("%Y-%m-%d"),
+            "type": entry_type,
+            "content": content
+        }
+        self._insert_diary([entry])
+        return entry
+
+    def _insert_diary(self, entries: List[Dict[str, Any]]):
+        self._transaction([self._diary_insert_statement(entries)])
+
+    def _diary_insert_statement(self, entries: List[Dict[str, Any]]) -> tuple:
+        rows = [(e.get("timestamp", ""), e.get("date", ""), e.get("type", ""), e.get("content", "")) for e in entries]
+        return ("INSERT INTO diary(timestamp, date, type, content) VALUES (?, ?, ?, ?)", rows)
+
+    def get_diary(self, limit: Optional[int] = None, entry_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """日記を古い順に取得（limit指定時は最新limit件）"""
+        sql = "SELECT timestamp, date, type, content FROM diary"
+        params = []
+        if entry_type:
+            sql += " WHERE type = ?"
+            params.append(entry_type)
+        sql += " ORDER BY id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._query(sql, params)
+        return [
+            {"timestamp": ts, "date": date, "type": kind, "content": content}
+            for ts, date, kind, content in reversed(rows)
+        ]
+
+    def replace_diary(self, entries: List[Dict[str, Any]]):
+        self._transaction([("DELETE FROM diary", ()), self._diary_insert_statement(entries)])
+
+    # 一覧データ（TODO・メモ・進化ルール）
+    def _replace_list(self, table: str, items: List[Any]) -> List[tuple]:
+        return [
+            (f"DELETE FROM {table}", ()),
+            (f"INSERT INTO {table}(position, data) VALUES (?, ?)",
+             [(index, _dumps(item)) for index, item in enumerate(items)]),
+        ]
+
+    def _get_list(self, table: str) -> List[Any]:
+        return [json.loads(row[0]) for row in self._query(f"SELECT data FROM {table} ORDER BY position")]
+
+    def save_evolution_rules(self, rules: List[Any]):
+        self._transaction(self._replace_list("evolution_rules", rules))
+
+    def get_evolution_rules(self) -> List[Any]:
+        return self._get_list("evolution_rules")
+
+    # ワークスペース状態
+    def save_workspace(self, workspace_data: Dict[str, Any]):
+        """ワークスペース状態を保存（一覧は各テーブル、その他はキー単位）"""
+        statements = []
+        for key, value in workspace_data.items():
+            if key in LIST_TABLES:
+                statements.extend(self._replace_list(LIST_TABLES[key], value or []))
+            else:
+                statements.append(("INSERT OR REPLACE INTO workspace(key, value) VALUES (?, ?)", (key, _dumps(value))))
+        self._transaction(statements)
+
+    def get_workspace(self) -> Dict[str, Any]:
+        workspace_data = {key: json.loads(value) for key, value in self._query("SELECT key, value FROM workspace")}
+        for key, table in LIST_TABLES.items():
+            workspace_data[key] = self._get_list(table)
+        return workspace_data
+
+    def has_workspace(self) -> bool:
+        return bool(self._query("SELECT 1 FROM workspace LIMIT 1"))
+
+    # エクスポート・移行
+    def export_all(self) -> Dict[str, Any]:
+        """export_all_data と同じ形式でエクスポート"""
+        return {
+            "export_timestamp": datetime.datetime.now().isoformat(),
+            "workspace_state": self.get_workspace() if self.has_workspace() else {},
+            "conversation_history": self.get_conversations(),
+            "agent_diary": self.get_diary(),
+            "evolution_rules": self.get_evolution_rules()
+        }
+
+    def migrate_from_json(self) -> Dict[str, int]:
+        """既存のJSONファイルから一度だけ移行"""
+        if self.get_meta("migrated_from_json"):
+            return {}
+
+        migrated = {}
+
+        def _load(path: Path):
+            try:
+                if path.exists():
+                    with open(path, "r", encoding="utf-8") as f:
+                        return json.load(f)
+            except Exception as e:
+                print(f"⚠️ 移行元ファイル読み込みエラー {path}: {e}")
+            return None
+
+        workspace_data = _load(WORKSPACE_STATE_FILE)
+        if isinstance(workspace_data, dict):
+            self.save_workspace(workspace_data)
+            migrated["workspace_state"] = 1
+
+        history = _load(DATA_DIR / "conversation_history.json")
+        if isinstance(history, list):
+            self.append_conversations(history)
+            migrated["conversation_history"] = len(history)
+
+        diary_data = _load(AGENT_DIARY_FILE)
+        if isinstance(diary_data, dict) and diary_data.get("entries"):
+            self._insert_diary(diary_data["entries"])
+            migrated["agent_diary"] = len(diary_data["entries"])
+
+        custom_data = _load(PERSONALITIES_CUSTOM_FILE)
+        if isinstance(custom_data, dict) and custom_data.get("evolution_rules"):
+            self.save_evolution_rules(custom_data["evolution_rules"])
+            migrated["evolution_rules"] = len(custom_data["evolution_rules"])
+
+        self.set_meta("migrated_from_json", datetime.datetime.now().isoformat())
+        if migrated:
+            print(f"✅ JSONファイルからワークスペースストアへ移行しました: {migrated}")
+        return migrated
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_workspace_store = None
+_workspace_store_lock = threading.Lock()
+
+
+def get_workspace_store() -> WorkspaceStore:
+    """共有ワークスペースストアを取得（初回利用時に作成・移行）"""
+    global _workspace_store
+    with _workspace_store_lock:
+        if _workspace_store is None:
+            _workspace_store = WorkspaceStore()
+            _workspace_store.migrate_from_json()
+        return _workspace_store
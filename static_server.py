@@ -9,6 +9,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
+import re
 
 app = FastAPI(title="VRM Static Server", description="VRMアバター表示用静的ファイルサーバー")
 
@@ -21,6 +22,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 内容のハッシュ付きのCSS（ui/theme_bundle.py が書き出す）は中身が変わらないので長期キャッシュさせる
+FINGERPRINTED_CSS = re.compile(r"^/static/css/[\w-]+\.[0-9a-f]{12}\.css$")
+
+@app.middleware("http")
+async def cache_fingerprinted_assets(request, call_next):
+    response = await call_next(request)
+    if response.status_code == 200 and FINGERPRINTED_CSS.match(request.url.path):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
 # 静的ファイル配信の設定
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
@@ -42,6 +53,7 @@ if __name__ == "__main__":
     print("📁 静的ファイル配信: http://localhost:8000/static/")
     print("🔧 VRMファイル: http://localhost:8000/static/avatar.vrm")
     print("📜 JavaScript: http://localhost:8000/static/js/vrm_app.js")
+    print("🎨 テーマCSS: http://localhost:8000/static/css/ （THEME_CSS_BASE_URL に設定）")
     
     uvicorn.run(
         app,
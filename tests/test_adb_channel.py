@@ -0,0 +1,108 @@
+"""AdbChannelManager を偽の adb サーバー（fake_adb_server）に対して検証する"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_adb_server import FakeAdbServer  # noqa: E402
+from services.adb_channel import AdbChannelManager  # noqa: E402
+
+SERIALS = ["emulator-5554", "emulator-5556", "emulator-5558"]
+
+
+@pytest.fixture
+def server():
+    fake = FakeAdbServer(device_count=len(SERIALS)).start_in_background()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def manager(server):
+    host, port = server.address
+    channel_manager = AdbChannelManager(host=host, port=port, max_workers=4, info_ttl=60.0)
+    yield channel_manager
+    channel_manager.shutdown()
+
+
+def test_devices(manager):
+    assert manager.is_available()
+    assert manager.devices() == [(serial, "device") for serial in SERIALS]
+
+
+def test_snapshot_batched_and_cached(server, manager):
+    snapshots = manager.map_devices(manager.get_device_snapshot, SERIALS)
+
+    for index, serial in enumerate(SERIALS):
+        snapshot = snapshots[serial]
+        assert snapshot["model"] == f"Pixel Fake {index}"
+        assert snapshot["android_version"] == "14"
+        assert snapshot["properties"]["ro.build.version.sdk"] == "34"
+        assert snapshot["ip_address"] == f"192.168.0.{10 + index}"
+        assert snapshot["battery_level"].endswith(str(80 - index))
+    # 端末ごとにシェル実行は1回だけ
+    assert manager.stats["shell_calls"] == len(SERIALS)
+    assert manager.stats["info_queries"] == len(SERIALS)
+
+    # TTL 内の再取得はサーバーへ問い合わせない
+    request_count = len(server.requests)
+    assert manager.get_device_snapshot(SERIALS[0]) is snapshots[SERIALS[0]]
+    assert len(server.requests) == request_count
+    assert manager.stats["info_cache_hits"] == 1
+    assert manager.get_statistics()["cached_devices"] == len(SERIALS)
+
+    # refresh と invalidate はキャッシュを無視する
+    manager.get_device_snapshot(SERIALS[0], refresh=True)
+    manager.invalidate(SERIALS[1])
+    manager.get_device_snapshot(SERIALS[1])
+    assert manager.stats["info_queries"] == len(SERIALS) + 2
+    assert len(server.requests) > request_count
+
+
+def test_shell_exit_codes(manager):
+    result = manager.shell(SERIALS[0], "echo hello")
+    assert result["success"] and result["exit_code"] == 0
+    assert result["output"].strip() == "hello"
+
+    result = manager.shell(SERIALS[0], "cat /sdcard/missing.txt")
+    assert not result["success"] and result["exit_code"] == 1
+    assert "No such file" in result["error"]
+
+    result = manager.shell(SERIALS[0], "no-such-command")
+    assert not result["success"] and result["exit_code"] == 127
+
+
+def test_unknown_device(manager):
+    result = manager.shell("emulator-9999", "echo hello")
+    assert not result["success"]
+    assert "exit_code" not in result
+
+
+def test_push_pull_install(server, manager, tmp_path):
+    payload = bytes(range(256)) * 300
+    local_file = tmp_path / "data.bin"
+    local_file.write_bytes(payload)
+
+    pushed = manager.push(SERIALS[0], str(local_file), "/sdcard/data.bin")
+    assert pushed["success"], pushed
+    assert server.devices[SERIALS[0]].files["/sdcard/data.bin"] == payload
+
+    pulled_file = tmp_path / "pulled.bin"
+    pulled = manager.pull(SERIALS[0], "/sdcard/data.bin", str(pulled_file))
+    assert pulled["success"], pulled
+    assert pulled_file.read_bytes() == payload
+
+    missing = manager.pull(SERIALS[0], "/sdcard/missing.bin", str(tmp_path / "missing.bin"))
+    assert not missing["success"]
+
+    apk = tmp_path / "app.apk"
+    apk.write_bytes(b"PK\x03\x04fake apk")
+    installed = manager.install(SERIALS[1], str(apk))
+    assert installed["success"], installed
+    device = server.devices[SERIALS[1]]
+    assert device.installed == ["app.apk"]
+    # 一時領域の APK は削除されている
+    assert "/data/local/tmp/app.apk" not in device.files
@@ -0,0 +1,131 @@
+"""SearchClient をローカルの代替検索サーバーに対して検証する"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.search_client import SearchClient, SearchHTTPError  # noqa: E402
+
+RESPONSE_DELAY = 0.2
+
+
+class _SearchHandler(BaseHTTPRequestHandler):
+    """クエリをそのまま返す検索API（/error は500を返す）"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.hits.append(url.path)
+        time.sleep(RESPONSE_DELAY)
+        if url.path == "/error":
+            self.send_response(500)
+            self.end_headers()
+            return
+        query = parse_qs(url.query).get("q", [""])[0]
+        body = json.dumps({"query": query, "count": len(self.server.hits)}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _SearchHandler)
+    httpd.hits = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client():
+    search_client = SearchClient(cache_ttl=60, rate_limits={"slow": 0.5})
+    yield search_client
+    search_client.close()
+
+
+def _url(server, path: str = "/search") -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{path}"
+
+
+def _fetch(client, server, query: str, source: str = "local", path: str = "/search"):
+    return client.fetch(source, query, _url(server, path), params={"q": query}, response_type="json")
+
+
+def test_cache_hit(server, client):
+    first = asyncio.run(_fetch(client, server, "Python asyncio"))
+    # 正規化後に同じクエリはキャッシュから返る（別ループからの呼び出しでも共有）
+    second = asyncio.run(_fetch(client, server, "  python　ASYNCIO "))
+
+    assert first == second == {"query": "Python asyncio", "count": 1}
+    assert server.hits == ["/search"]
+    stats = client.get_statistics()
+    assert stats["requests"] == 1
+    assert stats["cache_hits"] == 1
+    assert stats["cache_entries"] == 1
+
+
+def test_concurrent_fetches_coalesce(server, client):
+    async def run():
+        return await asyncio.gather(*(_fetch(client, server, "rag") for _ in range(5)))
+
+    results = asyncio.run(run())
+
+    assert all(result == results[0] for result in results)
+    assert len(server.hits) == 1
+    stats = client.get_statistics()
+    assert stats["requests"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["inflight"] == 0
+
+
+def test_rate_limit_spaces_requests(server, client):
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(_fetch(client, server, "first", source="slow"),
+                             _fetch(client, server, "second", source="slow"))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+
+    assert len(server.hits) == 2
+    # 2件目は最小間隔を待ってから送信される
+    assert elapsed >= 0.5 + RESPONSE_DELAY
+
+
+def test_unlimited_source_runs_in_parallel(server, client):
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(_fetch(client, server, f"query {i}") for i in range(3)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(run())
+
+    assert len(server.hits) == 3
+    assert elapsed < RESPONSE_DELAY * 3
+
+
+def test_http_error_is_not_cached(server, client):
+    for _ in range(2):
+        with pytest.raises(SearchHTTPError) as excinfo:
+            asyncio.run(_fetch(client, server, "broken", path="/error"))
+        assert excinfo.value.status == 500
+
+    assert server.hits == ["/error", "/error"]
+    assert client.get_statistics()["errors"] == 2
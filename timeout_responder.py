@@ -19,6 +19,7 @@ import queue
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from ollama_vrm_integrated_app import OllamaClient
+from services.job_queue import JobQueue, QueueFullError, queue_full_response, register_job_routes
 
 class TimeoutResponder:
     def __init__(self):
@@ -27,6 +28,7 @@ class TimeoutResponder:
         self.progress_queue = queue.Queue()
         self.active_tasks = {}
         self.task_counter = 0
+        self._task_lock = threading.Lock()
         self.timeout_threshold = 30  # 30秒でタイムアウト
         self.progress_interval = 3  # 3秒ごとに進捗報告
         
@@ -42,6 +44,9 @@ class TimeoutResponder:
         self.load_responses()
         self.load_progress()
         
+        # 生成リクエストは上限付きジョブキューで実行（状態はSQLiteに記録）
+        self.jobs = JobQueue(self.data_dir / "timeout_jobs.db", max_workers=2, max_pending=8, name="timeout-responder")
+        
         # Flaskアプリケーション
         self.app = Flask(__name__)
         self.setup_routes()
@@ -341,14 +346,16 @@ class TimeoutResponder:
     
     def generate_response_with_progress(self, prompt, task_description=""):
         """進捗報告付きでレスポンスを生成"""
-        task_id = f"task_{self.task_counter}"
-        self.task_counter += 1
+        with self._task_lock:
+            task_id = f"task_{self.task_counter}"
+            self.task_counter += 1
+        start_time = time.time()
         
         # タスクをアクティブリストに追加
         self.active_tasks[task_id] = {
             "prompt": prompt,
             "description": task_description,
-            "start_time": time.time()
+            "start_time": start_time
         }
         
         print(f"🚀 タスク開始: {task_id} - {task_description}")
@@ -362,8 +369,7 @@ class TimeoutResponder:
             response = self.ollama_client.generate_response(prompt)
             
             # タスク完了
-            if task_id in self.active_tasks:
-                del self.active_tasks[task_id]
+            self.active_tasks.pop(task_id, None)
             
             # 完了レスポンス
             completion_response = {
@@ -373,7 +379,7 @@ class TimeoutResponder:
                 "message": "✅ レスポンス生成完了！",
                 "ai_response": response,
                 "task_description": task_description,
-                "processing_time": time.time() - self.active_tasks.get(task_id, {}).get("start_time", time.time())
+                "processing_time": time.time() - start_time
             }
             
             self.response_queue.put(completion_response)
@@ -391,8 +397,7 @@ class TimeoutResponder:
             
         except Exception as e:
             # エラーレスポンス
-            if task_id in self.active_tasks:
-                del self.active_tasks[task_id]
+            self.active_tasks.pop(task_id, None)
             
             error_response = {
                 "task_id": task_id,
@@ -421,7 +426,8 @@ class TimeoutResponder:
             "latest_progress": latest_progress,
             "active_tasks": len(self.active_tasks),
             "total_responses": len(self.response_queue.queue),
-            "total_progress": len(self.progress_queue.queue)
+            "total_progress": len(self.progress_queue.queue),
+            "jobs": self.jobs.get_statistics()
         }
     
     def setup_routes(self):
@@ -527,7 +533,7 @@ class TimeoutResponder:
                 const result = await response.json();
                 
                 if (result.success) {
-                    console.log('タスク開始:', result.task_id);
+                    console.log('ジョブ登録:', result.job_id);
                 } else {
                     console.error('エラー:', result.error);
                 }
@@ -614,12 +620,24 @@ class TimeoutResponder:
                 prompt = data.get('prompt', '')
                 task_description = data.get('task_description', '')
                 
-                result = self.generate_response_with_progress(prompt, task_description)
-                return jsonify(result)
+                # 生成はワーカーで実行し、ジョブIDを即座に返す（結果は /api/jobs/<job_id>）
+                job_id = self.jobs.submit("generate", self.generate_response_with_progress, prompt, task_description,
+                                          payload={"task_description": task_description})
+                return jsonify({
+                    "success": True,
+                    "status": "queued",
+                    "job_id": job_id,
+                    "status_url": f"/api/jobs/{job_id}"
+                }), 202
                 
+            except QueueFullError as e:
+                return queue_full_response(e)
             except Exception as e:
                 return jsonify({"success": False, "error": str(e)})
         
+        # ジョブ状態（?wait=秒 でロングポーリング）・SSE・統計
+        register_job_routes(self.app, self.jobs)
+        
         @self.app.route('/api/status')
         def status():
             """ステータスAPI"""
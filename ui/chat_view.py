@@ -0,0 +1,118 @@
+"""
+チャット表示モジュール
+長い会話でも再実行ごとの送信量が増えないよう、直近のターンだけを描画する
+
+- 表示するのは末尾の CHAT_PAGE_SIZE ターン。「以前のメッセージ」ボタンで1ページずつ遡る
+- ターンごとのHTMLはメッセージ単位でキャッシュし、再実行のたびに組み立て直さない
+- 自動スクロールは新しいターンが追加されたときだけ挿入する
+"""
+
+import datetime
+import functools
+from typing import Dict, List
+
+import streamlit as st
+
+from core.constants import CHAT_HTML_CACHE_SIZE, CHAT_PAGE_SIZE, SESSION_KEYS
+
+AUTO_SCROLL_SCRIPT = """
+<script>
+setTimeout(function() {
+    window.scrollTo({
+        top: document.body.scrollHeight,
+        behavior: 'smooth'
+    });
+}, 100);
+</script>
+"""
+
+# 再実行時にチャット部分だけを描画し直せる場合は fragment を使う（古いStreamlitでは通常の関数）
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def format_message_time(timestamp) -> str:
+    """保存されたISO形式のタイムスタンプを HH:MM に変換"""
+    if not timestamp:
+        return ""
+    try:
+        return datetime.datetime.fromisoformat(str(timestamp)).strftime("%H:%M")
+    except ValueError:
+        return ""
+
+
+@functools.lru_cache(maxsize=CHAT_HTML_CACHE_SIZE)
+def render_turn_html(user_message: str, assistant_message: str, time_label: str) -> str:
+    """1ターン（ユーザー発言とAI応答）のHTMLを生成（同じメッセージは再生成しない）"""
+    return f'''
+        <div class="chat-message user-message">
+            <div class="message-content">
+                <div class="message-bubble user-bubble">
+                    {user_message}
+                </div>
+                <div class="message-time">
+                    {time_label}
+                    <span class="read-indicator">既読</span>
+                </div>
+            </div>
+            <div class="message-avatar user-avatar">👤</div>
+        </div>
+        <div class="chat-message ai-message">
+            <div class="message-avatar ai-avatar">🐿️</div>
+            <div class="message-content">
+                <div class="message-bubble ai-bubble">
+                    {assistant_message}
+                </div>
+                <div class="message-time">{time_label}</div>
+            </div>
+        </div>
+        '''
+
+
+def get_visible_window(conversation_history: List[Dict], visible_turns: int) -> List[Dict]:
+    """末尾から visible_turns ターン分を返す"""
+    if visible_turns <= 0:
+        return []
+    return conversation_history[-visible_turns:]
+
+
+def _render_chat_window(conversation_history: List[Dict], page_size: int):
+    """表示ウィンドウ内のターンを描画"""
+    visible_key = SESSION_KEYS['chat_visible_turns']
+    rendered_key = SESSION_KEYS['chat_rendered_turns']
+    visible_turns = st.session_state.get(visible_key, page_size)
+
+    hidden_turns = len(conversation_history) - visible_turns
+    if hidden_turns > 0:
+        if st.button(f"⬆️ 以前のメッセージを読み込む（残り{hidden_turns}件）", key="chat_load_earlier"):
+            visible_turns += page_size
+            st.session_state[visible_key] = visible_turns
+            hidden_turns = len(conversation_history) - visible_turns
+
+    for conv in get_visible_window(conversation_history, visible_turns):
+        # 時刻の無いターン（旧形式の履歴など）は初めて表示した時刻を記録し、再実行ごとに表示が変わらないようにする
+        if not conv.get("timestamp"):
+            conv["timestamp"] = datetime.datetime.now().isoformat()
+        st.markdown(
+            render_turn_html(conv.get("user", ""), conv.get("assistant", ""),
+                             format_message_time(conv["timestamp"])),
+            unsafe_allow_html=True
+        )
+
+    # 新しいターンが増えたときだけ最下部へスクロール
+    total_turns = len(conversation_history)
+    if total_turns > st.session_state.get(rendered_key, 0):
+        st.markdown(AUTO_SCROLL_SCRIPT, unsafe_allow_html=True)
+    st.session_state[rendered_key] = total_turns
+
+
+_render_chat_window_fragment = _fragment(_render_chat_window) if _fragment else _render_chat_window
+
+
+def render_chat_view(conversation_history: List[Dict], page_size: int = CHAT_PAGE_SIZE):
+    """LINE風チャットを直近のターンだけ描画"""
+    if not conversation_history:
+        return
+
+    st.markdown('<div class="line-chat-container">', unsafe_allow_html=True)
+    _render_chat_window_fragment(conversation_history, page_size)
+    st.markdown('</div>', unsafe_allow_html=True)
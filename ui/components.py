@@ -12,60 +12,11 @@ from core.llm_client import extract_todos_from_text, detect_app_launch_command
 from services.state_manager import save_workspace_state, load_workspace_state, write_agent_diary, read_agent_diary, cleanup_temp_files
 from services.app_generator import scan_generated_apps, execute_app_inline, self_repair_app
 from ui.styles import get_tool_panel_style
+from ui.chat_view import render_chat_view
 
 def render_line_chat(conversation_history):
-    """LINE風チャットUIを描画"""
-    if not conversation_history:
-        return
-    
-    # LINE風コンテナ
-    st.markdown('<div class="line-chat-container">', unsafe_allow_html=True)
-    
-    for i, conv in enumerate(conversation_history):
-        timestamp = datetime.datetime.now().strftime("%H:%M")
-        
-        # ユーザーメッセージ
-        st.markdown(f'''
-        <div class="chat-message user-message">
-            <div class="message-content">
-                <div class="message-bubble user-bubble">
-                    {conv["user"]}
-                </div>
-                <div class="message-time">
-                    {timestamp}
-                    <span class="read-indicator">既読</span>
-                </div>
-            </div>
-            <div class="message-avatar user-avatar">👤</div>
-        </div>
-        ''', unsafe_allow_html=True)
-        
-        # AIメッセージ（エゾモモンガ）
-        st.markdown(f'''
-        <div class="chat-message ai-message">
-            <div class="message-avatar ai-avatar">🐿️</div>
-            <div class="message-content">
-                <div class="message-bubble ai-bubble">
-                    {conv["assistant"]}
-                </div>
-                <div class="message-time">{timestamp}</div>
-            </div>
-        </div>
-        ''', unsafe_allow_html=True)
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # 自動スクロール用JavaScript
-    st.markdown("""
-    <script>
-    setTimeout(function() {
-        window.scrollTo({
-            top: document.body.scrollHeight,
-            behavior: 'smooth'
-        });
-    }, 100);
-    </script>
-    """, unsafe_allow_html=True)
+    """LINE風チャットUIを描画（直近のターンのみ。古いものは段階的に読み込む）"""
+    render_chat_view(conversation_history)
 
 def render_tool_panel():
     """ツール棚を描画"""
@@ -101,6 +101,28 @@ THEMES = {
     }
 }
 
+# 人格ごとのテーマ（テーマCSSバンドルに全人格分を含め、表示時はクラスで切り替える）
+PERSONALITY_THEMES = {
+    "friend": {
+        "primaryColor": "#4CAF50",
+        "backgroundColor": "#ffffff",
+        "secondaryBackgroundColor": "#f0f0f0",
+        "textColor": "#000000"
+    },
+    "copy": {
+        "primaryColor": "#2196F3",
+        "backgroundColor": "#ffffff",
+        "secondaryBackgroundColor": "#f0f0f0",
+        "textColor": "#000000"
+    },
+    "expert": {
+        "primaryColor": "#9C27B0",
+        "backgroundColor": "#f3e5f5",
+        "secondaryBackgroundColor": "#e1bee7",
+        "textColor": "#000000"
+    }
+}
+
 # Z-index設定
 Z_INDEX = {
     "dropdown": 1000,
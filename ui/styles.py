@@ -3,6 +3,7 @@ UIスタイルモジュール
 LINE風CSSやテーマ設定（ベージュ・茶色）を管理
 """
 
+import functools
 import streamlit as st
 from ui.constants import UI_COLORS, UI_STYLES, COMPONENT_STYLES, THEMES
 
@@ -59,8 +60,7 @@ def get_gliding_mode_css():
 
 def apply_gliding_mode():
     """滑空モードを適用"""
-    css = get_gliding_mode_css()
-    st.markdown(css, unsafe_allow_html=True)
+    apply_custom_css(gliding=True)
     
     # VRMアバターに滑空アニメーションを適用
     if 'vrm_controller' in st.session_state:
@@ -75,8 +75,7 @@ def apply_gliding_mode():
 def disable_gliding_mode():
     """滑空モードを無効化"""
     # 通常のCSSに戻す
-    css = get_line_chat_css()
-    st.markdown(css, unsafe_allow_html=True)
+    apply_custom_css()
     
     # VRMアバターを通常表情に戻す
     if 'vrm_controller' in st.session_state:
@@ -332,11 +331,13 @@ def get_ui_consistency_prompt():
 [絶対命令]: どのようなアプリを生成する場合でも、上記のデザインルールを100%適用すること。これに違反するコードは生成してはならない。
 """
 
-def apply_custom_css():
-    """カスタムCSSを適用"""
-    import streamlit as st
-    st.markdown(get_line_chat_css(), unsafe_allow_html=True)
+def apply_custom_css(personality=None, gliding=False):
+    """カスタムCSSを適用（組み立て済みのテーマCSSと、人格テーマを切り替える目印だけを送る）"""
+    from ui.theme_bundle import THEME_BUNDLE, get_theme_marker_html, get_theme_stylesheet_html
+    st.markdown(get_theme_stylesheet_html(THEME_BUNDLE, personality, gliding) + get_theme_marker_html(personality),
+                unsafe_allow_html=True)
 
+@functools.lru_cache(maxsize=1)
 def get_tool_panel_style():
     """ツールパネルのスタイルを取得"""
     return f"""
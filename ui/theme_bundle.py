@@ -0,0 +1,166 @@
+"""
+テーマCSSバンドルモジュール
+LINE風チャット・滑空モード・人格テーマのCSSをプロセスごとに一度だけ組み立てる
+
+- バンドルは内容のハッシュを付けた名前で static/css/ に書き出す（static_server.py が配信）
+- THEME_CSS_BASE_URL が設定されていれば再実行ごとに送るのは <link> タグだけ。未設定なら必要な節だけを縮めてインラインで送る
+- 人格テーマは全人格分をバンドルに含め、再実行ごとには小さな目印の要素（クラス）だけを切り替える
+"""
+
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from core.constants import THEME_CSS_BASE_URL, THEME_CSS_DIR
+from ui.constants import PERSONALITY_THEMES
+
+# 人格テーマの切り替えに使う目印の要素のクラス
+THEME_MARKER_CLASS = "theme-marker"
+
+# バンドル名: "theme" は LINE風チャット・滑空モード・人格テーマ、"personality" は人格テーマのみ
+THEME_BUNDLE = "theme"
+PERSONALITY_BUNDLE = "personality"
+BASE_SECTION = "base"
+GLIDING_SECTION = "gliding"
+
+_published_lock = threading.Lock()
+_published_fingerprints: Dict[str, str] = {}
+
+
+@dataclass(frozen=True)
+class ThemeBundle:
+    """組み立て済みのテーマCSS（節ごとに保持し、ファイルには全節をまとめて書き出す）"""
+    name: str
+    sections: Tuple[Tuple[str, str], ...]
+    fingerprint: str
+
+    @property
+    def filename(self) -> str:
+        return f"{self.name}.{self.fingerprint}.css"
+
+    @cached_property
+    def css(self) -> str:
+        return "\n".join(css for _, css in self.sections) + "\n"
+
+    def select(self, section_names: Tuple[str, ...]) -> str:
+        """指定した節だけのCSS"""
+        wanted = set(section_names)
+        return "\n".join(css for name, css in self.sections if name in wanted)
+
+
+def _strip_style_tags(html: str) -> str:
+    """<style> ～ </style> の中身だけを取り出す"""
+    start = html.find("<style>")
+    end = html.rfind("</style>")
+    if start == -1 or end == -1:
+        return html.strip()
+    return html[start + len("<style>"):end].strip()
+
+
+def minify_css(css: str) -> str:
+    """コメントと余分な空白を除く（文字列リテラルを含まない手書きのCSS向け）"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def _personality_theme_css(personality: str, theme: dict) -> str:
+    """目印の要素があるときだけ効く人格テーマのCSS"""
+    scope = f"body:has(.{THEME_MARKER_CLASS}.theme-{personality})"
+    return f"""
+{scope} .stButton > button:first-child {{
+    background-color: {theme['primaryColor']} !important;
+    color: white !important;
+}}
+
+{scope} .stSelectbox > div > div > select,
+{scope} .stTextInput > div > div > input,
+{scope} .stTextArea > div > div > textarea,
+{scope} .stSidebar {{
+    background-color: {theme['secondaryBackgroundColor']} !important;
+}}
+
+{scope} .streamlit-container {{
+    background-color: {theme['backgroundColor']} !important;
+}}
+"""
+
+
+@lru_cache(maxsize=None)
+def compile_theme_bundle(name: str = THEME_BUNDLE) -> ThemeBundle:
+    """テーマCSSを一度だけ組み立てる"""
+    sections = []
+    if name == THEME_BUNDLE:
+        from ui.styles import get_gliding_mode_css, get_line_chat_css
+        sections.append((BASE_SECTION, _strip_style_tags(get_line_chat_css())))
+        sections.append((GLIDING_SECTION, _strip_style_tags(get_gliding_mode_css())))
+    elif name != PERSONALITY_BUNDLE:
+        raise ValueError(f"不明なテーマバンドル: {name}")
+    sections.extend((f"personality-{personality}", _personality_theme_css(personality, theme))
+                    for personality, theme in PERSONALITY_THEMES.items())
+
+    sections = tuple((section, minify_css(css)) for section, css in sections)
+    fingerprint = hashlib.sha256("\n".join(css for _, css in sections).encode("utf-8")).hexdigest()[:12]
+    return ThemeBundle(name=name, sections=sections, fingerprint=fingerprint)
+
+
+def publish_theme_bundle(name: str = THEME_BUNDLE, css_dir: Path = THEME_CSS_DIR) -> Path:
+    """バンドルを static/css/<name>.<hash>.css に書き出し、古い版を削除"""
+    bundle = compile_theme_bundle(name)
+    css_dir = Path(css_dir)
+    target = css_dir / bundle.filename
+
+    with _published_lock:
+        if _published_fingerprints.get(name) == bundle.fingerprint and target.exists():
+            return target
+
+        css_dir.mkdir(parents=True, exist_ok=True)
+        if not target.exists():
+            tmp_path = target.with_suffix(".css.tmp")
+            tmp_path.write_text(bundle.css, encoding="utf-8")
+            os.replace(tmp_path, target)
+            print(f"🎨 テーマCSSを書き出しました: {target.name}")
+
+        for old in css_dir.glob(f"{name}.*.css"):
+            if old != target:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        _published_fingerprints[name] = bundle.fingerprint
+        return target
+
+
+@lru_cache(maxsize=64)
+def _inline_stylesheet_html(name: str, personality: Optional[str], gliding: bool) -> str:
+    """配信元が無いときのインラインCSS（表示に必要な節だけ）"""
+    sections = (BASE_SECTION, f"personality-{personality}") + ((GLIDING_SECTION,) if gliding else ())
+    return f"<style>{compile_theme_bundle(name).select(sections)}</style>"
+
+
+def get_theme_stylesheet_html(name: str = THEME_BUNDLE, personality: Optional[str] = None, gliding: bool = False,
+                              base_url: str = THEME_CSS_BASE_URL) -> str:
+    """テーマCSSを読み込むHTML（配信元があれば全節をまとめた <link>、無ければ必要な節だけのインライン <style>）"""
+    if base_url:
+        try:
+            bundle = compile_theme_bundle(name)
+            publish_theme_bundle(name)
+            return f'<link rel="stylesheet" href="{base_url.rstrip("/")}/{bundle.filename}">'
+        except OSError as e:
+            print(f"⚠️ テーマCSSの書き出しに失敗しました（インラインで適用）: {e}")
+    return _inline_stylesheet_html(name, personality, gliding)
+
+
+@lru_cache(maxsize=32)
+def get_theme_marker_html(personality: Optional[str] = None) -> str:
+    """人格テーマを切り替える目印の要素"""
+    classes = [THEME_MARKER_CLASS]
+    if personality in PERSONALITY_THEMES:
+        classes.append(f"theme-{personality}")
+    return f'<div class="{" ".join(classes)}" style="display:none"></div>'
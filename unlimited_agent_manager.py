@@ -14,14 +14,23 @@ from unlimited_agent_core import (
     TemplateApproach,
     HeuristicApproach
 )
+from services.response_cache import ResponseCache, get_response_cache
+
+# 応答キャッシュ上でこのマネージャーの解決策を区別する名前
+SOLUTION_CACHE_MODEL = "unlimited_agent"
+
+# OllamaClient がエラー時に返す文字列（成功扱いにすると永続キャッシュに残ってしまう）
+ERROR_RESPONSE_PREFIXES = ("エラー", "Ollama APIエラー", "APIエラー", "API呼び出しエラー", "AI応答がタイムアウト")
 
 class UnlimitedAgentManager:
     """制限なし親友エージェントマネージャー"""
     
-    def __init__(self, timeout_threshold: int = 240):
+    def __init__(self, timeout_threshold: int = 240, response_cache: Optional[ResponseCache] = None):
         self.timeout_threshold = timeout_threshold
         self.approaches: List[ApproachInterface] = []
         self.solution_cache: Dict[str, Dict[str, Any]] = {}
+        # 再起動後も残る共有キャッシュ（solution_cache はプロセス内の高速層）
+        self.response_cache = response_cache or get_response_cache()
         self.execution_history: List[Dict[str, Any]] = []
         
         # アプローチを初期化
@@ -36,8 +45,9 @@ class UnlimitedAgentManager:
             HeuristicApproach()
         ]
     
-    def generate_response_with_fallback(self, prompt: str, task_description: str = "", progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
-        """フォールバック付き応答生成（ステップ進行ごとに報告）"""
+    def generate_response_with_fallback(self, prompt: str, task_description: str = "", progress_callback: Optional[Callable] = None,
+                                        bypass_cache: bool = False) -> Dict[str, Any]:
+        """フォールバック付き応答生成（ステップ進行ごとに報告、bypass_cache=True でキャッシュを読まない）"""
         start_time = time.time()
         
         # 開始報告
@@ -56,8 +66,8 @@ class UnlimitedAgentManager:
             })
         
         cache_key = self._generate_cache_key(prompt, task_description)
-        if cache_key in self.solution_cache:
-            cached_result = self.solution_cache[cache_key]
+        cached_result = None if bypass_cache else self._find_cached_solution(cache_key, prompt, task_description)
+        if cached_result:
             print(f"📋 キャッシュヒット: {cached_result['approach']}")
             
             if progress_callback:
@@ -101,12 +111,12 @@ class UnlimitedAgentManager:
             try:
                 response = approach.execute(prompt, task_description, progress_callback)
                 
-                if response and not response.startswith("エラー") and not response.startswith("Ollama APIエラー"):
+                if response and not response.startswith(ERROR_RESPONSE_PREFIXES):
                     elapsed = time.time() - start_time
                     print(f"✅ 成功: {approach_name} (所要時間: {elapsed:.2f}秒)")
                     
                     # 成功結果をキャッシュ
-                    self._cache_solution(cache_key, approach_name, response)
+                    self._cache_solution(cache_key, approach_name, response, prompt, task_description)
                     
                     # 実行履歴を記録
                     self._record_execution(approach_name, True, elapsed, response)
@@ -170,14 +180,35 @@ class UnlimitedAgentManager:
         combined = f"{prompt}_{task_description}"
         return hashlib.md5(combined.encode()).hexdigest()
     
-    def _cache_solution(self, cache_key: str, approach: str, response: str):
-        """解決策をキャッシュ"""
+    def _find_cached_solution(self, cache_key: str, prompt: str, task_description: str) -> Optional[Dict[str, Any]]:
+        """プロセス内キャッシュ → 共有キャッシュ（完全一致・類似依頼）の順に探す"""
+        if cache_key in self.solution_cache:
+            return self.solution_cache[cache_key]
+        
+        # Ollamaのアプローチは温度0.7で生成するため類似層は使わない（「Python電卓」と「JavaScript電卓」を取り違える）
+        hit = self.response_cache.lookup(SOLUTION_CACHE_MODEL, prompt, {"task": task_description}, semantic=False)
+        if not hit:
+            return None
+        solution = {
+            "approach": (hit["metadata"] or {}).get("approach", "cache"),
+            "response": hit["response"],
+            "timestamp": time.time(),
+            "success_rate": 1.0
+        }
+        self.solution_cache[cache_key] = solution
+        return solution
+    
+    def _cache_solution(self, cache_key: str, approach: str, response: str, prompt: str = None, task_description: str = ""):
+        """解決策をキャッシュ（プロンプトがあれば共有キャッシュにも保存）"""
         self.solution_cache[cache_key] = {
             "approach": approach,
             "response": response,
             "timestamp": time.time(),
             "success_rate": 1.0
         }
+        if prompt is not None:
+            self.response_cache.put(SOLUTION_CACHE_MODEL, prompt, response, {"task": task_description},
+                                    metadata={"approach": approach}, semantic=False)
     
     def _record_execution(self, approach: str, success: bool, elapsed_time: float, result: str):
         """実行履歴を記録"""
@@ -239,8 +270,9 @@ class UnlimitedAgentManager:
         return stats
     
     def clear_cache(self):
-        """キャッシュをクリア"""
+        """キャッシュをクリア（共有キャッシュ内のこのマネージャーの分も削除）"""
         self.solution_cache.clear()
+        self.response_cache.invalidate(SOLUTION_CACHE_MODEL)
         print("✅ キャッシュをクリアしました")
     
     def clear_history(self):
@@ -254,7 +286,8 @@ class UnlimitedAgentManager:
             "cache_size": len(self.solution_cache),
             "cache_keys": list(self.solution_cache.keys()),
             "oldest_cache": min(self.solution_cache.values(), key=lambda x: x["timestamp"])["timestamp"] if self.solution_cache else None,
-            "newest_cache": max(self.solution_cache.values(), key=lambda x: x["timestamp"])["timestamp"] if self.solution_cache else None
+            "newest_cache": max(self.solution_cache.values(), key=lambda x: x["timestamp"])["timestamp"] if self.solution_cache else None,
+            "persistent_cache": self.response_cache.get_statistics()
         }
     
     def export_cache(self, filepath: str):
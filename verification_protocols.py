@@ -18,6 +18,7 @@ from pathlib import Path
 import streamlit as st
 import requests
 from dataclasses import dataclass
+from services.sandbox_pool import get_sandbox_pool
 
 @dataclass
 class DiagnosticResult:
@@ -515,19 +516,13 @@ class AutoVerificationLoop:
         """サンドボックス実行"""
         try:
             if language == "python":
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                    f.write(code)
-                    temp_file = f.name
-                
-                try:
-                    result = subprocess.run([sys.executable, temp_file], 
-                                          capture_output=True, text=True, timeout=30)
-                    if result.returncode == 0:
-                        return result.stdout, None
-                    else:
-                        return None, result.stderr
-                finally:
-                    os.unlink(temp_file)
+                # ウォーム済みのサンドボックスワーカーで実行
+                result = get_sandbox_pool().execute(code, timeout=30)
+                if result.timed_out:
+                    return None, "実行タイムアウト"
+                if result.success:
+                    return result.stdout, None
+                return None, result.stderr or result.error
             
             elif language == "javascript":
                 # Node.jsで実行（利用可能な場合）
@@ -7,15 +7,14 @@ llama3.2-visionモデルと画面認識を統合した高度なAIシステム
 import streamlit as st
 import ollama
 import pyautogui
-import tempfile
-import os
 import time
 from datetime import datetime
 from PIL import Image
 import io
-import base64
 import json
 
+from services.image_pipeline import get_vision_preprocessor
+
 class VisionAISystem:
     """ビジョンAI統合システム"""
     
@@ -24,6 +23,8 @@ class VisionAISystem:
         self.vision_model = "llama3.2-vision"
         self.text_model = "llama3.1:8b"
         self.current_mode = "text"  # text, vision, hybrid
+        # 画像はモデル入力解像度のJPEGにメモリ上で変換して送る（内容ハッシュでキャッシュ）
+        self.preprocessor = get_vision_preprocessor()
         
     def initialize(self):
         """システム初期化"""
@@ -52,93 +53,89 @@ class VisionAISystem:
             st.error(f"❌ 画面キャプチャエラー: {str(e)}")
             return None, None
     
-    def image_to_base64(self, image_path):
-        """画像をbase64に変換"""
+    def image_to_base64(self, image):
+        """画像（パス・バイト列・PIL画像）をモデル入力用のbase64に変換"""
         try:
-            with open(image_path, "rb") as img_file:
-                return base64.b64encode(img_file.read()).decode('utf-8')
+            return self.preprocessor.prepare(image)
         except Exception as e:
             st.error(f"❌ 画像変換エラー: {str(e)}")
             return None
     
+    def generate_with_images(self, prompt, images):
+        """前処理した画像でビジョンモデルを呼び出す（モデルの上限枚数ごとにリクエストを分割）"""
+        batches = self.preprocessor.batches(images, self.vision_model)
+        responses = []
+        for batch in batches:
+            response = self.ollama_client.generate(
+                model=self.vision_model,
+                prompt=prompt,
+                images=batch
+            )
+            responses.append(response['response'])
+        
+        if len(responses) == 1:
+            return responses[0]
+        return "\n\n".join(f"【{index}/{len(responses)}】\n{text}" for index, text in enumerate(responses, 1))
+    
     def analyze_screen_with_vision(self, prompt="この画面について詳細に説明してください"):
         """ビジョンモデルで画面分析"""
         try:
-            # 画面キャプチャ取得
-            temp_path, screenshot = self.capture_screen()
+            # 画面キャプチャ取得（一時ファイルは作らない）
+            _, screenshot = self.capture_screen(save_temp=False)
             
-            if temp_path is None:
+            if screenshot is None:
                 return "画面キャプチャの取得に失敗しました"
             
             # ビジョンモデルで分析
             with st.spinner("🔍 ビジョンAIで画面分析中..."):
-                response = self.ollama_client.generate(
-                    model=self.vision_model,
-                    prompt=prompt,
-                    images=[temp_path]
-                )
-            
-            # 一時ファイル削除
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-            
-            return response['response']
+                return self.generate_with_images(prompt, [screenshot])
             
         except Exception as e:
             return f"❌ 画面分析エラー: {str(e)}"
     
     def analyze_image_file(self, image_file, prompt="この画像について詳細に説明してください"):
-        """アップロードされた画像ファイルを分析"""
+        """画像ファイル（パス・バイト列・PIL画像）を分析"""
         try:
             with st.spinner("🔍 ビジョンAIで画像分析中..."):
-                response = self.ollama_client.generate(
-                    model=self.vision_model,
-                    prompt=prompt,
-                    images=[image_file]
-                )
+                return self.generate_with_images(prompt, [image_file])
             
-            return response['response']
+        except Exception as e:
+            return f"❌ 画像分析エラー: {str(e)}"
+    
+    def analyze_images(self, images, prompt="これらの画像について詳細に説明してください"):
+        """複数画像をまとめて分析"""
+        try:
+            with st.spinner(f"🔍 ビジョンAIで{len(images)}枚の画像を分析中..."):
+                return self.generate_with_images(prompt, images)
             
         except Exception as e:
             return f"❌ 画像分析エラー: {str(e)}"
     
-    def hybrid_analysis(self, prompt, image_path=None):
+    def hybrid_analysis(self, prompt, image=None):
         """ハイブリッド分析（テキスト+画像）"""
         try:
             # 画像がない場合は画面キャプチャ
-            if image_path is None:
-                image_path, _ = self.capture_screen()
+            if image is None:
+                _, image = self.capture_screen(save_temp=False)
             
-            if image_path is None:
+            if image is None:
                 return "画面キャプチャの取得に失敗しました"
             
             with st.spinner("🧠 ハイブリッドAI分析中..."):
-                response = self.ollama_client.generate(
-                    model=self.vision_model,
-                    prompt=f"以下の画像とテキスト情報を統合して回答してください:\n\nテキスト: {prompt}\n\n画像:",
-                    images=[image_path]
+                return self.generate_with_images(
+                    f"以下の画像とテキスト情報を統合して回答してください:\n\nテキスト: {prompt}\n\n画像:",
+                    [image]
                 )
             
-            # 一時ファイル削除
-            try:
-                if os.path.exists(image_path) and "temp_screenshot" in image_path:
-                    os.unlink(image_path)
-            except:
-                pass
-            
-            return response['response']
-            
         except Exception as e:
             return f"❌ ハイブリッド分析エラー: {str(e)}"
     
     def extract_text_from_screen(self):
         """画面からテキスト抽出（OCR機能）"""
         try:
-            temp_path, _ = self.capture_screen()
+            _, screenshot = self.capture_screen(save_temp=False)
             
-            if temp_path is None:
+            if screenshot is None:
                 return "画面キャプチャの取得に失敗しました"
             
             ocr_prompt = """この画像からすべてのテキスト情報を抽出してください。
@@ -146,19 +143,7 @@ class VisionAISystem:
             ボタン、ラベル、メニュー項目、エラーメッセージなど、すべてのテキストを含めてください。"""
             
             with st.spinner("📝 画面からテキスト抽出中..."):
-                response = self.ollama_client.generate(
-                    model=self.vision_model,
-                    prompt=ocr_prompt,
-                    images=[temp_path]
-                )
-            
-            # 一時ファイル削除
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-            
-            return response['response']
+                return self.generate_with_images(ocr_prompt, [screenshot])
             
         except Exception as e:
             return f"❌ テキスト抽出エラー: {str(e)}"
@@ -166,9 +151,9 @@ class VisionAISystem:
     def analyze_ui_elements(self):
         """UI要素の分析"""
         try:
-            temp_path, _ = self.capture_screen()
+            _, screenshot = self.capture_screen(save_temp=False)
             
-            if temp_path is None:
+            if screenshot is None:
                 return "画面キャプチャの取得に失敗しました"
             
             ui_prompt = """この画面のUI要素を詳細に分析してください：
@@ -182,19 +167,7 @@ class VisionAISystem:
             可能な限り詳細に、構造化して報告してください。"""
             
             with st.spinner("🎨 UI要素分析中..."):
-                response = self.ollama_client.generate(
-                    model=self.vision_model,
-                    prompt=ui_prompt,
-                    images=[temp_path]
-                )
-            
-            # 一時ファイル削除
-            try:
-                os.unlink(temp_path)
-            except:
-                pass
-            
-            return response['response']
+                return self.generate_with_images(ui_prompt, [screenshot])
             
         except Exception as e:
             return f"❌ UI分析エラー: {str(e)}"
@@ -278,20 +251,10 @@ def render_vision_interface():
         )
         
         if st.button("🔍 画像を分析", type="primary", key="analyze_image"):
-            # 一時ファイルに保存
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_file_path = tmp_file.name
-            
-            result = vision_system.analyze_image_file(tmp_file_path, image_prompt)
+            # アップロードされたバイト列をそのまま前処理して送る
+            result = vision_system.analyze_image_file(uploaded_file.getvalue(), image_prompt)
             st.subheader("📊 画像分析結果")
             st.write(result)
-            
-            # 一時ファイル削除
-            try:
-                os.unlink(tmp_file_path)
-            except:
-                pass
 
 def render_hybrid_interface():
     """ハイブリッドインターフェース"""
@@ -321,21 +284,9 @@ def render_hybrid_interface():
     # ハイブリッド分析実行
     if st.button("🧠 ハイブリッド分析", type="primary", key="hybrid_analysis"):
         if 'hybrid_image' in st.session_state and hybrid_prompt:
-            # 一時ファイルに保存
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp_file:
-                screenshot = st.session_state.hybrid_image
-                screenshot.save(tmp_file.name)
-                tmp_file_path = tmp_file.name
-            
-            result = vision_system.hybrid_analysis(hybrid_prompt, tmp_file_path)
+            result = vision_system.hybrid_analysis(hybrid_prompt, st.session_state.hybrid_image)
             st.subheader("🧠 ハイブリッド分析結果")
             st.write(result)
-            
-            # 一時ファイル削除
-            try:
-                os.unlink(tmp_file_path)
-            except:
-                pass
         else:
             st.warning("⚠️ 画面キャプチャとテキストの両方が必要です")
 
@@ -379,7 +330,8 @@ def main():
     st.title("👁️ AI Agent Vision System")
     st.markdown("### 🚀 llama3.2-vision + 画面認識の統合")
     
-    # グローバル変数初期化
+    # グローバル変数初期化（各描画関数はモジュールの vision_system を参照する）
+    global vision_system
     if 'vision_system' not in st.session_state:
         st.session_state.vision_system = VisionAISystem()
         if st.session_state.vision_system.initialize():
@@ -414,6 +366,12 @@ def main():
         st.metric("分析実行回数", "0")
         st.metric("テキスト抽出回数", "0")
         st.metric("UI分析回数", "0")
+        
+        # 画像前処理キャッシュ
+        preprocess_stats = vision_system.preprocessor.get_statistics()
+        st.metric("画像キャッシュヒット率", f"{preprocess_stats['hit_rate']:.0%}")
+        if preprocess_stats["bytes_in"]:
+            st.caption(f"送信サイズ: 元画像の{preprocess_stats['bytes_out'] / preprocess_stats['bytes_in']:.1%}")
     
     # メインタブ
     tab1, tab2, tab3 = st.tabs(["👁️ ビジョンAI", "🧠 ハイブリッド分析", "⚡ クイックアクション"])